@@ -107,6 +107,71 @@ class Config:
 
     # 楽天トラベル
     RAKUTEN_AFFILIATE_ID = os.environ.get('RAKUTEN_AFFILIATE_ID')
+
+    # ホテル価格オファー（公開API）: 各プロバイダへ並列に問い合わせ、締切までに返った分で応答する
+    HOTEL_OFFERS_DEADLINE = float(os.environ.get('HOTEL_OFFERS_DEADLINE', '5.0'))      # 全プロバイダ共通の締切（秒）
+    HOTEL_OFFERS_PARTIAL_TTL = int(os.environ.get('HOTEL_OFFERS_PARTIAL_TTL', '60'))   # 締切に間に合わなかった応答のキャッシュ秒数
+    HOTEL_OFFERS_POOL_SIZE = int(os.environ.get('HOTEL_OFFERS_POOL_SIZE', '16'))
+    # キャッシュ: soft TTL を過ぎた値は返しつつ裏で再計算し、hard TTL で消える
+    HOTEL_OFFERS_SOFT_TTL = int(os.environ.get('HOTEL_OFFERS_SOFT_TTL', '600'))
+    HOTEL_OFFERS_HARD_TTL = int(os.environ.get('HOTEL_OFFERS_HARD_TTL', '3600'))
+    HOTEL_OFFERS_LOCK_TTL = int(os.environ.get('HOTEL_OFFERS_LOCK_TTL', '30'))          # 再計算ロックの期限（秒）
+    HOTEL_OFFERS_REFRESH_WORKERS = int(os.environ.get('HOTEL_OFFERS_REFRESH_WORKERS', '4'))
+    # 一括取得API（/public/api/hotel_offers/batch）
+    HOTEL_OFFERS_BATCH_MAX = int(os.environ.get('HOTEL_OFFERS_BATCH_MAX', '60'))
+    HOTEL_OFFERS_BATCH_CONCURRENCY = int(os.environ.get('HOTEL_OFFERS_BATCH_CONCURRENCY', '4'))   # 同時に計算するスポット数
+    HOTEL_OFFERS_BATCH_DEADLINE = float(os.environ.get('HOTEL_OFFERS_BATCH_DEADLINE', '8.0'))
+    # 事前計算（CLI: offers-prewarm）: view 上位スポット × よく見られる日付のキャッシュを soft TTL 切れ前に温め直す
+    HOTEL_OFFERS_PREWARM_TOP_N = int(os.environ.get('HOTEL_OFFERS_PREWARM_TOP_N', '200'))
+    HOTEL_OFFERS_PREWARM_DAYS = int(os.environ.get('HOTEL_OFFERS_PREWARM_DAYS', '7'))            # view 数を数える期間（日）
+    HOTEL_OFFERS_PREWARM_OFFSETS = os.environ.get('HOTEL_OFFERS_PREWARM_OFFSETS', '1,7')         # 今日から何日後のチェックインか
+    HOTEL_OFFERS_PREWARM_WEEKENDS = int(os.environ.get('HOTEL_OFFERS_PREWARM_WEEKENDS', '2'))    # 直近の土曜泊を何週分
+    HOTEL_OFFERS_PREWARM_BUDGET = int(os.environ.get('HOTEL_OFFERS_PREWARM_BUDGET', '300'))      # 1回の実行でのプロバイダごとの呼び出し上限
+    HOTEL_OFFERS_PREWARM_MARGIN = int(os.environ.get('HOTEL_OFFERS_PREWARM_MARGIN', '360'))      # soft TTL の残りがこれを切ったら温め直す（秒。実行間隔より少し長く）
+    HOTEL_OFFERS_PREWARM_CONCURRENCY = int(os.environ.get('HOTEL_OFFERS_PREWARM_CONCURRENCY', '4'))
+    # スポット → 価格プロバイダIDのキャッシュ（SpotProviderId の変更時はコミットで無効化）
+    PROVIDER_MAPPINGS_TTL = int(os.environ.get('PROVIDER_MAPPINGS_TTL', '3600'))
+    PROVIDER_MAPPINGS_LRU_SIZE = int(os.environ.get('PROVIDER_MAPPINGS_LRU_SIZE', '4096'))
+    PROVIDER_MAPPINGS_LRU_TTL = int(os.environ.get('PROVIDER_MAPPINGS_LRU_TTL', '60'))       # 他プロセスの無効化が届かないので短め
+
+    # Instagram インポート（スポット保存ジョブ）
+    IMPORT_SAVE_CONCURRENCY = int(os.environ.get('IMPORT_SAVE_CONCURRENCY', '8'))  # 外部API補完の並列数
+    IMPORT_SAVE_BATCH_SIZE = int(os.environ.get('IMPORT_SAVE_BATCH_SIZE', '50'))  # 一括INSERT/コミットの件数
+    IMPORT_OPENAI_CONCURRENCY = int(os.environ.get('IMPORT_OPENAI_CONCURRENCY', '4'))  # キャプション解析の同時リクエスト数
+    IMPORT_PLACES_CONCURRENCY = int(os.environ.get('IMPORT_PLACES_CONCURRENCY', '8'))  # 候補の Places 検索の同時リクエスト数
+    # キャプション解析: 'per_post'（投稿ごと） | 'batched'（入力トークン予算までまとめて1リクエスト）
+    IMPORT_OPENAI_EXTRACT_MODE = os.environ.get('IMPORT_OPENAI_EXTRACT_MODE', 'per_post')
+    IMPORT_OPENAI_BATCH_TOKENS = int(os.environ.get('IMPORT_OPENAI_BATCH_TOKENS', '6000'))
+    IMPORT_OPENAI_BATCH_MAX_POSTS = int(os.environ.get('IMPORT_OPENAI_BATCH_MAX_POSTS', '25'))
+    # LLM 応答キャッシュ（Redis + llm_cache テーブル）。キーは model + プロンプト版 + 入力のハッシュ
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true')
+    LLM_CACHE_TTL_DAYS = int(os.environ.get('LLM_CACHE_TTL_DAYS', '30'))        # llm_cache テーブルの保持日数
+    LLM_CACHE_REDIS_TTL = int(os.environ.get('LLM_CACHE_REDIS_TTL', '604800'))  # Redis 側の保持秒数（上限）
+    PLACE_CATEGORY_TABLE_TTL = int(os.environ.get('PLACE_CATEGORY_TABLE_TTL', '300'))  # types→カテゴリ対応表の再読込間隔（秒）
+    # Google Places 検索・詳細の共有キャッシュ（プロセス内 LRU + Redis）。フィールドごとの短い TTL は places_client.FIELD_TTLS
+    PLACES_CACHE_TTL = int(os.environ.get('PLACES_CACHE_TTL', '604800'))      # 既定の保持秒数
+    PLACES_NEGATIVE_TTL = int(os.environ.get('PLACES_NEGATIVE_TTL', '600'))   # 見つからなかった結果の保持秒数
+    PLACES_INVALID_TTL = int(os.environ.get('PLACES_INVALID_TTL', '30'))      # 400（設定ミスの可能性あり）の保持秒数
+    PLACES_LRU_SIZE = int(os.environ.get('PLACES_LRU_SIZE', '2048'))
+    PLACES_LRU_TTL = int(os.environ.get('PLACES_LRU_TTL', '600'))             # プロセス内 LRU の保持秒数の上限
+    PLACES_HTTP_POOL_SIZE = int(os.environ.get('PLACES_HTTP_POOL_SIZE', '16'))
+    # Instagram 自動差分インポート（flask ig-auto-import）
+    IG_AUTO_IMPORT_CONCURRENCY = int(os.environ.get('IG_AUTO_IMPORT_CONCURRENCY', '4'))    # 全ワーカー合計の同時実行数
+    IG_AUTO_IMPORT_JITTER = int(os.environ.get('IG_AUTO_IMPORT_JITTER', '900'))            # 開始時刻をずらす最大秒数
+    IG_AUTO_IMPORT_RETRY_DELAY = int(os.environ.get('IG_AUTO_IMPORT_RETRY_DELAY', '60'))   # 枠が空いていないときの再投入
+    IG_AUTO_IMPORT_LEASE = int(os.environ.get('IG_AUTO_IMPORT_LEASE', '600'))              # 枠のリース秒数（ジョブのタイムアウト）
+    IG_AUTO_IMPORT_LOOKBACK_DAYS = int(os.environ.get('IG_AUTO_IMPORT_LOOKBACK_DAYS', '30'))  # 初回の取得期間
+    IG_AUTO_IMPORT_COOLDOWN = int(os.environ.get('IG_AUTO_IMPORT_COOLDOWN', '3600'))       # 利用制限に当たったトークンの待ち時間
+    IG_APP_USAGE_COOLDOWN_PCT = int(os.environ.get('IG_APP_USAGE_COOLDOWN_PCT', '90'))     # X-App-Usage がこの%を超えたら待つ
+    # Instagram 投稿の取得（一覧は最小フィールド、残った投稿だけ本文を取り直す）
+    IG_PAGE_LIMIT = int(os.environ.get('IG_PAGE_LIMIT', '100'))
+    IG_HYDRATE_PER_POST_MAX = int(os.environ.get('IG_HYDRATE_PER_POST_MAX', '5'))  # これを超えたらページごと取り直す
+    IG_HYDRATE_CONCURRENCY = int(os.environ.get('IG_HYDRATE_CONCURRENCY', '8'))
+    IG_FETCH_RETRIES = int(os.environ.get('IG_FETCH_RETRIES', '3'))               # 5xx・利用制限の再試行回数
+    IG_FETCH_BACKOFF = float(os.environ.get('IG_FETCH_BACKOFF', '1.0'))           # 再試行の初回待ち秒数（指数で増やす）
+    # OpenAI のレート上限の初期値（レスポンスの x-ratelimit-* ヘッダを受け取ったらそちらに追従）
+    OPENAI_RPM_LIMIT = int(os.environ.get('OPENAI_RPM_LIMIT', '500'))
+    OPENAI_TPM_LIMIT = int(os.environ.get('OPENAI_TPM_LIMIT', '30000'))
     
     # Wallet/Analytics 設定
     WALLET_TZ = os.environ.get('WALLET_TZ', 'Asia/Tokyo')
@@ -120,6 +185,27 @@ class Config:
     WALLET_CREATOR_DAILY_CAP = float(os.environ.get('WALLET_CREATOR_DAILY_CAP', '20000'))
     WALLET_BURST_FACTOR = float(os.environ.get('WALLET_BURST_FACTOR', '3.0'))
     WALLET_BURST_CAP_REDUCTION = float(os.environ.get('WALLET_BURST_CAP_REDUCTION', '0.20'))  # 20%
+    # ビーコン取り込み: direct=リクエスト毎にINSERT, buffered=Redisに積んでドレインワーカーでバッチINSERT
+    WALLET_INGEST_MODE = os.environ.get('WALLET_INGEST_MODE', 'direct')
+    WALLET_INGEST_BUFFER_MAX = int(os.environ.get('WALLET_INGEST_BUFFER_MAX', '100000'))  # 超えたら直接INSERTに切替
+    WALLET_INGEST_BATCH_SIZE = int(os.environ.get('WALLET_INGEST_BATCH_SIZE', '500'))
+    WALLET_INGEST_DEDUPE_TTL = int(os.environ.get('WALLET_INGEST_DEDUPE_TTL', '86400'))  # event_id 重複排除の保持秒数
+    WALLET_INGEST_UID_RETAIN_DAYS = int(os.environ.get('WALLET_INGEST_UID_RETAIN_DAYS', '7'))  # event_log_uid の保持日数
+    # 日次集計モード: full=event_logから再計算, incremental=creator_daily_live（差分積み上げ）から確定
+    WALLET_AGGREGATION_MODE = os.environ.get('WALLET_AGGREGATION_MODE', 'full')
+    WALLET_DAILY_SHARDS = int(os.environ.get('WALLET_DAILY_SHARDS', '1'))  # 日次集計の並列シャード数（DBプール上限未満にする）
+    WALLET_ROLLUP_SETTLE_SECONDS = int(os.environ.get('WALLET_ROLLUP_SETTLE_SECONDS', '120'))  # 採番後この秒数経過した id までを処理
+    WALLET_ROLLUP_BATCH_EVENTS = int(os.environ.get('WALLET_ROLLUP_BATCH_EVENTS', '200000'))
+    WALLET_ROLLUP_RETAIN_DAYS = int(os.environ.get('WALLET_ROLLUP_RETAIN_DAYS', '40'))  # クリックキー/度数分布の保持日数
+    # ユニーククリック数: 取り込み時に Redis HLL へ登録し、WALLET_CLICK_COUNT_SOURCE=hll なら日次集計（full）で推定値を使う
+    WALLET_CLICK_HLL_ENABLED = os.environ.get('WALLET_CLICK_HLL_ENABLED', 'true').lower() in ['true', 'on', '1']
+    WALLET_CLICK_HLL_TTL_DAYS = int(os.environ.get('WALLET_CLICK_HLL_TTL_DAYS', '40'))
+    WALLET_CLICK_COUNT_SOURCE = os.environ.get('WALLET_CLICK_COUNT_SOURCE', 'sql')  # 'sql' | 'hll'
+    # event_log 月次パーティション: 先行作成する月数 / 保持する月数（0 = 切り離さない）
+    WALLET_EVENT_LOG_MONTHS_AHEAD = int(os.environ.get('WALLET_EVENT_LOG_MONTHS_AHEAD', '3'))
+    WALLET_EVENT_LOG_RETAIN_MONTHS = int(os.environ.get('WALLET_EVENT_LOG_RETAIN_MONTHS', '0'))
+    # /api/wallet/trends の Redis キャッシュ保持秒数（キーは確定処理のウォーターマークを含むので古い値は返らない）
+    WALLET_TRENDS_CACHE_TTL = int(os.environ.get('WALLET_TRENDS_CACHE_TTL', '86400'))
 
     # Stripe/Wallet Payout 設定
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
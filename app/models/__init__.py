@@ -8,6 +8,10 @@ from .sent_message import SentMessage
 from .import_history import ImportHistory
 from .import_progress import ImportProgress 
 from .spot_provider_id import SpotProviderId
-from .event_log import EventLog
+from .event_log import EventLog, EventLogUid
 from .wallet import CreatorDaily, CreatorMonthly, PayoutLedger, PayoutTransaction, RateOverride
-from .payments import StripeAccount, Withdrawal, Transfer, Payout, LedgerEntry, AuditLog
\ No newline at end of file
+from .wallet import CreatorDailyLive, CreatorDailyClickKey, CreatorDailyPriceHist, CreatorMonthlyPriceHist, WalletRollupState
+from .wallet import CreatorDailyShadow, CreatorDailyStaging, WalletReplayDay, CreatorBalance
+from .payments import StripeAccount, Withdrawal, Transfer, Payout, LedgerEntry, AuditLog
+from .llm_cache import LlmCacheEntry
+from .place_type_category import PlaceTypeCategory
\ No newline at end of file
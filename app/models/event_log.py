@@ -1,14 +1,22 @@
 from datetime import datetime
-from sqlalchemy import Index, CheckConstraint
+from sqlalchemy import DDL, Index, CheckConstraint, event
 from sqlalchemy.dialects.postgresql import INET
 from app import db
 
 
 class EventLog(db.Model):
+    """生イベント。created_at の月単位で RANGE パーティション化されている。
+
+    パーティションキーは一意制約に含める必要があるため、PK は (id, created_at)。
+    月次パーティションの作成/切り離しは app/services/event_partitions.py（CLI: wallet-partitions）。
+    クライアント採番の event_id の重複排除は受信時刻に依存しない EventLogUid で行う。
+    """
     __tablename__ = 'event_log'
 
-    id = db.Column(db.BigInteger, primary_key=True)
-    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    # 冪等キー（クライアント採番の event_id、無ければサーバー採番）。バッファ経由の再送を重複排除する
+    event_uid = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), primary_key=True, nullable=False, default=datetime.utcnow)
 
     # クリエイター（=既存ユーザー）と対象ページ（v1はスポット詳細のみ）
     user_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -48,9 +56,35 @@ class EventLog(db.Model):
         Index('ix_event_log_user_created_at', 'user_id', 'created_at'),
         Index('ix_event_log_event_type_created_at', 'event_type', 'created_at'),
         Index('ix_event_log_user_page_event_created_at', 'user_id', 'page_id', 'event_type', 'created_at'),
+        # (event_uid, created_at) はバッファの再投入（created_at が同じ）用。クライアントの再送は EventLogUid で弾く
+        Index('ux_event_log_event_uid', 'event_uid', 'created_at', unique=True),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
     )
 
     def __repr__(self) -> str:
         return f"<EventLog id={self.id} user_id={self.user_id} page_id={self.page_id} type={self.event_type}>"
 
 
+# db.create_all() で作った場合もパーティション無しで INSERT が失敗しないよう、default パーティションを付ける
+# （月次パーティションは wallet-partitions が作成し、default に落ちた行を移送する）
+event.listen(
+    EventLog.__table__,
+    'after_create',
+    DDL("CREATE TABLE IF NOT EXISTS event_log_default PARTITION OF event_log DEFAULT").execute_if(dialect='postgresql'),
+)
+
+
+class EventLogUid(db.Model):
+    """クライアント採番の event_id の重複排除表（パーティション無し）。
+
+    event_log の一意キーは created_at（受信時刻）を含むため、時間を置いた再送は衝突しない。
+    event_log への INSERT と同じトランザクションでここに ON CONFLICT DO NOTHING で入れ、
+    入らなかった event_id の行は捨てる。古い行は wallet-partitions が WALLET_INGEST_UID_RETAIN_DAYS で消す。
+    """
+    __tablename__ = 'event_log_uid'
+
+    event_uid = db.Column(db.String(64), primary_key=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self) -> str:
+        return f"<EventLogUid {self.event_uid}>"
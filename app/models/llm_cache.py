@@ -0,0 +1,29 @@
+from datetime import datetime
+from app import db
+
+
+class LlmCacheEntry(db.Model):
+    """LLM 応答の永続キャッシュ（Redis の下位層）。
+
+    key は model + プロンプト版 + 入力のハッシュ。プロンプト版を上げると旧行は参照されなくなり、
+    `flask llm-cache-prune` で期限切れと一緒に削除される。
+    """
+    __tablename__ = 'llm_cache'
+
+    key = db.Column(db.String(64), primary_key=True)             # sha256 hex
+    namespace = db.Column(db.String(50), nullable=False)         # 'caption_spots', 'place_category' など
+    model = db.Column(db.String(50), nullable=False)
+    prompt_version = db.Column(db.Integer, nullable=False)
+    value = db.Column(db.JSON, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    last_hit_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_llm_cache_expires_at', 'expires_at'),
+        db.Index('ix_llm_cache_namespace_version', 'namespace', 'prompt_version'),
+    )
+
+    def __repr__(self):
+        return f"<LlmCacheEntry {self.namespace} v{self.prompt_version} {self.key[:12]}>"
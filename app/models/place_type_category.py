@@ -0,0 +1,23 @@
+from datetime import datetime
+from app import db
+
+
+class PlaceTypeCategory(db.Model):
+    """Google Places の types → 日本語カテゴリの対応表。
+
+    types_key は単一の type（'cafe'）か、LLM で決めた組み合わせ（ソートしてカンマ区切り）。
+    priority が小さいほど具体的で、複数の type が当たったときに優先する。
+    version が app/services/place_categories.py の MAPPING_VERSION と違う行は使わない。
+    """
+    __tablename__ = 'place_type_categories'
+
+    types_key = db.Column(db.String(500), primary_key=True)
+    category = db.Column(db.String(50), nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=50)
+    source = db.Column(db.String(20), nullable=False, default='seed')  # 'seed' / 'llm' / 'manual'
+    version = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<PlaceTypeCategory {self.types_key} -> {self.category} ({self.source} v{self.version})>"
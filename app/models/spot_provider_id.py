@@ -14,6 +14,11 @@ class SpotProviderId(db.Model):
 
     spot = db.relationship('Spot', backref=db.backref('provider_ids', lazy=True, cascade='all, delete-orphan'))
 
+    __table_args__ = (
+        # 1スポット1プロバイダ1件（価格取得・has_offers はスポット単位でまとめて引く）
+        db.Index('ux_spot_provider_ids_spot_provider', 'spot_id', 'provider', unique=True),
+    )
+
     def __repr__(self):
         return f"<SpotProviderId spot={self.spot_id} provider={self.provider} external_id={self.external_id}>"
 
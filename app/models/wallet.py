@@ -1,5 +1,6 @@
 from datetime import datetime
 from sqlalchemy import Index, UniqueConstraint, CheckConstraint
+from sqlalchemy.dialects.postgresql import UUID
 from app import db
 
 
@@ -25,6 +26,57 @@ class CreatorDaily(db.Model):
     )
 
 
+class CreatorDailyShadow(db.Model):
+    """creator_daily と同じ形の検証用テーブル（wallet-replay --dry-run の書き込み先。本番の集計には使わない）。"""
+    __tablename__ = 'creator_daily_shadow'
+
+    day = db.Column(db.Date, nullable=False, primary_key=True)
+    user_id = db.Column(db.BigInteger, nullable=False, primary_key=True)
+
+    pv = db.Column(db.Integer, nullable=False, default=0)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    ctr = db.Column(db.Numeric(8, 6), nullable=False, default=0)
+    price_median = db.Column(db.Numeric(10, 2), nullable=True)
+    cpc_dynamic = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    ppv = db.Column(db.Numeric(10, 4), nullable=False, default=0)
+    ecmp = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    payout_day = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+
+class CreatorDailyStaging(db.Model):
+    """シャード並列の日次集計の書き込み先（上限/予算の適用前）。finalize のトランザクションで target の表へ移して消す。"""
+    __tablename__ = 'creator_daily_staging'
+
+    target = db.Column(db.String(32), nullable=False, primary_key=True)  # 移し先（creator_daily / creator_daily_shadow）
+    day = db.Column(db.Date, nullable=False, primary_key=True)
+    user_id = db.Column(db.BigInteger, nullable=False, primary_key=True)
+
+    pv = db.Column(db.Integer, nullable=False, default=0)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    ctr = db.Column(db.Numeric(8, 6), nullable=False, default=0)
+    price_median = db.Column(db.Numeric(10, 2), nullable=True)
+    cpc_dynamic = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    ppv = db.Column(db.Numeric(10, 4), nullable=False, default=0)
+    ecmp = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    payout_day = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    created_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+
+class WalletReplayDay(db.Model):
+    """wallet-replay のチェックポイント（run_id ごとの完了日）。再実行時は done の日を飛ばす。"""
+    __tablename__ = 'wallet_replay_days'
+
+    run_id = db.Column(db.String(128), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default='done')  # 'done' | 'failed'
+    seconds = db.Column(db.Numeric(10, 3), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    finished_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+
 class CreatorMonthly(db.Model):
     __tablename__ = 'creator_monthly'
 
@@ -86,3 +138,94 @@ class RateOverride(db.Model):
     updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
 
 
+
+
+class CreatorDailyLive(db.Model):
+    """event_log から差分で積み上げる (day, user_id) 単位の速報カウンタ（JST日）。
+
+    creator_daily は確定値、こちらは当日を含む暫定値。更新は app/services/wallet_rollup.py のみ。
+    """
+    __tablename__ = 'creator_daily_live'
+
+    day = db.Column(db.Date, nullable=False, primary_key=True)
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), nullable=False, primary_key=True)
+
+    pv = db.Column(db.BigInteger, nullable=False, default=0)
+    clicks = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_creator_daily_live_user_day', 'user_id', 'day'),
+    )
+
+
+class CreatorDailyClickKey(db.Model):
+    """ユニーククリック判定用のキー集合（md5(user, page, ota, session_or_client) を uuid で保持）。"""
+    __tablename__ = 'creator_daily_click_keys'
+
+    day = db.Column(db.Date, nullable=False, primary_key=True)
+    user_id = db.Column(db.BigInteger, nullable=False, primary_key=True)
+    click_key = db.Column(UUID(as_uuid=False), nullable=False, primary_key=True)
+
+
+class CreatorDailyPriceHist(db.Model):
+    """price_median の度数分布（app/utils/price_sketch.py の PRICE_BUCKET_YEN 幅）。マージ可能な中央値スケッチ。"""
+    __tablename__ = 'creator_daily_price_hist'
+
+    day = db.Column(db.Date, nullable=False, primary_key=True)
+    user_id = db.Column(db.BigInteger, nullable=False, primary_key=True)
+    bucket = db.Column(db.Integer, nullable=False, primary_key=True)
+    cnt = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class CreatorMonthlyPriceHist(db.Model):
+    """creator_daily_price_hist の月次版（月初日で保持）。日次分を削除した後も月の中央値を出せる。"""
+    __tablename__ = 'creator_monthly_price_hist'
+
+    month = db.Column(db.Date, nullable=False, primary_key=True)
+    user_id = db.Column(db.BigInteger, nullable=False, primary_key=True)
+    bucket = db.Column(db.Integer, nullable=False, primary_key=True)
+    cnt = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class WalletRollupState(db.Model):
+    """差分集計の処理済み位置（event_log.id のハイウォーターマーク）。
+
+    id は採番順にコミットされるとは限らないため、ある時点で観測した MAX(id) を
+    WALLET_ROLLUP_SETTLE_SECONDS 経過後に「確定位置」（settled_event_id）へ昇格させ、そこまでを処理する。
+    """
+    __tablename__ = 'wallet_rollup_state'
+
+    name = db.Column(db.String(64), primary_key=True)
+    last_event_id = db.Column(db.BigInteger, nullable=False, default=0)
+    settled_event_id = db.Column(db.BigInteger, nullable=False, default=0)
+    observed_max_id = db.Column(db.BigInteger, nullable=False, default=0)
+    observed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
+
+
+class CreatorBalance(db.Model):
+    """おさいふ残高のスナップショット（user 単位）。
+
+    出金可能額 = 前月まで未払い + 当月(昨日まで) − 申請中(拘束) − 当月支払済。
+    元テーブル（payout_ledger / creator_daily / withdrawals / payout_transactions / stripe_accounts）を
+    更新する処理が同じトランザクション内で app/services/wallet_balance.py の refresh を呼んで維持する。
+    """
+    __tablename__ = 'creator_balance'
+
+    user_id = db.Column(db.BigInteger, db.ForeignKey('users.id'), primary_key=True)
+    month = db.Column(db.Date, nullable=False)        # 当月（月初）
+    as_of_date = db.Column(db.Date, nullable=False)   # 当月分を含めた最終日（昨日）
+
+    unpaid_prev = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    current_month_ytd = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    month_estimated = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    on_hold = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    paid_this_month = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    withdrawable = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    has_stripe_account = db.Column(db.Boolean, nullable=False, default=False)
+    payouts_enabled = db.Column(db.Boolean, nullable=False, default=False)
+    payouts_ready = db.Column(db.Boolean, nullable=False, default=False)  # payouts_enabled かつ requirements 取得済み
+
+    updated_at = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import StripeAccount, Withdrawal, Transfer as WithdrawalTransfer, Payout as WithdrawalPayout, PayoutLedger
+from app.services.wallet_balance import refresh_wallet_balance
 import stripe
 from app.models.user import User
 from app.models.sent_message import SentMessage
@@ -80,6 +81,7 @@ def stripe_events():
                 acct.charges_enabled = bool(data.get('charges_enabled'))
                 acct.requirements_json = data.get('requirements')
                 acct.status = 'verified' if acct.payouts_enabled else 'restricted'
+                refresh_wallet_balance(acct.user_id)
                 db.session.commit()
 
         elif et == 'transfer.created':
@@ -137,11 +139,14 @@ def stripe_events():
                             ))
                     except Exception:
                         pass
+                    if w:
+                        refresh_wallet_balance(w.user_id)
                     db.session.commit()
                 else:
                     po.status = 'failed' if et == 'payout.failed' else 'canceled'
                     if w:
                         w.status = 'failed'
+                        refresh_wallet_balance(w.user_id)
                     db.session.commit()
 
     except Exception as e:
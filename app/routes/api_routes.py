@@ -1,8 +1,8 @@
 from flask import Blueprint, jsonify, current_app
 from flask_login import current_user, login_required
 from app import db
-from app.models import StripeAccount, Withdrawal, PayoutLedger, LedgerEntry
-from datetime import datetime, timedelta, timezone
+from app.models import StripeAccount, Withdrawal, LedgerEntry
+from datetime import datetime, timedelta
 import uuid
 
 # 先にブループリントを定義（以降のデコレータ参照のため）
@@ -13,58 +13,23 @@ api_bp = Blueprint('api_routes', __name__, url_prefix='/api')
 def request_withdrawal_full_amount():
     """おさいふの出金可能額を全額で申請。72時間クールダウンを設定。"""
     user_id = current_user.id
+    from app.services.wallet_balance import get_wallet_balance, refresh_wallet_balance
+
+    # 出金可能額（A案: 前月まで未払い + 当月(昨日まで) − on_hold − 当月支払済）
+    # 行ロックの上で元テーブルから再計算する（同時申請で二重に引き出せないように）
+    balance = get_wallet_balance(user_id, for_update=True)
 
     # KYC/受取設定チェック
-    acct = StripeAccount.query.filter_by(user_id=user_id).first()
-    if not (acct and acct.payouts_enabled and acct.requirements_json is not None):
+    if not balance['payouts_ready']:
+        db.session.commit()
         return jsonify({'error': 'payouts_not_enabled'}), 409
 
-    # 出金可能額（A案: 前月まで未払い + 当月(昨日まで) − on_hold − 当月支払済）
-    JST = timezone(timedelta(hours=9))
-    today_jst = datetime.now(JST).date()
-    this_month = _month_start(today_jst)
-    from_date = this_month
-    to_date = today_jst - timedelta(days=1)
-
-    # 前月までの未払い残
-    unpaid_prev = db.session.query(db.func.coalesce(db.func.sum(PayoutLedger.unpaid_balance), 0)) \
-        .filter(PayoutLedger.user_id == user_id) \
-        .filter(PayoutLedger.month < this_month) \
-        .scalar() or 0
-
-    # 当月の昨日までの確定日次合計
-    current_month_ytd = 0
-    if to_date >= from_date:
-        current_month_ytd = db.session.query(db.func.coalesce(db.func.sum(CreatorDaily.payout_day), 0)) \
-            .filter(CreatorDaily.user_id == user_id) \
-            .filter(CreatorDaily.day >= from_date) \
-            .filter(CreatorDaily.day <= to_date) \
-            .scalar() or 0
-
-    # 申請中・処理中（拘束）
-    hold_statuses = ['requested', 'pending_review', 'approved', 'transferring', 'payout_pending']
-    on_hold = db.session.query(db.func.coalesce(db.func.sum(Withdrawal.amount), 0)) \
-        .filter(Withdrawal.user_id == user_id) \
-        .filter(Withdrawal.status.in_(hold_statuses)) \
-        .scalar() or 0
-
-    # 当月すでに支払済み（着金済み）
-    from app.models import PayoutTransaction
-    from_month = this_month
-    next_month = _next_month_start(this_month)
-    paid_this_month = db.session.query(db.func.coalesce(db.func.sum(PayoutTransaction.amount), 0)) \
-        .filter(PayoutTransaction.user_id == user_id) \
-        .filter(PayoutTransaction.paid_at >= from_month) \
-        .filter(PayoutTransaction.paid_at < next_month) \
-        .scalar() or 0
-
-    amount = float(unpaid_prev) + float(current_month_ytd) - float(on_hold) - float(paid_this_month)
-    if amount < 0:
-        amount = 0
+    amount = balance['withdrawable']
 
     # 最小額チェック
     min_payout = current_app.config.get('MIN_PAYOUT_YEN', 1000)
     if amount < min_payout:
+        db.session.commit()
         return jsonify({'error': 'below_minimum', 'minimum': min_payout}), 400
 
     # 大型出金は審査キュー
@@ -94,6 +59,7 @@ def request_withdrawal_full_amount():
         ref_id=None
     ))
 
+    refresh_wallet_balance(user_id)
     db.session.commit()
     return jsonify({'withdrawal_id': w.id, 'status': w.status, 'cooldown_until_at': cooldown_until.isoformat()}), 202
 
@@ -123,7 +89,7 @@ import requests
 import logging
 from flask import jsonify, request, abort, Blueprint, current_app, redirect
 from app.models import Spot, Photo, SocialPost, ImportHistory, ImportProgress, User
-from app.models import CreatorDaily, CreatorMonthly, PayoutLedger, PayoutTransaction
+from app.models import CreatorDaily, PayoutTransaction
 from app.models import StripeAccount, Withdrawal, Transfer as WithdrawalTransfer, Payout as WithdrawalPayout, LedgerEntry
 import stripe
 from sqlalchemy.orm import joinedload
@@ -134,6 +100,7 @@ import re
 from datetime import datetime, timedelta
 from app.utils.instagram_helpers import extract_cursor_from_url, refresh_user_instagram_token_if_needed, validate_instagram_token
 from app.services.google_photos import get_google_photos_by_place_id
+from app.services import llm_cache, places_client
 from app.utils.rakuten_api import search_hotel, generate_rakuten_affiliate_url, select_best_hotel_with_evaluation, simple_hotel_search_for_manual, search_hotel_with_fallback
 from rq import Queue
 from redis import Redis
@@ -356,29 +323,17 @@ def place_details():
     if not place_id:
         return jsonify({'error': 'Place ID is required'}), 400
     
-    # 新しいGoogle Places API v1を呼び出す
-    url = f"https://places.googleapis.com/v1/places/{place_id}"
-    headers = {
-        'Content-Type': 'application/json',
-        'X-Goog-Api-Key': GOOGLE_MAPS_API_KEY,
-        'X-Goog-FieldMask': 'displayName,formattedAddress,location,types,photos,editorialSummary,reviewSummary',
-        'X-Goog-LanguageCode': 'ja',  # 日本語を指定（ヘッダー）
-        'User-Agent': 'my-map.link App (https://my-map.link)'
-    }
-    
-    print(f"Calling Google Places API v1 Details with URL: {url}")
-    print(f"Headers: {headers}")
-    
+    # 共有キャッシュ付きの Places クライアント経由で呼び出す（同じ place_id は API を叩かない）
     try:
-        # GETリクエストを使用
-        # ヘッダーだけでなく、クエリにも languageCode=ja を明示
-        response = requests.get(url, headers=headers, params={'languageCode': 'ja'})
-        print(f"Response status code: {response.status_code}")
-        data = response.json()
+        data = places_client.get_place(
+            place_id,
+            'displayName,formattedAddress,location,types,photos,editorialSummary,reviewSummary',
+            language='ja',
+        )
         print(f"Google Places API response: {data}")
-        
-        if response.status_code != 200:
-            error_message = data.get('error', {}).get('message', 'Unknown error')
+
+        if data is None:
+            error_message = 'Place not found or Places API error'
             print(f"API Error: {error_message}")
             
             # APIエラーの場合はモックデータを返す（開発用）
@@ -464,25 +419,13 @@ def place_details():
         
         # 常にsearchTextエンドポイントを使用して日本語の情報を取得
         # X-Goog-LanguageCodeヘッダーでは日本語が取得できないため
-        search_url = "https://places.googleapis.com/v1/places:searchText"
-        search_headers = {
-            'Content-Type': 'application/json',
-            'X-Goog-Api-Key': GOOGLE_MAPS_API_KEY,
-            'X-Goog-FieldMask': 'places.displayName,places.formattedAddress,places.types,places.addressComponents'
-        }
-        search_data = {
-            'textQuery': place_details['name'],  # 英語の名前で検索
-            'languageCode': 'ja',
-            'regionCode': 'jp'
-        }
-        
-        print(f"Calling searchText API with URL: {search_url}")
-        print(f"Search headers: {search_headers}")
-        print(f"Search data: {search_data}")
-        
-        search_response = requests.post(search_url, headers=search_headers, json=search_data)
-        if search_response.status_code == 200:
-            search_data = search_response.json()
+        places = places_client.search_text(
+            place_details['name'],  # 英語の名前で検索
+            'places.displayName,places.formattedAddress,places.types,places.addressComponents',
+            language='ja', region='jp',
+        )
+        if places is not None:
+            search_data = {'places': places}
             print(f"Search API response: {search_data}")
             
             if 'places' in search_data and len(search_data['places']) > 0:
@@ -602,30 +545,13 @@ def places_autocomplete():
     if not query or len(query) < 3:
         return jsonify([])
     
-    # 新しいGoogle Places API v1を呼び出す
-    url = "https://places.googleapis.com/v1/places:autocomplete"
-    headers = {
-        'Content-Type': 'application/json',
-        'X-Goog-Api-Key': GOOGLE_MAPS_API_KEY,
-        'X-Goog-FieldMask': 'suggestions.placePrediction.structuredFormat.mainText.text,suggestions.placePrediction.structuredFormat.secondaryText.text,suggestions.placePrediction.placeId',
-        'X-Goog-LanguageCode': 'ja',  # 日本語を指定
-        'User-Agent': 'my-map.link App (https://my-map.link)'
-    }
-    
-    data = {
-        'input': query,
-        'languageCode': 'ja',  # 日本語を指定
-        'regionCode': 'jp'     # 日本の地域コードを指定
-    }
-    
-    print(f"Calling Google Places API v1 with URL: {url}")
-    print(f"Headers: {headers}")
-    print(f"Request data: {data}")
-    
     try:
-        response = requests.post(url, headers=headers, json=data)
-        print(f"Response status code: {response.status_code}")
-        response_data = response.json()
+        suggestions = places_client.autocomplete(
+            query,
+            'suggestions.placePrediction.structuredFormat.mainText.text,suggestions.placePrediction.structuredFormat.secondaryText.text,suggestions.placePrediction.placeId',
+            language='ja', region='jp',
+        )
+        response_data = {'suggestions': suggestions} if suggestions else {}
         print(f"Google Places API response: {response_data}")
         
         if 'suggestions' not in response_data:
@@ -866,58 +792,12 @@ def _next_month_start(d):
 def wallet_summary():
     user_id = current_user.id
 
-    from datetime import datetime, timedelta, timezone
-    JST = timezone(timedelta(hours=9))
-    today_jst = datetime.now(JST).date()
-    this_month = _month_start(today_jst)
-    last_month = _month_start(this_month - timedelta(days=1))
-
-    # A案の式で申請可能額（=表示額）を算出
-    from_date = this_month
-    to_date = today_jst - timedelta(days=1)
+    from app.services.wallet_balance import get_wallet_balance
 
-    unpaid_prev = db.session.query(db.func.coalesce(db.func.sum(PayoutLedger.unpaid_balance), 0)) \
-        .filter(PayoutLedger.user_id == user_id) \
-        .filter(PayoutLedger.month < this_month) \
-        .scalar() or 0
-
-    current_month_ytd = 0
-    if to_date >= from_date:
-        current_month_ytd = db.session.query(db.func.coalesce(db.func.sum(CreatorDaily.payout_day), 0)) \
-            .filter(CreatorDaily.user_id == user_id) \
-            .filter(CreatorDaily.day >= from_date) \
-            .filter(CreatorDaily.day <= to_date) \
-            .scalar() or 0
-
-    hold_statuses = ['requested', 'pending_review', 'approved', 'transferring', 'payout_pending']
-    on_hold = db.session.query(db.func.coalesce(db.func.sum(Withdrawal.amount), 0)) \
-        .filter(Withdrawal.user_id == user_id) \
-        .filter(Withdrawal.status.in_(hold_statuses)) \
-        .scalar() or 0
-
-    from app.models import PayoutTransaction
-    next_month = _next_month_start(this_month)
-    paid_this_month = db.session.query(db.func.coalesce(db.func.sum(PayoutTransaction.amount), 0)) \
-        .filter(PayoutTransaction.user_id == user_id) \
-        .filter(PayoutTransaction.paid_at >= this_month) \
-        .filter(PayoutTransaction.paid_at < next_month) \
-        .scalar() or 0
-
-    withdrawable = float(unpaid_prev) + float(current_month_ytd) - float(on_hold) - float(paid_this_month)
-    if withdrawable < 0:
-        withdrawable = 0
-
-    # 受取可フラグ（KYC/口座完了判定）
-    acct = StripeAccount.query.filter_by(user_id=user_id).first()
-    has_stripe_account = bool(acct) if acct else False
-    payouts_enabled = bool(acct.payouts_enabled) if acct else False
-
-    # this_month_estimated: 当月の Σ payout_day
-    estimated = db.session.query(db.func.coalesce(db.func.sum(CreatorDaily.payout_day), 0)) \
-        .filter(CreatorDaily.user_id == user_id) \
-        .filter(CreatorDaily.day >= this_month) \
-        .filter(CreatorDaily.day < _next_month_start(this_month)) \
-        .scalar() or 0
+    # 申請可能額（=表示額）は creator_balance のスナップショットから読む（A案の式は wallet_balance に一本化）
+    balance = get_wallet_balance(user_id)
+    db.session.commit()
+    this_month = balance['month']
 
     # next_payout_date: 翌月末（JST）
     from calendar import monthrange
@@ -926,15 +806,15 @@ def wallet_summary():
     next_payout_date = nm.replace(day=last_day)
 
     return jsonify({
-        'withdrawable_balance': round(float(withdrawable), 0),
-        'this_month_estimated': round(float(estimated), 0),
+        'withdrawable_balance': round(float(balance['withdrawable']), 0),
+        'this_month_estimated': round(float(balance['month_estimated']), 0),
         'minimum_payout_yen': int(current_app.config.get('MIN_PAYOUT_YEN', 1000)),
-        'payouts_enabled': payouts_enabled,
-        'has_stripe_account': has_stripe_account,
-        'on_hold': round(float(on_hold), 0),
+        'payouts_enabled': balance['payouts_enabled'],
+        'has_stripe_account': balance['has_stripe_account'],
+        'on_hold': round(float(balance['on_hold']), 0),
         'next_payout_date': next_payout_date.isoformat(),
         'last_closed_month': this_month.isoformat(),
-        'as_of_date': (today_jst - timedelta(days=1)).isoformat(),
+        'as_of_date': balance['as_of_date'].isoformat(),
         'as_of_label': '昨日までの額を反映'
     })
 
@@ -969,72 +849,87 @@ def wallet_current():
         .order_by(desc(CreatorDaily.day)).first()
     cpc_dynamic = float(last_daily.cpc_dynamic) if last_daily and last_daily.cpc_dynamic is not None else 0.0
 
+    # 未確定日（当日など）は速報カウンタから加算。収益は直近確定日の PPV で概算する
+    from app.models import CreatorDailyLive
+    finalized_days = db.session.query(CreatorDaily.day).filter(
+        CreatorDaily.user_id == user_id,
+        CreatorDaily.day >= this_month,
+        CreatorDaily.day < _next_month_start(this_month)
+    )
+    live = db.session.query(
+        db.func.coalesce(db.func.sum(CreatorDailyLive.pv), 0),
+        db.func.coalesce(db.func.sum(CreatorDailyLive.clicks), 0),
+        db.func.max(CreatorDailyLive.updated_at)
+    ).filter(
+        CreatorDailyLive.user_id == user_id,
+        CreatorDailyLive.day >= this_month,
+        CreatorDailyLive.day < _next_month_start(this_month),
+        ~CreatorDailyLive.day.in_(finalized_days)
+    ).first()
+    live_pv, live_clicks, live_updated_at = live
+
+    # 価格中央値は月次/日次スケッチのマージで求める（日次中央値の中央値ではなく、当月の全価格の中央値）
+    from app.services.wallet_rollup import price_sketch_for_range
+    sketch_median = price_sketch_for_range(user_id, this_month, today_jst).median()
+    if sketch_median is not None:
+        price_median = sketch_median
+    last_ppv = float(last_daily.ppv) if last_daily and last_daily.ppv is not None else 0.0
+    live_revenue = float(live_pv or 0) * last_ppv
+
     return jsonify({
         'month': this_month.isoformat(),
-        'pv': int(pv or 0),
-        'clicks': int(clicks or 0),
-        'estimated_revenue': round(float(revenue or 0), 0),
+        'pv': int(pv or 0) + int(live_pv or 0),
+        'clicks': int(clicks or 0) + int(live_clicks or 0),
+        'estimated_revenue': round(float(revenue or 0) + live_revenue, 0),
         'ctr': float(ctr or 0),
         'ecpm': round(float(ecpm or 0)),
         'price_median': float(price_median or 0) if price_median is not None else 0,
-        'cpc_dynamic': cpc_dynamic
+        'cpc_dynamic': cpc_dynamic,
+        'live': {
+            'pv': int(live_pv or 0),
+            'clicks': int(live_clicks or 0),
+            'estimated_revenue': round(live_revenue, 0),
+            'updated_at': live_updated_at.isoformat() if live_updated_at else None,
+        }
     })
 
 
 @api_bp.route('/wallet/trends', methods=['GET'])
 @login_required
 def wallet_trends():
-    user_id = current_user.id
-    from datetime import datetime, timedelta, timezone
-    JST = timezone(timedelta(hours=9))
-    today_jst = datetime.now(JST).date()
-    this_month = _month_start(today_jst)
-    months_param = request.args.get('months', default=3, type=int)
-
-    months = []
-    pv_list, clicks_list, revenue_list = [], [], []
+    """PV/クリック/収益の推移。?months=N（当月を含む）&granularity=month|week|day
 
-    # 過去n-1か月: creator_monthly、当月: creator_daily
-    for i in range(months_param):
-        m_start = _month_start(this_month - timedelta(days=1)) if i == months_param - 1 else _month_start(this_month - timedelta(days=30*(months_param-1-i)))
-    
-    # 正確に直近nヶ月を生成
-    months_seq = []
-    cur = _month_start(this_month - timedelta(days=1))  # 前月初
-    for _ in range(months_param - 1):
-        months_seq.append(cur)
-        cur = _month_start(cur - timedelta(days=1))
-    months_seq = list(reversed(months_seq)) + [this_month]
-
-    for m in months_seq:
-        if m == this_month:
-            # 当月: daily 合算
-            q = db.session.query(
-                db.func.coalesce(db.func.sum(CreatorDaily.pv), 0),
-                db.func.coalesce(db.func.sum(CreatorDaily.clicks), 0),
-                db.func.coalesce(db.func.sum(CreatorDaily.payout_day), 0),
-            ).filter(
-                CreatorDaily.user_id == user_id,
-                CreatorDaily.day >= this_month,
-                CreatorDaily.day < _next_month_start(this_month)
-            ).first()
-            pv, clicks, revenue = q
+    1文の SQL で取得し、確定処理のウォーターマークから作る ETag で 304 を返す（結果は Redis にも保持）。
+    """
+    user_id = current_user.id
+    from app.services.wallet_trends import (
+        GRANULARITIES, MAX_MONTHS, aggregation_watermark, cached_trend_series, trends_etag,
+    )
+    months_param = max(1, min(request.args.get('months', default=3, type=int) or 3, MAX_MONTHS))
+    granularity = request.args.get('granularity', default='month')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': 'invalid_granularity', 'allowed': sorted(GRANULARITIES)}), 400
+
+    etag = trends_etag(user_id, months_param, granularity, aggregation_watermark())
+    if request.if_none_match and etag in request.if_none_match:
+        resp = current_app.response_class(status=304)
+    else:
+        data = cached_trend_series(user_id, months_param, granularity, etag)
+        payload = {
+            'granularity': granularity,
+            'pv': data['pv'],
+            'clicks': data['clicks'],
+            'revenue': data['revenue'],
+            'revenue_cumulative': data['revenue_cumulative'],
+        }
+        if granularity == 'month':
+            payload['months'] = data['buckets']
         else:
-            cm = CreatorMonthly.query.filter_by(user_id=user_id, month=m).first()
-            pv = int(cm.pv) if cm else 0
-            clicks = int(cm.clicks) if cm else 0
-            revenue = float(cm.payout_month) if cm else 0
-        months.append(m.isoformat())
-        pv_list.append(int(pv or 0))
-        clicks_list.append(int(clicks or 0))
-        revenue_list.append(round(float(revenue or 0), 0))
-
-    return jsonify({
-        'months': months,
-        'pv': pv_list,
-        'clicks': clicks_list,
-        'revenue': revenue_list
-    })
+            payload['buckets'] = data['buckets']
+        resp = jsonify(payload)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
 
 
 @api_bp.route('/wallet/payouts', methods=['GET'])
@@ -1261,71 +1156,80 @@ def analyze_instagram_posts():
             }}
             """
             
-            print("DEBUG: Calling OpenAI API")
-            try:
-                # タイムアウト付きでAPIを呼び出す
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    response_format={"type": "json_object"},
-                    messages=[
-                        {"role": "system", "content": "あなたはInstagramの投稿からスポット情報を抽出する専門家です。日本語のキャプションから場所名を正確に抽出してください。"},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=500  # トークン数を制限
-                )
-                print(f"DEBUG: OpenAI API response received")
-            except Exception as openai_error:
-                print(f"DEBUG: OpenAI API error: {str(openai_error)}")
-                # エラーが発生した場合でも処理を続行
-                # 位置情報があれば使用
-                location = post.get('location', {})
-                if location and 'name' in location:
-                    spot_name = location.get('name')
-                    print(f"DEBUG: Using location from post metadata: {spot_name}")
+            # 同じキャプションの抽出結果は llm_cache から返す（プロンプトが取り込みジョブと違うので namespace は別）
+            cached_names = llm_cache.get('caption_spots_analyze', 'gpt-4o', caption)
+            if cached_names is None:
+                print("DEBUG: Calling OpenAI API")
+                try:
+                    # タイムアウト付きでAPIを呼び出す
+                    response = client.chat.completions.create(
+                        model="gpt-4o",
+                        response_format={"type": "json_object"},
+                        messages=[
+                            {"role": "system", "content": "あなたはInstagramの投稿からスポット情報を抽出する専門家です。日本語のキャプションから場所名を正確に抽出してください。"},
+                            {"role": "user", "content": prompt}
+                        ],
+                        max_tokens=500  # トークン数を制限
+                    )
+                    print(f"DEBUG: OpenAI API response received")
+                except Exception as openai_error:
+                    print(f"DEBUG: OpenAI API error: {str(openai_error)}")
+                    # エラーが発生した場合でも処理を続行
+                    # 位置情報があれば使用
+                    location = post.get('location', {})
+                    if location and 'name' in location:
+                        spot_name = location.get('name')
+                        print(f"DEBUG: Using location from post metadata: {spot_name}")
                     
-                    # 位置情報からスポット候補を追加
-                    spot_candidate = {
-                        'name': spot_name,
-                        'formatted_address': '',
-                        'instagram_post_id': post.get('id'),
-                        'instagram_permalink': post.get('permalink'),
-                        'instagram_caption': caption[:100] + "..." if len(caption) > 100 else caption,
-                        'timestamp': post.get('timestamp')  # タイムスタンプを明示的に追加
-                    }
-                    spot_candidates.append(spot_candidate)
-                    print(f"DEBUG: Added spot candidate from location metadata: {spot_name}")
+                        # 位置情報からスポット候補を追加
+                        spot_candidate = {
+                            'name': spot_name,
+                            'formatted_address': '',
+                            'instagram_post_id': post.get('id'),
+                            'instagram_permalink': post.get('permalink'),
+                            'instagram_caption': caption[:100] + "..." if len(caption) > 100 else caption,
+                            'timestamp': post.get('timestamp')  # タイムスタンプを明示的に追加
+                        }
+                        spot_candidates.append(spot_candidate)
+                        print(f"DEBUG: Added spot candidate from location metadata: {spot_name}")
                 
-                continue
+                    continue
+            else:
+                current_app.logger.debug("caption cache hit (llm_cache caption_spots_analyze)")
             
             try:
-                # レスポンスからスポット名のリストを取得
-                content = response.choices[0].message.content
-                print(f"DEBUG: OpenAI response content: {content}")
-                result = json.loads(content)
-                print(f"DEBUG: Parsed JSON result: {result}")
+                if isinstance(cached_names, list):
+                    spot_names = list(cached_names)
+                else:
+                    # レスポンスからスポット名のリストを取得
+                    content = response.choices[0].message.content
+                    print(f"DEBUG: OpenAI response content: {content}")
+                    result = json.loads(content)
+                    print(f"DEBUG: Parsed JSON result: {result}")
                 
-                # スポット名を抽出（様々な形式に対応）
-                spot_names = []
+                    # スポット名を抽出（様々な形式に対応）
+                    spot_names = []
                 
-                # 辞書型の場合
-                if isinstance(result, dict):
-                    # 辞書の値を確認
-                    for key, value in result.items():
-                        # リスト型の値の場合
-                        if isinstance(value, list):
-                            spot_names.extend(value)
-                        # 文字列型の値の場合（キーがerrorでない場合のみ）
-                        elif isinstance(value, str) and not key.lower() in ['error', 'エラー']:
-                            spot_names.append(value)
-                        # 辞書型の値の場合（再帰的に処理）
-                        elif isinstance(value, dict):
-                            for sub_key, sub_value in value.items():
-                                if isinstance(sub_value, str) and not sub_key.lower() in ['error', 'エラー']:
-                                    spot_names.append(sub_value)
+                    # 辞書型の場合
+                    if isinstance(result, dict):
+                        # 辞書の値を確認
+                        for key, value in result.items():
+                            # リスト型の値の場合
+                            if isinstance(value, list):
+                                spot_names.extend(value)
+                            # 文字列型の値の場合（キーがerrorでない場合のみ）
+                            elif isinstance(value, str) and not key.lower() in ['error', 'エラー']:
+                                spot_names.append(value)
+                            # 辞書型の値の場合（再帰的に処理）
+                            elif isinstance(value, dict):
+                                for sub_key, sub_value in value.items():
+                                    if isinstance(sub_value, str) and not sub_key.lower() in ['error', 'エラー']:
+                                        spot_names.append(sub_value)
                 
-                # リスト型の場合
-                elif isinstance(result, list):
-                    spot_names = result
+                    # リスト型の場合
+                    elif isinstance(result, list):
+                        spot_names = result
+                    llm_cache.put('caption_spots_analyze', 'gpt-4o', caption, spot_names)
                 
                 print(f"DEBUG: Extracted spot names: {spot_names}")
                 
@@ -2091,6 +1995,8 @@ def start_instagram_import():
     data = request.get_json() or {}
     start_date = data.get('start_date')
     end_date = data.get('end_date')
+    # 差分インポート: 前回取り込んだ最新投稿まででページングを止める
+    incremental = bool(data.get('incremental'))
     user_id = current_user.id  # ログイン中のユーザーIDを使用
 
     if not all([start_date, end_date]):
@@ -2152,11 +2058,15 @@ def start_instagram_import():
         if progress:
             # 既存のレコードがあれば更新（実行中でない場合のみここに到達）
             progress.job_id = job_id
-            progress.status = 'pending'
             progress.import_period_start = datetime.fromisoformat(start_date)
             progress.import_period_end = datetime.fromisoformat(end_date)
             progress.error_info = None
-            progress.result_data = None
+            # 差分インポートが途中で落ちていたら（カーソルが残っている）、途中結果とカーソルを残して再開させる
+            resume = incremental and progress.next_page_cursor and progress.status in ('failed', 'processing')
+            if not resume:
+                progress.result_data = None
+                progress.next_page_cursor = None
+            progress.status = 'pending'
         else:
             # 新しいジョブエントリをDBに作成
             progress = ImportProgress(
@@ -2174,7 +2084,7 @@ def start_instagram_import():
         # タスクをキューに追加
         q.enqueue(
             fetch_and_analyze_posts,
-            args=[job_id, user_id, start_date, end_date],
+            args=[job_id, user_id, start_date, end_date, incremental],
             job_timeout=600, # 10分でタイムアウト
             job_id=job_id
         )
@@ -2209,6 +2119,9 @@ def get_import_status(job_id):
         
         if progress.status == 'completed':
             response_data['result_data'] = json.loads(progress.result_data) if progress.result_data else {}
+        elif progress.status == 'processing' and progress.result_data:
+            # パイプライン処理中の途中結果（partial=True）。補完済みの候補から順に増えていく
+            response_data['result_data'] = json.loads(progress.result_data)
         elif progress.status == 'failed':
             response_data['error_info'] = progress.error_info
             
@@ -2530,54 +2443,26 @@ def manual_rakuten_search():
 @api_bp.route('/wallet/ingest/view', methods=['POST'])
 def ingest_view():
     try:
+        from app.services.event_ingest import build_event_record, ingest_event
         data = request.get_json() or {}
         user_id = int(data.get('user_id'))  # クリエイターID（公開ページ側で埋め込む）
         page_id = int(data.get('page_id'))  # spot.id
-        client_id = data.get('client_id')   # 1st-party cookie（生）
-        session_id = data.get('session_id') # 30分スライディング
-        user_agent = request.headers.get('User-Agent', '')
-        ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-        referrer = request.referrer
         dwell_ms = int(data.get('dwell_ms') or 0)
-        price_median = data.get('price_median')
-
-        # Bot簡易判定
-        ua = (user_agent or '').lower()
-        bot_keywords = ['bot', 'crawl', 'spider', 'headless', 'selenium', 'python', 'curl', 'wget']
-        is_bot = any(k in ua for k in bot_keywords) or 'headlesschrome' in ua
-        bot_reason = None
-        if is_bot:
-            bot_reason = 'ua'
-        if dwell_ms < 3000:
-            # viewとしては無効だが、生ログは残す
-            pass
-
-        # client_key = HMAC_SHA256(salt, client_id)（生は保存しない）
-        client_key = None
-        if client_id:
-            import hmac, hashlib
-            salt = current_app.config.get('SECRET_KEY', 'salt')
-            client_key = hmac.new(salt.encode('utf-8'), client_id.encode('utf-8'), hashlib.sha256).hexdigest()
-
-        from app.models import EventLog
-        from sqlalchemy.dialects.postgresql import INET
-        ev = EventLog(
-            user_id=user_id,
-            page_id=page_id,
-            event_type='view',
-            client_key=client_key,
-            session_id=session_id,
-            user_agent=user_agent,
-            ip=ip,
-            referrer=referrer,
+        # dwell_ms < 3000 は view としては無効だが、生ログは残す（集計側で除外）
+
+        record = build_event_record(
+            'view', user_id, page_id,
+            client_id=data.get('client_id'),    # 1st-party cookie（生）
+            session_id=data.get('session_id'),  # 30分スライディング
+            user_agent=request.headers.get('User-Agent', ''),
+            ip=request.headers.get('X-Forwarded-For', request.remote_addr),
+            referrer=request.referrer,
             dwell_ms=dwell_ms,
-            price_median=price_median,
-            is_bot=is_bot,
-            bot_reason=bot_reason,
+            price_median=data.get('price_median'),
+            event_id=data.get('event_id'),
         )
-        db.session.add(ev)
-        db.session.commit()
-        return jsonify({'ok': True})
+        status = ingest_event(record)
+        return jsonify({'ok': True, 'status': status})
     except Exception as e:
         db.session.rollback()
         return jsonify({'ok': False, 'error': str(e)}), 400
@@ -2586,46 +2471,23 @@ def ingest_view():
 @api_bp.route('/wallet/ingest/click', methods=['POST'])
 def ingest_click():
     try:
+        from app.services.event_ingest import build_event_record, ingest_event
         data = request.get_json() or {}
         user_id = int(data.get('user_id'))
         page_id = int(data.get('page_id'))
-        ota = data.get('ota')
-        client_id = data.get('client_id')
-        session_id = data.get('session_id')
-        user_agent = request.headers.get('User-Agent', '')
-        ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-        referrer = request.referrer
-
-        # client_key生成
-        client_key = None
-        if client_id:
-            import hmac, hashlib
-            salt = current_app.config.get('SECRET_KEY', 'salt')
-            client_key = hmac.new(salt.encode('utf-8'), client_id.encode('utf-8'), hashlib.sha256).hexdigest()
-
-        # Bot簡易判定
-        ua = (user_agent or '').lower()
-        bot_keywords = ['bot', 'crawl', 'spider', 'headless', 'selenium', 'python', 'curl', 'wget']
-        is_bot = any(k in ua for k in bot_keywords) or 'headlesschrome' in ua
-        bot_reason = 'ua' if is_bot else None
-
-        from app.models import EventLog
-        ev = EventLog(
-            user_id=user_id,
-            page_id=page_id,
-            ota=ota,
-            event_type='click',
-            client_key=client_key,
-            session_id=session_id,
-            user_agent=user_agent,
-            ip=ip,
-            referrer=referrer,
-            is_bot=is_bot,
-            bot_reason=bot_reason,
+
+        record = build_event_record(
+            'click', user_id, page_id,
+            ota=data.get('ota'),
+            client_id=data.get('client_id'),
+            session_id=data.get('session_id'),
+            user_agent=request.headers.get('User-Agent', ''),
+            ip=request.headers.get('X-Forwarded-For', request.remote_addr),
+            referrer=request.referrer,
+            event_id=data.get('event_id'),
         )
-        db.session.add(ev)
-        db.session.commit()
-        return jsonify({'ok': True})
+        status = ingest_event(record)
+        return jsonify({'ok': True, 'status': status})
     except Exception as e:
         db.session.rollback()
         return jsonify({'ok': False, 'error': str(e)}), 400
@@ -2634,43 +2496,30 @@ def ingest_click():
 @api_bp.route('/wallet/r/<string:ota>')
 def wallet_redirect(ota: str):
     """クリック計測用リダイレクト。
-    クエリ: user_id, page_id, url (エンコード済み)
+    クエリ: user_id, page_id, url (エンコード済み), sid, cid, eid（任意のイベントID）
     """
     try:
+        from app.services.event_ingest import build_event_record, ingest_event
         user_id = int(request.args.get('user_id'))
         page_id = int(request.args.get('page_id'))
         dest = request.args.get('url')
-        session_id = request.args.get('sid')
-        client_id = request.args.get('cid')
-        user_agent = request.headers.get('User-Agent', '')
-        ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-        referrer = request.referrer
-
-        # client_key
-        client_key = None
-        if client_id:
-            import hmac, hashlib
-            salt = current_app.config.get('SECRET_KEY', 'salt')
-            client_key = hmac.new(salt.encode('utf-8'), client_id.encode('utf-8'), hashlib.sha256).hexdigest()
-
-        from app.models import EventLog
-        ev = EventLog(
-            user_id=user_id,
-            page_id=page_id,
+
+        record = build_event_record(
+            'click', user_id, page_id,
             ota=ota,
-            event_type='click',
-            client_key=client_key,
-            session_id=session_id,
-            user_agent=user_agent,
-            ip=ip,
-            referrer=referrer,
+            client_id=request.args.get('cid'),
+            session_id=request.args.get('sid'),
+            user_agent=request.headers.get('User-Agent', ''),
+            ip=request.headers.get('X-Forwarded-For', request.remote_addr),
+            referrer=request.referrer,
+            event_id=request.args.get('eid'),
+            detect_bots=False,
         )
-        db.session.add(ev)
-        db.session.commit()
+        ingest_event(record)
 
         if not dest:
             return jsonify({'ok': False, 'error': 'Missing url'}), 400
         return redirect(dest, code=302)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'ok': False, 'error': str(e)}), 400
\ No newline at end of file
+        return jsonify({'ok': False, 'error': str(e)}), 400
@@ -17,6 +17,8 @@ import hmac
 import json
 import traceback
 from app.services.google_photos import get_google_photos_by_place_id
+from app.services.provider_mappings import has_offer_mapping, mappings_for_spots
+from app.services.wallet_balance import refresh_wallet_balance
 import stripe
 
 bp = Blueprint('profile', __name__)
@@ -302,6 +304,7 @@ def stripe_create_or_link():
                 requirements_json=acc.get('requirements')
             )
             db.session.add(acct)
+            refresh_wallet_balance(current_user.id)
             db.session.commit()
         else:
             # 最新状態を反映
@@ -310,6 +313,7 @@ def stripe_create_or_link():
             acct.charges_enabled = bool(acc.get('charges_enabled'))
             acct.requirements_json = acc.get('requirements')
             acct.status = 'verified' if acct.payouts_enabled else 'restricted'
+            refresh_wallet_balance(acct.user_id)
             db.session.commit()
 
         # リンク作成
@@ -365,6 +369,7 @@ def stripe_return():
             acct.charges_enabled = bool(acc.get('charges_enabled'))
             acct.requirements_json = acc.get('requirements')
             acct.status = 'verified' if acct.payouts_enabled else 'restricted'
+            refresh_wallet_balance(acct.user_id)
             db.session.commit()
             flash('受取設定の状態を更新しました。', 'success')
         else:
@@ -1534,6 +1539,8 @@ def slug_profile(slug):
     user = User.query.filter_by(slug=slug).first_or_404()
     # アクティブなスポットのみを取得し、更新日時の新しい順に並べ替え
     spots = Spot.query.filter_by(user_id=user.id, is_active=True).order_by(Spot.updated_at.desc()).all()
+    # 価格プロバイダのマッピングは全スポット分をまとめて引く（キャッシュ経由）
+    provider_mappings = mappings_for_spots([spot.id for spot in spots])
     
     # スポットデータをJSONシリアライズ可能な形式に変換
     spots_data = []
@@ -1554,8 +1561,7 @@ def slug_profile(slug):
         # ユーザー写真とGoogle写真を結合
         all_photos = user_photo_list + google_photo_list
 
-        providers = [p.provider for p in getattr(spot, 'provider_ids', [])]
-        has_offers = any(p in ['dataforseo', 'rakuten', 'agoda'] for p in providers)
+        has_offers = has_offer_mapping(provider_mappings.get(spot.id, {}))
 
         spot_dict = {
             'id': spot.id,
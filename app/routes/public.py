@@ -1,22 +1,16 @@
-from flask import Blueprint, render_template, abort, jsonify, redirect, Response, url_for, request
+from flask import Blueprint, render_template, abort, jsonify, redirect, Response, url_for, request, current_app
 from app.models import User, Spot, Photo, SocialAccount, SocialPost
 from app import db
 from sqlalchemy.orm import joinedload
 from sqlalchemy import func
 import requests
 import os
-import json
 from flask_login import current_user
 
 # 新しいサービスをインポート
-from app.services.google_photos import get_google_photos_by_place_id, get_redis_client
-from app.services.agoda import build_deeplink as build_agoda_deeplink
-from app.services.agoda import fetch_price as fetch_agoda_price_by_hotel
-from app.services.dataforseo import fetch_hotel_offers as dfs_fetch_hotel_offers
-from app.services.dataforseo import normalize_offers_from_hotel_info as dfs_normalize
-from app.services.affiliates import wrap_offers
-from app.services.rakuten_travel import build_offer_from_hotel_no as rakuten_build_offer
-from app.models.spot_provider_id import SpotProviderId
+from app.services.google_photos import get_google_photos_by_place_id
+from app.services.hotel_offers import get_min_offers, get_offers
+from app.services.provider_mappings import has_offer_mapping, mappings_for_spot
 
 public_bp = Blueprint('public', __name__)
 
@@ -310,7 +304,7 @@ def user_spot_detail(slug, spot_id):
             social_links[post.platform] = post.post_url
 
     # 価格比較ブロックの表示可否（DataForSEO or 楽天 or AgodaのIDがあるときに表示）
-    has_offers = any((p.provider in ['dataforseo', 'rakuten', 'agoda']) for p in getattr(spot, 'provider_ids', []))
+    has_offers = has_offer_mapping(mappings_for_spot(spot.id))
     
     return render_template('public/spot_detail.html', 
                           user=user, 
@@ -396,17 +390,8 @@ def sitemap_users():
     resp.headers['Cache-Control'] = 'public, max-age=3600'
     return resp
 
-@public_bp.route('/public/api/spots/<int:spot_id>/hotel_offers')
-def public_spot_hotel_offers(spot_id: int):
-    """公開: スポットのホテル価格オファー取得API
-    クエリ: checkIn=YYYY-MM-DD, checkOut=YYYY-MM-DD, adults=2
-    デフォルト: 翌日チェックイン/1泊, 大人2名
-    """
-    spot = Spot.query.get_or_404(spot_id)
-    if not spot.is_active:
-        return jsonify({'error': 'スポットが見つかりません'}), 404
-
-    # 日付デフォルト: 翌日〜翌々日
+def _hotel_offer_params():
+    """checkIn / checkOut / adults / children（日付が無ければ翌日チェックイン・1泊）。"""
     from datetime import date, timedelta
     check_in = request.args.get('checkIn')
     check_out = request.args.get('checkOut')
@@ -418,215 +403,56 @@ def public_spot_hotel_offers(spot_id: int):
         check_in = d1.strftime('%Y-%m-%d')
         check_out = d2.strftime('%Y-%m-%d')
 
-    # まずRedisキャッシュを確認（10分TTL想定）
-    redis_client = get_redis_client()
+    children = int(request.args.get('children', '0'))
+    return check_in, check_out, adults, children
 
-    def build_cache_key(spot_id: int, check_in: str, check_out: str, adults: int, children: int) -> str:
-        return f"hotel_offers:v1:{spot_id}:{check_in}:{check_out}:{adults}:{children}"
 
-    def compute_min_offer(offers_list):
-        def price_value(o):
-            try:
-                return float(o['price']) if o.get('price') is not None else float('inf')
-            except Exception:
-                return float('inf')
-        if not offers_list:
-            return None
-        # 最小価格の要素を選択
-        min_idx = None
-        min_val = float('inf')
-        for idx, o in enumerate(offers_list):
-            v = price_value(o)
-            if v < min_val:
-                min_val = v
-                min_idx = idx
-        if min_idx is None or min_val == float('inf'):
-            return None
-        # 返却用のdict（キャッシュ破壊を避けコピー）
-        mo = dict(offers_list[min_idx])
-        mo['is_min_price'] = True
-        return mo
-
-    def mark_min_flag(offers_list):
-        """与えられた offers の中で最安値に is_min_price=True を設定（非破壊）。"""
-        if not isinstance(offers_list, list) or not offers_list:
-            return offers_list
-        # 最安値のインデックスを特定
-        min_idx = None
-        min_val = float('inf')
-        for idx, o in enumerate(offers_list):
-            try:
-                v = float(o['price']) if o.get('price') is not None else float('inf')
-            except Exception:
-                v = float('inf')
-            if v < min_val:
-                min_val = v
-                min_idx = idx
-        # マークを付けて新しいリストを返す
-        out = []
-        for idx, o in enumerate(offers_list):
-            c = dict(o)
-            c['is_min_price'] = (idx == min_idx and min_val != float('inf'))
-            out.append(c)
-        return out
+@public_bp.route('/public/api/spots/<int:spot_id>/hotel_offers')
+def public_spot_hotel_offers(spot_id: int):
+    """公開: スポットのホテル価格オファー取得API
+    クエリ: checkIn=YYYY-MM-DD, checkOut=YYYY-MM-DD, adults=2
+    デフォルト: 翌日チェックイン/1泊, 大人2名
+    """
+    spot = Spot.query.get_or_404(spot_id)
+    if not spot.is_active:
+        return jsonify({'error': 'スポットが見つかりません'}), 404
 
-    children = int(request.args.get('children', '0'))
-    cache_key = build_cache_key(spot.id, check_in, check_out, adults, children)
+    check_in, check_out, adults, children = _hotel_offer_params()
 
-    if redis_client:
-        try:
-            cached = redis_client.get(cache_key)
-            if cached:
-                try:
-                    offers_cached = json.loads(cached)
-                except Exception:
-                    offers_cached = None
-                if isinstance(offers_cached, list):
-                    # キャッシュヒット: 最安値フラグを付けてから返却
-                    offers_cached_marked = mark_min_flag(offers_cached)
-                    # 可能なら更新（後続ヒットでもフラグ付きになるように）
-                    try:
-                        redis_client.setex(cache_key, 600, json.dumps(offers_cached_marked))
-                    except Exception:
-                        pass
-                    summary = (request.args.get('summary') or '').lower() in ['1', 'true', 'yes']
-                    if summary:
-                        return jsonify({'min_offer': compute_min_offer(offers_cached_marked)})
-                    else:
-                        return jsonify({'offers': offers_cached_marked, 'min_offer': compute_min_offer(offers_cached_marked)})
-        except Exception:
-            # キャッシュ障害時はそのまま計算へフォールバック
-            pass
-
-    offers = []
-
-    # DataForSEOがあれば最優先（メタサーチとして複数OTAの価格・リンクを取得）
-    dfs_map = SpotProviderId.query.filter_by(spot_id=spot.id, provider='dataforseo').first()
-    if dfs_map:
-        dfs_result = dfs_fetch_hotel_offers(
-            hotel_identifier=dfs_map.external_id,
-            language_code=os.environ.get('DATAFORSEO_DEFAULT_LANGUAGE', 'ja'),
-            location_name=os.environ.get('DATAFORSEO_DEFAULT_LOCATION', 'Japan'),
-            check_in=check_in,
-            check_out=check_out,
-            currency=os.environ.get('AGODA_CURRENCY', 'JPY'),
-            adults=adults,
-        )
-        offers.extend(dfs_normalize(dfs_result))
-
-    # 楽天トラベルIDがあれば個別で追加
-    rakuten_map = SpotProviderId.query.filter_by(spot_id=spot.id, provider='rakuten').first()
-    if rakuten_map:
-        rakuten_offer = rakuten_build_offer(rakuten_map.external_id, check_in, check_out, adults)
-        if rakuten_offer:
-            offers.append(rakuten_offer)
-
-    if offers:
-        # 価格が数値のものを優先し昇順ソート
-        def price_value(o):
-            try:
-                return float(o['price']) if o.get('price') is not None else float('inf')
-            except Exception:
-                return float('inf')
-        offers.sort(key=price_value)
-        # アフィリエイト包み（有効時）
-        try:
-            # コンテキスト付きでラップ（BookingはAllez優先）
-            from app.services.affiliates import wrap_offers_with_context
-            offers = wrap_offers_with_context(offers, spot)
-        except Exception:
-            pass
-        # 最安値フラグ付与
-        offers = mark_min_flag(offers)
-        # キャッシュ保存（10分）
-        if redis_client:
-            try:
-                redis_client.setex(cache_key, 600, json.dumps(offers))
-            except Exception:
-                pass
-        # 応答
-        summary = (request.args.get('summary') or '').lower() in ['1', 'true', 'yes']
-        min_offer = offers[0] if offers and price_value(offers[0]) != float('inf') else None
-        if summary:
-            return jsonify({'min_offer': min_offer})
-        return jsonify({'offers': offers, 'min_offer': min_offer})
-
-    # Agodaフォールバック: DataForSEOマッピングが無い場合のみ
-    has_agoda_mapping = SpotProviderId.query.filter_by(spot_id=spot.id, provider='agoda').first() is not None
-    is_agoda = has_agoda_mapping
-
-    sub_id = f"spot_{spot.id}"
-
-    if is_agoda:
-        # Agoda: まずはMVPとしてdeeplinkのみ（価格なし）。hotel_provider_idがAgodaのhotelIdなら使用。
-        cid = os.environ.get('AGODA_PARTNER_ID')
-        campaign_id = os.environ.get('AGODA_CAMPAIGN_ID')
-        agoda_locale = os.environ.get('AGODA_LOCALE', 'ja-jp')
-        agoda_currency = os.environ.get('AGODA_CURRENCY', 'JPY')
-        # provider_id優先: SpotProviderId
-        agoda_map = SpotProviderId.query.filter_by(spot_id=spot.id, provider='agoda').first()
-        agoda_hotel_id = None
-        if agoda_map:
-            agoda_hotel_id = agoda_map.external_id
-
-        children = int(request.args.get('children', '0'))
-        deeplink = build_agoda_deeplink(
-            agoda_hotel_id=agoda_hotel_id,
-            check_in=check_in,
-            check_out=check_out,
-            adults=adults,
-            children=children,
-            cid=cid,
-            campaign_id=campaign_id,
-            locale=agoda_locale,
-            currency=agoda_currency,
-            sub_id=sub_id,
-        )
-        # 価格取得（利用可能な場合のみ）
-        price_info = None
-        if agoda_hotel_id:
-            price_info = fetch_agoda_price_by_hotel(
-                hotel_id=agoda_hotel_id,
-                check_in=check_in,
-                check_out=check_out,
-                adults=adults,
-                locale=agoda_locale,
-                currency=agoda_currency,
-                sub_id=sub_id,
-            )
-        offer = {
-            'provider': 'Agoda',
-            'price': price_info.get('price') if price_info else None,
-            'currency': price_info.get('currency') if price_info else agoda_currency,
-            'deeplink': price_info.get('deeplink') if price_info and price_info.get('deeplink') else deeplink,
-            'is_min_price': True,
-        }
-        # アフィリエイト包み（有効時）
-        try:
-            wrapped_single = wrap_offers([offer])
-            if isinstance(wrapped_single, list) and wrapped_single:
-                offer = wrapped_single[0]
-        except Exception:
-            pass
-        # キャッシュ保存（10分）
-        if redis_client:
-            try:
-                redis_client.setex(cache_key, 600, json.dumps([offer]))
-            except Exception:
-                pass
-        summary = (request.args.get('summary') or '').lower() in ['1', 'true', 'yes']
-        if summary:
-            return jsonify({'min_offer': offer})
-        return jsonify({'offers': [offer], 'min_offer': offer})
+    # キャッシュ（soft TTL 切れは古い値を返して裏で1回だけ再計算）→ ミス時はマッピングのある全プロバイダへ並列に問い合わせる
+    result = get_offers(spot, check_in, check_out, adults, children)
+
+    summary = (request.args.get('summary') or '').lower() in ['1', 'true', 'yes']
+    if summary:
+        resp = jsonify({'min_offer': result['min_offer']})
     else:
-        # Hotellook分岐は廃止
-        # キャッシュ保存（空でも短期キャッシュしてスパイク抑止）
-        if redis_client:
-            try:
-                redis_client.setex(cache_key, 600, json.dumps([]))
-            except Exception:
-                pass
-        summary = (request.args.get('summary') or '').lower() in ['1', 'true', 'yes']
-        if summary:
-            return jsonify({'min_offer': None})
-        return jsonify({'offers': [], 'min_offer': None})
\ No newline at end of file
+        resp = jsonify({'offers': result['offers'], 'min_offer': result['min_offer']})
+    resp.headers['X-Offers-Cache'] = result['cache']
+    # 締切に間に合わなかったプロバイダがあればヘッダで知らせる（応答の形は変えない）
+    if result['partial']:
+        resp.headers['X-Offers-Partial'] = '1'
+    return resp
+
+
+@public_bp.route('/public/api/hotel_offers/batch')
+def public_hotel_offers_batch():
+    """公開: 複数スポットの最安値をまとめて取得するAPI（プロフィールページ用）
+    クエリ: spot_ids=1,2,3（最大 HOTEL_OFFERS_BATCH_MAX 件）, checkIn, checkOut, adults, children
+    応答: results[spot_id] = {min_offer, cache, partial}。cache=pending は締切に間に合わなかったもの（少し後に再取得）
+    """
+    try:
+        spot_ids = list(dict.fromkeys(int(x) for x in (request.args.get('spot_ids') or '').split(',') if x.strip()))
+    except ValueError:
+        return jsonify({'error': 'spot_ids が不正です'}), 400
+    if not spot_ids:
+        return jsonify({'error': 'spot_ids を指定してください'}), 400
+    if len(spot_ids) > int(current_app.config.get('HOTEL_OFFERS_BATCH_MAX', 60)):
+        return jsonify({'error': 'spot_ids が多すぎます'}), 400
+
+    check_in, check_out, adults, children = _hotel_offer_params()
+    results = get_min_offers(spot_ids, check_in, check_out, adults, children)
+    return jsonify({
+        'check_in': check_in,
+        'check_out': check_out,
+        'results': {str(spot_id): row for spot_id, row in results.items()},
+    })
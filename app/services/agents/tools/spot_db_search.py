@@ -2,14 +2,13 @@
 改良版スポットDB検索ツール - 自動情報統合対応
 """
 import logging
-import requests
-import os
 from langchain.tools import tool
 from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
 
 from app.models import Spot, User
 from app import db
+from app.services import places_client
 
 logger = logging.getLogger(__name__)
 
@@ -41,26 +40,21 @@ def _safe_float_conversion(value) -> float:
         return None
 
 def _get_google_place_details(place_id: str) -> dict:
-    """Google Places APIから詳細情報を取得"""
-    api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-    if not api_key or not place_id:
+    """Google Places APIから詳細情報を取得（places_client のキャッシュ経由）"""
+    if not place_id:
         return {}
     
     try:
-        url = f"https://places.googleapis.com/v1/places/{place_id}"
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Goog-Api-Key': api_key,
-            'X-Goog-FieldMask': 'displayName,formattedAddress,location,types,photos,rating,userRatingCount,priceLevel,currentOpeningHours,regularOpeningHours,businessStatus,accessibilityOptions',
-            'X-Goog-LanguageCode': 'ja'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.debug(f"Google Places API error for {place_id}: {response.status_code}")
+        details = places_client.get_place(
+            place_id,
+            'displayName,formattedAddress,location,types,photos,rating,userRatingCount,priceLevel,currentOpeningHours,regularOpeningHours,businessStatus,accessibilityOptions',
+            language='ja',
+            timeout=5,
+        )
+        if details is None:
+            logger.debug(f"Google Places API returned no details for {place_id}")
             return {}
+        return details
     except Exception as e:
         logger.debug(f"Google Places API request failed for {place_id}: {e}")
         return {}
@@ -0,0 +1,188 @@
+import logging
+import os
+import threading
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Optional
+
+import redis
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+from app.services.google_photos import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+# (user, JST日) ごとのユニーククリック HyperLogLog と、その日にクリックがあった user の集合
+HLL_KEY_PREFIX = 'wallet:clicks:hll:'
+USERS_KEY_PREFIX = 'wallet:clicks:users:'
+# 取り込み時の HLL 更新に失敗した日の印（その日の推定値は欠けているので日次集計は正確値を使う）
+DEGRADED_KEY_PREFIX = 'wallet:clicks:degraded:'
+
+# Redis に印を書けなかった日（次に書けたときにまとめて書く）
+_pending_degraded = set()
+_pending_lock = threading.Lock()
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def _hll_key(user_id: int, day: date) -> str:
+    return f"{HLL_KEY_PREFIX}{int(user_id)}:{day.isoformat()}"
+
+
+def _users_key(day: date) -> str:
+    return f"{USERS_KEY_PREFIX}{day.isoformat()}"
+
+
+def _degraded_key(day: date) -> str:
+    return f"{DEGRADED_KEY_PREFIX}{day.isoformat()}"
+
+
+def local_day(created_at: Any) -> date:
+    """受信時刻（UTC isoformat / datetime）を WALLET_TZ の日付にする。"""
+    from zoneinfo import ZoneInfo
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(ZoneInfo(_cfg('WALLET_TZ', 'Asia/Tokyo'))).date()
+
+
+def click_element(record: Dict[str, Any]) -> str:
+    """日次集計の DISTINCT キー（page, ota, session_or_client）と同じ粒度の要素文字列。"""
+    who = record.get('session_id') or record.get('client_key') or 'anon'
+    parts = [str(record['page_id'])] if record.get('page_id') is not None else []
+    parts += [record.get('ota') or '', who]
+    return '#'.join(parts)
+
+
+def _flush_degraded(client, ttl: int) -> None:
+    with _pending_lock:
+        days = list(_pending_degraded)
+    for day in days:
+        client.set(_degraded_key(day), 1, ex=ttl)
+        with _pending_lock:
+            _pending_degraded.discard(day)
+
+
+def _mark_degraded(client, day: date, ttl: int) -> None:
+    with _pending_lock:
+        _pending_degraded.add(day)
+    if client is None:
+        return
+    try:
+        _flush_degraded(client, ttl)
+    except redis.exceptions.RedisError:
+        pass
+
+
+def record_click(record: Dict[str, Any], redis_client=None) -> bool:
+    """Bot 以外のクリックを HLL に登録する（取り込み時に呼ぶ）。Redis 障害時は False。
+
+    失敗した日は degraded の印を付け、estimate_clicks_for_day がその日の推定値を返さないようにする。
+    Redis に印を書けなければプロセス内に持ち、次に書けたときに書く。
+    """
+    if record.get('event_type') != 'click' or record.get('is_bot'):
+        return False
+    day = local_day(record['created_at'])
+    ttl = int(_cfg('WALLET_CLICK_HLL_TTL_DAYS', 40)) * 86400
+    client = None
+    try:
+        client = redis_client or get_redis_client()
+        if client is None:
+            _mark_degraded(None, day, ttl)
+            return False
+        key = _hll_key(record['user_id'], day)
+        pipe = client.pipeline(transaction=False)
+        pipe.pfadd(key, click_element(record))
+        pipe.expire(key, ttl)
+        pipe.sadd(_users_key(day), int(record['user_id']))
+        pipe.expire(_users_key(day), ttl)
+        pipe.execute()
+        if _pending_degraded:
+            _flush_degraded(client, ttl)
+        return True
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"click HLL update failed: {e}")
+        _mark_degraded(client, day, ttl)
+        return False
+
+
+def is_degraded(day: date, client=None) -> bool:
+    """その日に HLL の更新に失敗したクリックがあるか。"""
+    with _pending_lock:
+        if day in _pending_degraded:
+            return True
+    client = client or get_redis_client()
+    return client is not None and bool(client.exists(_degraded_key(day)))
+
+
+def estimate_clicks_for_day(day: date, allow_degraded: bool = False) -> Optional[Dict[int, int]]:
+    """その日の user_id -> 推定ユニーククリック数。
+
+    Redis が使えないとき、またはその日に HLL の更新に失敗していれば（allow_degraded でない限り）None。
+    """
+    try:
+        client = get_redis_client()
+        if client is None:
+            return None
+        if not allow_degraded and is_degraded(day, client):
+            logger.warning(f"click HLL for {day.isoformat()} missed some clicks at ingest")
+            return None
+        user_ids = [int(u) for u in client.smembers(_users_key(day))]
+        pipe = client.pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.pfcount(_hll_key(uid, day))
+        counts = pipe.execute()
+        return {uid: int(c or 0) for uid, c in zip(user_ids, counts)}
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"click HLL read failed: {e}")
+        return None
+
+
+def exact_clicks_for_day(day: date) -> Dict[int, int]:
+    """日次集計と同じ定義の正確なユニーククリック数（照合用）。"""
+    from app.tasks import _day_bounds_utc
+    start_utc, end_utc = _day_bounds_utc(day, _cfg('WALLET_TZ', 'Asia/Tokyo'))
+    rows = db.session.execute(text(
+        """
+        SELECT e.user_id,
+               COUNT(DISTINCT concat_ws('#', e.user_id::text, e.page_id::text, COALESCE(e.ota,''),
+                                        COALESCE(NULLIF(e.session_id,''), COALESCE(NULLIF(e.client_key,''), 'anon')))) AS clicks
+        FROM event_log e
+        WHERE e.created_at >= :start_utc AND e.created_at < :end_utc
+          AND e.event_type = 'click' AND COALESCE(e.is_bot, false) = false
+        GROUP BY 1
+        """
+    ), {'start_utc': start_utc, 'end_utc': end_utc}).fetchall()
+    return {int(r[0]): int(r[1]) for r in rows}
+
+
+def reconcile_day(day: date) -> Dict[str, Any]:
+    """HLL 推定値と SQL の正確値を user 単位で突き合わせる。"""
+    exact = exact_clicks_for_day(day)
+    estimate = estimate_clicks_for_day(day, allow_degraded=True) or {}
+    rows = []
+    for uid in sorted(set(exact) | set(estimate)):
+        e, h = exact.get(uid, 0), estimate.get(uid, 0)
+        rel = abs(h - e) / e if e else (1.0 if h else 0.0)
+        rows.append({'user_id': uid, 'exact': e, 'hll': h, 'rel_error': rel})
+    total_exact = sum(exact.values())
+    total_hll = sum(estimate.values())
+    try:
+        degraded = is_degraded(day)
+    except redis.exceptions.RedisError:
+        degraded = None
+    return {
+        'day': day.isoformat(),
+        'degraded': degraded,
+        'users': len(rows),
+        'total_exact': total_exact,
+        'total_hll': total_hll,
+        'total_rel_error': (abs(total_hll - total_exact) / total_exact) if total_exact else 0.0,
+        'max_rel_error': max((r['rel_error'] for r in rows), default=0.0),
+        'rows': rows,
+    }
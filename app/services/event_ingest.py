@@ -0,0 +1,268 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import redis
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import db
+from app.models import EventLog, EventLogUid
+from app.services.google_photos import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+# Redis キー（バージョンを上げるときはドレイン済みであることを確認）
+BUFFER_KEY = 'event_log:buffer:v1'
+PROCESSING_KEY_PREFIX = 'event_log:buffer:v1:processing:'
+SEEN_KEY_PREFIX = 'event_log:seen:v1:'
+
+# バッファから最大 n 件を取り出し、同一トランザクションで処理中リストへ移す。
+# INSERT がコミットされるまで処理中リストに残るため、ワーカーが落ちても失われない（at-least-once）。
+_CLAIM_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+  redis.call('LTRIM', KEYS[1], #items, -1)
+  redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+BOT_KEYWORDS = ['bot', 'crawl', 'spider', 'headless', 'selenium', 'python', 'curl', 'wget']
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def hash_client_id(client_id: Optional[str]) -> Optional[str]:
+    """client_key = HMAC_SHA256(salt, client_id)（生の client_id は保存しない）"""
+    if not client_id:
+        return None
+    salt = _cfg('SECRET_KEY', 'salt')
+    return hmac.new(salt.encode('utf-8'), client_id.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def detect_bot(user_agent: Optional[str]) -> Optional[str]:
+    """UA による簡易Bot判定。Botなら理由（'ua'）を、そうでなければ None を返す。"""
+    ua = (user_agent or '').lower()
+    if any(k in ua for k in BOT_KEYWORDS) or 'headlesschrome' in ua:
+        return 'ua'
+    return None
+
+
+def build_event_record(event_type: str, user_id: int, page_id: int, *, ota: Optional[str] = None,
+                       client_id: Optional[str] = None, session_id: Optional[str] = None,
+                       user_agent: Optional[str] = None, ip: Optional[str] = None,
+                       referrer: Optional[str] = None, dwell_ms: Optional[int] = None,
+                       price_median: Any = None, event_id: Optional[str] = None,
+                       detect_bots: bool = True) -> Dict[str, Any]:
+    """ビーコン1件を event_log の1行に対応するコンパクトな dict にする。
+
+    created_at は受信時刻で確定させる（バッファ経由でも集計日がずれないように）。
+    event_id（クライアント採番）が無ければサーバー側で採番し、ドレインの再実行でも重複しないようにする。
+    """
+    bot_reason = detect_bot(user_agent) if detect_bots else None
+    return {
+        'event_uid': (str(event_id)[:64] if event_id else uuid.uuid4().hex),
+        'client_event_id': bool(event_id),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'user_id': int(user_id),
+        'page_id': int(page_id),
+        'ota': ota,
+        'event_type': event_type,
+        'client_key': hash_client_id(client_id),
+        'session_id': session_id,
+        'user_agent': user_agent,
+        'ip': ip,
+        'referrer': referrer,
+        'dwell_ms': dwell_ms,
+        'price_median': price_median,
+        'is_bot': bot_reason is not None,
+        'bot_reason': bot_reason,
+    }
+
+
+def _to_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    row = {k: v for k, v in record.items() if k != 'client_event_id'}
+    if isinstance(row.get('created_at'), str):
+        row['created_at'] = datetime.fromisoformat(row['created_at'])
+    return row
+
+
+def _claim_client_uids(records: List[Dict[str, Any]]) -> set:
+    """クライアント採番の event_uid を event_log_uid に入れ、今回初めて入ったものを返す。"""
+    uids = list(dict.fromkeys(r['event_uid'] for r in records if r.get('client_event_id')))
+    if not uids:
+        return set()
+    now = datetime.now(timezone.utc)
+    table = EventLogUid.__table__
+    stmt = (pg_insert(table)
+            .values([{'event_uid': uid, 'created_at': now} for uid in uids])
+            .on_conflict_do_nothing(index_elements=['event_uid'])
+            .returning(table.c.event_uid))
+    return set(db.session.execute(stmt).scalars().all())
+
+
+def insert_event_rows(records: Iterable[Dict[str, Any]]) -> int:
+    """複数行を1文の INSERT ... VALUES で書き込む（event_uid 重複は無視）。コミットは呼び出し側。
+
+    クライアント採番の event_id は同じトランザクションで event_log_uid に入れ、既にあったもの
+    （時間を置いた再送）は捨てる。event_log 自体の一意キーは (event_uid, created_at) で、
+    created_at を受信時に確定してバッファに保存しているので、バッファの再投入はここで衝突する。
+    """
+    records = list(records)
+    claimed = _claim_client_uids(records)
+    rows = []
+    seen = set()
+    for record in records:
+        if record.get('client_event_id'):
+            if record['event_uid'] not in claimed or record['event_uid'] in seen:
+                continue
+            seen.add(record['event_uid'])
+        rows.append(_to_row(record))
+    if not rows:
+        return 0
+    stmt = pg_insert(EventLog.__table__).values(rows).on_conflict_do_nothing(index_elements=['event_uid', 'created_at'])
+    result = db.session.execute(stmt)
+    return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+
+
+def _is_duplicate(redis_client, record: Dict[str, Any]) -> bool:
+    """クライアント採番の event_id を受信時点で重複排除する（再送ビーコン対策）。
+
+    SET NX で先に押さえ、同時に届いた再送を弾く。取り込みに失敗したら _forget で外し、
+    クライアントの再送が duplicate 扱いで捨てられないようにする。
+    """
+    if not record.get('client_event_id') or redis_client is None:
+        return False
+    ttl = int(_cfg('WALLET_INGEST_DEDUPE_TTL', 86400))
+    try:
+        return not redis_client.set(SEEN_KEY_PREFIX + record['event_uid'], 1, nx=True, ex=ttl)
+    except redis.exceptions.RedisError:
+        return False
+
+
+def _forget(redis_client, record: Dict[str, Any]) -> None:
+    if not record.get('client_event_id') or redis_client is None:
+        return
+    try:
+        redis_client.delete(SEEN_KEY_PREFIX + record['event_uid'])
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"event dedupe key release failed: {e}")
+
+
+def ingest_event(record: Dict[str, Any]) -> str:
+    """イベントを取り込む。戻り値は 'buffered' | 'direct' | 'duplicate'。
+
+    WALLET_INGEST_MODE=buffered のときは Redis リストに積み、ドレインワーカーがまとめて INSERT する。
+    Redis 障害時やバッファが WALLET_INGEST_BUFFER_MAX を超えたときは直接 INSERT に切り替える（バックプレッシャ）。
+    """
+    mode = _cfg('WALLET_INGEST_MODE', 'direct')
+    redis_client = None
+    if mode == 'buffered' or record.get('client_event_id'):
+        try:
+            redis_client = get_redis_client()
+        except Exception:
+            redis_client = None
+
+    if _is_duplicate(redis_client, record):
+        return 'duplicate'
+    try:
+        status = _store(record, mode, redis_client)
+    except Exception:
+        _forget(redis_client, record)
+        raise
+
+    # 取り込めたものだけ HLL に入れる（失敗した日は click_sketch 側で印を付け、日次集計は正確値に戻す）
+    if record.get('event_type') == 'click' and _cfg('WALLET_CLICK_HLL_ENABLED', True):
+        from app.services.click_sketch import record_click
+        record_click(record, redis_client)
+    return status
+
+
+def _store(record: Dict[str, Any], mode: str, redis_client) -> str:
+    if mode == 'buffered' and redis_client is not None:
+        try:
+            max_len = int(_cfg('WALLET_INGEST_BUFFER_MAX', 100000))
+            if redis_client.llen(BUFFER_KEY) < max_len:
+                redis_client.rpush(BUFFER_KEY, json.dumps(record, ensure_ascii=False, default=str))
+                return 'buffered'
+            logger.warning("event buffer is full; falling back to direct insert")
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"event buffer unavailable ({e}); falling back to direct insert")
+
+    insert_event_rows([record])
+    db.session.commit()
+    return 'direct'
+
+
+def _processing_key(consumer: str) -> str:
+    return PROCESSING_KEY_PREFIX + consumer
+
+
+def requeue_stale_processing(redis_client, consumer: str) -> int:
+    """前回異常終了したコンシューマの処理中リストをバッファ先頭に戻す。"""
+    key = _processing_key(consumer)
+    moved = 0
+    while True:
+        item = redis_client.rpoplpush(key, BUFFER_KEY)
+        if item is None:
+            break
+        moved += 1
+    if moved:
+        # RPOPLPUSH は末尾に積むため順序は崩れるが、created_at は受信時刻なので集計には影響しない
+        logger.info(f"requeued {moved} in-flight events from {key}")
+    return moved
+
+
+def drain_event_buffer(batch_size: int = 500, max_batches: Optional[int] = None, consumer: str = 'default') -> Dict[str, int]:
+    """バッファを空になるまで（または max_batches まで）バッチ INSERT する。"""
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return {'batches': 0, 'events': 0, 'inserted': 0}
+
+    claim = redis_client.register_script(_CLAIM_SCRIPT)
+    processing_key = _processing_key(consumer)
+    requeue_stale_processing(redis_client, consumer)
+
+    stats = {'batches': 0, 'events': 0, 'inserted': 0}
+    while max_batches is None or stats['batches'] < max_batches:
+        items = claim(keys=[BUFFER_KEY, processing_key], args=[batch_size])
+        if not items:
+            break
+        records: List[Dict[str, Any]] = []
+        for raw in items:
+            try:
+                records.append(json.loads(raw))
+            except (TypeError, ValueError):
+                logger.error(f"dropping malformed buffered event: {raw!r}")
+        try:
+            inserted = insert_event_rows(records)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # 失敗したバッチはバッファに戻して再試行（event_uid で重複は防がれる）
+            requeue_stale_processing(redis_client, consumer)
+            raise
+        redis_client.delete(processing_key)
+        stats['batches'] += 1
+        stats['events'] += len(records)
+        stats['inserted'] += inserted
+    return stats
+
+
+def buffer_length() -> int:
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return 0
+    try:
+        return int(redis_client.llen(BUFFER_KEY))
+    except redis.exceptions.RedisError:
+        return 0
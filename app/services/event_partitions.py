@@ -0,0 +1,179 @@
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'event_log'
+DEFAULT_PARTITION = 'event_log_default'
+_PARTITION_RE = re.compile(r'^event_log_p(\d{4})_(\d{2})$')
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def _tz():
+    """パーティション境界はローカル日（WALLET_TZ）の月初に揃える（JST日の集計が1パーティションに収まる）。"""
+    from zoneinfo import ZoneInfo
+    return ZoneInfo(_cfg('WALLET_TZ', 'Asia/Tokyo'))
+
+
+def _add_months(d: date, n: int) -> date:
+    idx = d.year * 12 + (d.month - 1) + n
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"event_log_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_bounds(month: date) -> Tuple[datetime, datetime]:
+    """月 month の [月初, 翌月初) をタイムゾーン付きで返す。"""
+    tz = _tz()
+    nxt = _add_months(month, 1)
+    return (datetime(month.year, month.month, 1, tzinfo=tz),
+            datetime(nxt.year, nxt.month, 1, tzinfo=tz))
+
+
+def list_partitions() -> List[Dict[str, Any]]:
+    """event_log に接続済みの月次パーティション（default 以外）を古い順に返す。"""
+    rows = db.session.execute(text(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :parent
+        ORDER BY c.relname
+        """
+    ), {'parent': PARENT_TABLE}).fetchall()
+    parts = []
+    for (name,) in rows:
+        m = _PARTITION_RE.match(name)
+        if not m:
+            continue
+        parts.append({'name': name, 'month': date(int(m.group(1)), int(m.group(2)), 1)})
+    return parts
+
+
+def is_partitioned() -> bool:
+    relkind = db.session.execute(text(
+        "SELECT c.relkind FROM pg_class c WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {'name': PARENT_TABLE}).scalar()
+    return relkind == 'p'
+
+
+def create_partition(month: date) -> bool:
+    """月次パーティションを作成して接続する。既に存在すれば False。
+
+    default パーティションに該当期間の行が溜まっている場合（先行作成が漏れた等）でも失敗しないよう、
+    単独テーブルとして作成 → default から行を移送 → ATTACH の順で行う。
+    """
+    name = partition_name(month)
+    exists = db.session.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar()
+    if exists:
+        return False
+    start, end = partition_bounds(month)
+    params = {'start': start, 'end': end}
+    db.session.execute(text(f'CREATE TABLE "{name}" (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    has_default = db.session.execute(text("SELECT to_regclass(:name)"), {'name': DEFAULT_PARTITION}).scalar()
+    if has_default:
+        moved = db.session.execute(text(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= :start AND created_at < :end
+                RETURNING *
+            )
+            INSERT INTO "{name}" SELECT * FROM moved
+            """
+        ), params).rowcount
+        if moved:
+            logger.warning(f"moved {moved} rows from {DEFAULT_PARTITION} into {name}")
+    # 境界と一致する CHECK を先に付けておくと ATTACH 時の全件検証を省略できる
+    db.session.execute(text(
+        f'ALTER TABLE "{name}" ADD CONSTRAINT "{name}_bounds" '
+        f"CHECK (created_at >= TIMESTAMPTZ '{start.isoformat()}' AND created_at < TIMESTAMPTZ '{end.isoformat()}')"
+    ))
+    db.session.execute(text(
+        f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION "{name}" '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    db.session.execute(text(f'ALTER TABLE "{name}" DROP CONSTRAINT "{name}_bounds"'))
+    return True
+
+
+def ensure_partitions(months_ahead: int = 3, today: Optional[date] = None, dry_run: bool = False) -> List[str]:
+    """当月から months_ahead ヶ月先までのパーティションを用意する。作成した名前を返す。"""
+    if today is None:
+        today = datetime.now(timezone.utc).astimezone(_tz()).date()
+    current = date(today.year, today.month, 1)
+    existing = {p['name'] for p in list_partitions()}
+    created = []
+    for i in range(0, months_ahead + 1):
+        month = _add_months(current, i)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        if not dry_run:
+            create_partition(month)
+            db.session.commit()
+        created.append(name)
+    return created
+
+
+def detach_old_partitions(retain_months: int, drop: bool = False, today: Optional[date] = None,
+                          dry_run: bool = False) -> List[str]:
+    """当月を含めて retain_months ヶ月より古いパーティションを切り離す。
+
+    切り離したテーブルは同名の単独テーブルとして残る（pg_dump でアーカイブしてから --drop で削除する想定）。
+    retain_months <= 0 のときは何もしない。
+    """
+    if retain_months <= 0:
+        return []
+    if today is None:
+        today = datetime.now(timezone.utc).astimezone(_tz()).date()
+    cutoff = _add_months(date(today.year, today.month, 1), -(retain_months - 1))
+    targets = [p['name'] for p in list_partitions() if p['month'] < cutoff]
+    if dry_run:
+        return targets
+    for name in targets:
+        db.session.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}"'))
+        if drop:
+            db.session.execute(text(f'DROP TABLE "{name}"'))
+        db.session.commit()
+        logger.info(f"{'dropped' if drop else 'detached'} partition {name}")
+    return targets
+
+
+def default_partition_rows() -> int:
+    """default パーティションに落ちている行数（0 以外なら先行作成が追いついていない）。"""
+    exists = db.session.execute(text("SELECT to_regclass(:name)"), {'name': DEFAULT_PARTITION}).scalar()
+    if not exists:
+        return 0
+    return int(db.session.execute(text(f"SELECT COUNT(*) FROM {DEFAULT_PARTITION}")).scalar() or 0)
+
+
+def prune_event_uids(retain_days: int, dry_run: bool = False) -> int:
+    """event_log_uid（クライアント event_id の重複排除表）から retain_days 日より古い行を消す。"""
+    if retain_days <= 0:
+        return 0
+    params = {'days': retain_days}
+    if dry_run:
+        return int(db.session.execute(text(
+            "SELECT COUNT(*) FROM event_log_uid WHERE created_at < NOW() - make_interval(days => :days)"
+        ), params).scalar() or 0)
+    deleted = db.session.execute(text(
+        "DELETE FROM event_log_uid WHERE created_at < NOW() - make_interval(days => :days)"
+    ), params).rowcount
+    db.session.commit()
+    return int(deleted or 0)
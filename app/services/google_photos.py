@@ -3,23 +3,33 @@ import json
 import redis
 from flask import current_app
 
+# プロセス内でURLごとにクライアント（=接続プール）を使い回す
+_redis_clients = {}
+
 def get_redis_client():
     """
     環境に応じたRedisクライアントを取得します。
     Heroku環境('rediss://')ではSSL接続設定を、ローカル環境('redis://')では
     標準の接続設定を返します。
+    リクエストごとに接続を張り直さないよう、同一URLのクライアントは再利用します。
     """
     redis_url = current_app.config.get('REDIS_URL')
     if not redis_url:
         print("エラー: REDIS_URLが設定されていません。")
         return None
-    
+
+    client = _redis_clients.get(redis_url)
+    if client is not None:
+        return client
+
     # ローカル開発環境でのSSLエラーを回避
     if 'localhost' in redis_url or '127.0.0.1' in redis_url:
-        return redis.from_url(redis_url)
+        client = redis.from_url(redis_url)
     else:
         # Heroku等の本番環境ではSSL証明書検証を無効化
-        return redis.from_url(redis_url, ssl_cert_reqs=None)
+        client = redis.from_url(redis_url, ssl_cert_reqs=None)
+    _redis_clients[redis_url] = client
+    return client
 
 def get_google_photos_by_place_id(place_id: str, max_photos: int = 5) -> list[str]:
     """
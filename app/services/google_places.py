@@ -1,7 +1,8 @@
 import os
-import requests
 from typing import Optional
 
+from app.services import places_client
+
 
 GOOGLE_MAPS_API_KEY = os.environ.get("GOOGLE_MAPS_API_KEY")
 
@@ -15,23 +16,10 @@ def get_place_review_summary(place_id: str, timeout_seconds: int = 5) -> Optiona
     if not GOOGLE_MAPS_API_KEY or not place_id:
         return None
 
-    base_url = f"https://places.googleapis.com/v1/places/{place_id}"
-
     # editorialSummary を最優先で取得し、無ければ reviewSummary → reviewsSummary の順
     for field_name in ("editorialSummary", "reviewSummary", "reviewsSummary"):
         try:
-            resp = requests.get(
-                base_url,
-                params={
-                    "fields": field_name,
-                    "languageCode": "ja",
-                    "key": GOOGLE_MAPS_API_KEY,
-                },
-                timeout=timeout_seconds,
-            )
-            if resp.status_code != 200:
-                continue
-            data = resp.json() if resp.content else {}
+            data = places_client.get_place(place_id, field_name, language="ja", timeout=timeout_seconds) or {}
             summary = data.get(field_name)
             if not summary:
                 continue
@@ -61,19 +49,7 @@ def get_place_name(place_id: str, language_code: str = "en", timeout_seconds: in
     if not GOOGLE_MAPS_API_KEY or not place_id:
         return None
     try:
-        base_url = f"https://places.googleapis.com/v1/places/{place_id}"
-        resp = requests.get(
-            base_url,
-            params={
-                "fields": "displayName",
-                "languageCode": language_code,
-                "key": GOOGLE_MAPS_API_KEY,
-            },
-            timeout=timeout_seconds,
-        )
-        if resp.status_code != 200:
-            return None
-        data = resp.json() if resp.content else {}
+        data = places_client.get_place(place_id, "displayName", language=language_code, timeout=timeout_seconds) or {}
         dn = data.get("displayName")
         if isinstance(dn, dict):
             txt = dn.get("text")
@@ -0,0 +1,620 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import redis
+from flask import current_app
+
+from app.models import Spot
+from app.services.agoda import build_deeplink as build_agoda_deeplink
+from app.services.agoda import fetch_price as fetch_agoda_price_by_hotel
+from app.services.affiliates import wrap_offers, wrap_offers_with_context
+from app.services.dataforseo import fetch_hotel_offers as dfs_fetch_hotel_offers
+from app.services.dataforseo import normalize_offers_from_hotel_info as dfs_normalize
+from app.services.google_photos import get_redis_client
+from app.services.provider_mappings import OFFER_PROVIDERS, mappings_for_spots
+from app.services.rakuten_travel import build_offer_from_hotel_no as rakuten_build_offer
+
+
+logger = logging.getLogger(__name__)
+
+# 価格を取りに行くプロバイダ（SpotProviderId.provider）。agoda は他に1件も無いときのフォールバック
+PROVIDERS = OFFER_PROVIDERS
+STATS_KEY = 'hotel_offers:provider_stats'
+STAT_FIELDS = ('calls', 'ok', 'empty', 'errors', 'timeouts', 'ms_total', 'ms_max')
+
+# キャッシュ（値は envelope。fresh_until を過ぎたら stale として返しつつ裏で1回だけ再計算する）
+CACHE_KEY_PREFIX = 'hotel_offers:v1:'
+LOCK_KEY_PREFIX = 'hotel_offers:lock:'
+CACHE_STATS_KEY = 'hotel_offers:cache_stats'
+CACHE_STAT_FIELDS = ('hit', 'stale', 'miss', 'coalesced', 'refresh', 'refresh_error', 'prewarm')
+
+# 自分が取ったロックだけ消す
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# 裏での再計算用（プロバイダ呼び出しのプールとは分け、再計算がプールを埋めて詰まらないようにする）
+_refresh_executor: Optional[ThreadPoolExecutor] = None
+# バッチAPIのミス計算用（プロセス全体でプロバイダへ同時に問い合わせるスポット数の上限になる）
+_batch_executor: Optional[ThreadPoolExecutor] = None
+# 同じキーの同時ミスはプロセス内で1回の計算にまとめる（key → 計算中の Future）
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """プロバイダ呼び出し用のスレッドプール（プロセスで共有。締切を過ぎた呼び出しも最後まで走らせる）。"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                size = max(int(_cfg('HOTEL_OFFERS_POOL_SIZE', 16)), 1)
+                _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='hotel-offers')
+    return _executor
+
+
+def _get_refresh_executor() -> ThreadPoolExecutor:
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _executor_lock:
+            if _refresh_executor is None:
+                size = max(int(_cfg('HOTEL_OFFERS_REFRESH_WORKERS', 4)), 1)
+                _refresh_executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='hotel-offers-refresh')
+    return _refresh_executor
+
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+    global _batch_executor
+    if _batch_executor is None:
+        with _executor_lock:
+            if _batch_executor is None:
+                size = max(int(_cfg('HOTEL_OFFERS_BATCH_CONCURRENCY', 4)), 1)
+                _batch_executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='hotel-offers-batch')
+    return _batch_executor
+
+
+def provider_mappings(spot_id: int) -> Dict[str, str]:
+    """spot の価格プロバイダ → external_id（provider_mappings のキャッシュ経由）。"""
+    return provider_mappings_for([spot_id]).get(spot_id, {})
+
+
+def provider_mappings_for(spot_ids: List[int]) -> Dict[int, Dict[str, str]]:
+    """複数スポットの価格プロバイダ → external_id。価格プロバイダのマッピングが無いスポットは含まない。"""
+    mappings: Dict[int, Dict[str, str]] = {}
+    for spot_id, row in mappings_for_spots(spot_ids).items():
+        row = {provider: external_id for provider, external_id in row.items() if provider in PROVIDERS}
+        if row:
+            mappings[spot_id] = row
+    return mappings
+
+
+def _record(provider: str, status: str, ms: int) -> None:
+    """プロバイダごとの呼び出し数・結果・所要時間を Redis のハッシュに加算する（締切後に返ったものも含む）。"""
+    try:
+        client = get_redis_client()
+        if client is None:
+            return
+        pipe = client.pipeline()
+        pipe.hincrby(STATS_KEY, f'{provider}:calls', 1)
+        pipe.hincrby(STATS_KEY, f'{provider}:{status}', 1)
+        pipe.hincrby(STATS_KEY, f'{provider}:ms_total', ms)
+        pipe.execute()
+        # 最大値は HINCRBY で持てないので読んでから比べる（厳密でなくてよい）
+        current = client.hget(STATS_KEY, f'{provider}:ms_max')
+        if current is None or int(current) < ms:
+            client.hset(STATS_KEY, f'{provider}:ms_max', ms)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"hotel offers stats write failed: {e}")
+
+
+def _record_timeouts(providers: List[str]) -> None:
+    if not providers:
+        return
+    try:
+        client = get_redis_client()
+        if client is not None:
+            pipe = client.pipeline()
+            for provider in providers:
+                pipe.hincrby(STATS_KEY, f'{provider}:timeouts', 1)
+            pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"hotel offers stats write failed: {e}")
+
+
+def provider_stats() -> Dict[str, Dict[str, Any]]:
+    """プロバイダごとの累計（calls / ok / empty / errors / timeouts）と平均・最大の所要時間。"""
+    client = get_redis_client()
+    raw = client.hgetall(STATS_KEY) if client is not None else {}
+    counters = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+    out = {}
+    for provider in PROVIDERS:
+        row = {f: counters.get(f'{provider}:{f}', 0) for f in STAT_FIELDS}
+        row['ms_avg'] = round(row['ms_total'] / row['calls']) if row['calls'] else 0
+        out[provider] = row
+    return out
+
+
+def _fetch_dataforseo(external_id: str, check_in: str, check_out: str, adults: int, children: int,
+                      spot_id: int) -> List[Dict[str, Any]]:
+    result = dfs_fetch_hotel_offers(
+        hotel_identifier=external_id,
+        language_code=os.environ.get('DATAFORSEO_DEFAULT_LANGUAGE', 'ja'),
+        location_name=os.environ.get('DATAFORSEO_DEFAULT_LOCATION', 'Japan'),
+        check_in=check_in,
+        check_out=check_out,
+        currency=os.environ.get('AGODA_CURRENCY', 'JPY'),
+        adults=adults,
+    )
+    return dfs_normalize(result)
+
+
+def _fetch_rakuten(external_id: str, check_in: str, check_out: str, adults: int, children: int,
+                   spot_id: int) -> List[Dict[str, Any]]:
+    offer = rakuten_build_offer(external_id, check_in, check_out, adults)
+    return [offer] if offer else []
+
+
+def _agoda_params() -> Dict[str, Optional[str]]:
+    return {
+        'cid': os.environ.get('AGODA_PARTNER_ID'),
+        'campaign_id': os.environ.get('AGODA_CAMPAIGN_ID'),
+        'locale': os.environ.get('AGODA_LOCALE', 'ja-jp'),
+        'currency': os.environ.get('AGODA_CURRENCY', 'JPY'),
+    }
+
+
+def _fetch_agoda(external_id: str, check_in: str, check_out: str, adults: int, children: int,
+                 spot_id: int) -> List[Dict[str, Any]]:
+    # 価格だけ取る（deeplink は締切に間に合わなくても agoda_offer で組み立てる）
+    params = _agoda_params()
+    price_info = fetch_agoda_price_by_hotel(
+        hotel_id=external_id,
+        check_in=check_in,
+        check_out=check_out,
+        adults=adults,
+        locale=params['locale'],
+        currency=params['currency'],
+        sub_id=f"spot_{spot_id}",
+    )
+    return [price_info] if price_info else []
+
+
+_FETCHERS: Dict[str, Callable[..., List[Dict[str, Any]]]] = {
+    'dataforseo': _fetch_dataforseo,
+    'rakuten': _fetch_rakuten,
+    'agoda': _fetch_agoda,
+}
+
+
+def agoda_offer(spot_id: int, agoda_hotel_id: Optional[str], check_in: str, check_out: str, adults: int,
+                children: int, price_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Agoda のオファー。価格が取れていなければ deeplink のみ（MVP）。"""
+    params = _agoda_params()
+    deeplink = build_agoda_deeplink(
+        agoda_hotel_id=agoda_hotel_id,
+        check_in=check_in,
+        check_out=check_out,
+        adults=adults,
+        children=children,
+        cid=params['cid'],
+        campaign_id=params['campaign_id'],
+        locale=params['locale'],
+        currency=params['currency'],
+        sub_id=f"spot_{spot_id}",
+    )
+    return {
+        'provider': 'Agoda',
+        'price': price_info.get('price') if price_info else None,
+        'currency': price_info.get('currency') if price_info else params['currency'],
+        'deeplink': price_info.get('deeplink') if price_info and price_info.get('deeplink') else deeplink,
+        'is_min_price': True,
+    }
+
+
+def _call_provider(app, provider: str, fetch: Callable[..., List[Dict[str, Any]]], args: tuple) -> tuple:
+    """(status, offers, ms) を返す。status は ok / empty / errors。"""
+    with app.app_context():
+        started = time.monotonic()
+        status, offers = 'errors', []
+        try:
+            offers = fetch(*args) or []
+            status = 'ok' if offers else 'empty'
+        except Exception as e:
+            logger.warning(f"hotel offers {provider} failed: {e}")
+        ms = int((time.monotonic() - started) * 1000)
+        _record(provider, status, ms)
+        return status, offers, ms
+
+
+def aggregate_offers(spot_id: int, check_in: str, check_out: str, adults: int, children: int = 0,
+                     deadline: Optional[float] = None, mappings: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """マッピングのある全プロバイダに並列で問い合わせ、共通の締切（HOTEL_OFFERS_DEADLINE 秒）までに返った分を集める。
+
+    戻り値:
+    - offers: DataForSEO → 楽天の順に並べたオファー（未ソート・未ラップ）
+    - fallback: offers が空のときに使う Agoda のオファー（マッピングが無ければ空）
+    - partial: 締切に間に合わなかったプロバイダがあれば True
+    - providers: provider → {'status': ok/empty/errors/timeout, 'ms': 所要ミリ秒}
+    締切を過ぎた呼び出しは待たずに返す（裏で最後まで走り、所要時間は provider_stats に記録される）。
+    mappings を渡せばマッピングは引き直さない（バッチ用）。
+    """
+    deadline = float(deadline if deadline is not None else _cfg('HOTEL_OFFERS_DEADLINE', 5.0))
+    if mappings is None:
+        mappings = provider_mappings(spot_id)
+    app = current_app._get_current_object()
+    executor = _get_executor()
+
+    started = time.monotonic()
+    args = (check_in, check_out, adults, children, spot_id)
+    futures = {
+        provider: executor.submit(_call_provider, app, provider, _FETCHERS[provider], (mappings[provider],) + args)
+        for provider in PROVIDERS if provider in mappings
+    }
+    done, _ = wait(futures.values(), timeout=deadline)
+
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    providers: Dict[str, Dict[str, Any]] = {}
+    timed_out = []
+    for provider, future in futures.items():
+        if future in done:
+            status, results[provider], ms = future.result()
+            providers[provider] = {'status': status, 'ms': ms}
+        else:
+            timed_out.append(provider)
+            providers[provider] = {'status': 'timeout', 'ms': int((time.monotonic() - started) * 1000)}
+    _record_timeouts(timed_out)
+    if timed_out:
+        logger.info(f"hotel offers spot={spot_id}: {', '.join(timed_out)} missed the {deadline}s deadline")
+
+    offers = results.get('dataforseo', []) + results.get('rakuten', [])
+    fallback = []
+    if 'agoda' in mappings:
+        price_info = (results.get('agoda') or [None])[0]
+        fallback = [agoda_offer(spot_id, mappings['agoda'], check_in, check_out, adults, children, price_info)]
+    return {
+        'offers': offers,
+        'fallback': fallback,
+        'partial': bool(timed_out),
+        'providers': providers,
+    }
+
+
+def price_value(offer: Dict[str, Any]) -> float:
+    try:
+        return float(offer['price']) if offer.get('price') is not None else float('inf')
+    except Exception:
+        return float('inf')
+
+
+def mark_min_flag(offers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """最安値のものだけ is_min_price=True にした新しいリスト（非破壊）。"""
+    if not isinstance(offers, list) or not offers:
+        return offers
+    values = [price_value(o) for o in offers]
+    min_val = min(values)
+    min_idx = values.index(min_val)
+    return [dict(o, is_min_price=(idx == min_idx and min_val != float('inf'))) for idx, o in enumerate(offers)]
+
+
+def compute_min_offer(offers: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """価格が数値のもののうち最安値（コピー）。無ければ None。"""
+    priced = [o for o in offers or [] if price_value(o) != float('inf')]
+    if not priced:
+        return None
+    return dict(min(priced, key=price_value), is_min_price=True)
+
+
+def cache_key(spot_id: int, check_in: str, check_out: str, adults: int, children: int) -> str:
+    return f"{CACHE_KEY_PREFIX}{spot_id}:{check_in}:{check_out}:{adults}:{children}"
+
+
+def compute_offers(spot: Spot, check_in: str, check_out: str, adults: int, children: int = 0,
+                   mappings: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """プロバイダから取り直した応答（キャッシュは見ない）。
+
+    戻り値は {offers, min_offer, partial}。offers は価格昇順・アフィリエイト包み・最安値フラグ付き。
+    DataForSEO・楽天が空なら Agoda のフォールバック1件（価格が無くても min_offer にする）。
+    """
+    aggregated = aggregate_offers(spot.id, check_in, check_out, adults, children, mappings=mappings)
+    offers = aggregated['offers']
+    if offers:
+        offers.sort(key=price_value)
+        try:
+            # コンテキスト付きでラップ（BookingはAllez優先）
+            offers = wrap_offers_with_context(offers, spot)
+        except Exception:
+            pass
+        offers = mark_min_flag(offers)
+        min_offer = offers[0] if price_value(offers[0]) != float('inf') else None
+    elif aggregated['fallback']:
+        offer = aggregated['fallback'][0]
+        try:
+            wrapped = wrap_offers([offer])
+            if isinstance(wrapped, list) and wrapped:
+                offer = wrapped[0]
+        except Exception:
+            pass
+        offers, min_offer = [offer], offer
+    else:
+        min_offer = None
+    return {'offers': offers, 'min_offer': min_offer, 'partial': aggregated['partial']}
+
+
+def _count(field: str, n: int = 1) -> None:
+    try:
+        client = get_redis_client()
+        if client is not None:
+            client.hincrby(CACHE_STATS_KEY, field, n)
+    except redis.exceptions.RedisError:
+        pass
+
+
+def cache_stats() -> Dict[str, Any]:
+    """hit（新鮮）/ stale（古い値を返して裏で再計算）/ miss（その場で計算）などの累計とヒット率。"""
+    client = get_redis_client()
+    raw = client.hgetall(CACHE_STATS_KEY) if client is not None else {}
+    counters = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+    row = {f: counters.get(f, 0) for f in CACHE_STAT_FIELDS}
+    lookups = row['hit'] + row['stale'] + row['miss']
+    row['hit_rate'] = round((row['hit'] + row['stale']) / lookups, 4) if lookups else 0.0
+    return row
+
+
+def decode_entry(raw: Any) -> Optional[Dict[str, Any]]:
+    """キャッシュ値 → {offers, min_offer, partial, fresh_until}。旧形式（offers の配列）は stale 扱い。"""
+    if not raw:
+        return None
+    try:
+        value = json.loads(raw)
+    except Exception:
+        return None
+    if isinstance(value, list):
+        offers = mark_min_flag(value)
+        return {'offers': offers, 'min_offer': compute_min_offer(offers), 'partial': False, 'fresh_until': 0}
+    if isinstance(value, dict) and isinstance(value.get('offers'), list):
+        return value
+    return None
+
+
+def store_entry(key: str, result: Dict[str, Any], client=None) -> Dict[str, Any]:
+    """soft TTL（途中結果は HOTEL_OFFERS_PARTIAL_TTL）を fresh_until に入れ、hard TTL で Redis に置く。"""
+    soft = int(_cfg('HOTEL_OFFERS_PARTIAL_TTL', 60)) if result['partial'] else int(_cfg('HOTEL_OFFERS_SOFT_TTL', 600))
+    hard = max(int(_cfg('HOTEL_OFFERS_HARD_TTL', 3600)), soft)
+    entry = dict(result, fresh_until=time.time() + soft)
+    client = client if client is not None else get_redis_client()
+    if client is not None:
+        try:
+            client.set(key, json.dumps(entry), ex=hard)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"hotel offers cache write failed: {e}")
+    return entry
+
+
+def _acquire_lock(client, key: str) -> Optional[str]:
+    token = uuid.uuid4().hex
+    try:
+        ttl = int(_cfg('HOTEL_OFFERS_LOCK_TTL', 30))
+        if client.set(LOCK_KEY_PREFIX + key, token, nx=True, ex=ttl):
+            return token
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"hotel offers lock failed: {e}")
+    return None
+
+
+def _release_lock(client, key: str, token: str) -> None:
+    try:
+        client.eval(_RELEASE_SCRIPT, 1, LOCK_KEY_PREFIX + key, token)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"hotel offers lock release failed: {e}")
+
+
+def _refresh(app, key: str, token: str, spot_id: int, check_in: str, check_out: str, adults: int,
+             children: int) -> None:
+    """裏での再計算（ロックを取ったリクエストだけが投げる）。"""
+    with app.app_context():
+        client = get_redis_client()
+        try:
+            spot = Spot.query.get(spot_id)
+            if spot is None or not spot.is_active:
+                return
+            store_entry(key, compute_offers(spot, check_in, check_out, adults, children), client)
+            _count('refresh')
+        except Exception as e:
+            _count('refresh_error')
+            logger.warning(f"hotel offers refresh failed for {key}: {e}")
+        finally:
+            _release_lock(client, key, token)
+
+
+def warm(spot: Spot, check_in: str, check_out: str, adults: int, children: int = 0,
+         mappings: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+    """キャッシュを計算し直して置く（offers-prewarm 用）。同じキーを他が計算中なら何もせず None。"""
+    key = cache_key(spot.id, check_in, check_out, adults, children)
+    client = get_redis_client()
+    token = _acquire_lock(client, key) if client is not None else None
+    if client is not None and token is None:
+        return None
+    try:
+        entry = store_entry(key, compute_offers(spot, check_in, check_out, adults, children, mappings), client)
+        _count('prewarm')
+        return entry
+    finally:
+        if token:
+            _release_lock(client, key, token)
+
+
+def _compute_single_flight(client, key: str, spot: Spot, check_in: str, check_out: str, adults: int,
+                           children: int, mappings: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """ミス時の計算。プロセス内は Future、プロセス間は Redis ロックで同じキーの計算を1回にまとめる。"""
+    with _inflight_lock:
+        leader = _inflight.get(key)
+        if leader is None:
+            future: Future = Future()
+            _inflight[key] = future
+    if leader is not None:
+        _count('coalesced')
+        try:
+            return leader.result(timeout=float(_cfg('HOTEL_OFFERS_DEADLINE', 5.0)) + 5)
+        except Exception as e:
+            # 先行の計算が遅い・失敗した: 500 にせず空の途中結果を返す（キャッシュはしない）
+            logger.warning(f"hotel offers coalesced wait failed for {key}: {e!r}")
+            return {'offers': [], 'min_offer': None, 'partial': True}
+
+    try:
+        token = _acquire_lock(client, key) if client is not None else None
+        if client is not None and token is None:
+            # 他のプロセスが計算中: 締切まで書き込みを待ち、来なければ自分で計算する
+            waited_until = time.monotonic() + float(_cfg('HOTEL_OFFERS_DEADLINE', 5.0)) + 1
+            while time.monotonic() < waited_until:
+                time.sleep(0.1)
+                try:
+                    entry = decode_entry(client.get(key))
+                except redis.exceptions.RedisError:
+                    break
+                if entry is not None:
+                    _count('coalesced')
+                    future.set_result(entry)
+                    return entry
+        try:
+            entry = store_entry(key, compute_offers(spot, check_in, check_out, adults, children, mappings), client)
+        finally:
+            if token:
+                _release_lock(client, key, token)
+        future.set_result(entry)
+        return entry
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _serve_cached(client, key: str, entry: Dict[str, Any], spot_id: int, check_in: str, check_out: str,
+                  adults: int, children: int) -> str:
+    """キャッシュにあった値の状態（hit / stale）。stale ならロックを取れたときだけ裏で再計算を投げる。"""
+    state = 'hit' if entry.get('fresh_until', 0) > time.time() else 'stale'
+    _count(state)
+    if state == 'stale':
+        token = _acquire_lock(client, key)
+        if token:
+            app = current_app._get_current_object()
+            _get_refresh_executor().submit(_refresh, app, key, token, spot_id, check_in, check_out,
+                                           adults, children)
+    return state
+
+
+def get_offers(spot: Spot, check_in: str, check_out: str, adults: int, children: int = 0) -> Dict[str, Any]:
+    """キャッシュ経由のオファー（stale-while-revalidate）。
+
+    戻り値は {offers, min_offer, partial, cache}。cache は hit / stale / miss。
+    - hit: soft TTL 内の値をそのまま返す
+    - stale: soft TTL 切れ・hard TTL 内の値を返し、ロックを取れたリクエストだけが裏で再計算する
+    - miss: その場で計算する（同じキーの同時ミスは1回の計算を待ち合わせる）
+    """
+    key = cache_key(spot.id, check_in, check_out, adults, children)
+    client = None
+    entry = None
+    try:
+        client = get_redis_client()
+        if client is not None:
+            entry = decode_entry(client.get(key))
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"hotel offers cache read failed: {e}")
+        client = None
+
+    if entry is not None:
+        state = _serve_cached(client, key, entry, spot.id, check_in, check_out, adults, children)
+    else:
+        state = 'miss'
+        _count(state)
+        entry = _compute_single_flight(client, key, spot, check_in, check_out, adults, children)
+    return {
+        'offers': entry['offers'],
+        'min_offer': entry['min_offer'],
+        'partial': bool(entry.get('partial')),
+        'cache': state,
+    }
+
+
+def _compute_for_batch(app, client, key: str, spot: Spot, check_in: str, check_out: str, adults: int,
+                       children: int, mappings: Dict[str, str]) -> Dict[str, Any]:
+    with app.app_context():
+        return _compute_single_flight(client, key, spot, check_in, check_out, adults, children, mappings)
+
+
+def get_min_offers(spot_ids: List[int], check_in: str, check_out: str, adults: int,
+                   children: int = 0) -> Dict[int, Dict[str, Any]]:
+    """複数スポットの最安値をまとめて返す（プロフィールページ用）。
+
+    スポットは1クエリ、マッピングは provider_mappings のキャッシュ（ミス分だけ1クエリ）、オファーのキャッシュは
+    MGET 1往復で引き、ミスしたスポットだけ HOTEL_OFFERS_BATCH_CONCURRENCY 件ずつプロバイダへ問い合わせる。
+    戻り値は spot_id → {min_offer, cache, partial}。cache は hit / stale / miss / none（マッピング無し）/
+    pending（HOTEL_OFFERS_BATCH_DEADLINE に間に合わなかった。計算は続き、結果はキャッシュに入る）。
+    公開中でないスポットは含まない。
+    """
+    spots = Spot.query.filter(Spot.id.in_(spot_ids), Spot.is_active == True).all() if spot_ids else []
+    mappings = provider_mappings_for([spot.id for spot in spots])
+    results: Dict[int, Dict[str, Any]] = {}
+    targets = []
+    for spot in spots:
+        if spot.id in mappings:
+            targets.append(spot)
+        else:
+            results[spot.id] = {'min_offer': None, 'cache': 'none', 'partial': False}
+    if not targets:
+        return results
+
+    keys = [cache_key(spot.id, check_in, check_out, adults, children) for spot in targets]
+    client = None
+    raws: List[Any] = [None] * len(keys)
+    try:
+        client = get_redis_client()
+        if client is not None:
+            raws = client.mget(keys)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"hotel offers cache read failed: {e}")
+        client = None
+
+    app = current_app._get_current_object()
+    executor = _get_batch_executor()
+    futures = {}
+    for spot, key, raw in zip(targets, keys, raws):
+        entry = decode_entry(raw)
+        if entry is not None:
+            state = _serve_cached(client, key, entry, spot.id, check_in, check_out, adults, children)
+            results[spot.id] = {'min_offer': entry['min_offer'], 'cache': state, 'partial': bool(entry.get('partial'))}
+        else:
+            _count('miss')
+            futures[spot.id] = executor.submit(_compute_for_batch, app, client, key, spot, check_in, check_out,
+                                               adults, children, mappings[spot.id])
+
+    if futures:
+        done, _ = wait(futures.values(), timeout=float(_cfg('HOTEL_OFFERS_BATCH_DEADLINE', 8.0)))
+        for spot_id, future in futures.items():
+            if future not in done:
+                results[spot_id] = {'min_offer': None, 'cache': 'pending', 'partial': True}
+                continue
+            try:
+                entry = future.result()
+                results[spot_id] = {'min_offer': entry['min_offer'], 'cache': 'miss',
+                                    'partial': bool(entry.get('partial'))}
+            except Exception as e:
+                logger.warning(f"hotel offers batch failed for spot {spot_id}: {e}")
+                results[spot_id] = {'min_offer': None, 'cache': 'miss', 'partial': True}
+    return results
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+import redis
+from flask import current_app
+
+from app import db
+from app.models import ImportProgress, User
+from app.services.google_photos import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+# Redis キー
+SLOTS_KEY = 'ig:auto_import:slots'                # 同時実行枠（holder → リース期限の ZSET）
+COOLDOWN_KEY_PREFIX = 'ig:cooldown:'              # トークンごとの Graph API 制限の待ち時間
+RUN_KEY_PREFIX = 'ig:auto_import:run:'            # 実行ごとの集計（HASH）
+LAST_RUN_KEY = 'ig:auto_import:last_run'
+RUN_REPORT_TTL = 7 * 86400
+# rate_limited / reauth_required は users_failed の内訳
+REPORT_FIELDS = ('scheduled', 'users_done', 'users_failed', 'rate_limited', 'reauth_required', 'deferred',
+                 'posts', 'api_calls', 'candidates')
+
+# 期限切れのリースを掃除してから、空きがあれば holder を登録する（全ワーカーで共有の上限）
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+  redis.call('ZADD', KEYS[1], ARGV[4], ARGV[3])
+  return 1
+end
+return 0
+"""
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def _token_key(token: str) -> str:
+    # トークンそのものはキーに残さない
+    return COOLDOWN_KEY_PREFIX + hashlib.sha256(token.encode('utf-8')).hexdigest()[:24]
+
+
+def set_cooldown(token: str, seconds: Optional[int] = None, reason: str = '') -> None:
+    """このトークンでの Graph API 呼び出しを seconds 秒（既定 IG_AUTO_IMPORT_COOLDOWN）止める。"""
+    if not token:
+        return
+    seconds = int(seconds if seconds is not None else _cfg('IG_AUTO_IMPORT_COOLDOWN', 3600))
+    try:
+        client = get_redis_client()
+        if client is not None:
+            client.set(_token_key(token), reason or '1', ex=max(seconds, 1))
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"ig cooldown write failed: {e}")
+
+
+def cooldown_remaining(token: str) -> int:
+    """待ち時間の残り秒数（無ければ 0）。"""
+    if not token:
+        return 0
+    try:
+        client = get_redis_client()
+        if client is not None:
+            return max(int(client.ttl(_token_key(token))), 0)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"ig cooldown read failed: {e}")
+    return 0
+
+
+def acquire_slot(holder: str, limit: Optional[int] = None, lease_seconds: Optional[int] = None) -> bool:
+    """全 RQ ワーカー共通の同時実行枠を1つ取る。Redis が使えないときは制限しない。
+
+    ワーカーが落ちても枠が戻るようにリース（既定はジョブのタイムアウトと同じ 600 秒）で持つ。
+    """
+    limit = int(limit or _cfg('IG_AUTO_IMPORT_CONCURRENCY', 4))
+    lease_seconds = int(lease_seconds or _cfg('IG_AUTO_IMPORT_LEASE', 600))
+    now = time.time()
+    try:
+        client = get_redis_client()
+        if client is None:
+            return True
+        return bool(client.eval(_ACQUIRE_SCRIPT, 1, SLOTS_KEY, now, limit, holder, now + lease_seconds))
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"ig auto import slot acquire failed: {e}")
+        return True
+
+
+def release_slot(holder: str) -> None:
+    try:
+        client = get_redis_client()
+        if client is not None:
+            client.zrem(SLOTS_KEY, holder)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"ig auto import slot release failed: {e}")
+
+
+def record(run_id: str, **counts: int) -> None:
+    """実行ごとの集計に加算する。"""
+    counts = {k: int(v) for k, v in counts.items() if v}
+    if not run_id or not counts:
+        return
+    try:
+        client = get_redis_client()
+        if client is not None:
+            pipe = client.pipeline()
+            for field, n in counts.items():
+                pipe.hincrby(RUN_KEY_PREFIX + run_id, field, n)
+            pipe.expire(RUN_KEY_PREFIX + run_id, RUN_REPORT_TTL)
+            pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"ig auto import report write failed: {e}")
+
+
+def run_report(run_id: Optional[str] = None) -> Dict[str, Any]:
+    """run_id（省略時は直近の実行）の集計。"""
+    client = get_redis_client()
+    if client is None:
+        return {}
+    if not run_id:
+        raw = client.get(LAST_RUN_KEY)
+        run_id = raw.decode() if isinstance(raw, bytes) else raw
+        if not run_id:
+            return {}
+    raw = client.hgetall(RUN_KEY_PREFIX + run_id)
+    counters = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in raw.items()}
+    report = {'run_id': run_id}
+    report.update({f: counters.get(f, 0) for f in REPORT_FIELDS})
+    report['pending'] = max(report['scheduled'] - report['users_done'] - report['users_failed'], 0)
+    return report
+
+
+def _has_unsaved_result(progress: ImportProgress) -> bool:
+    """完了したインポートの候補がまだ保存されていない（ユーザーが job_id で結果を見に来る）。"""
+    if progress.status != 'completed' or not progress.result_data or progress.save_status == 'completed':
+        return False
+    try:
+        return bool(json.loads(progress.result_data).get('spot_candidates'))
+    except (ValueError, AttributeError):
+        return False
+
+
+def _skip_reason(progress: Optional[ImportProgress]) -> Optional[str]:
+    """自動インポートを積まない理由。手動のジョブが動いている・未保存の結果があるときは残す。"""
+    if progress is None:
+        return None
+    if progress.status in ('pending', 'processing') \
+            and progress.last_imported_at > datetime.utcnow() - timedelta(minutes=15):
+        return 'running'
+    if _has_unsaved_result(progress):
+        return 'unsaved'
+    return None
+
+
+def _prepare_progress(user: User, progress: Optional[ImportProgress], lookback_days: int) -> ImportProgress:
+    """自動インポート用に ImportProgress を pending にする（_skip_reason が None のときだけ呼ぶ）。"""
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=lookback_days)
+    job_id = str(uuid.uuid4())
+    if progress:
+        # 差分インポートが途中で落ちていればカーソルと途中結果を残して再開させる（/import/instagram/start と同じ）
+        resume = progress.next_page_cursor and progress.status in ('failed', 'processing')
+        if not resume:
+            progress.result_data = None
+            progress.next_page_cursor = None
+        progress.job_id = job_id
+        progress.status = 'pending'
+        progress.error_info = None
+        progress.import_period_start = datetime.combine(start, datetime.min.time())
+        progress.import_period_end = datetime.combine(today, datetime.min.time())
+    else:
+        progress = ImportProgress(
+            user_id=user.id,
+            source='instagram',
+            job_id=job_id,
+            status='pending',
+            import_period_start=datetime.combine(start, datetime.min.time()),
+            import_period_end=datetime.combine(today, datetime.min.time()),
+        )
+        db.session.add(progress)
+    return progress
+
+
+def schedule(dry_run: bool = False, max_jitter: Optional[int] = None, lookback_days: Optional[int] = None,
+             limit: Optional[int] = None) -> Dict[str, Any]:
+    """instagram_token が有効な全ユーザーの差分インポートを RQ に積む（開始時刻は 0〜max_jitter 秒ずらす）。
+
+    手動インポートが動いているユーザー、保存されていない完了済みの結果があるユーザー
+    （上書きすると結果のポーリングが 404 になる）と、Graph API 制限の待ち時間中のトークンは飛ばす。
+    実行の集計は run_report(run_id) で見られる。
+    """
+    from rq import Queue
+    from app.tasks import auto_import_instagram
+
+    max_jitter = int(max_jitter if max_jitter is not None else _cfg('IG_AUTO_IMPORT_JITTER', 900))
+    lookback_days = int(lookback_days if lookback_days is not None else _cfg('IG_AUTO_IMPORT_LOOKBACK_DAYS', 30))
+    run_id = datetime.utcnow().strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:6]
+
+    now = datetime.utcnow()
+    query = (User.query
+             .filter(User.instagram_token.isnot(None))
+             .filter((User.instagram_token_expires_at == None) | (User.instagram_token_expires_at > now))
+             .order_by(User.id))
+    if limit:
+        query = query.limit(limit)
+    users = query.all()
+
+    summary = {'run_id': run_id, 'eligible': len(users), 'scheduled': 0,
+               'skipped_running': 0, 'skipped_unsaved': 0, 'skipped_cooldown': 0}
+    queue = None if dry_run else Queue(connection=get_redis_client())
+    for user in users:
+        if cooldown_remaining(user.instagram_token):
+            summary['skipped_cooldown'] += 1
+            continue
+        progress = ImportProgress.query.filter_by(user_id=user.id, source='instagram').first()
+        reason = _skip_reason(progress)
+        if reason:
+            summary['skipped_' + reason] += 1
+            continue
+        if dry_run:
+            summary['scheduled'] += 1
+            continue
+        progress = _prepare_progress(user, progress, lookback_days)
+        db.session.commit()
+        start = progress.import_period_start.date().isoformat()
+        end = progress.import_period_end.date().isoformat()
+        queue.enqueue_in(
+            timedelta(seconds=random.uniform(0, max_jitter)),
+            auto_import_instagram,
+            args=[run_id, progress.job_id, user.id, start, end],
+            job_timeout=600,
+            job_id=progress.job_id,
+        )
+        summary['scheduled'] += 1
+
+    if not dry_run:
+        record(run_id, scheduled=summary['scheduled'])
+        try:
+            get_redis_client().set(LAST_RUN_KEY, run_id, ex=RUN_REPORT_TTL)
+        except redis.exceptions.RedisError:
+            pass
+    return summary
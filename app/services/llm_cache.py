@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import redis
+from flask import current_app, has_app_context
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.services.google_photos import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+# namespace ごとのプロンプト版。プロンプトや出力形式を変えたら上げる（キーが変わり旧エントリは参照されない）
+PROMPT_VERSIONS = {
+    # キャプション → 施設名リスト。プロンプトごとに出力が変わるので namespace を分ける
+    'caption_spots': 1,          # tasks._caption_prompt（投稿単位）
+    'caption_spots_batch': 1,    # tasks._batch_caption_prompt（複数投稿を1リクエスト）
+    'caption_spots_analyze': 1,  # 同期の /import/instagram/analyze のプロンプト
+    'place_category': 2,   # Google Places types → 日本語カテゴリ（tasks._generate_japanese_category、対応表に無いときだけ）
+    'hotel_match': 1,      # スポット名 × 楽天候補の適合スコア（rakuten_api.evaluate_hotel_candidates_with_llm）
+}
+
+REDIS_KEY_PREFIX = 'llm:cache:v1:'
+STATS_KEY = 'llm:cache:stats'
+STAT_FIELDS = ('redis_hit', 'db_hit', 'miss', 'store')
+
+_local_stats: Dict[str, int] = {}
+_local_stats_lock = threading.Lock()
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def _enabled() -> bool:
+    # Redis クライアントと DB エンジンはアプリコンテキストから取るので、外では素通しにする
+    if not has_app_context():
+        return False
+    return str(_cfg('LLM_CACHE_ENABLED', 'true')).lower() not in ('0', 'false', 'no')
+
+
+def cache_key(namespace: str, model: str, payload: Any) -> str:
+    """model + プロンプト版 + 入力（正規化した JSON）の sha256。"""
+    raw = json.dumps(
+        [namespace, model, PROMPT_VERSIONS[namespace], payload],
+        ensure_ascii=False, sort_keys=True, separators=(',', ':'),
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _count(namespace: str, **fields: int) -> None:
+    fields = {f"{namespace}:{name}": n for name, n in fields.items() if n > 0}
+    if not fields:
+        return
+    with _local_stats_lock:
+        for name, n in fields.items():
+            _local_stats[name] = _local_stats.get(name, 0) + n
+    try:
+        client = get_redis_client()
+        if client is not None:
+            pipe = client.pipeline()
+            for name, n in fields.items():
+                pipe.hincrby(STATS_KEY, name, n)
+            pipe.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+
+def get_many(namespace: str, model: str, payloads: Sequence[Any]) -> List[Optional[Any]]:
+    """payloads と同じ順序で値（無ければ None）を返す。Redis → llm_cache テーブルの順に引く。"""
+    if not payloads or not _enabled():
+        return [None] * len(payloads)
+    keys = [cache_key(namespace, model, p) for p in payloads]
+    found: Dict[str, Any] = {}
+
+    client = None
+    try:
+        client = get_redis_client()
+        if client is not None:
+            for key, raw in zip(keys, client.mget([REDIS_KEY_PREFIX + k for k in keys])):
+                if raw is not None:
+                    found[key] = json.loads(raw)
+    except (redis.exceptions.RedisError, ValueError) as e:
+        logger.warning(f"llm cache redis read failed: {e}")
+        client = None
+    redis_hits = len(found)
+
+    missing = [k for k in dict.fromkeys(keys) if k not in found]
+    db_rows = {}
+    if missing:
+        try:
+            with db.engine.begin() as conn:
+                rows = conn.execute(text(
+                    """
+                    UPDATE llm_cache SET hits = hits + 1, last_hit_at = NOW()
+                    WHERE key = ANY(:keys) AND expires_at > NOW()
+                    RETURNING key, value, expires_at
+                    """
+                ), {'keys': missing}).fetchall()
+            for key, value, expires_at in rows:
+                value = json.loads(value) if isinstance(value, str) else value
+                found[key] = value
+                db_rows[key] = (value, expires_at)
+        except SQLAlchemyError as e:
+            logger.warning(f"llm cache db read failed: {e}")
+
+    # テーブルで見つかった分は Redis に戻しておく
+    if client is not None and db_rows:
+        try:
+            pipe = client.pipeline()
+            for key, (value, expires_at) in db_rows.items():
+                pipe.set(REDIS_KEY_PREFIX + key, json.dumps(value, ensure_ascii=False), ex=_redis_ttl(expires_at))
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"llm cache redis backfill failed: {e}")
+
+    results = [found.get(k) for k in keys]
+    _count(namespace,
+           redis_hit=sum(1 for k in keys if k in found and k not in db_rows),
+           db_hit=sum(1 for k in keys if k in db_rows),
+           miss=sum(1 for r in results if r is None))
+    logger.debug(f"llm cache {namespace}: {redis_hits} redis / {len(db_rows)} db / {len(keys)} keys")
+    return results
+
+
+def get(namespace: str, model: str, payload: Any) -> Optional[Any]:
+    return get_many(namespace, model, [payload])[0]
+
+
+def _redis_ttl(expires_at: Optional[datetime] = None) -> int:
+    ttl = int(_cfg('LLM_CACHE_REDIS_TTL', 7 * 86400))
+    if expires_at is not None:
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        remaining = int((expires_at - datetime.now(timezone.utc)).total_seconds())
+        ttl = min(ttl, remaining)
+    return max(ttl, 1)
+
+
+def put_many(namespace: str, model: str, items: Iterable[Tuple[Any, Any]], ttl_days: Optional[int] = None) -> None:
+    """(payload, value) を Redis と llm_cache テーブルの両方に保存する。失敗しても例外は出さない。"""
+    if not _enabled():
+        return
+    ttl_days = int(ttl_days if ttl_days is not None else _cfg('LLM_CACHE_TTL_DAYS', 30))
+    expires_at = datetime.now(timezone.utc) + timedelta(days=ttl_days)
+    version = PROMPT_VERSIONS[namespace]
+    rows = {}
+    for payload, value in items:
+        if value is None:
+            continue
+        rows[cache_key(namespace, model, payload)] = json.dumps(value, ensure_ascii=False)
+    if not rows:
+        return
+
+    try:
+        client = get_redis_client()
+        if client is not None:
+            pipe = client.pipeline()
+            for key, raw in rows.items():
+                pipe.set(REDIS_KEY_PREFIX + key, raw, ex=_redis_ttl(expires_at))
+            pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"llm cache redis write failed: {e}")
+
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                """
+                INSERT INTO llm_cache (key, namespace, model, prompt_version, value, hits, created_at, expires_at)
+                VALUES (:key, :namespace, :model, :version, CAST(:value AS json), 0, NOW(), :expires_at)
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+                """
+            ), [
+                {'key': key, 'namespace': namespace, 'model': model, 'version': version,
+                 'value': raw, 'expires_at': expires_at}
+                for key, raw in rows.items()
+            ])
+    except SQLAlchemyError as e:
+        logger.warning(f"llm cache db write failed: {e}")
+    _count(namespace, store=len(rows))
+
+
+def put(namespace: str, model: str, payload: Any, value: Any, ttl_days: Optional[int] = None) -> None:
+    put_many(namespace, model, [(payload, value)], ttl_days)
+
+
+def cache_stats(reset: bool = False) -> Dict[str, Dict[str, Any]]:
+    """namespace ごとのヒット数とヒット率。Redis が使えればプロセス横断の累計、無ければこのプロセスの値。"""
+    counters: Dict[str, int] = {}
+    try:
+        client = get_redis_client()
+        if client is not None:
+            raw = client.hgetall(STATS_KEY)
+            counters = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in raw.items()}
+            if reset:
+                client.delete(STATS_KEY)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"llm cache stats read failed: {e}")
+    if not counters:
+        with _local_stats_lock:
+            counters = dict(_local_stats)
+    if reset:
+        with _local_stats_lock:
+            _local_stats.clear()
+
+    out = {}
+    for namespace in PROMPT_VERSIONS:
+        row = {f: counters.get(f"{namespace}:{f}", 0) for f in STAT_FIELDS}
+        lookups = row['redis_hit'] + row['db_hit'] + row['miss']
+        row['hit_rate'] = round((row['redis_hit'] + row['db_hit']) / lookups, 4) if lookups else 0.0
+        row['prompt_version'] = PROMPT_VERSIONS[namespace]
+        out[namespace] = row
+    return out
+
+
+def prune(dry_run: bool = False) -> Dict[str, int]:
+    """期限切れの行と、現行でないプロンプト版の行を削除する（Redis 側は TTL で消える）。"""
+    current = [{'ns': ns, 'v': v} for ns, v in PROMPT_VERSIONS.items()]
+    conditions = ' OR '.join(f"(namespace = :ns{i} AND prompt_version = :v{i})" for i in range(len(current)))
+    params = {}
+    for i, row in enumerate(current):
+        params[f'ns{i}'] = row['ns']
+        params[f'v{i}'] = row['v']
+    where = f"expires_at <= NOW() OR NOT ({conditions})"
+
+    with db.engine.begin() as conn:
+        expired = conn.execute(text("SELECT COUNT(*) FROM llm_cache WHERE expires_at <= NOW()")).scalar() or 0
+        stale = conn.execute(text(f"SELECT COUNT(*) FROM llm_cache WHERE expires_at > NOW() AND NOT ({conditions})"),
+                             params).scalar() or 0
+        if not dry_run:
+            conn.execute(text(f"DELETE FROM llm_cache WHERE {where}"), params)
+        remaining = conn.execute(text("SELECT COUNT(*) FROM llm_cache")).scalar() or 0
+    return {'expired': int(expired), 'stale_version': int(stale), 'remaining': int(remaining)}
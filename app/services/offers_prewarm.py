@@ -0,0 +1,156 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+from app.models import Spot
+from app.services.google_photos import get_redis_client
+from app.services import hotel_offers
+
+
+logger = logging.getLogger(__name__)
+
+# 直近 N 日の view 数が多い順の、価格プロバイダのマッピングがある公開中スポット（Bot 除外）
+TOP_SPOTS_SQL = """
+SELECT e.page_id AS spot_id, COUNT(*) AS views
+FROM event_log e
+JOIN spots s ON s.id = e.page_id AND s.is_active = true
+WHERE e.event_type = 'view'
+  AND e.created_at >= :since
+  AND COALESCE(e.is_bot, false) = false
+  AND EXISTS (
+    SELECT 1 FROM spot_provider_ids p
+    WHERE p.spot_id = e.page_id AND p.provider = ANY(:providers)
+  )
+GROUP BY e.page_id
+ORDER BY views DESC, e.page_id
+LIMIT :limit
+"""
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def top_spots(limit: int, days: int) -> List[Tuple[int, int]]:
+    """(spot_id, views) を view 数の多い順に。"""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    rows = db.session.execute(text(TOP_SPOTS_SQL), {
+        'since': since,
+        'providers': list(hotel_offers.PROVIDERS),
+        'limit': limit,
+    }).fetchall()
+    return [(int(r[0]), int(r[1])) for r in rows]
+
+
+def date_windows(today: Optional[date] = None, offsets: Optional[List[int]] = None,
+                 weekends: Optional[int] = None) -> List[Tuple[str, str]]:
+    """温めておく (checkIn, checkOut) の1泊の組。
+
+    - offsets: 今日から何日後のチェックインか（既定 1 = API の既定、7 = 画面側の既定）
+    - weekends: 直近の土曜泊を何週分含めるか
+    """
+    today = today or date.today()
+    if offsets is None:
+        offsets = [int(x) for x in str(_cfg('HOTEL_OFFERS_PREWARM_OFFSETS', '1,7')).split(',') if x.strip()]
+    weekends = int(weekends if weekends is not None else _cfg('HOTEL_OFFERS_PREWARM_WEEKENDS', 2))
+    check_ins = [today + timedelta(days=n) for n in offsets]
+    saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+    check_ins += [saturday + timedelta(weeks=w) for w in range(weekends)]
+    windows = []
+    for d in check_ins:
+        window = (d.isoformat(), (d + timedelta(days=1)).isoformat())
+        if window not in windows:
+            windows.append(window)
+    return sorted(windows)
+
+
+def _needs_refresh(entry: Optional[Dict[str, Any]], margin: int, now: float) -> bool:
+    """キャッシュが無いか、soft TTL の残りが margin 秒を切っていれば温め直す。"""
+    return entry is None or entry.get('fresh_until', 0) - now < margin
+
+
+def _warm(app, spot_id: int, check_in: str, check_out: str, adults: int, children: int,
+          mappings: Dict[str, str]) -> str:
+    with app.app_context():
+        try:
+            spot = Spot.query.get(spot_id)
+            if spot is None or not spot.is_active:
+                return 'skipped'
+            entry = hotel_offers.warm(spot, check_in, check_out, adults, children, mappings)
+            if entry is None:
+                return 'locked'
+            return 'partial' if entry.get('partial') else 'warmed'
+        except Exception as e:
+            logger.warning(f"offers prewarm failed for spot {spot_id} {check_in}: {e}")
+            return 'failed'
+
+
+def prewarm(limit: Optional[int] = None, days: Optional[int] = None, budget: Optional[int] = None,
+            margin: Optional[int] = None, adults: int = 2, children: int = 0,
+            dry_run: bool = False) -> Dict[str, Any]:
+    """よく見られている宿スポットの hotel_offers キャッシュを、soft TTL が切れる前に計算し直す。
+
+    対象は top_spots(limit, days) × date_windows()。view 数の多いスポット・近い日付から順に、
+    プロバイダごとの呼び出し数が budget（既定 HOTEL_OFFERS_PREWARM_BUDGET）を超えない範囲で温める。
+    予算を超えるものは飛ばして次を見る（そのプロバイダのマッピングが無いスポットはまだ入る）。
+    """
+    limit = int(limit or _cfg('HOTEL_OFFERS_PREWARM_TOP_N', 200))
+    days = int(days or _cfg('HOTEL_OFFERS_PREWARM_DAYS', 7))
+    budget = int(budget if budget is not None else _cfg('HOTEL_OFFERS_PREWARM_BUDGET', 300))
+    margin = int(margin if margin is not None else _cfg('HOTEL_OFFERS_PREWARM_MARGIN', 360))
+
+    spots = top_spots(limit, days)
+    windows = date_windows()
+    mappings = hotel_offers.provider_mappings_for([spot_id for spot_id, _ in spots])
+    items = [(spot_id, check_in, check_out) for spot_id, _ in spots if spot_id in mappings
+             for check_in, check_out in windows]
+
+    client = get_redis_client()
+    keys = [hotel_offers.cache_key(spot_id, ci, co, adults, children) for spot_id, ci, co in items]
+    raws: List[Any] = [None] * len(keys)
+    if client is not None and keys:
+        try:
+            raws = client.mget(keys)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"offers prewarm cache read failed: {e}")
+
+    summary: Dict[str, Any] = {'spots': len(spots), 'windows': len(windows), 'candidates': len(items),
+                               'fresh': 0, 'over_budget': 0, 'scheduled': 0,
+                               'warmed': 0, 'partial': 0, 'locked': 0, 'failed': 0, 'skipped': 0}
+    used = {provider: 0 for provider in hotel_offers.PROVIDERS}
+    now = time.time()
+    jobs = []
+    for (spot_id, check_in, check_out), raw in zip(items, raws):
+        if not _needs_refresh(hotel_offers.decode_entry(raw), margin, now):
+            summary['fresh'] += 1
+            continue
+        providers = list(mappings[spot_id])
+        if any(used[p] + 1 > budget for p in providers):
+            summary['over_budget'] += 1
+            continue
+        for p in providers:
+            used[p] += 1
+        jobs.append((spot_id, check_in, check_out, mappings[spot_id]))
+    summary['scheduled'] = len(jobs)
+    summary['provider_calls'] = used
+
+    if dry_run or not jobs:
+        return summary
+
+    started = time.monotonic()
+    app = current_app._get_current_object()
+    workers = max(int(_cfg('HOTEL_OFFERS_PREWARM_CONCURRENCY', 4)), 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='offers-prewarm') as pool:
+        futures = [pool.submit(_warm, app, spot_id, ci, co, adults, children, m) for spot_id, ci, co, m in jobs]
+        for future in futures:
+            summary[future.result()] += 1
+    summary['seconds'] = round(time.monotonic() - started, 1)
+    return summary
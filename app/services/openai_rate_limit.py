@@ -0,0 +1,147 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Mapping, Optional
+
+from flask import current_app
+
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """x-ratelimit-reset-* の値（'1s' / '6m0s' / '20ms' / '0.5s'）を秒にする。"""
+    if not value:
+        return None
+    total = 0.0
+    matched = False
+    for num, unit in _DURATION_PART.findall(str(value)):
+        matched = True
+        total += float(num) * {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}[unit]
+    return total if matched else None
+
+
+def count_tokens(text: str, model: str = 'gpt-4o') -> int:
+    """tiktoken でトークン数を数える。エンコーディングを読めない環境では文字数で近似する。"""
+    enc = _encodings.get(model)
+    if enc is None and model not in _encodings:
+        with _encodings_lock:
+            if model not in _encodings:
+                try:
+                    import tiktoken
+                    try:
+                        _encodings[model] = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        _encodings[model] = tiktoken.get_encoding('o200k_base')
+                except Exception as e:
+                    logger.warning(f"tiktoken unavailable for {model}; using character estimate: {e}")
+                    _encodings[model] = None
+        enc = _encodings.get(model)
+    if enc is None:
+        # 日本語はおおむね1文字1トークン前後
+        return len(text or '')
+    return len(enc.encode(text or ''))
+
+
+class _Bucket:
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """amount 取り出せるまでの秒数（0 なら即時）。"""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate if self.rate > 0 else 1.0
+
+
+class OpenAIRateLimiter:
+    """RPM/TPM の2つのトークンバケットでリクエストを間引く（スレッドセーフ）。
+
+    初期値は OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT。レスポンスの x-ratelimit-* ヘッダを受け取ったら
+    上限と残量をサーバー側の値に合わせる（組織/モデルごとの実際の上限に追従する）。
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self._lock = threading.Lock()
+        self.requests = _Bucket(rpm or int(_cfg('OPENAI_RPM_LIMIT', 500)))
+        self.tokens = _Bucket(tpm or int(_cfg('OPENAI_TPM_LIMIT', 30000)))
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self, est_tokens: int) -> float:
+        """1リクエスト分と est_tokens を確保する。待った秒数を返す。"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                delay = max(self.requests.wait_for(1), self.tokens.wait_for(est_tokens))
+                if delay <= 0:
+                    self.requests.level -= 1
+                    self.tokens.level -= min(est_tokens, self.tokens.capacity)
+                    if waited:
+                        self.waits += 1
+                        self.waited_seconds += waited
+                    return waited
+            sleep_for = min(delay, 5.0)
+            time.sleep(sleep_for)
+            waited += sleep_for
+
+    def settle(self, est_tokens: int, used_tokens: Optional[int]) -> None:
+        """見積りと実使用量（usage.total_tokens）の差を精算する。"""
+        if used_tokens is None:
+            return
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + est_tokens - used_tokens)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        if not headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for kind, bucket in (('requests', self.requests), ('tokens', self.tokens)):
+                try:
+                    limit = headers.get(f'x-ratelimit-limit-{kind}')
+                    remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+                    if limit:
+                        bucket.refill(now)
+                        bucket.capacity = float(limit)
+                        reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                        # 残量が reset 秒で満タンに戻る速度（無ければ1分で上限まで）
+                        if remaining is not None and reset:
+                            deficit = max(float(limit) - float(remaining), 0.0)
+                            bucket.rate = max(deficit / reset, float(limit) / 60.0) if deficit else float(limit) / 60.0
+                        else:
+                            bucket.rate = float(limit) / 60.0
+                    if remaining is not None:
+                        bucket.level = min(bucket.level, float(remaining))
+                except (TypeError, ValueError):
+                    continue
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'rpm_limit': int(self.requests.capacity),
+                'tpm_limit': int(self.tokens.capacity),
+                'waits': self.waits,
+                'waited_seconds': round(self.waited_seconds, 3),
+            }
@@ -0,0 +1,254 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+
+
+logger = logging.getLogger(__name__)
+
+# 対応表の版。SEED_TYPE_CATEGORIES の割り当てを変えたら上げる（旧版の行は参照されず、sync で削除される）
+MAPPING_VERSION = 1
+
+CATEGORIES = (
+    'レストラン', 'カフェ', 'バー', 'ショッピング', '観光スポット', '公園',
+    '美術館・博物館', 'ホテル', 'エンターテイメント', 'スポーツ施設', 'その他',
+)
+
+# 書き戻した行の priority。単一 type の行が他の組み合わせに効くときは最後の手段にする
+LEARNED_PRIORITY = 100
+
+# 汎用すぎてカテゴリの決め手にならない type
+IGNORED_TYPES = frozenset({'point_of_interest', 'establishment', 'premise', 'geocode'})
+
+# type: (カテゴリ, priority)。priority が小さいほど具体的で優先する（同値なら types の並び順）
+SEED_TYPE_CATEGORIES: Dict[str, Tuple[str, int]] = {
+    # 宿泊
+    'lodging': ('ホテル', 10), 'hotel': ('ホテル', 10), 'motel': ('ホテル', 10),
+    'resort_hotel': ('ホテル', 10), 'inn': ('ホテル', 10), 'japanese_inn': ('ホテル', 10),
+    'budget_japanese_inn': ('ホテル', 10), 'bed_and_breakfast': ('ホテル', 10),
+    'guest_house': ('ホテル', 10), 'hostel': ('ホテル', 10), 'extended_stay_hotel': ('ホテル', 10),
+    'cottage': ('ホテル', 10), 'private_guest_room': ('ホテル', 10), 'farmstay': ('ホテル', 10),
+    'camping_cabin': ('ホテル', 15), 'campground': ('ホテル', 30), 'rv_park': ('ホテル', 30),
+    # カフェ
+    'cafe': ('カフェ', 10), 'coffee_shop': ('カフェ', 10), 'tea_house': ('カフェ', 10),
+    'cat_cafe': ('カフェ', 10), 'dog_cafe': ('カフェ', 10), 'internet_cafe': ('カフェ', 20),
+    'bakery': ('カフェ', 20), 'dessert_shop': ('カフェ', 20), 'dessert_restaurant': ('カフェ', 20),
+    'ice_cream_shop': ('カフェ', 20), 'juice_shop': ('カフェ', 20), 'donut_shop': ('カフェ', 20),
+    'chocolate_shop': ('カフェ', 25), 'confectionery': ('カフェ', 25), 'cafeteria': ('カフェ', 35),
+    # バー
+    'bar': ('バー', 10), 'pub': ('バー', 10), 'wine_bar': ('バー', 10), 'bar_and_grill': ('レストラン', 20),
+    # レストラン
+    'japanese_restaurant': ('レストラン', 20), 'ramen_restaurant': ('レストラン', 20),
+    'sushi_restaurant': ('レストラン', 20), 'italian_restaurant': ('レストラン', 20),
+    'chinese_restaurant': ('レストラン', 20), 'korean_restaurant': ('レストラン', 20),
+    'french_restaurant': ('レストラン', 20), 'indian_restaurant': ('レストラン', 20),
+    'thai_restaurant': ('レストラン', 20), 'vietnamese_restaurant': ('レストラン', 20),
+    'mexican_restaurant': ('レストラン', 20), 'spanish_restaurant': ('レストラン', 20),
+    'american_restaurant': ('レストラン', 20), 'mediterranean_restaurant': ('レストラン', 20),
+    'seafood_restaurant': ('レストラン', 20), 'steak_house': ('レストラン', 20),
+    'barbecue_restaurant': ('レストラン', 20), 'pizza_restaurant': ('レストラン', 20),
+    'hamburger_restaurant': ('レストラン', 20), 'fast_food_restaurant': ('レストラン', 20),
+    'vegetarian_restaurant': ('レストラン', 20), 'vegan_restaurant': ('レストラン', 20),
+    'buffet_restaurant': ('レストラン', 20), 'brunch_restaurant': ('レストラン', 20),
+    'breakfast_restaurant': ('レストラン', 20), 'sandwich_shop': ('レストラン', 25),
+    'restaurant': ('レストラン', 40), 'meal_takeaway': ('レストラン', 45), 'meal_delivery': ('レストラン', 45),
+    'food': ('レストラン', 90),
+    # 美術館・博物館
+    'museum': ('美術館・博物館', 10), 'art_gallery': ('美術館・博物館', 10), 'art_studio': ('美術館・博物館', 20),
+    # 公園
+    'park': ('公園', 15), 'national_park': ('公園', 15), 'state_park': ('公園', 15),
+    'garden': ('公園', 15), 'botanical_garden': ('公園', 15), 'dog_park': ('公園', 15),
+    'playground': ('公園', 20), 'picnic_ground': ('公園', 20), 'hiking_area': ('公園', 30),
+    # エンターテイメント
+    'amusement_park': ('エンターテイメント', 15), 'water_park': ('エンターテイメント', 15),
+    'amusement_center': ('エンターテイメント', 20), 'movie_theater': ('エンターテイメント', 20),
+    'bowling_alley': ('エンターテイメント', 20), 'casino': ('エンターテイメント', 20),
+    'night_club': ('エンターテイメント', 20), 'karaoke': ('エンターテイメント', 20),
+    'video_arcade': ('エンターテイメント', 20), 'comedy_club': ('エンターテイメント', 20),
+    'performing_arts_theater': ('エンターテイメント', 20), 'concert_hall': ('エンターテイメント', 20),
+    'opera_house': ('エンターテイメント', 20), 'event_venue': ('エンターテイメント', 40),
+    # スポーツ施設
+    'gym': ('スポーツ施設', 20), 'fitness_center': ('スポーツ施設', 20), 'stadium': ('スポーツ施設', 20),
+    'arena': ('スポーツ施設', 20), 'sports_complex': ('スポーツ施設', 20), 'sports_club': ('スポーツ施設', 20),
+    'golf_course': ('スポーツ施設', 20), 'ski_resort': ('スポーツ施設', 20), 'swimming_pool': ('スポーツ施設', 20),
+    'athletic_field': ('スポーツ施設', 20), 'ice_skating_rink': ('スポーツ施設', 20),
+    'sports_activity_location': ('スポーツ施設', 30),
+    # 観光スポット
+    'zoo': ('観光スポット', 20), 'aquarium': ('観光スポット', 20), 'observation_deck': ('観光スポット', 25),
+    'historical_landmark': ('観光スポット', 25), 'historical_place': ('観光スポット', 25),
+    'cultural_landmark': ('観光スポット', 25), 'monument': ('観光スポット', 25), 'castle': ('観光スポット', 25),
+    'place_of_worship': ('観光スポット', 25), 'church': ('観光スポット', 25), 'hindu_temple': ('観光スポット', 25),
+    'buddhist_temple': ('観光スポット', 25), 'shinto_shrine': ('観光スポット', 25),
+    'mosque': ('観光スポット', 25), 'synagogue': ('観光スポット', 25), 'beach': ('観光スポット', 25),
+    'marina': ('観光スポット', 30), 'spa': ('観光スポット', 35), 'public_bath': ('観光スポット', 35),
+    'wellness_center': ('観光スポット', 40), 'visitor_center': ('観光スポット', 40),
+    'tourist_information_center': ('観光スポット', 40), 'tourist_attraction': ('観光スポット', 50),
+    'natural_feature': ('観光スポット', 60),
+    # ショッピング
+    'shopping_mall': ('ショッピング', 20), 'department_store': ('ショッピング', 20),
+    'clothing_store': ('ショッピング', 30), 'shoe_store': ('ショッピング', 30), 'jewelry_store': ('ショッピング', 30),
+    'book_store': ('ショッピング', 30), 'gift_shop': ('ショッピング', 30), 'electronics_store': ('ショッピング', 30),
+    'furniture_store': ('ショッピング', 30), 'home_goods_store': ('ショッピング', 30),
+    'sporting_goods_store': ('ショッピング', 30), 'supermarket': ('ショッピング', 30),
+    'grocery_store': ('ショッピング', 30), 'convenience_store': ('ショッピング', 30), 'market': ('ショッピング', 30),
+    'liquor_store': ('ショッピング', 30), 'florist': ('ショッピング', 30), 'drugstore': ('ショッピング', 30),
+    'pharmacy': ('ショッピング', 40), 'store': ('ショッピング', 80),
+}
+
+_table: Optional[Dict[str, Tuple[str, int, str]]] = None
+_table_loaded_at = 0.0
+_table_lock = threading.Lock()
+_stats = {'seed': 0, 'table': 0, 'unmapped': 0, 'learned': 0}
+_stats_lock = threading.Lock()
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def types_key(types_list: Iterable[str]) -> str:
+    return ','.join(sorted({str(t) for t in types_list if t}))
+
+
+def _count(field: str) -> None:
+    with _stats_lock:
+        _stats[field] += 1
+
+
+def _load_table(force: bool = False) -> Dict[str, Tuple[str, int, str]]:
+    """現行版の行をプロセス内に読み込む（PLACE_CATEGORY_TABLE_TTL 秒ごとに読み直す）。"""
+    global _table, _table_loaded_at
+    ttl = float(_cfg('PLACE_CATEGORY_TABLE_TTL', 300))
+    if not force and _table is not None and time.monotonic() - _table_loaded_at < ttl:
+        return _table
+    with _table_lock:
+        if not force and _table is not None and time.monotonic() - _table_loaded_at < ttl:
+            return _table
+        table = {}
+        try:
+            with db.engine.connect() as conn:
+                rows = conn.execute(text(
+                    "SELECT types_key, category, priority, source FROM place_type_categories WHERE version = :v"
+                ), {'v': MAPPING_VERSION}).fetchall()
+            table = {r[0]: (r[1], int(r[2]), r[3]) for r in rows}
+        except SQLAlchemyError as e:
+            # テーブルが無い・DB に届かないときはコード側の対応表だけで動かす
+            logger.warning(f"place_type_categories unavailable; using built-in mapping: {e}")
+            table = dict(_table or {})
+        _table = table
+        _table_loaded_at = time.monotonic()
+        return _table
+
+
+def category_for_types(types_list: List[str]) -> Optional[str]:
+    """対応表からカテゴリを引く。決まらなければ None（LLM で決めて remember する）。
+
+    1. 組み合わせ全体の行（以前 LLM で決めたもの）
+    2. 各 type の行（テーブル > SEED_TYPE_CATEGORIES）のうち priority が最小のもの
+    """
+    if not types_list:
+        return None
+    table = _load_table()
+    combo = table.get(types_key(types_list))
+    if combo:
+        _count('table')
+        return combo[0]
+
+    best = None  # (priority, 並び順, カテゴリ, 出どころ)
+    for order, t in enumerate(types_list):
+        if t in IGNORED_TYPES:
+            continue
+        if t in table:
+            category, priority, _ = table[t]
+            source = 'table'
+        elif t in SEED_TYPE_CATEGORIES:
+            category, priority = SEED_TYPE_CATEGORIES[t]
+            source = 'seed'
+        else:
+            continue
+        if best is None or (priority, order) < best[:2]:
+            best = (priority, order, category, source)
+    if best is None:
+        _count('unmapped')
+        return None
+    _count(best[3])
+    return best[2]
+
+
+def remember(types_list: List[str], category: str, source: str = 'llm') -> bool:
+    """LLM などで決めた組み合わせのカテゴリを書き戻す。固定カテゴリ以外は保存しない。"""
+    if not types_list or category not in CATEGORIES:
+        return False
+    key = types_key(types_list)
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                """
+                INSERT INTO place_type_categories (types_key, category, priority, source, version, created_at, updated_at)
+                VALUES (:key, :category, :priority, :source, :v, NOW(), NOW())
+                ON CONFLICT (types_key) DO UPDATE
+                  SET category = EXCLUDED.category, source = EXCLUDED.source,
+                      version = EXCLUDED.version, updated_at = NOW()
+                  WHERE place_type_categories.source = 'llm' OR place_type_categories.version <> EXCLUDED.version
+                """
+            ), {'key': key, 'category': category, 'priority': LEARNED_PRIORITY, 'source': source, 'v': MAPPING_VERSION})
+    except SQLAlchemyError as e:
+        logger.warning(f"failed to store place category for {key}: {e}")
+        return False
+    with _table_lock:
+        if _table is not None:
+            _table.setdefault(key, (category, LEARNED_PRIORITY, source))
+    _count('learned')
+    return True
+
+
+def sync_seed(dry_run: bool = False) -> Dict[str, int]:
+    """SEED_TYPE_CATEGORIES を現行版で書き込み、旧版の行を削除する（'manual' の現行版の行は上書きしない）。"""
+    with db.engine.begin() as conn:
+        stale = conn.execute(text(
+            "SELECT COUNT(*) FROM place_type_categories WHERE version <> :v"
+        ), {'v': MAPPING_VERSION}).scalar() or 0
+        learned = conn.execute(text(
+            "SELECT COUNT(*) FROM place_type_categories WHERE version = :v AND source = 'llm'"
+        ), {'v': MAPPING_VERSION}).scalar() or 0
+        if not dry_run:
+            conn.execute(text("DELETE FROM place_type_categories WHERE version <> :v"), {'v': MAPPING_VERSION})
+            conn.execute(text(
+                """
+                INSERT INTO place_type_categories (types_key, category, priority, source, version, created_at, updated_at)
+                VALUES (:key, :category, :priority, 'seed', :v, NOW(), NOW())
+                ON CONFLICT (types_key) DO UPDATE
+                  SET category = EXCLUDED.category, priority = EXCLUDED.priority, updated_at = NOW()
+                  WHERE place_type_categories.source = 'seed'
+                """
+            ), [
+                {'key': t, 'category': c, 'priority': p, 'v': MAPPING_VERSION}
+                for t, (c, p) in SEED_TYPE_CATEGORIES.items()
+            ])
+    if not dry_run:
+        _load_table(force=True)
+    return {'seed': len(SEED_TYPE_CATEGORIES), 'stale_removed': int(stale), 'learned': int(learned)}
+
+
+def learned_combinations(limit: int = 50) -> List[Tuple[str, str]]:
+    """LLM で決めた組み合わせ（SEED に取り込む候補の確認用）。"""
+    rows = db.session.execute(text(
+        """
+        SELECT types_key, category FROM place_type_categories
+        WHERE version = :v AND source = 'llm'
+        ORDER BY updated_at DESC LIMIT :limit
+        """
+    ), {'v': MAPPING_VERSION, 'limit': limit}).fetchall()
+    return [(r[0], r[1]) for r in rows]
+
+
+def mapping_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
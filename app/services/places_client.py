@@ -0,0 +1,298 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+import requests
+from flask import current_app, has_app_context
+
+from app.services.google_photos import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+PLACES_BASE_URL = 'https://places.googleapis.com/v1'
+USER_AGENT = 'my-map.link App (https://my-map.link)'
+
+CACHE_KEY_PREFIX = 'places:v1:'
+STATS_KEY = 'places:cache:stats'
+STAT_FIELDS = ('lru_hit', 'redis_hit', 'negative_hit', 'miss', 'request', 'error', 'invalid')
+
+# フィールドごとの TTL（秒）。フィールドマスクの TTL は含まれるフィールドの最小値
+FIELD_TTLS = {
+    'currentOpeningHours': 3600,
+    'businessStatus': 3600,
+    'photos': 86400,             # photo name は期限付きなので短め
+    'rating': 86400,
+    'userRatingCount': 86400,
+    'priceLevel': 86400,
+    'reviewSummary': 7 * 86400,
+    'editorialSummary': 7 * 86400,
+    'suggestions': 86400,        # autocomplete
+}
+
+# 見つからなかった結果として負キャッシュする HTTP ステータス
+NEGATIVE_STATUSES = (404,)
+# 400 は存在しない place id のほかフィールドマスク・キーの設定ミスでも返るため、PLACES_INVALID_TTL の短い間だけ負キャッシュする
+INVALID_STATUSES = (400,)
+_NEGATIVE = {'__negative__': True}
+
+_lru: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+_lru_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_stats: Dict[str, int] = {}
+_pending_stats: Dict[str, int] = {}
+_stats_lock = threading.Lock()
+_stats_flushed_at = time.monotonic()
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if has_app_context() else os.environ.get(key, default)
+
+
+def _api_key() -> Optional[str]:
+    return _cfg('GOOGLE_MAPS_API_KEY') or os.environ.get('GOOGLE_MAPS_API_KEY')
+
+
+def get_session() -> requests.Session:
+    """Places API 用の requests.Session（接続プール付き）をプロセスで1つ共有する。"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                pool = max(int(_cfg('PLACES_HTTP_POOL_SIZE', 16)), 1)
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool))
+                _session = session
+    return _session
+
+
+def normalize_query(query: str) -> str:
+    """全角/半角・大文字小文字・空白の違いを吸収した検索語（キャッシュキー用）。"""
+    return ' '.join(unicodedata.normalize('NFKC', query or '').split()).casefold()
+
+
+def ttl_for_field_mask(field_mask: str) -> int:
+    ttl = int(_cfg('PLACES_CACHE_TTL', 7 * 86400))
+    for field in field_mask.split(','):
+        # 'places.photos' / 'suggestions.placePrediction.placeId' / 'photos.0.name' の先頭側で判定する
+        for part in field.strip().split('.'):
+            if part in FIELD_TTLS:
+                ttl = min(ttl, FIELD_TTLS[part])
+    return ttl
+
+
+def _cache_key(kind: str, subject: str, field_mask: str, language: str, extra: Any = None) -> str:
+    mask = ','.join(sorted(f.strip() for f in field_mask.split(',') if f.strip()))
+    raw = json.dumps([kind, subject, mask, language, extra], ensure_ascii=False, separators=(',', ':'))
+    return CACHE_KEY_PREFIX + kind + ':' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _count(field: str) -> None:
+    """プロセス内で数え、一定間隔で Redis のハッシュにまとめて加算する（ヒットのたびに往復しない）。"""
+    global _stats_flushed_at
+    with _stats_lock:
+        _stats[field] = _stats.get(field, 0) + 1
+        _pending_stats[field] = _pending_stats.get(field, 0) + 1
+        if time.monotonic() - _stats_flushed_at < 30 and sum(_pending_stats.values()) < 200:
+            return
+        pending = dict(_pending_stats)
+        _pending_stats.clear()
+        _stats_flushed_at = time.monotonic()
+    client = _redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        for name, n in pending.items():
+            pipe.hincrby(STATS_KEY, name, n)
+        pipe.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+
+def _redis():
+    if not has_app_context():
+        return None
+    try:
+        return get_redis_client()
+    except redis.exceptions.RedisError:
+        return None
+
+
+def _lru_get(key: str) -> Optional[Any]:
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del _lru[key]
+            return None
+        _lru.move_to_end(key)
+        return value
+
+
+def _lru_put(key: str, value: Any, ttl: int) -> None:
+    # プロセス内は他プロセスの更新が見えないので、Redis より短い上限で持つ
+    ttl = min(ttl, int(_cfg('PLACES_LRU_TTL', 600)))
+    size = int(_cfg('PLACES_LRU_SIZE', 2048))
+    with _lru_lock:
+        _lru[key] = (time.monotonic() + ttl, value)
+        _lru.move_to_end(key)
+        while len(_lru) > size:
+            _lru.popitem(last=False)
+
+
+def _cached_call(key: str, ttl: int, fetch) -> Tuple[str, Any]:
+    """LRU → Redis → fetch() の順に引く。fetch も戻り値も (status, value)。
+
+    status: 'ok' は ttl、'negative'（見つからない）は PLACES_NEGATIVE_TTL、'invalid'（400）は PLACES_INVALID_TTL で
+    キャッシュし、'error' はキャッシュしない。'invalid' は呼び出し側へ 'negative' として返す。
+    """
+    value = _lru_get(key)
+    if value is not None:
+        _count('negative_hit' if value == _NEGATIVE else 'lru_hit')
+        return ('negative', None) if value == _NEGATIVE else ('ok', value)
+
+    client = _redis()
+    if client is not None:
+        try:
+            raw, remaining = client.pipeline().get(key).ttl(key).execute()
+            if raw is not None:
+                value = json.loads(raw)
+                _lru_put(key, value, remaining if remaining and remaining > 0 else ttl)
+                _count('negative_hit' if value == _NEGATIVE else 'redis_hit')
+                return ('negative', None) if value == _NEGATIVE else ('ok', value)
+        except (redis.exceptions.RedisError, ValueError) as e:
+            logger.warning(f"places cache read failed: {e}")
+            client = None
+
+    _count('miss')
+    _count('request')
+    status, value = fetch()
+    if status == 'error':
+        _count('error')
+        return status, None
+    stored = value
+    if status == 'invalid':
+        _count('invalid')
+        status, stored, ttl = 'negative', _NEGATIVE, int(_cfg('PLACES_INVALID_TTL', 30))
+    elif status == 'negative':
+        stored, ttl = _NEGATIVE, int(_cfg('PLACES_NEGATIVE_TTL', 600))
+    _lru_put(key, stored, ttl)
+    if client is not None:
+        try:
+            client.set(key, json.dumps(stored, ensure_ascii=False), ex=ttl)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"places cache write failed: {e}")
+    return status, value
+
+
+def _headers(field_mask: str, language: str) -> Dict[str, str]:
+    return {
+        'Content-Type': 'application/json',
+        'X-Goog-Api-Key': _api_key() or '',
+        'X-Goog-FieldMask': field_mask,
+        'X-Goog-LanguageCode': language,
+        'User-Agent': USER_AGENT,
+    }
+
+
+def _request(method: str, url: str, field_mask: str, language: str, timeout: float, **kwargs) -> Tuple[str, Any]:
+    try:
+        resp = get_session().request(method, url, headers=_headers(field_mask, language), timeout=timeout, **kwargs)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Places API request failed ({url}): {e}")
+        return 'error', None
+    if resp.status_code in NEGATIVE_STATUSES:
+        logger.info(f"Places API {resp.status_code} for {url}: {resp.text[:200]}")
+        return 'negative', None
+    if resp.status_code in INVALID_STATUSES:
+        logger.warning(f"Places API {resp.status_code} for {url}: {resp.text[:200]}")
+        return 'invalid', None
+    if resp.status_code != 200:
+        logger.warning(f"Places API {resp.status_code} for {url}: {resp.text[:200]}")
+        return 'error', None
+    try:
+        return 'ok', resp.json() if resp.content else {}
+    except ValueError:
+        return 'error', None
+
+
+def get_place(place_id: str, field_mask: str, language: str = 'ja', timeout: float = 10) -> Optional[Dict[str, Any]]:
+    """Place Details（places/{id}）。見つからない・エラーのときは None。"""
+    if not place_id or not _api_key():
+        return None
+    key = _cache_key('details', place_id, field_mask, language)
+    url = f"{PLACES_BASE_URL}/places/{place_id}"
+    _, place = _cached_call(key, ttl_for_field_mask(field_mask), lambda: _request(
+        'GET', url, field_mask, language, timeout, params={'languageCode': language},
+    ))
+    return place
+
+
+def search_text(query: str, field_mask: str, language: str = 'ja', region: str = 'JP',
+                timeout: float = 10) -> Optional[List[Dict[str, Any]]]:
+    """places:searchText の places 配列。0件は []（負キャッシュ）、エラーは None。"""
+    if not query or not query.strip() or not _api_key():
+        return None
+    subject = normalize_query(query)
+    key = _cache_key('search', subject, field_mask, language, region.upper())
+
+    def fetch():
+        status, data = _request('POST', f"{PLACES_BASE_URL}/places:searchText", field_mask, language, timeout,
+                                json={'textQuery': query, 'languageCode': language, 'regionCode': region})
+        if status != 'ok':
+            return status, None
+        places = (data or {}).get('places')
+        return ('ok', places) if places else ('negative', None)
+
+    status, places = _cached_call(key, ttl_for_field_mask(field_mask), fetch)
+    return [] if status == 'negative' else places
+
+
+def autocomplete(text_input: str, field_mask: str, language: str = 'ja', region: str = 'jp',
+                 timeout: float = 10) -> Optional[List[Dict[str, Any]]]:
+    """places:autocomplete の suggestions 配列。エラーは None。"""
+    if not text_input or not _api_key():
+        return None
+    key = _cache_key('autocomplete', normalize_query(text_input), field_mask, language, region.lower())
+
+    def fetch():
+        status, data = _request('POST', f"{PLACES_BASE_URL}/places:autocomplete", field_mask, language, timeout,
+                                json={'input': text_input, 'languageCode': language, 'regionCode': region})
+        if status != 'ok':
+            return status, None
+        suggestions = (data or {}).get('suggestions')
+        return ('ok', suggestions) if suggestions else ('negative', None)
+
+    status, suggestions = _cached_call(key, ttl_for_field_mask(field_mask), fetch)
+    return [] if status == 'negative' else suggestions
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Redis に集約したカウンタ（無ければこのプロセスの値）とヒット率。"""
+    counters: Dict[str, int] = {}
+    client = _redis()
+    if client is not None:
+        try:
+            raw = client.hgetall(STATS_KEY)
+            counters = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in raw.items()}
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"places cache stats read failed: {e}")
+    if not counters:
+        with _stats_lock:
+            counters = dict(_stats)
+    row = {f: counters.get(f, 0) for f in STAT_FIELDS}
+    lookups = row['lru_hit'] + row['redis_hit'] + row['negative_hit'] + row['miss']
+    row['hit_rate'] = round((lookups - row['miss']) / lookups, 4) if lookups else 0.0
+    return row
@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple
+
+import redis
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect as sa_inspect, select
+from sqlalchemy.orm import Session
+
+from app.models.spot_provider_id import SpotProviderId
+from app.services.google_photos import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+# 価格比較（hotel_offers）に使うプロバイダ。いずれかのマッピングがあれば has_offers
+OFFER_PROVIDERS = ('dataforseo', 'rakuten', 'agoda')
+
+CACHE_KEY_PREFIX = 'provider_mappings:v1:'
+# コミット後に無効化する spot_id を Session.info に溜めるキー
+_PENDING_KEY = 'provider_mappings_invalidate'
+
+_lru: 'OrderedDict[int, Tuple[float, Dict[str, str]]]' = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if has_app_context() else os.environ.get(key, default)
+
+
+def _redis():
+    if not has_app_context():
+        return None
+    try:
+        return get_redis_client()
+    except redis.exceptions.RedisError:
+        return None
+
+
+def _cache_key(spot_id: int) -> str:
+    return f"{CACHE_KEY_PREFIX}{spot_id}"
+
+
+def _lru_get(spot_id: int):
+    with _lru_lock:
+        entry = _lru.get(spot_id)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del _lru[spot_id]
+            return None
+        _lru.move_to_end(spot_id)
+        return value
+
+
+def _lru_put(spot_id: int, value: Dict[str, str]) -> None:
+    # 他プロセスでの無効化は見えないので、プロセス内は短い TTL で持つ
+    ttl = int(_cfg('PROVIDER_MAPPINGS_LRU_TTL', 60))
+    size = int(_cfg('PROVIDER_MAPPINGS_LRU_SIZE', 4096))
+    with _lru_lock:
+        _lru[spot_id] = (time.monotonic() + ttl, value)
+        _lru.move_to_end(spot_id)
+        while len(_lru) > size:
+            _lru.popitem(last=False)
+
+
+def _load(spot_ids: List[int]) -> Dict[int, Dict[str, str]]:
+    """DB から provider → external_id（1クエリ。同じプロバイダが複数あれば id の小さいもの）。"""
+    rows = (SpotProviderId.query
+            .with_entities(SpotProviderId.spot_id, SpotProviderId.provider, SpotProviderId.external_id)
+            .filter(SpotProviderId.spot_id.in_(spot_ids))
+            .order_by(SpotProviderId.id)
+            .all())
+    mappings: Dict[int, Dict[str, str]] = {spot_id: {} for spot_id in spot_ids}
+    for spot_id, provider, external_id in rows:
+        mappings[spot_id].setdefault(provider, external_id)
+    return mappings
+
+
+def mappings_for_spots(spot_ids: Iterable[int]) -> Dict[int, Dict[str, str]]:
+    """spot_id → {provider: external_id}（マッピングが無いスポットは {}）。
+
+    プロセス内 LRU → Redis（MGET 1往復）→ DB（1クエリ）の順に引き、引けたものを上の段に戻す。
+    SpotProviderId の追加・更新・削除はコミット時に無効化される。
+    """
+    spot_ids = list(dict.fromkeys(int(s) for s in spot_ids))
+    result: Dict[int, Dict[str, str]] = {}
+    missing = []
+    for spot_id in spot_ids:
+        value = _lru_get(spot_id)
+        if value is None:
+            missing.append(spot_id)
+        else:
+            result[spot_id] = value
+    if not missing:
+        return result
+
+    client = _redis()
+    if client is not None:
+        try:
+            raws = client.mget([_cache_key(s) for s in missing])
+            still_missing = []
+            for spot_id, raw in zip(missing, raws):
+                if raw is None:
+                    still_missing.append(spot_id)
+                    continue
+                value = json.loads(raw)
+                _lru_put(spot_id, value)
+                result[spot_id] = value
+            missing = still_missing
+        except (redis.exceptions.RedisError, ValueError) as e:
+            logger.warning(f"provider mappings cache read failed: {e}")
+            client = None
+    if not missing:
+        return result
+
+    loaded = _load(missing)
+    ttl = int(_cfg('PROVIDER_MAPPINGS_TTL', 3600))
+    for spot_id, value in loaded.items():
+        _lru_put(spot_id, value)
+        result[spot_id] = value
+    if client is not None:
+        try:
+            pipe = client.pipeline()
+            for spot_id, value in loaded.items():
+                pipe.set(_cache_key(spot_id), json.dumps(value), ex=ttl)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"provider mappings cache write failed: {e}")
+    return result
+
+
+def mappings_for_spot(spot_id: int) -> Dict[str, str]:
+    return mappings_for_spots([spot_id])[int(spot_id)]
+
+
+def has_offer_mapping(mappings: Dict[str, str]) -> bool:
+    return any(provider in mappings for provider in OFFER_PROVIDERS)
+
+
+def invalidate(spot_ids: Iterable[int]) -> None:
+    spot_ids = list(dict.fromkeys(int(s) for s in spot_ids))
+    if not spot_ids:
+        return
+    with _lru_lock:
+        for spot_id in spot_ids:
+            _lru.pop(spot_id, None)
+    client = _redis()
+    if client is not None:
+        try:
+            client.delete(*[_cache_key(s) for s in spot_ids])
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"provider mappings cache invalidate failed: {e}")
+
+
+def invalidate_on_commit(session: Session, spot_ids: Iterable[int]) -> None:
+    """session のコミット後に無効化する（Core の INSERT など ORM のイベントが出ない書き込み用）。"""
+    session.info.setdefault(_PENDING_KEY, set()).update(int(s) for s in spot_ids if s is not None)
+
+
+def _mark(target, spot_ids) -> None:
+    session = Session.object_session(target)
+    if session is not None:
+        invalidate_on_commit(session, spot_ids)
+    else:
+        invalidate(s for s in spot_ids if s is not None)
+
+
+def _on_mapping_change(mapper, connection, target) -> None:
+    _mark(target, {target.spot_id})
+
+
+def _before_mapping_update(mapper, connection, target) -> None:
+    spot_ids = {target.spot_id}
+    # spot_id の付け替えは元のスポットも無効化する（期限切れで旧値が履歴に無ければ DB から読む）
+    history = sa_inspect(target).attrs.spot_id.history
+    if history.has_changes():
+        previous = list(history.deleted or ())
+        if not previous:
+            table = SpotProviderId.__table__
+            previous = [connection.execute(select(table.c.spot_id).where(table.c.id == target.id)).scalar()]
+        spot_ids.update(previous)
+    _mark(target, spot_ids)
+
+
+def _after_commit(session: Session) -> None:
+    spot_ids = session.info.pop(_PENDING_KEY, None)
+    if spot_ids:
+        invalidate(spot_ids)
+
+
+event.listen(SpotProviderId, 'after_insert', _on_mapping_change)
+event.listen(SpotProviderId, 'before_update', _before_mapping_update)
+event.listen(SpotProviderId, 'after_delete', _on_mapping_change)
+# ロールバックされた分は残しておき、次のコミットでまとめて消す（余分に消しても害はない）
+event.listen(Session, 'after_commit', _after_commit)
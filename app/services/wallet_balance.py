@@ -0,0 +1,255 @@
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+
+
+logger = logging.getLogger(__name__)
+
+# 出金可能額から差し引く「申請中・処理中（拘束）」の出金ステータス
+HOLD_STATUSES = ('requested', 'pending_review', 'approved', 'transferring', 'payout_pending')
+
+BALANCE_COLUMNS = (
+    'user_id', 'month', 'as_of_date',
+    'unpaid_prev', 'current_month_ytd', 'month_estimated', 'on_hold', 'paid_this_month', 'withdrawable',
+    'has_stripe_account', 'payouts_enabled', 'payouts_ready',
+)
+
+# 出金可能額（A案）: 前月まで未払い + 当月(昨日まで) − on_hold − 当月支払済（負なら0）
+# {target} は対象 user_id の集合を返す SELECT。
+_BALANCE_SELECT = """
+WITH target AS (
+  {target}
+),
+ledger AS (
+  SELECT pl.user_id, SUM(pl.unpaid_balance) AS unpaid_prev
+  FROM payout_ledger pl JOIN target t ON t.user_id = pl.user_id
+  WHERE pl.month < :m_start
+  GROUP BY pl.user_id
+),
+daily AS (
+  SELECT cd.user_id,
+         SUM(cd.payout_day) FILTER (WHERE cd.day <= :ytd_to) AS ytd,
+         SUM(cd.payout_day) AS estimated
+  FROM creator_daily cd JOIN target t ON t.user_id = cd.user_id
+  WHERE cd.day >= :m_start AND cd.day < :m_next
+  GROUP BY cd.user_id
+),
+hold AS (
+  SELECT w.user_id, SUM(w.amount) AS on_hold
+  FROM withdrawals w JOIN target t ON t.user_id = w.user_id
+  WHERE w.status = ANY(:hold_statuses)
+  GROUP BY w.user_id
+),
+paid AS (
+  SELECT pt.user_id, SUM(pt.amount) AS paid
+  FROM payout_transactions pt JOIN target t ON t.user_id = pt.user_id
+  WHERE pt.paid_at >= :m_start AND pt.paid_at < :m_next
+  GROUP BY pt.user_id
+),
+acct AS (
+  SELECT sa.user_id,
+         bool_or(sa.payouts_enabled) AS payouts_enabled,
+         bool_or(sa.payouts_enabled AND sa.requirements_json IS NOT NULL
+                 AND sa.requirements_json::text <> 'null') AS payouts_ready
+  FROM stripe_accounts sa JOIN target t ON t.user_id = sa.user_id
+  GROUP BY sa.user_id
+)
+SELECT t.user_id,
+       CAST(:m_start AS date) AS month,
+       CAST(:as_of AS date) AS as_of_date,
+       COALESCE(l.unpaid_prev, 0) AS unpaid_prev,
+       COALESCE(d.ytd, 0) AS current_month_ytd,
+       COALESCE(d.estimated, 0) AS month_estimated,
+       COALESCE(h.on_hold, 0) AS on_hold,
+       COALESCE(p.paid, 0) AS paid_this_month,
+       GREATEST(COALESCE(l.unpaid_prev, 0) + COALESCE(d.ytd, 0) - COALESCE(h.on_hold, 0) - COALESCE(p.paid, 0), 0) AS withdrawable,
+       (a.user_id IS NOT NULL) AS has_stripe_account,
+       COALESCE(a.payouts_enabled, false) AS payouts_enabled,
+       COALESCE(a.payouts_ready, false) AS payouts_ready
+FROM target t
+LEFT JOIN ledger l ON l.user_id = t.user_id
+LEFT JOIN daily d ON d.user_id = t.user_id
+LEFT JOIN hold h ON h.user_id = t.user_id
+LEFT JOIN paid p ON p.user_id = t.user_id
+LEFT JOIN acct a ON a.user_id = t.user_id
+"""
+
+_TARGET_ONE = "SELECT CAST(:user_id AS bigint) AS user_id"
+
+# 残高が発生しうる user 全員（既存スナップショットも含め、0 に戻ったものも更新する）
+_TARGET_ALL = """
+  SELECT user_id FROM payout_ledger WHERE month < :m_start
+  UNION SELECT user_id FROM creator_daily WHERE day >= :m_start AND day < :m_next
+  UNION SELECT user_id FROM withdrawals WHERE status = ANY(:hold_statuses)
+  UNION SELECT user_id FROM payout_transactions WHERE paid_at >= :m_start AND paid_at < :m_next
+  UNION SELECT user_id FROM stripe_accounts
+  UNION SELECT user_id FROM creator_balance
+"""
+
+_UPSERT = """
+INSERT INTO creator_balance ({cols}, updated_at)
+SELECT b.*, NOW() FROM ({select}) b
+ON CONFLICT (user_id) DO UPDATE
+  SET {updates}, updated_at = NOW()
+"""
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def _today() -> date:
+    from zoneinfo import ZoneInfo
+    return datetime.now(ZoneInfo(_cfg('WALLET_TZ', 'Asia/Tokyo'))).date()
+
+
+def balance_period(today: Optional[date] = None) -> Dict[str, Any]:
+    """today（WALLET_TZ）時点の集計期間パラメータ。当月分は昨日までを含める。"""
+    today = today or _today()
+    m_start = today.replace(day=1)
+    m_next = (m_start + timedelta(days=32)).replace(day=1)
+    as_of = today - timedelta(days=1)
+    return {
+        'm_start': m_start,
+        'm_next': m_next,
+        'ytd_to': as_of,
+        'as_of': as_of,
+        'hold_statuses': list(HOLD_STATUSES),
+    }
+
+
+def _to_dict(row) -> Dict[str, Any]:
+    out = {}
+    for k, v in dict(row).items():
+        if isinstance(v, (bool, int, date)) or v is None:
+            out[k] = v
+        else:
+            out[k] = float(v)
+    return out
+
+
+def _upsert_sql(target: str, returning: bool = False) -> str:
+    sql = _UPSERT.format(
+        cols=', '.join(BALANCE_COLUMNS),
+        select=_BALANCE_SELECT.format(target=target),
+        updates=', '.join(f"{c} = EXCLUDED.{c}" for c in BALANCE_COLUMNS if c != 'user_id'),
+    )
+    if returning:
+        sql += " RETURNING " + ', '.join(BALANCE_COLUMNS)
+    return sql
+
+
+def compute_wallet_balances(user_id: Optional[int] = None, today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """元テーブルから残高を計算する（書き込みなし）。user_id 省略時は全員。"""
+    params = balance_period(today)
+    target = _TARGET_ONE if user_id is not None else _TARGET_ALL
+    if user_id is not None:
+        params['user_id'] = int(user_id)
+    rows = db.session.execute(text(_BALANCE_SELECT.format(target=target)), params).mappings().all()
+    return [_to_dict(r) for r in rows]
+
+
+def refresh_wallet_balance(user_id: int, today: Optional[date] = None, lock: bool = False) -> Dict[str, Any]:
+    """1ユーザーのスナップショットを再計算して UPSERT する。コミットは呼び出し側。
+
+    元テーブルを変更した処理は、コミット前に同じトランザクション内で呼ぶこと。
+    lock=True のときは先に creator_balance の行をロックしてから再計算する（出金申請の二重計上防止）。
+    ロック待ちの後に文を発行し直すため、READ COMMITTED でも先行トランザクションの結果を読める。
+    """
+    db.session.flush()
+    params = balance_period(today)
+    params['user_id'] = int(user_id)
+    if lock:
+        db.session.execute(text(
+            """
+            INSERT INTO creator_balance (user_id, month, as_of_date, updated_at)
+            VALUES (:user_id, :m_start, :as_of, NOW())
+            ON CONFLICT (user_id) DO NOTHING
+            """
+        ), params)
+        db.session.execute(text("SELECT user_id FROM creator_balance WHERE user_id = :user_id FOR UPDATE"), params)
+    row = db.session.execute(text(_upsert_sql(_TARGET_ONE, returning=True)), params).mappings().first()
+    return _to_dict(row)
+
+
+def refresh_all_wallet_balances(today: Optional[date] = None) -> int:
+    """全ユーザーのスナップショットを1文で再計算する（日次・月次ジョブ用）。コミットは呼び出し側。"""
+    db.session.flush()
+    result = db.session.execute(text(_upsert_sql(_TARGET_ALL)), balance_period(today))
+    return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else 0
+
+
+def get_wallet_balance(user_id: int, for_update: bool = False) -> Dict[str, Any]:
+    """おさいふ残高（/api/wallet/summary と出金申請の共通の読み取り口）。
+
+    通常はスナップショットを1行読むだけ。行が無い・日付が変わって古い場合はその場で再計算する。
+    for_update=True のときは行ロックの上で元テーブルから再計算した値を返す（出金額の確定用）。
+    再計算した場合の書き込みはコミットしないので、呼び出し側でコミットする。
+    """
+    if for_update:
+        return refresh_wallet_balance(user_id, lock=True)
+    params = balance_period()
+    row = db.session.execute(
+        text(f"SELECT {', '.join(BALANCE_COLUMNS)} FROM creator_balance WHERE user_id = :user_id"),
+        {'user_id': int(user_id)},
+    ).mappings().first()
+    if row is None or row['month'] != params['m_start'] or row['as_of_date'] != params['as_of']:
+        return refresh_wallet_balance(user_id)
+    return _to_dict(row)
+
+
+def check_wallet_balances(tolerance: float = 0.5, fix: bool = False, limit: int = 50) -> Dict[str, Any]:
+    """スナップショットと元テーブルからの再計算値を突き合わせてドリフトを報告する。
+
+    as_of_date が古い行は日付の繰り越し待ち（stale）として数え、ドリフトには含めない。
+    fix=True のときは全件を再計算してコミットする。
+    """
+    params = balance_period()
+    expected = {r['user_id']: r for r in compute_wallet_balances()}
+    snapshots = {
+        int(r['user_id']): _to_dict(r)
+        for r in db.session.execute(text(f"SELECT {', '.join(BALANCE_COLUMNS)} FROM creator_balance")).mappings().all()
+    }
+
+    amount_cols = ('unpaid_prev', 'current_month_ytd', 'month_estimated', 'on_hold', 'paid_this_month', 'withdrawable')
+    flag_cols = ('has_stripe_account', 'payouts_enabled', 'payouts_ready')
+    drift: List[Dict[str, Any]] = []
+    missing = stale = 0
+    for uid, exp in expected.items():
+        snap = snapshots.get(uid)
+        if snap is None:
+            missing += 1
+            continue
+        if snap['month'] != params['m_start'] or snap['as_of_date'] != params['as_of']:
+            stale += 1
+            continue
+        diffs = {c: {'snapshot': snap[c], 'expected': exp[c]}
+                 for c in amount_cols if abs(float(snap[c]) - float(exp[c])) > tolerance}
+        diffs.update({c: {'snapshot': snap[c], 'expected': exp[c]} for c in flag_cols if bool(snap[c]) != bool(exp[c])})
+        if diffs:
+            drift.append({'user_id': uid, 'diffs': diffs})
+
+    report = {
+        'as_of_date': params['as_of'].isoformat(),
+        'users': len(expected),
+        'snapshots': len(snapshots),
+        'missing': missing,
+        'stale': stale,
+        'drifted': len(drift),
+        'max_withdrawable_drift': max(
+            (abs(d['diffs']['withdrawable']['snapshot'] - d['diffs']['withdrawable']['expected'])
+             for d in drift if 'withdrawable' in d['diffs']), default=0.0),
+        'drift': drift[:limit],
+    }
+    if drift:
+        logger.warning(f"wallet balance drift: {len(drift)} users (max withdrawable {report['max_withdrawable_drift']})")
+    if fix:
+        report['refreshed'] = refresh_all_wallet_balances()
+        db.session.commit()
+    return report
@@ -0,0 +1,359 @@
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+from app.utils.price_sketch import PRICE_BUCKET_YEN, PriceSketch
+
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = 'creator_daily'
+
+# 差分スライス（:slice_where で絞った event_log 行）を (JST日, user) 単位でカウンタへ加算する。
+# クリックは (user, page, ota, session_or_client) のキーを日毎の集合に入れ、新規に入った分だけ加算する。
+_APPLY_COUNTERS_SQL = """
+WITH slice AS (
+    SELECT e.user_id,
+           (e.created_at AT TIME ZONE :tz)::date AS day,
+           e.event_type, e.is_bot, e.dwell_ms, e.page_id, e.ota, e.session_id, e.client_key
+    FROM event_log e
+    WHERE {slice_where}
+),
+new_keys AS (
+    INSERT INTO creator_daily_click_keys (day, user_id, click_key)
+    SELECT DISTINCT s.day, s.user_id,
+           md5(concat_ws('#', s.user_id::text, s.page_id::text, COALESCE(s.ota,''),
+                         COALESCE(NULLIF(s.session_id,''), COALESCE(NULLIF(s.client_key,''), 'anon'))))::uuid
+    FROM slice s
+    WHERE s.event_type = 'click' AND COALESCE(s.is_bot, false) = false
+    ON CONFLICT DO NOTHING
+    RETURNING day, user_id
+),
+new_clicks AS (
+    SELECT day, user_id, COUNT(*) AS clicks FROM new_keys GROUP BY 1, 2
+),
+views AS (
+    SELECT s.day, s.user_id,
+           SUM(CASE WHEN s.event_type='view' AND COALESCE(s.is_bot, false)=false AND COALESCE(s.dwell_ms,0) >= 3000 THEN 1 ELSE 0 END) AS pv
+    FROM slice s
+    GROUP BY 1, 2
+)
+INSERT INTO creator_daily_live AS l (day, user_id, pv, clicks, updated_at)
+SELECT v.day, v.user_id, v.pv, COALESCE(c.clicks, 0), NOW()
+FROM views v
+LEFT JOIN new_clicks c ON c.day = v.day AND c.user_id = v.user_id
+ON CONFLICT (day, user_id) DO UPDATE
+  SET pv = l.pv + EXCLUDED.pv,
+      clicks = l.clicks + EXCLUDED.clicks,
+      updated_at = NOW()
+"""
+
+_APPLY_PRICE_HIST_SQL = """
+INSERT INTO creator_daily_price_hist AS h (day, user_id, bucket, cnt)
+SELECT (e.created_at AT TIME ZONE :tz)::date, e.user_id, FLOOR(e.price_median / :bucket_yen)::int, COUNT(*)
+FROM event_log e
+WHERE {slice_where} AND e.price_median IS NOT NULL
+GROUP BY 1, 2, 3
+ON CONFLICT (day, user_id, bucket) DO UPDATE
+  SET cnt = h.cnt + EXCLUDED.cnt
+"""
+
+_APPLY_MONTHLY_PRICE_HIST_SQL = """
+INSERT INTO creator_monthly_price_hist AS h (month, user_id, bucket, cnt)
+SELECT date_trunc('month', e.created_at AT TIME ZONE :tz)::date, e.user_id, FLOOR(e.price_median / :bucket_yen)::int, COUNT(*)
+FROM event_log e
+WHERE {slice_where} AND e.price_median IS NOT NULL
+GROUP BY 1, 2, 3
+ON CONFLICT (month, user_id, bucket) DO UPDATE
+  SET cnt = h.cnt + EXCLUDED.cnt
+"""
+
+# price_hist(user_id, bucket, cnt) から中央値を求める CTE 群。
+# 累積度数が半数を超える最初の階級の中央値を代表値にする（PriceSketch.quantile と同じ定義）
+PRICE_MEDIAN_CTE = """
+price_cum AS (
+    SELECT user_id, bucket,
+           SUM(cnt) OVER (PARTITION BY user_id ORDER BY bucket) AS cum,
+           SUM(cnt) OVER (PARTITION BY user_id) AS total
+    FROM price_hist
+),
+price_med AS (
+    SELECT user_id, (MIN(bucket) + 0.5) * :price_bucket_yen AS price_median
+    FROM price_cum
+    WHERE cum * 2 >= total
+    GROUP BY 1
+)
+"""
+
+
+def live_base_cte(shard_predicate: str = '') -> str:
+    """日次集計（incremental モード）の base CTE。shard_predicate は '{col}' を列名で置き換える条件（シャード用）。"""
+    return """
+price_hist AS (
+    SELECT user_id, bucket, cnt FROM creator_daily_price_hist
+    WHERE day = :target_day""" + shard_predicate.format(col='user_id') + """
+),
+""" + PRICE_MEDIAN_CTE + """,
+base AS (
+    SELECT l.user_id, l.day, l.pv, l.clicks, pm.price_median
+    FROM creator_daily_live l
+    LEFT JOIN price_med pm ON pm.user_id = l.user_id
+    WHERE l.day = :target_day""" + shard_predicate.format(col='l.user_id') + """
+)
+"""
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def _tz_name() -> str:
+    return _cfg('WALLET_TZ', 'Asia/Tokyo')
+
+
+def _apply_slice(slice_where: str, params: Dict[str, Any]) -> None:
+    params = dict(params, tz=_tz_name(), bucket_yen=PRICE_BUCKET_YEN)
+    db.session.execute(text(_APPLY_COUNTERS_SQL.format(slice_where=slice_where)), params)
+    db.session.execute(text(_APPLY_PRICE_HIST_SQL.format(slice_where=slice_where)), params)
+    db.session.execute(text(_APPLY_MONTHLY_PRICE_HIST_SQL.format(slice_where=slice_where)), params)
+
+
+def _lock_state() -> Dict[str, Any]:
+    """状態行を行ロックして返す（同時実行の rollup は直列化される）。"""
+    db.session.execute(text(
+        "INSERT INTO wallet_rollup_state (name, last_event_id, settled_event_id, observed_max_id, updated_at) "
+        "VALUES (:name, 0, 0, 0, NOW()) ON CONFLICT (name) DO NOTHING"
+    ), {'name': STATE_NAME})
+    row = db.session.execute(text(
+        """
+        SELECT last_event_id, settled_event_id, observed_max_id,
+               (observed_at IS NULL AND last_event_id = 0) AS uninitialized,
+               (observed_at IS NULL OR observed_at <= NOW() - make_interval(secs => :settle)) AS observation_settled
+        FROM wallet_rollup_state WHERE name = :name FOR UPDATE
+        """
+    ), {'name': STATE_NAME, 'settle': int(_cfg('WALLET_ROLLUP_SETTLE_SECONDS', 120))}).mappings().first()
+    return dict(row)
+
+
+def _advance_settled(state: Dict[str, Any]) -> int:
+    """settle 秒以上前に観測した MAX(id) を確定位置に昇格し、新たに現在の MAX(id) を観測する。
+
+    観測時点で採番済みの id は、その後 settle 秒のうちにコミット（またはロールバック）済みとみなせる。
+    """
+    settled = int(state['settled_event_id'])
+    if state['observation_settled']:
+        settled = max(settled, int(state['observed_max_id']))
+        current_max = int(db.session.execute(text("SELECT COALESCE(MAX(id), 0) FROM event_log")).scalar() or 0)
+        db.session.execute(text(
+            """
+            UPDATE wallet_rollup_state
+            SET settled_event_id = :settled, observed_max_id = :observed, observed_at = NOW()
+            WHERE name = :name
+            """
+        ), {'settled': settled, 'observed': current_max, 'name': STATE_NAME})
+    return settled
+
+
+def run_wallet_rollup(max_batches: Optional[int] = None, batch_events: Optional[int] = None) -> Dict[str, Any]:
+    """未処理の event_log を id 順に切り出し、creator_daily_live へ加算する。
+
+    1バッチ = 1トランザクション（カウンタ加算とハイウォーターマーク更新を同時にコミット）。
+    初回（状態行が未初期化）は event_log 全体を読まないよう initialize_watermark で現在の MAX(id) から始める。
+    """
+    batch_events = batch_events or int(_cfg('WALLET_ROLLUP_BATCH_EVENTS', 200000))
+    stats: Dict[str, Any] = {'batches': 0, 'from_id': None, 'to_id': None, 'settled_id': None}
+    if initialize_watermark(only_if_new=True) is not None:
+        logger.warning("wallet rollup initialized at current MAX(id); "
+                       "backfill earlier days with `flask wallet-rollup --rebuild-day`")
+    while max_batches is None or stats['batches'] < max_batches:
+        try:
+            state = _lock_state()
+            low = int(state['last_event_id'])
+            settled = _advance_settled(state) if stats['batches'] == 0 else stats['settled_id']
+            if stats['from_id'] is None:
+                stats['from_id'] = low
+                stats['settled_id'] = settled
+            if settled <= low:
+                db.session.commit()
+                break
+            upper = min(settled, low + batch_events)
+            _apply_slice("e.id > :low AND e.id <= :upper", {'low': low, 'upper': upper})
+            db.session.execute(text(
+                "UPDATE wallet_rollup_state SET last_event_id = :upper, updated_at = NOW() WHERE name = :name"
+            ), {'upper': upper, 'name': STATE_NAME})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        stats['batches'] += 1
+        stats['to_id'] = upper
+    if stats['to_id'] is None:
+        stats['to_id'] = stats['from_id']
+    return stats
+
+
+def rebuild_live_day(day: date) -> None:
+    """1日分の速報カウンタを event_log から作り直す（初回導入・不整合時）。
+
+    処理済み位置（ハイウォーターマーク）以下の行だけを対象にするので、以降の差分加算と二重計上しない。
+    月次スケッチからはその日の日次度数分布を差し引いて入れ直すため、日次度数分布が prune_rollup_detail で
+    消えている（WALLET_ROLLUP_RETAIN_DAYS より前の）日は作り直せない（ValueError）。
+    """
+    from app.tasks import _day_bounds_utc
+    if day < _prune_cutoff():
+        raise ValueError(f"{day.isoformat()} is older than WALLET_ROLLUP_RETAIN_DAYS; "
+                         "its daily price histogram may be pruned, so the monthly sketch cannot be corrected")
+    start_utc, end_utc = _day_bounds_utc(day, _tz_name())
+    try:
+        watermark = int(_lock_state()['last_event_id'])
+        # 月次スケッチからその日の寄与を差し引いてから作り直す（月次側の二重計上を防ぐ）
+        db.session.execute(text(
+            """
+            UPDATE creator_monthly_price_hist m
+            SET cnt = m.cnt - d.cnt
+            FROM creator_daily_price_hist d
+            WHERE d.day = :day AND m.month = :month AND m.user_id = d.user_id AND m.bucket = d.bucket
+            """
+        ), {'day': day, 'month': day.replace(day=1)})
+        for table in ('creator_daily_live', 'creator_daily_click_keys', 'creator_daily_price_hist'):
+            db.session.execute(text(f"DELETE FROM {table} WHERE day = :day"), {'day': day})
+        _apply_slice(
+            "e.created_at >= :start_utc AND e.created_at < :end_utc AND e.id <= :watermark",
+            {'start_utc': start_utc, 'end_utc': end_utc, 'watermark': watermark},
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def initialize_watermark(only_if_new: bool = False) -> Optional[int]:
+    """ハイウォーターマークが未設定なら現在の MAX(id) に合わせる（過去分は rebuild_live_day で埋める）。
+
+    戻り値は処理済み位置。only_if_new のときは、今回初期化した場合だけ位置を返し、それ以外は None。
+    """
+    try:
+        state = _lock_state()
+        low = int(state['last_event_id'])
+        initialized = bool(state['uninitialized']) if only_if_new else low == 0
+        if initialized:
+            low = int(db.session.execute(text("SELECT COALESCE(MAX(id), 0) FROM event_log")).scalar() or 0)
+            db.session.execute(text(
+                """
+                UPDATE wallet_rollup_state
+                SET last_event_id = :low, settled_event_id = :low, observed_max_id = :low,
+                    observed_at = NOW(), updated_at = NOW()
+                WHERE name = :name
+                """
+            ), {'low': low, 'name': STATE_NAME})
+        db.session.commit()
+        if only_if_new and not initialized:
+            return None
+        return low
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def price_sketch_for_range(user_id: int, start_day: date, end_day: date) -> PriceSketch:
+    """[start_day, end_day] の価格スケッチ。月全体を含む区間は月次スケッチ、端数は日次スケッチをマージする。"""
+    rows = []
+    month = start_day.replace(day=1)
+    while month <= end_day:
+        nxt = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        month_end = nxt - timedelta(days=1)
+        if start_day <= month and month_end <= end_day:
+            rows += db.session.execute(text(
+                "SELECT bucket, cnt FROM creator_monthly_price_hist WHERE user_id = :uid AND month = :month"
+            ), {'uid': user_id, 'month': month}).fetchall()
+        else:
+            rows += db.session.execute(text(
+                """
+                SELECT bucket, SUM(cnt) FROM creator_daily_price_hist
+                WHERE user_id = :uid AND day >= :s AND day <= :e
+                GROUP BY bucket
+                """
+            ), {'uid': user_id, 's': max(start_day, month), 'e': min(end_day, month_end)}).fetchall()
+        month = nxt
+    return PriceSketch.from_rows(rows)
+
+
+def _prune_cutoff(retain_days: Optional[int] = None, today: Optional[date] = None) -> date:
+    """この日より前のクリックキー・日次度数分布は prune_rollup_detail の対象。"""
+    retain_days = retain_days if retain_days is not None else int(_cfg('WALLET_ROLLUP_RETAIN_DAYS', 40))
+    if today is None:
+        from zoneinfo import ZoneInfo
+        today = datetime.now(timezone.utc).astimezone(ZoneInfo(_tz_name())).date()
+    return today - timedelta(days=retain_days)
+
+
+def prune_rollup_detail(retain_days: Optional[int] = None, today: Optional[date] = None) -> int:
+    """確定済みの古い日のクリックキー・日次度数分布を削除する（カウンタ本体と月次スケッチは残す）。"""
+    cutoff = _prune_cutoff(retain_days, today)
+    deleted = 0
+    for table in ('creator_daily_click_keys', 'creator_daily_price_hist'):
+        deleted += db.session.execute(text(f"DELETE FROM {table} WHERE day < :cutoff"), {'cutoff': cutoff}).rowcount or 0
+    db.session.commit()
+    return deleted
+
+
+def price_sketch_report(day: date) -> Dict[str, Any]:
+    """1日分の価格中央値について、スケッチの値と PERCENTILE_CONT の正確値を user 単位で比較する。
+
+    日次スケッチが保持期間外/未作成なら event_log から同じ階級で作って比較する。
+    """
+    from app.tasks import _day_bounds_utc
+    from app.utils.price_sketch import m_price_for
+    start_utc, end_utc = _day_bounds_utc(day, _tz_name())
+    params = {'start_utc': start_utc, 'end_utc': end_utc, 'day': day, 'bucket_yen': PRICE_BUCKET_YEN}
+    exact = dict(db.session.execute(text(
+        """
+        SELECT user_id, PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price_median)
+        FROM event_log
+        WHERE created_at >= :start_utc AND created_at < :end_utc AND price_median IS NOT NULL
+        GROUP BY 1
+        """
+    ), params).fetchall())
+    stored = db.session.execute(text(
+        "SELECT user_id, bucket, cnt FROM creator_daily_price_hist WHERE day = :day"
+    ), params).fetchall()
+    source = 'stored'
+    if not stored:
+        source = 'event_log'
+        stored = db.session.execute(text(
+            """
+            SELECT user_id, FLOOR(price_median / :bucket_yen)::int, COUNT(*)
+            FROM event_log
+            WHERE created_at >= :start_utc AND created_at < :end_utc AND price_median IS NOT NULL
+            GROUP BY 1, 2
+            """
+        ), params).fetchall()
+    sketches: Dict[int, PriceSketch] = {}
+    for uid, bucket, cnt in stored:
+        sketches.setdefault(int(uid), PriceSketch()).counts[int(bucket)] = int(cnt)
+
+    rows = []
+    for uid in sorted(set(exact) | set(sketches)):
+        e = float(exact[uid]) if exact.get(uid) is not None else None
+        sk = sketches.get(uid)
+        m = sk.median() if sk else None
+        rows.append({
+            'user_id': uid, 'exact': e, 'sketch': m,
+            'abs_error': abs(m - e) if (m is not None and e is not None) else None,
+            'same_bin': m_price_for(m) == m_price_for(e),
+        })
+    errors = [r['abs_error'] for r in rows if r['abs_error'] is not None]
+    return {
+        'day': day.isoformat(),
+        'source': source,
+        'users': len(rows),
+        'mean_abs_error': (sum(errors) / len(errors)) if errors else 0.0,
+        'max_abs_error': max(errors, default=0.0),
+        'bin_agreement': (sum(1 for r in rows if r['same_bin']) / len(rows)) if rows else 1.0,
+        'rows': rows,
+    }
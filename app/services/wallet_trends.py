@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+import redis
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+from app.services.google_photos import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+# 日次/月次の確定処理がコミットのたびに更新する wallet_rollup_state の行（updated_at をウォーターマークに使う）
+AGGREGATION_STATE_NAME = 'wallet_aggregation'
+CACHE_KEY_PREFIX = 'wallet:trends:v1:'
+
+GRANULARITIES = {
+    # granularity: (date_trunc の単位, generate_series の刻み)
+    'month': ('month', '1 month'),
+    'week': ('week', '1 week'),
+    'day': ('day', '1 day'),
+}
+MAX_MONTHS = 120
+
+# バケット列を generate_series で作り、確定済みの月は creator_monthly、それ以降は creator_daily を
+# 同じ粒度に丸めて LEFT JOIN する（期間の長さに関わらず1文・1往復）。
+# day/week 粒度では全期間を creator_daily から作る（:monthly_until = :first で monthly 側は空）。
+_TRENDS_SQL = """
+WITH buckets AS (
+  SELECT CAST(generate_series(CAST(:first AS date), CAST(:last AS date), CAST(:step AS interval)) AS date) AS bucket
+),
+src AS (
+  SELECT cm.month AS day, cm.pv, cm.clicks, cm.payout_month AS revenue
+  FROM creator_monthly cm
+  WHERE cm.user_id = :user_id AND cm.month >= :first AND cm.month < :monthly_until
+  UNION ALL
+  SELECT cd.day, cd.pv, cd.clicks, cd.payout_day AS revenue
+  FROM creator_daily cd
+  WHERE cd.user_id = :user_id AND cd.day >= :daily_from AND cd.day < :until
+),
+agg AS (
+  SELECT CAST(date_trunc(:unit, day) AS date) AS bucket,
+         SUM(pv) AS pv, SUM(clicks) AS clicks, SUM(revenue) AS revenue
+  FROM src
+  GROUP BY 1
+)
+SELECT b.bucket,
+       COALESCE(a.pv, 0) AS pv,
+       COALESCE(a.clicks, 0) AS clicks,
+       COALESCE(a.revenue, 0) AS revenue,
+       SUM(COALESCE(a.revenue, 0)) OVER (ORDER BY b.bucket) AS revenue_cumulative
+FROM buckets b
+LEFT JOIN agg a ON a.bucket = b.bucket
+ORDER BY b.bucket
+"""
+
+
+def _cfg(key: str, default: Any = None) -> Any:
+    return current_app.config.get(key, default) if current_app else os.environ.get(key, default)
+
+
+def _today() -> date:
+    from zoneinfo import ZoneInfo
+    return datetime.now(ZoneInfo(_cfg('WALLET_TZ', 'Asia/Tokyo'))).date()
+
+
+def _add_months(d: date, n: int) -> date:
+    idx = d.year * 12 + (d.month - 1) + n
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+def trend_params(user_id: int, months: int = 3, granularity: str = 'month',
+                 today: Optional[date] = None) -> Dict[str, Any]:
+    """直近 months ヶ月（当月を含む）を granularity で区切る SQL パラメータ。"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"unsupported granularity: {granularity}")
+    months = max(1, min(int(months), MAX_MONTHS))
+    today = today or _today()
+    this_month = today.replace(day=1)
+    first = _add_months(this_month, -(months - 1))
+    unit, step = GRANULARITIES[granularity]
+    if granularity == 'month':
+        last, monthly_until, daily_from = this_month, this_month, this_month
+    else:
+        # creator_daily は昨日まで（当月1日は前日で終わる）
+        yesterday = today - timedelta(days=1)
+        last = yesterday if yesterday >= first else first
+        if granularity == 'week':
+            first = first - timedelta(days=first.weekday())
+            last = last - timedelta(days=last.weekday())
+        monthly_until, daily_from = first, first
+    return {
+        'user_id': int(user_id),
+        'first': first,
+        'last': last,
+        'step': step,
+        'unit': unit,
+        'monthly_until': monthly_until,
+        'daily_from': daily_from,
+        'until': _add_months(this_month, 1),
+    }
+
+
+def trend_series(user_id: int, months: int = 3, granularity: str = 'month',
+                 today: Optional[date] = None) -> Dict[str, Any]:
+    """PV/クリック/収益の推移を1文で取得する。"""
+    params = trend_params(user_id, months, granularity, today)
+    rows = db.session.execute(text(_TRENDS_SQL), params).fetchall()
+    return {
+        'granularity': granularity,
+        'buckets': [r[0].isoformat() for r in rows],
+        'pv': [int(r[1] or 0) for r in rows],
+        'clicks': [int(r[2] or 0) for r in rows],
+        'revenue': [round(float(r[3] or 0), 0) for r in rows],
+        'revenue_cumulative': [round(float(r[4] or 0), 0) for r in rows],
+    }
+
+
+def touch_aggregation_watermark() -> None:
+    """creator_daily / creator_monthly を更新したトランザクション内で呼ぶ（コミットは呼び出し側）。"""
+    db.session.execute(text(
+        """
+        INSERT INTO wallet_rollup_state (name, last_event_id, settled_event_id, observed_max_id, updated_at)
+        VALUES (:name, 0, 0, 0, clock_timestamp())
+        ON CONFLICT (name) DO UPDATE SET updated_at = clock_timestamp()
+        """
+    ), {'name': AGGREGATION_STATE_NAME})
+
+
+def aggregation_watermark() -> str:
+    """最後に日次/月次の確定値が変わった時刻。未記録なら空文字。"""
+    value = db.session.execute(
+        text("SELECT updated_at FROM wallet_rollup_state WHERE name = :name"),
+        {'name': AGGREGATION_STATE_NAME},
+    ).scalar()
+    return value.isoformat() if value else ''
+
+
+def trends_etag(user_id: int, months: int, granularity: str, watermark: str, today: Optional[date] = None) -> str:
+    """ウォーターマークと日付（当月/昨日の境界）が同じ間は同じ値になる ETag。"""
+    today = today or _today()
+    raw = f"{int(user_id)}:{int(months)}:{granularity}:{watermark}:{today.isoformat()}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def cached_trend_series(user_id: int, months: int, granularity: str, etag: str) -> Dict[str, Any]:
+    """ETag をキーに Redis へ結果を保持する。Redis 不可時は毎回 SQL を実行する。"""
+    key = CACHE_KEY_PREFIX + etag
+    client = None
+    try:
+        client = get_redis_client()
+        if client is not None:
+            cached = client.get(key)
+            if cached:
+                return json.loads(cached)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"trends cache read failed: {e}")
+        client = None
+
+    data = trend_series(user_id, months, granularity)
+    if client is not None:
+        try:
+            client.set(key, json.dumps(data), ex=int(_cfg('WALLET_TRENDS_CACHE_TTL', 86400)))
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"trends cache write failed: {e}")
+    return data
@@ -88,6 +88,7 @@
         method:'POST',
         headers:{ 'Content-Type':'application/json' },
         body: JSON.stringify({
+          event_id: uuidv4(), // 再送時のサーバー側重複排除キー
           user_id: Number(ids.userId),
           page_id: Number(ids.pageId),
           client_id: ids.cid,
@@ -4,6 +4,10 @@ import uuid
 from datetime import datetime, timedelta, timezone, date
 import logging
 import requests
+import queue
+import random
+import threading
+import time
 import traceback
 
 from app import db
@@ -13,12 +17,13 @@ from app.models import StripeAccount, Withdrawal, Transfer as WithdrawalTransfer
 import stripe
 from sqlalchemy import text
 from app.models.spot_provider_id import SpotProviderId
-from app.utils.instagram_helpers import refresh_user_instagram_token_if_needed
+from app.utils.instagram_helpers import extract_cursor_from_url, refresh_user_instagram_token_if_needed
 from app.services.dataforseo import search_hotels as dfs_search_hotels
 from app.utils.rakuten_api import safe_decode_text, search_hotel as rakuten_search
 from app.services.rakuten_travel import fetch_detail_by_hotel_no as rakuten_fetch_detail
 from app.services.rakuten_travel import simple_hotel_search_by_geo as rakuten_simple_geo
 from app.services.google_places import get_place_review_summary
+from app.services import places_client, provider_mappings
 from app.utils.s3_utils import delete_file_from_s3
 
 # ロガーの設定
@@ -46,9 +51,65 @@ def _update_job_status(job_id, status, error_info=None, result_data=None):
         db.session.rollback()
         logger.error(f"[Job {job_id}] Failed to update job status: {e}")
 
-def fetch_and_analyze_posts(job_id, user_id, start_date_str, end_date_str):
+def _update_job_partial_result(job_id, result_data, next_page_cursor=None):
+    """処理中の途中結果だけを書き込む（status は触らないので、途中でのキャンセルを上書きしない）
+
+    next_page_cursor を渡すと同じコミットで保存する（差分インポートが落ちたときにこのページの次から再開する）。
+    """
+    try:
+        progress = ImportProgress.query.filter_by(job_id=job_id).first()
+        if progress:
+            progress.result_data = json.dumps(result_data, ensure_ascii=False)
+            if next_page_cursor:
+                progress.next_page_cursor = next_page_cursor
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Job {job_id}] Failed to write partial result: {e}")
+
+def _advance_import_watermark(job_id, newest_post):
+    """差分インポート完了時に、取り込んだ最新投稿を last_post_id / last_post_timestamp に記録して再開用カーソルを消す"""
+    try:
+        progress = ImportProgress.query.filter_by(job_id=job_id).first()
+        if not progress:
+            return
+        if newest_post and newest_post.get('timestamp'):
+            newest_dt = datetime.fromisoformat(newest_post['timestamp'].replace('Z', '+00:00'))
+            newest_dt = newest_dt.astimezone(timezone.utc).replace(tzinfo=None)
+            # 期間を絞った実行で古い投稿に巻き戻さない
+            if progress.last_post_timestamp is None or newest_dt > progress.last_post_timestamp:
+                progress.last_post_id = newest_post.get('id')
+                progress.last_post_timestamp = newest_dt
+        progress.next_page_cursor = None
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[Job {job_id}] Failed to advance import watermark: {e}")
+
+def _drop_imported_posts(user_id, posts):
+    """SocialPost に既に紐付いている投稿（permalink が同じもの）を除く"""
+    permalinks = [p.get('permalink') for p in posts if p.get('permalink')]
+    if not permalinks:
+        return posts
+    known = {row[0] for row in db.session.query(SocialPost.post_url).filter(
+        SocialPost.user_id == user_id,
+        SocialPost.platform == 'instagram',
+        SocialPost.post_url.in_(permalinks),
+    ).all()}
+    return [p for p in posts if p.get('permalink') not in known]
+
+def fetch_and_analyze_posts(job_id, user_id, start_date_str, end_date_str, incremental=False):
     """
     Instagramの投稿を取得し、分析してスポット候補を抽出する非同期タスク。
+
+    取得（Graph API のページ）→ 分析 → Google Places 補完をページ単位のパイプラインで流し、
+    補完が済むたびに result_data（partial=True）を更新する。ステータスAPIは processing 中も候補を返せる。
+
+    incremental=True（差分インポート）のとき:
+    - 前回取り込んだ最新投稿（last_post_id / last_post_timestamp）に達したらページングを止める
+    - ページごとに next_page_cursor を保存し、前回のジョブが途中で落ちていればそのカーソルと途中結果から再開する
+    - SocialPost に既にある投稿は分析しない
+    - 完了時に last_post_id / last_post_timestamp を進める
     """
     logger.info(f"[Job {job_id}] Processing started for user {user_id}.")
     
@@ -85,34 +146,100 @@ def fetch_and_analyze_posts(job_id, user_id, start_date_str, end_date_str):
             # リフレッシュ失敗は致命ではない。後段APIで190が出たらUX対応へ
             pass
 
-        # --- 1. 全投稿を取得 ---
+        # --- 1〜3. 取得 → 分析 → 補完をページ単位で重ねて流す ---
+        # 取得と分析は別スレッドで先に進め、補完が済んだページから result_data に途中結果を書き出す
         check_if_cancelled()  # 投稿取得前にチェック
-        
-        all_posts = _fetch_all_instagram_posts(job_id, user.instagram_token, start_date_str, end_date_str)
-        if not all_posts:
-            logger.info(f"[Job {job_id}] No posts found for the specified period.")
-            _update_job_status(job_id, 'completed', result_data={'spot_candidates': [], 'analyzed_posts': []})
-            return
 
-        # --- 2. 投稿を分析 ---
-        check_if_cancelled()  # 分析前にチェック
-        
-        spot_candidates = _analyze_posts_with_openai(job_id, all_posts)
+        from flask import current_app
+        from app.services.openai_rate_limit import OpenAIRateLimiter
+
+        app = current_app._get_current_object()
+        token = user.instagram_token
+        started = time.monotonic()
+        stats = {'pages': 0, 'openai': {}, 'places': {}}
+        # 取得スレッドが書く（stats は途中結果の書き出し中に触らせない）
+        fetch_stats = {'skipped_known_posts': 0} if incremental else {}
+        newest_fetched = []  # 今回最初に取得した投稿（ページは新しい順）
+
+        all_posts = []
+        enriched_candidates = []
+        resume_cursor = None
+        stop_at = None
+        if incremental:
+            progress = ImportProgress.query.filter_by(job_id=job_id).first()
+            if progress:
+                stop_at = (progress.last_post_id, progress.last_post_timestamp)
+                resume_cursor = progress.next_page_cursor
+                if resume_cursor and progress.result_data:
+                    # 前回落ちたジョブの途中結果を引き継いで、保存済みカーソルの次のページから続ける
+                    try:
+                        previous = json.loads(progress.result_data)
+                        all_posts = list(previous.get('analyzed_posts') or [])
+                        enriched_candidates = list(previous.get('spot_candidates') or [])
+                    except ValueError:
+                        pass
+            stats['incremental'] = {'resumed': bool(resume_cursor), 'stop_at_post_id': stop_at[0] if stop_at else None}
+        # OpenAI のトークンバケットはページをまたいで共有する（ページごとに満タンから始めない）
+        limiter = OpenAIRateLimiter()
+        stop = threading.Event()
+        pages_q, analyzed_q = queue.Queue(), queue.Queue()
+
+        def exclude_imported(posts):
+            # 取り込み済みの投稿は本文を取り直す前に落とす
+            if not newest_fetched:
+                newest_fetched.append(posts[0])
+            fresh = _drop_imported_posts(user_id, posts)
+            fetch_stats['skipped_known_posts'] += len(posts) - len(fresh)
+            return fresh
+
+        def fetch_pages():
+            for posts, cursor in _iter_instagram_post_pages(job_id, token, start_date_str, end_date_str,
+                                                            after=resume_cursor, stop_at=stop_at, stats=fetch_stats,
+                                                            exclude=exclude_imported if incremental else None):
+                yield posts, cursor
+            fetch_stats['fetch_seconds'] = round(time.monotonic() - started, 3)
+
+        _start_pipeline_stage(app, stop, pages_q, fetch_pages)
+        _start_pipeline_stage(app, stop, analyzed_q, lambda: _analyze_post_pages(job_id, _drain_pipeline(pages_q), limiter))
 
-        # --- 3. Google Places APIで情報を補完 ---
-        check_if_cancelled()  # Google Places検索前にチェック
-        
-        enriched_candidates = _enrich_candidates_with_google_places(job_id, spot_candidates)
+        try:
+            for page, cursor, spot_candidates, openai_stats in _drain_pipeline(analyzed_q):
+                check_if_cancelled()
 
+                places_stats = {}
+                enriched_candidates.extend(_enrich_candidates_with_google_places(job_id, spot_candidates, stats=places_stats))
+                all_posts.extend(page)
+                stats['pages'] += 1
+                _merge_stage_stats(stats['openai'], openai_stats)
+                _merge_stage_stats(stats['places'], places_stats)
+                if enriched_candidates and 'first_candidate_seconds' not in stats:
+                    stats['first_candidate_seconds'] = round(time.monotonic() - started, 3)
+
+                _update_job_partial_result(job_id, _import_result(enriched_candidates, all_posts, stats, partial=True),
+                                           next_page_cursor=cursor if incremental else None)
+        finally:
+            stop.set()
+
+        stats.update(fetch_stats)
+        stats['total_seconds'] = round(time.monotonic() - started, 3)
+        if not all_posts:
+            logger.info(f"[Job {job_id}] No posts found for the specified period.")
         logger.info(f"[Job {job_id}] Found {len(enriched_candidates)} potential spots.")
-        
-        result = {
-            'spot_candidates': enriched_candidates,
-            'analyzed_posts': [{'id': p.get('id'), 'permalink': p.get('permalink'), 'timestamp': p.get('timestamp')} for p in all_posts]
-        }
-        _update_job_status(job_id, 'completed', result_data=result)
+
+        if incremental:
+            # 再開時は引き継いだ途中結果の先頭（前回のジョブが最初に取得した投稿）が最新
+            newest = all_posts[:1] if resume_cursor and all_posts else newest_fetched
+            _advance_import_watermark(job_id, newest[0] if newest else None)
+
+        _update_job_status(job_id, 'completed', result_data=_import_result(enriched_candidates, all_posts, stats))
         logger.info(f"[Job {job_id}] Processing finished successfully.")
 
+    except _InstagramTokenExpired:
+        # 期限切れ: ジョブをUX向けの失敗状態で終了し、Sentryは送らない。
+        # 取り込み位置と再開用カーソルは進めない（再認証後の差分インポートが続きから取り直す）
+        _update_job_status(job_id, 'failed', error_info=f'{REAUTH_REQUIRED}: Instagram token expired or invalid (Code:190)')
+        logger.info(f"[Job {job_id}] Token invalid/expired (190). Marked as reauth_required.")
+
     except Exception as e:
         # キャンセルされた場合は静かに終了
         if "CANCELLED_BY_USER" in str(e):
@@ -138,61 +265,353 @@ def fetch_and_analyze_posts(job_id, user_id, start_date_str, end_date_str):
         
         _update_job_status(job_id, 'failed', error_info=str(e))
 
-def _fetch_all_instagram_posts(job_id, token, start_date_str, end_date_str):
-    """指定期間のInstagram投稿をすべて取得する"""
-    all_posts = []
+def auto_import_instagram(run_id, job_id, user_id, start_date_str, end_date_str):
+    """スケジューラ（flask ig-auto-import）が積む差分インポート。
+
+    全 RQ ワーカー共通の同時実行枠（IG_AUTO_IMPORT_CONCURRENCY）が空いていなければ、
+    IG_AUTO_IMPORT_RETRY_DELAY 秒前後あとに積み直す。結果は実行ごとの集計（run_id）に加算する。
+    """
+    from flask import current_app
+    from rq import Queue, get_current_job
+    from app.services import instagram_auto_import as auto_import
+
+    progress = ImportProgress.query.filter_by(job_id=job_id).first()
+    if progress is None or progress.status == 'cancelled':
+        # 手動インポートに置き換わった・キャンセルされた
+        logger.info(f"[Job {job_id}] Auto import superseded or cancelled. Skipping.")
+        auto_import.record(run_id, users_failed=1)
+        return
+
+    job = get_current_job()
+    if not auto_import.acquire_slot(job_id):
+        if job is not None:
+            delay = int(current_app.config.get('IG_AUTO_IMPORT_RETRY_DELAY', 60))
+            Queue(job.origin, connection=job.connection).enqueue_in(
+                timedelta(seconds=delay + random.uniform(0, delay)),
+                auto_import_instagram,
+                args=[run_id, job_id, user_id, start_date_str, end_date_str],
+                job_timeout=job.timeout,
+            )
+            auto_import.record(run_id, deferred=1)
+            return
+        logger.warning(f"[Job {job_id}] No auto import slot, but not running under RQ. Running anyway.")
+
+    try:
+        fetch_and_analyze_posts(job_id, user_id, start_date_str, end_date_str, incremental=True)
+    finally:
+        auto_import.release_slot(job_id)
+
+    db.session.expire_all()
+    progress = ImportProgress.query.filter_by(job_id=job_id).first()
+    result = {}
+    if progress and progress.result_data:
+        try:
+            result = json.loads(progress.result_data)
+        except ValueError:
+            pass
+    failed = not progress or progress.status != 'completed'
+    error_info = (progress.error_info or '') if failed and progress else ''
+    auto_import.record(
+        run_id,
+        users_done=0 if failed else 1,
+        users_failed=1 if failed else 0,
+        rate_limited=1 if any(f'(Code: {code})' in error_info for code in INSTAGRAM_RATE_LIMIT_CODES) else 0,
+        reauth_required=1 if error_info.startswith(REAUTH_REQUIRED) else 0,
+        posts=len(result.get('analyzed_posts') or []),
+        api_calls=(result.get('stats') or {}).get('instagram_requests', 0),
+        candidates=len(result.get('spot_candidates') or []),
+    )
+
+
+_PIPELINE_DONE = object()
+
+
+def _import_result(spot_candidates, posts, stats, partial=False):
+    result = {
+        'spot_candidates': spot_candidates,
+        'analyzed_posts': [{'id': p.get('id'), 'permalink': p.get('permalink'), 'timestamp': p.get('timestamp')} for p in posts],
+        'stats': stats,
+    }
+    if partial:
+        # 処理中の途中結果（ステータスAPIが processing のまま候補を返す）
+        result['partial'] = True
+    return result
+
+
+def _start_pipeline_stage(app, stop, out_q, produce):
+    """produce() の要素を順に out_q へ流すスレッドを起動する。
+
+    終わったら _PIPELINE_DONE を、例外が起きたら例外オブジェクトを流す（受け側の _drain_pipeline で再送出）。
+    stop がセットされたら次の要素の前で止まる。
+    """
+    def run():
+        with app.app_context():
+            try:
+                for item in produce():
+                    if stop.is_set():
+                        break
+                    out_q.put(item)
+            except Exception as e:
+                out_q.put(e)
+            finally:
+                out_q.put(_PIPELINE_DONE)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _drain_pipeline(in_q):
+    while True:
+        item = in_q.get()
+        if item is _PIPELINE_DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def _analyze_post_pages(job_id, pages, limiter):
+    """取得済みの (posts, cursor) ごとに候補を抽出し (posts, cursor, spot_candidates, stats) を返す。"""
+    for posts, cursor in pages:
+        page_stats = {}
+        spot_candidates = _analyze_posts_with_openai(job_id, posts, stats=page_stats, limiter=limiter)
+        yield posts, cursor, spot_candidates, page_stats
+
+
+# ページをまたいで足し合わせない値（設定値・最後の状態）
+_NON_ADDITIVE_STATS = ('mode', 'concurrency', 'parallelism', 'rate_limit')
+
+
+def _merge_stage_stats(total, part):
+    for key, value in part.items():
+        if key in _NON_ADDITIVE_STATS or isinstance(value, bool) or not isinstance(value, (int, float)):
+            total[key] = value
+        else:
+            total[key] = round(total.get(key, 0) + value, 3)
+    if total.get('wall_seconds') and 'request_seconds_total' in total:
+        total['parallelism'] = round(total['request_seconds_total'] / total['wall_seconds'], 2)
+
+
+def _app_usage_percent(response):
+    """X-App-Usage ヘッダ（call_count / total_time / total_cputime の%）の最大値。無ければ 0"""
+    try:
+        usage = json.loads(response.headers.get('X-App-Usage') or '{}')
+        return max([int(v) for v in usage.values() if isinstance(v, (int, float))] or [0])
+    except (TypeError, ValueError):
+        return 0
+
+
+# 一覧では期間・取り込み済みの判定に要るものだけを取り、残った投稿だけ本文を取り直す
+INSTAGRAM_LIST_FIELDS = "id,timestamp,permalink"
+INSTAGRAM_POST_FIELDS = "id,caption,media_type,permalink,timestamp,location"
+# 利用制限のエラーコード（4: アプリ, 17: ユーザー, 32: ページ, 613: 呼び出し頻度）
+INSTAGRAM_RATE_LIMIT_CODES = (4, 17, 32, 613)
+
+_instagram_stats_lock = threading.Lock()
+
+
+class InstagramAPIError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class _InstagramTokenExpired(InstagramAPIError):
+    pass
+
+
+# トークン切れで失敗したジョブの error_info の接頭辞
+REAUTH_REQUIRED = 'reauth_required'
+
+
+def _instagram_get(job_id, token, url, params, stats=None):
+    """Graph API の GET。5xx・通信エラー・利用制限コードは指数バックオフ（IG_FETCH_RETRIES 回まで）で再試行する。
+
+    190 は _InstagramTokenExpired、それ以外の失敗は InstagramAPIError。利用制限で諦めたときと
+    X-App-Usage が IG_APP_USAGE_COOLDOWN_PCT を超えたときはこのトークンに待ち時間を設定する。
+    """
+    from flask import current_app
+    from app.services.instagram_auto_import import set_cooldown
+
+    cfg = current_app.config
+    retries = int(cfg.get('IG_FETCH_RETRIES', 3))
+    backoff = float(cfg.get('IG_FETCH_BACKOFF', 1.0))
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            # 1, 2, 4 ... 秒（上限30秒）に揺らぎを入れて待つ
+            delay = min(backoff * 2 ** (attempt - 1), 30.0)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            logger.info(f"[Job {job_id}] Retrying Instagram API ({attempt}/{retries}) after: {error}")
+        if stats is not None:
+            with _instagram_stats_lock:
+                stats['instagram_requests'] = stats.get('instagram_requests', 0) + 1
+        try:
+            response = requests.get(url, params=params, timeout=30)
+        except requests.exceptions.RequestException as e:
+            error = InstagramAPIError(f"Instagram API request failed: {e}")
+            continue
+
+        if response.status_code == 200:
+            usage = _app_usage_percent(response)
+            if usage >= int(cfg.get('IG_APP_USAGE_COOLDOWN_PCT', 90)):
+                # 制限に達する前に、このトークンの次の自動インポートを遅らせる
+                logger.info(f"[Job {job_id}] Instagram app usage at {usage}%. Setting cooldown.")
+                set_cooldown(token, reason=f'usage_{usage}')
+            return response.json()
+
+        # エラーレスポンスの詳細を解析
+        try:
+            error_info = json.loads(response.text).get('error', {})
+        except json.JSONDecodeError:
+            error_info = {}
+        error_code = error_info.get('code')
+        error_message = error_info.get('message', response.text)
+        if error_code == 190:
+            raise _InstagramTokenExpired(f"Instagram token expired or invalid (Code: {error_code})", error_code)
+        if error_code in INSTAGRAM_RATE_LIMIT_CODES:
+            error = InstagramAPIError(
+                f"Instagram APIの利用制限に達しました。時間をおいて再度お試しください。 (Code: {error_code})", error_code)
+        elif response.status_code >= 500 or error_info.get('is_transient'):
+            error = InstagramAPIError(f"Instagram API error: {error_message} (Code: {error_code})", error_code)
+        else:
+            raise InstagramAPIError(f"Instagram API error: {error_message} (Code: {error_code})", error_code)
+
+    if error.code in INSTAGRAM_RATE_LIMIT_CODES:
+        set_cooldown(token, reason=f'code_{error.code}')
+    raise error
+
+
+def _with_fields(url, params, fields):
+    """同じページを別のフィールドで取り直すための (url, params)。next の URL に入っているクエリも引き継ぐ。"""
+    from urllib.parse import parse_qsl, urlparse
+
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query))
+    query.update(params)
+    query['fields'] = fields
+    return parsed._replace(query='').geturl(), query
+
+
+def _hydrate_instagram_posts(job_id, token, posts, page_request, stats=None):
+    """一覧で残った投稿のキャプション等を取り直す（順序は維持）。
+
+    IG_HYDRATE_PER_POST_MAX 件までは投稿ごとに IG_HYDRATE_CONCURRENCY 並列で取り、それより多ければ
+    同じページを INSTAGRAM_POST_FIELDS で1回取り直す方が呼び出し回数が少ない。消えた投稿などは除く。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import current_app
+
+    cfg = current_app.config
+    hydrated = {}
+    if len(posts) > int(cfg.get('IG_HYDRATE_PER_POST_MAX', 5)):
+        url, params = _with_fields(*page_request, INSTAGRAM_POST_FIELDS)
+        data = _instagram_get(job_id, token, url, params, stats)
+        wanted = {p.get('id') for p in posts}
+        hydrated = {p.get('id'): p for p in data.get('data', []) if p.get('id') in wanted}
+
+    missing = [p for p in posts if p.get('id') not in hydrated]
+    if missing:
+        app = current_app._get_current_object()
+        base_url = f"https://graph.instagram.com/{INSTAGRAM_API_VERSION}/"
+
+        def fetch_one(post):
+            with app.app_context():
+                try:
+                    return _instagram_get(job_id, token, base_url + post['id'],
+                                          {'fields': INSTAGRAM_POST_FIELDS, 'access_token': token}, stats)
+                except _InstagramTokenExpired:
+                    raise
+                except InstagramAPIError as e:
+                    if e.code in INSTAGRAM_RATE_LIMIT_CODES:
+                        raise
+                    logger.warning(f"[Job {job_id}] Could not hydrate post {post.get('id')}: {e}")
+                    return None
+
+        concurrency = max(1, min(int(cfg.get('IG_HYDRATE_CONCURRENCY', 8)), len(missing)))
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for post in pool.map(fetch_one, missing):
+                if post:
+                    hydrated[post.get('id')] = post
+
+    return [hydrated[p.get('id')] for p in posts if p.get('id') in hydrated]
+
+
+def _iter_instagram_post_pages(job_id, token, start_date_str, end_date_str, after=None, stop_at=None, stats=None,
+                               exclude=None):
+    """指定期間のInstagram投稿を Graph API のページ単位で (posts, next_cursor) として返す
+
+    一覧は since/until で期間を絞り、INSTAGRAM_LIST_FIELDS だけを IG_PAGE_LIMIT 件ずつ取る。
+    期間外の投稿と exclude(posts) で除いた投稿（取り込み済みなど）を落としてから、残りだけ本文を取り直す。
+    空のページは返さない。next_cursor は次のページの after カーソル（最後のページは None）。
+    after: このカーソルの次のページから取得する（途中再開）
+    stop_at: (last_post_id, last_post_timestamp)。前回取り込んだ最新投稿に達したらそこで止める
+    stats を渡すと Graph API の呼び出し回数（instagram_requests）を書き込む。
+    トークン切れ（190）は途中で _InstagramTokenExpired を送出する（呼び出し側で reauth_required として失敗させる）。
+    """
+    from flask import current_app
+
+    total = 0
+    stop_id, stop_dt = stop_at or (None, None)
+    if stop_dt is not None and stop_dt.tzinfo is None:
+        stop_dt = stop_dt.replace(tzinfo=timezone.utc)
     
     start_dt = datetime.fromisoformat(f"{start_date_str}T00:00:00+00:00")
     end_dt = datetime.fromisoformat(f"{end_date_str}T23:59:59+00:00")
+    since_dt = max(start_dt, stop_dt) if stop_dt else start_dt
 
     params = {
-        "fields": "id,caption,media_type,media_url,permalink,timestamp,location",
+        "fields": INSTAGRAM_LIST_FIELDS,
         "access_token": token,
-        "limit": 50
+        "limit": int(current_app.config.get('IG_PAGE_LIMIT', 100)),
+        "since": int(since_dt.timestamp()),
+        "until": int(end_dt.timestamp()),
     }
+    if after:
+        params["after"] = after
     url = f"https://graph.instagram.com/{INSTAGRAM_API_VERSION}/me/media"
 
     is_dev_mode = os.environ.get("FLASK_ENV") == "development"
 
     while url:
+        page_request = None
         if is_dev_mode:
             logger.info(f"--- [Job {job_id}] RUNNING IN DEV MODE: LOADING MOCK INSTAGRAM DATA ---")
             with open("tests/mock_data/instagram_posts.json") as f:
                 data = json.load(f)
             url = None # 開発モードでは1回でループを抜ける
+            cursor = None
         else:
-            response = requests.get(url, params=params)
-            if response.status_code != 200:
-                # エラーレスポンスの詳細を解析
-                try:
-                    error_data = json.loads(response.text)
-                    error_info = error_data.get('error', {})
-                    error_code = error_info.get('code')
-                    error_message = error_info.get('message', response.text)
-                    
-                    if error_code == 190:
-                        # 期限切れ: ジョブをUX向けの失敗状態で終了し、Sentryは送らない
-                        _update_job_status(job_id, 'failed', error_info='reauth_required: Instagram token expired or invalid (Code:190)')
-                        logger.info(f"[Job {job_id}] Token invalid/expired (190). Marked as reauth_required.")
-                        return []
-                    elif error_code in [4, 17]:
-                        raise Exception(f"Instagram APIの利用制限に達しました。時間をおいて再度お試しください。 (Code: {error_code})")
-                    else:
-                        raise Exception(f"Instagram API error: {error_message} (Code: {error_code})")
-                except json.JSONDecodeError:
-                    raise Exception(f"Instagram API error: {response.text}")
-            data = response.json()
+            data = _instagram_get(job_id, token, url, params, stats)
+            page_request = (url, params)
             url = data.get("paging", {}).get("next")
-            # 次のリクエストではparamsをリセット
+            cursor = extract_cursor_from_url(url) if url else None
+            # 次のリクエストではparamsをリセット（next の URL にすべて入っている）
             params = {}
 
         posts_data = data.get('data', [])
         
-        # 期間でフィルタリング
+        # 期間でフィルタリング（前回取り込んだ最新投稿に達したらそれ以降は見ない）
+        page = []
+        reached_last_import = False
         for post in posts_data:
             post_dt = datetime.fromisoformat(post['timestamp'].replace('Z', '+00:00'))
+            if (stop_id and post.get('id') == stop_id) or (stop_dt and post_dt <= stop_dt):
+                reached_last_import = True
+                break
             if start_dt <= post_dt <= end_dt:
-                all_posts.append(post)
+                page.append(post)
+        if page and exclude:
+            page = exclude(page)
+        if page and page_request:
+            page = _hydrate_instagram_posts(job_id, token, page, page_request, stats)
+        if page:
+            total += len(page)
+            yield page, (None if reached_last_import else cursor)
+        if reached_last_import:
+            logger.info(f"[Job {job_id}] Reached the last imported post. Stopping pagination.")
+            break
         
         # 取得した最も古い投稿が開始日より前なら、ループを抜ける
         if posts_data:
@@ -200,28 +619,11 @@ def _fetch_all_instagram_posts(job_id, token, start_date_str, end_date_str):
             if oldest_post_dt < start_dt:
                 break
 
-    logger.info(f"[Job {job_id}] Fetched a total of {len(all_posts)} posts.")
-    return all_posts
+    logger.info(f"[Job {job_id}] Fetched a total of {total} posts.")
 
-def _analyze_posts_with_openai(job_id, posts):
-    """OpenAI APIを使って投稿からスポット候補を抽出する"""
-    if not OPENAI_API_KEY:
-        raise ValueError("OpenAI API key not configured.")
-    
-    from openai import OpenAI
-    client = OpenAI(api_key=OPENAI_API_KEY, timeout=60.0) # タイムアウトを60秒に延長
-    
-    spot_candidates = []
-    
-    for post in posts:
-        caption = post.get('caption', '')
-        if not caption:
-            continue
-        
-        if len(caption) > 1500: # 文字数制限を少し緩和
-            caption = caption[:1500]
+CAPTION_SYSTEM_PROMPT = "あなたはInstagramの投稿からスポット情報を抽出する専門家です。日本語のキャプションから場所名を正確に抽出してください。"
 
-        prompt = f"""
+_CAPTION_INSTRUCTIONS = """
         以下のInstagramキャプションから、実際に訪問した具体的な施設名・店舗名・観光スポット名を抽出してください。
         複数の施設を訪問している場合は、すべて抽出してください。
 
@@ -239,42 +641,273 @@ def _analyze_posts_with_openai(job_id, posts):
         複合表現の処理：
         - 「○○の△△ホテル」→「○○ △△」として抽出
         - ブランド名は保持（例：「星野リゾート」「リッツカールトン」）
+"""
+
 
+def _caption_prompt(caption):
+    return _CAPTION_INSTRUCTIONS + f"""
         キャプション: {caption}
         出力形式をJSON形式で返してください: {{"spots": ["施設名1", "施設名2", ...]}}
         """
+
+
+def _batch_caption_prompt(items):
+    """複数キャプションを1リクエストにまとめる。items は (post_id, caption) のリスト。"""
+    posts_json = json.dumps([{'id': post_id, 'caption': caption} for post_id, caption in items], ensure_ascii=False)
+    return _CAPTION_INSTRUCTIONS + f"""
+        各キャプションは独立した投稿です。投稿ごとに抽出してください。
+
+        投稿(JSON): {posts_json}
+        出力形式をJSON形式で返してください（すべての投稿IDをキーに含め、該当なしは空配列）:
+        {{"<投稿ID>": ["施設名1", "施設名2", ...], ...}}
+        """
+
+
+def _usage_tokens(response):
+    usage = getattr(response, 'usage', None)
+    if not usage:
+        return None, None, None
+    return (getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None),
+            getattr(usage, 'total_tokens', None))
+
+
+def _report_openai_error(job_id, e, post_id, caption_length, batch_size=None):
+    logger.error(f"[Job {job_id}] OpenAI API error for post {post_id}: {e}")
+
+    # Sentryに詳細情報を送信
+    try:
+        import sentry_sdk
+        context = {
+            "job_id": job_id,
+            "post_id": post_id,
+            "caption_length": caption_length,
+            "function": "_analyze_posts_with_openai"
+        }
+        if batch_size is not None:
+            context["batch_size"] = batch_size
+        sentry_sdk.set_context("openai_context", context)
+        sentry_sdk.capture_exception(e)
+    except Exception as sentry_error:
+        logger.error(f"[Job {job_id}] Failed to send OpenAI error to Sentry: {sentry_error}")
+
+
+class _CaptionCallError(Exception):
+    def __init__(self, call):
+        super().__init__(call.get('error'))
+        self.call = call
+
+
+def _openai_json_call(client, limiter, prompt, max_tokens):
+    """JSON モードで1回呼び出す。戻り値は (パース済みdict, 呼び出し記録)。例外は呼び出し側で処理する。"""
+    from app.services.openai_rate_limit import count_tokens
+
+    est_tokens = count_tokens(CAPTION_SYSTEM_PROMPT + prompt) + max_tokens
+    waited = limiter.acquire(est_tokens)
+    started = time.monotonic()
+    call = {'seconds': 0.0, 'waited': waited, 'prompt_tokens': None, 'completion_tokens': None, 'tokens': None, 'error': None}
+    try:
+        raw = client.chat.completions.with_raw_response.create(
+            model="gpt-4o",
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": CAPTION_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens
+        )
+        limiter.update_from_headers(raw.headers)
+        response = raw.parse()
+        call['prompt_tokens'], call['completion_tokens'], call['tokens'] = _usage_tokens(response)
+        limiter.settle(est_tokens, call['tokens'])
+        content = response.choices[0].message.content
+        return json.loads(content), call
+    except Exception as e:
+        limiter.update_from_headers(getattr(getattr(e, 'response', None), 'headers', None))
+        call['error'] = str(e)
+        raise _CaptionCallError(call) from e
+    finally:
+        call['seconds'] = time.monotonic() - started
+
+
+def _extract_spot_names_for_post(job_id, client, limiter, post, caption):
+    """1投稿分のキャプションから施設名を抽出する（スレッドプールから呼ぶ）。"""
+    try:
+        result, call = _openai_json_call(client, limiter, _caption_prompt(caption), 500)
+        spot_names = result.get("spots", [])
+        if not isinstance(spot_names, list):
+            spot_names = []
+    except _CaptionCallError as e:
+        _report_openai_error(job_id, e.__cause__, post.get('id'), len(caption))
+        call = e.call
+        spot_names = [] # エラー時はAIからの抽出は無しとする
+    return {'spot_names': spot_names, 'calls': [call], 'splits': 0, 'ok': call['error'] is None}
+
+
+def _pack_caption_batches(indexed_targets, token_budget, max_posts):
+    """(index, post, caption) を入力トークン予算と件数上限に収まるように詰める（順序は維持）。"""
+    from app.services.openai_rate_limit import count_tokens
+
+    overhead = count_tokens(CAPTION_SYSTEM_PROMPT + _batch_caption_prompt([]))
+    batches, current, used = [], [], overhead
+    for item in indexed_targets:
+        _, post, caption = item
+        cost = count_tokens(caption) + count_tokens(str(post.get('id'))) + 16
+        if current and (used + cost > token_budget or len(current) >= max_posts):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _extract_spot_names_for_batch(job_id, client, limiter, batch):
+    """複数投稿を1リクエストで抽出する。
+
+    JSON として読めない・投稿IDが欠けている・API エラーのときは半分に分けて再試行し、
+    1件になったら通常の投稿単位の抽出に戻す。
+    戻り値は {'results': {index: [施設名]}, 'calls': [...], 'splits': n, 'failed': [抽出できなかった index],
+    'single': [投稿単位のプロンプトで抽出した index]}
+    """
+    if len(batch) == 1:
+        index, post, caption = batch[0]
+        single = _extract_spot_names_for_post(job_id, client, limiter, post, caption)
+        return {'results': {index: single['spot_names']}, 'calls': single['calls'], 'splits': 0,
+                'failed': [] if single['ok'] else [index], 'single': [index]}
+
+    items = [(str(post.get('id')), caption) for _, post, caption in batch]
+    # 出力は投稿あたり数件の施設名なので、件数に比例した上限にする
+    max_tokens = min(4000, 200 + 80 * len(batch))
+    try:
+        result, call = _openai_json_call(client, limiter, _batch_caption_prompt(items), max_tokens)
+        missing = [post_id for post_id, _ in items if not isinstance(result.get(post_id), list)]
+        if missing:
+            raise ValueError(f"batch response is missing {len(missing)} of {len(items)} posts")
+        return {
+            'results': {index: result[str(post.get('id'))] for index, post, _ in batch},
+            'calls': [call],
+            'splits': 0,
+            'failed': [],
+            'single': [],
+        }
+    except (_CaptionCallError, ValueError, AttributeError) as e:
+        calls = [e.call] if isinstance(e, _CaptionCallError) else [call]
+        logger.warning(f"[Job {job_id}] caption batch of {len(batch)} failed ({e}); splitting and retrying")
+
+    mid = len(batch) // 2
+    merged = {'results': {}, 'calls': calls, 'splits': 1, 'failed': [], 'single': []}
+    for half in (batch[:mid], batch[mid:]):
+        part = _extract_spot_names_for_batch(job_id, client, limiter, half)
+        merged['results'].update(part['results'])
+        merged['calls'].extend(part['calls'])
+        merged['splits'] += part['splits']
+        merged['failed'].extend(part['failed'])
+        merged['single'].extend(part['single'])
+    return merged
+
+
+def _analyze_posts_with_openai(job_id, posts, stats=None, mode=None, limiter=None):
+    """OpenAI APIを使って投稿からスポット候補を抽出する
+
+    リクエストはスレッドプール（IMPORT_OPENAI_CONCURRENCY）で並列に投げ、RPM/TPM のトークンバケット
+    （x-ratelimit-* ヘッダで補正）で上限を超えないように間引く。候補は投稿の順序どおりに組み立てる。
+    mode（既定は IMPORT_OPENAI_EXTRACT_MODE）:
+    - 'per_post': 投稿ごとに1リクエスト
+    - 'batched': 入力 IMPORT_OPENAI_BATCH_TOKENS トークンまでのキャプションを1リクエストにまとめる
+    抽出結果は llm_cache に使ったプロンプトごとの namespace（投稿単位 'caption_spots'、まとめ
+    'caption_spots_batch'）で保存し、同じキャプションは再送しない。
+    stats を渡すと実測の所要時間・並列度・トークン数を書き込む。
+    limiter を渡すと呼び出しをまたいで同じレート制限を使う（ページ単位で呼ぶパイプライン用）。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import current_app
+    from app.services import llm_cache
+    from app.services.openai_rate_limit import OpenAIRateLimiter
+
+    if not OPENAI_API_KEY:
+        raise ValueError("OpenAI API key not configured.")
+    
+    from openai import OpenAI
+    client = OpenAI(api_key=OPENAI_API_KEY, timeout=60.0) # タイムアウトを60秒に延長
+    limiter = limiter or OpenAIRateLimiter()
+    cfg = current_app.config
+    concurrency = max(1, int(cfg.get('IMPORT_OPENAI_CONCURRENCY', 4)))
+    mode = mode or cfg.get('IMPORT_OPENAI_EXTRACT_MODE', 'per_post')
+
+    targets = []
+    for post in posts:
+        caption = post.get('caption', '')
+        if not caption:
+            continue
         
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": "あなたはInstagramの投稿からスポット情報を抽出する専門家です。日本語のキャプションから場所名を正確に抽出してください。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500
+        if len(caption) > 1500: # 文字数制限を少し緩和
+            caption = caption[:1500]
+        targets.append((post, caption))
+
+    started = time.monotonic()
+    spot_names_by_index = {}
+    # キャッシュはメインスレッドでまとめて引く（ワーカーはアプリコンテキストを持たない）
+    # batched でも1件に分かれた投稿は投稿単位のプロンプトで抽出するので、両方の namespace を見る
+    namespaces = ['caption_spots_batch', 'caption_spots'] if mode == 'batched' else ['caption_spots']
+    cached = [None] * len(targets)
+    for namespace in namespaces:
+        missing = [i for i, names in enumerate(cached) if not isinstance(names, list)]
+        if not missing:
+            break
+        found = llm_cache.get_many(namespace, 'gpt-4o', [targets[i][1] for i in missing])
+        for i, names in zip(missing, found):
+            cached[i] = names
+    pending = []
+    for i, ((post, caption), names) in enumerate(zip(targets, cached)):
+        if isinstance(names, list):
+            spot_names_by_index[i] = names
+        else:
+            pending.append((i, post, caption))
+    failed = set()
+    single = set()
+    calls, splits, batch_count = [], 0, 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if mode == 'batched':
+            batches = _pack_caption_batches(
+                pending,
+                int(cfg.get('IMPORT_OPENAI_BATCH_TOKENS', 6000)),
+                int(cfg.get('IMPORT_OPENAI_BATCH_MAX_POSTS', 25)),
             )
-            content = response.choices[0].message.content
-            result = json.loads(content)
-            spot_names = result.get("spots", [])
+            batch_count = len(batches)
+            futures = [pool.submit(_extract_spot_names_for_batch, job_id, client, limiter, batch) for batch in batches]
+            for f in futures:
+                part = f.result()
+                spot_names_by_index.update(part['results'])
+                calls.extend(part['calls'])
+                splits += part['splits']
+                failed.update(part['failed'])
+                single.update(part['single'])
+        else:
+            futures = [(i, pool.submit(_extract_spot_names_for_post, job_id, client, limiter, post, caption))
+                       for i, post, caption in pending]
+            # 完了順ではなく投稿順に受け取る
+            for i, f in futures:
+                part = f.result()
+                spot_names_by_index[i] = part['spot_names']
+                calls.extend(part['calls'])
+                single.add(i)
+                if not part['ok']:
+                    failed.add(i)
+    wall_seconds = time.monotonic() - started
+
+    # エラーで空になった投稿はキャッシュしない（次回の取り込みで再試行する）
+    llm_cache.put_many('caption_spots', 'gpt-4o', [
+        (caption, spot_names_by_index.get(i, [])) for i, _, caption in pending if i not in failed and i in single
+    ])
+    llm_cache.put_many('caption_spots_batch', 'gpt-4o', [
+        (caption, spot_names_by_index.get(i, [])) for i, _, caption in pending if i not in failed and i not in single
+    ])
 
-        except Exception as e:
-            logger.error(f"[Job {job_id}] OpenAI API error for post {post.get('id')}: {e}")
-            
-            # Sentryに詳細情報を送信
-            try:
-                import sentry_sdk
-                sentry_sdk.set_context("openai_context", {
-                    "job_id": job_id,
-                    "post_id": post.get('id'),
-                    "caption_length": len(caption),
-                    "function": "_analyze_posts_with_openai"
-                })
-                sentry_sdk.capture_exception(e)
-            except Exception as sentry_error:
-                logger.error(f"[Job {job_id}] Failed to send OpenAI error to Sentry: {sentry_error}")
-            
-            spot_names = [] # エラー時はAIからの抽出は無しとする
+    spot_candidates = []
+    
+    for i, (post, caption) in enumerate(targets):
+        spot_names = [n for n in spot_names_by_index.get(i, []) if isinstance(n, str)]
 
         # Instagramの位置情報があれば最優先で追加
         location = post.get('location')
@@ -300,121 +933,150 @@ def _analyze_posts_with_openai(job_id, posts):
                 'timestamp': post.get('timestamp')
             })
 
+    if stats is not None:
+        busy_seconds = sum(c['seconds'] for c in calls)
+        stats.update({
+            'mode': mode,
+            'posts': len(targets),
+            'cache_hits': len(targets) - len(pending),
+            'requests': len(calls),
+            'batches': batch_count,
+            'splits': splits,
+            'errors': sum(1 for c in calls if c['error']),
+            'concurrency': concurrency,
+            'wall_seconds': round(wall_seconds, 3),
+            'request_seconds_total': round(busy_seconds, 3),
+            # 実際に同時に走っていたリクエスト数の平均
+            'parallelism': round(busy_seconds / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+            'prompt_tokens': sum(c['prompt_tokens'] or 0 for c in calls),
+            'completion_tokens': sum(c['completion_tokens'] or 0 for c in calls),
+            'tokens': sum(c['tokens'] or 0 for c in calls),
+            'rate_limit': limiter.snapshot(),
+        })
+
     logger.info(f"[Job {job_id}] Analysis complete. Found {len(spot_candidates)} candidates.")
     return spot_candidates
 
 
-def _enrich_candidates_with_google_places(job_id, candidates):
-    """Google Places APIで情報を補完する"""
+PLACES_SEARCH_FIELD_MASK = 'places.displayName,places.formattedAddress,places.location,places.types,places.id,places.addressComponents'
+
+
+def _candidate_name_key(name):
+    """同じ施設名の候補をまとめるためのキー（全角/半角・大文字小文字・空白の違いを吸収）。"""
+    return places_client.normalize_query(name)
+
+
+def _search_place_for_name(job_id, name):
+    """施設名で places:searchText を引く（places_client のキャッシュ経由。スレッドプールから呼ぶ）。
+
+    戻り値: ('found', place) / ('not_found', None) / ('error', None)
+    """
+    try:
+        logger.info(f"[Job {job_id}] Searching Google Places for: '{name}'")
+        results = places_client.search_text(name, PLACES_SEARCH_FIELD_MASK, language='ja', region='JP')
+        if results is None:
+            logger.error(f"[Job {job_id}] Google Places API search failed for '{name}'")
+            return 'error', None
+        if not results:
+            return 'not_found', None
+        return 'found', results[0] # 最も関連性の高い結果を使用
+
+    except Exception as e:
+        logger.error(f"[Job {job_id}] Google Places API error for '{name}': {e}")
+
+        # Sentryに詳細情報を送信
+        try:
+            import sentry_sdk
+            sentry_sdk.set_context("google_places_context", {
+                "job_id": job_id,
+                "candidate_name": name,
+                "function": "_enrich_candidates_with_google_places"
+            })
+            sentry_sdk.capture_exception(e)
+        except Exception as sentry_error:
+            logger.error(f"[Job {job_id}] Failed to send Google Places error to Sentry: {sentry_error}")
+        return 'error', None
+
+
+def _search_place_in_context(app, job_id, name):
+    with app.app_context():
+        return _search_place_for_name(job_id, name)
+
+
+def _enrich_candidates_with_google_places(job_id, candidates, stats=None):
+    """Google Places APIで情報を補完する
+
+    同じ施設名（_candidate_name_key が同じもの）は1回だけ検索し、結果をすべての候補に反映する。
+    検索は IMPORT_PLACES_CONCURRENCY 本のスレッドプールから places_client（共有 Session・LRU/Redis キャッシュ）で引く。
+    Google で見つからなかった候補・エラーになった候補は除外する。
+    stats を渡すと候補数・実際に投げたリクエスト数・重複で省いた数などを書き込む。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import current_app
+
     if not GOOGLE_MAPS_API_KEY:
         logger.warning(f"[Job {job_id}] Google Maps API key not configured. Skipping enrichment.")
         return candidates
 
-    enriched_candidates = []
+    concurrency = max(1, int(current_app.config.get('IMPORT_PLACES_CONCURRENCY', 8)))
+    app = current_app._get_current_object()
+
+    # 施設名ごとに最初に出てきた表記で1回だけ検索する（順序は維持）
+    names_by_key = {}
     for candidate in candidates:
-        try:
-            # Google Places API v1 (searchText) を使用
-            search_url = "https://places.googleapis.com/v1/places:searchText"
-            headers = {
-                'Content-Type': 'application/json',
-                'X-Goog-Api-Key': GOOGLE_MAPS_API_KEY,
-                'X-Goog-FieldMask': 'places.displayName,places.formattedAddress,places.location,places.types,places.id,places.addressComponents',
-                'X-Goog-LanguageCode': 'ja',
-                'User-Agent': 'my-map.link App (https://my-map.link)'
-            }
-            search_data = {
-                "textQuery": candidate['name'],
-                "languageCode": "ja",
-                "regionCode": "JP"
-            }
-            
-            logger.info(f"[Job {job_id}] Searching Google Places for: '{candidate['name']}'")
-            response = requests.post(search_url, headers=headers, json=search_data, timeout=10)
-            
-            # APIレスポンスのステータスコードをチェック
-            if response.status_code != 200:
-                logger.error(f"[Job {job_id}] Google Places API returned status {response.status_code} for '{candidate['name']}'. Response: {response.text}")
-                continue # エラーの場合はこの候補をスキップ
+        key = _candidate_name_key(candidate.get('name'))
+        if key and key not in names_by_key:
+            names_by_key[key] = candidate['name']
 
-            response_data = response.json()
-            logger.info(f"[Job {job_id}] Google Places API response for '{candidate['name']}': {response_data}")
-            
-            results = response_data.get('places', [])
-
-            if results:
-                place = results[0] # 最も関連性の高い結果を使用
-                
-                # 更新: candidate辞書を直接更新する（フィールドマッピング修正）
-                candidate['formatted_address'] = place.get('formattedAddress')
-                loc = place.get('location', {})
-                candidate['latitude'] = loc.get('latitude')  # 修正: lat → latitude
-                candidate['longitude'] = loc.get('longitude')  # 修正: lng → longitude
-                candidate['place_id'] = place.get('id')
-                candidate['types'] = place.get('types', [])
-                candidate['name'] = place.get('displayName', {}).get('text', candidate['name'])
-                
-                # summary_locationを生成
-                if 'addressComponents' in place:
-                    country = None
-                    prefecture = None
-                    locality = None
-                    
-                    for component in place['addressComponents']:
-                        types = component.get('types', [])
-                        if 'country' in types:
-                            country = component.get('longText')
-                        elif 'administrative_area_level_1' in types:
-                            prefecture = component.get('longText')
-                        elif 'locality' in types or 'sublocality_level_1' in types:
-                            locality = component.get('longText')
-                    
-                    # サマリーロケーションを構築
-                    summary_parts = []
-                    if country and country != "日本":
-                        summary_parts.append(country)
-                    if prefecture:
-                        summary_parts.append(prefecture)
-                    if locality:
-                        summary_parts.append(locality)
-                    
-                    if summary_parts:
-                        candidate['summary_location'] = '、'.join(summary_parts)
-                        logger.info(f"[Job {job_id}] - Summary Location: {candidate['summary_location']}")
-                    else:
-                        candidate['summary_location'] = ''
-                else:
-                    candidate['summary_location'] = ''
-                
-                logger.info(f"[Job {job_id}] Successfully enriched '{candidate['name']}' with Google Places data")
-                logger.info(f"[Job {job_id}] - Place ID: {candidate['place_id']}")
-                logger.info(f"[Job {job_id}] - Coordinates: {candidate['latitude']}, {candidate['longitude']}")
-                logger.info(f"[Job {job_id}] - Address: {candidate['formatted_address']}")
-                
-                # 候補が見つかったものだけをリストに追加
-                enriched_candidates.append(candidate)
-            else:
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {key: pool.submit(_search_place_in_context, app, job_id, name) for key, name in names_by_key.items()}
+        lookups = {key: f.result() for key, f in futures.items()}
+    wall_seconds = time.monotonic() - started
+
+    enriched_candidates = []
+    for candidate in candidates:
+        status, place = lookups.get(_candidate_name_key(candidate.get('name')), ('not_found', None))
+        if status != 'found':
+            if status == 'not_found':
                 # Googleで見つからなかった候補は一旦除外する
                 logger.info(f"[Job {job_id}] Spot '{candidate['name']}' not found on Google Places. Skipping.")
+            continue # エラーが発生した候補もスキップ
+
+        # 更新: candidate辞書を直接更新する（フィールドマッピング修正）
+        candidate['formatted_address'] = place.get('formattedAddress')
+        loc = place.get('location', {})
+        candidate['latitude'] = loc.get('latitude')  # 修正: lat → latitude
+        candidate['longitude'] = loc.get('longitude')  # 修正: lng → longitude
+        candidate['place_id'] = place.get('id')
+        candidate['types'] = list(place.get('types', []))
+        candidate['name'] = place.get('displayName', {}).get('text', candidate['name'])
+        candidate['summary_location'] = _summary_location_from_components(place.get('addressComponents'))
+
+        logger.info(f"[Job {job_id}] Successfully enriched '{candidate['name']}' with Google Places data "
+                    f"(place_id={candidate['place_id']}, summary_location={candidate['summary_location']})")
+
+        # 候補が見つかったものだけをリストに追加
+        enriched_candidates.append(candidate)
+
+    if stats is not None:
+        statuses = [status for status, _ in lookups.values()]
+        stats.update({
+            'candidates': len(candidates),
+            'unique_names': len(names_by_key),
+            'requests': len(lookups),
+            'deduped': len(candidates) - len(lookups),
+            'found': statuses.count('found'),
+            'not_found': statuses.count('not_found'),
+            'errors': statuses.count('error'),
+            'concurrency': concurrency,
+            'wall_seconds': round(wall_seconds, 3),
+        })
+
+    logger.info(f"[Job {job_id}] Enrichment complete. {len(enriched_candidates)} candidates were enriched "
+                f"({len(lookups)} Places requests for {len(candidates)} candidates).")
+    return enriched_candidates
 
-        except Exception as e:
-            logger.error(f"[Job {job_id}] Google Places API error for '{candidate['name']}': {e}")
-            
-            # Sentryに詳細情報を送信
-            try:
-                import sentry_sdk
-                sentry_sdk.set_context("google_places_context", {
-                    "job_id": job_id,
-                    "candidate_name": candidate['name'],
-                    "function": "_enrich_candidates_with_google_places"
-                })
-                sentry_sdk.capture_exception(e)
-            except Exception as sentry_error:
-                logger.error(f"[Job {job_id}] Failed to send Google Places error to Sentry: {sentry_error}")
-            
-            continue # エラーが発生した候補はスキップ
-
-    logger.info(f"[Job {job_id}] Enrichment complete. {len(enriched_candidates)} candidates were enriched.")
-    return enriched_candidates 
 
 def _update_save_job_status(save_job_id, status, error_info=None, result_data=None):
     """DB の保存ジョブステータスを更新する"""
@@ -432,10 +1094,348 @@ def _update_save_job_status(save_job_id, status, error_info=None, result_data=No
         db.session.rollback()
         logger.error(f"[SaveJob {save_job_id}] Failed to update save job status: {e}")
 
+def _summary_location_from_components(components):
+    """addressComponents から「（海外なら国、）都道府県、市区町村」のサマリーを作る。"""
+    country = None
+    prefecture = None
+    locality = None
+    for component in components or []:
+        types = component.get('types', [])
+        if 'country' in types:
+            country = component.get('longText')
+        elif 'administrative_area_level_1' in types:
+            prefecture = component.get('longText')
+        elif 'locality' in types or 'sublocality_level_1' in types:
+            locality = component.get('longText')
+
+    summary_parts = []
+    if country and country != "日本":
+        summary_parts.append(country)
+    if prefecture:
+        summary_parts.append(prefecture)
+    if locality:
+        summary_parts.append(locality)
+    return '、'.join(summary_parts)
+
+
+def _is_lodging_category(cat: str) -> bool:
+    if not cat:
+        return False
+    cat_l = cat.lower()
+    return any(k in cat_l for k in ['hotel', 'hostel', 'inn', 'lodging']) or any(k in cat for k in ['旅館', 'ホテル'])
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    import math
+    R = 6371000.0
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians((lat2 - lat1))
+    dlambda = math.radians((lon2 - lon1))
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def _generate_japanese_category(save_job_id, client, types_list):
+    """Google Places の types から日本語カテゴリを1つ決める。
+
+    まず place_type_categories の対応表（place_categories.category_for_types）で決め、
+    対応表に無い組み合わせだけ LLM に聞いて結果を対応表へ書き戻す。
+    client が無く対応表でも決まらなければ None、LLM が失敗したら「その他」。
+    """
+    from app.services import llm_cache, place_categories
+
+    mapped = place_categories.category_for_types(types_list)
+    if mapped:
+        return mapped
+    if client is None:
+        return None
+
+    cached = llm_cache.get('place_category', 'gpt-4o', list(types_list))
+    if isinstance(cached, str) and cached:
+        place_categories.remember(types_list, cached)
+        return cached
+
+    types_str = ", ".join(types_list)
+    categories_str = "\n".join(f"    - {c}" for c in place_categories.CATEGORIES)
+    prompt = f"""
+    以下のGoogle Places APIから返されたタイプ情報から、最も適切な日本語のカテゴリ名を1つだけ選んでください。
+
+    タイプ情報: {types_str}
+
+    次のカテゴリから選んでください：
+{categories_str}
+
+    JSON形式で返してください: {{"category": "カテゴリ名"}}
+    """
+    try:
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": "あなたはGoogle Placesのタイプ情報から適切な日本語カテゴリを生成する専門家です。"},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=50
+        )
+        category_result = json.loads(response.choices[0].message.content.strip())
+        category = category_result.get('category', 'その他')
+        # キー違いで「その他」に丸めた結果は保存しない
+        if isinstance(category, str) and category and 'category' in category_result:
+            llm_cache.put('place_category', 'gpt-4o', list(types_list), category)
+            place_categories.remember(types_list, category)
+        return category
+    except Exception as e:
+        logger.error(f"[SaveJob {save_job_id}] カテゴリ生成エラー: {str(e)}")
+        return "その他"
+
+
+def _resolve_spot_for_save(save_job_id, spot_data, openai_client=None):
+    """1候補分の外部API補完（カテゴリ/住所サマリー/レビュー要約/宿泊系の提供元ID）を行う。
+
+    DB には触れないので、スレッドプールから並列に呼べる。
+    戻り値: {'spot': spots 行の列dict, 'provider_ids': [(provider, external_id)], 'spot_data': 元の候補}
+    """
+    types_list = spot_data.get('types') or []
+    spot = {
+        'name': spot_data.get('name'),
+        'description': '',  # デフォルトを空文字列に設定
+        'location': spot_data.get('formatted_address', ''),
+        'latitude': spot_data.get('latitude'),
+        'longitude': spot_data.get('longitude'),
+        'category': types_list[0] if types_list else None,
+        'google_place_id': spot_data.get('place_id'),
+        'formatted_address': spot_data.get('formatted_address', ''),
+        'summary_location': spot_data.get('summary_location', ''),
+        'thumbnail_url': spot_data.get('thumbnail_url', ''),
+        'types': None,
+        'review_summary': None,
+    }
+    provider_ids = []
+
+    # Google Placesのtypesから日本語カテゴリを生成
+    if types_list:
+        spot['types'] = json.dumps(types_list)
+        category = _generate_japanese_category(save_job_id, openai_client, types_list)
+        if category:
+            spot['category'] = category
+
+    # 日本語のsummary_locationを取得
+    if spot['google_place_id'] and not spot['summary_location']:
+        details = places_client.get_place(spot['google_place_id'], 'addressComponents', language='ja')
+        if details is not None:
+            summary = _summary_location_from_components(details.get('addressComponents'))
+            if summary:
+                spot['summary_location'] = summary
+        else:
+            logger.warning(f"[SaveJob {save_job_id}] Google Places API詳細取得エラー: place_id={spot['google_place_id']}")
+
+    # 日本語のsummary_locationが取得できなかった場合、searchTextエンドポイントを使用
+    if spot['google_place_id'] and (not spot['summary_location'] or not _is_japanese(spot['summary_location'])):
+        places = places_client.search_text(
+            spot['name'], 'places.displayName,places.formattedAddress,places.addressComponents',
+            language='ja', region='jp',
+        )
+        if places:
+            place = places[0]
+            summary = _summary_location_from_components(place.get('addressComponents'))
+            if summary:
+                spot['summary_location'] = summary
+            # フォーマット済み住所が取得できたら更新
+            if place.get('formattedAddress') and not spot['formatted_address']:
+                spot['formatted_address'] = place['formattedAddress']
+
+    lodging_ok = _is_lodging_category(spot['category']) or any(_is_lodging_category(str(t)) for t in types_list)
+    has_geo = spot['latitude'] is not None and spot['longitude'] is not None
+
+    # レビュー要約取得 & DataForSEO hotel_identifier（宿泊系 & 100m以内のみ）
+    try:
+        if lodging_ok:
+            items = dfs_search_hotels(
+                keyword=spot['name'],
+                location_name=os.environ.get('DATAFORSEO_DEFAULT_LOCATION', 'Japan'),
+                language_code=os.environ.get('DATAFORSEO_DEFAULT_LANGUAGE', 'ja'),
+                currency=os.environ.get('AGODA_CURRENCY', 'JPY'),
+                adults=2,
+            )
+            chosen = None
+            best_dist_m = None
+            for it in (items or []) if has_geo else []:
+                loc = (it.get('location') or {})
+                lat = loc.get('latitude')
+                lng = loc.get('longitude')
+                if lat is None or lng is None:
+                    continue
+                d_m = _haversine_m(spot['latitude'], spot['longitude'], float(lat), float(lng))
+                if best_dist_m is None or d_m < best_dist_m:
+                    best_dist_m = d_m
+                    chosen = it
+            if chosen and best_dist_m is not None and best_dist_m <= 100 and chosen.get('hotel_identifier'):
+                provider_ids.append(('dataforseo', str(chosen['hotel_identifier'])))
+
+        # review_summary のフォールバック取得
+        if spot['google_place_id']:
+            fetched_summary = get_place_review_summary(spot['google_place_id'])
+            if fetched_summary:
+                spot['review_summary'] = fetched_summary
+    except Exception as e:
+        logger.warning(f"[SaveJob {save_job_id}] mapping/summary step skipped: {e}")
+
+    # 楽天トラベル: 宿泊系 & 100m以内のとき hotelNo を保存
+    try:
+        if lodging_ok:
+            hotels = []
+            if has_geo:
+                geo_res = rakuten_simple_geo(spot['name'], float(spot['latitude']), float(spot['longitude']), hits=5)
+                if geo_res and isinstance(geo_res, dict):
+                    hotels = geo_res.get('hotels') or []
+                    hotels = [{'hotel': [h[0]]} for h in hotels if isinstance(h, list) and h]
+            if not hotels:
+                res = rakuten_search(spot['name'], affiliate_id=os.environ.get('RAKUTEN_AFFILIATE_ID'), hits=3)
+                hotels = res.get('hotels') if isinstance(res, dict) else []
+            best = None
+            best_d = None
+            for h in hotels or []:
+                try:
+                    basic = h['hotel'][0]['hotelBasicInfo'] if 'hotel' in h and h['hotel'] else {}
+                    hlat = basic.get('latitude')
+                    hlng = basic.get('longitude')
+                    if (hlat is None or hlng is None) and basic.get('hotelNo'):
+                        detail = rakuten_fetch_detail(str(basic.get('hotelNo')))
+                        if detail and isinstance(detail, dict):
+                            dhs = detail.get('hotels') or []
+                            if dhs and isinstance(dhs[0], dict) and dhs[0].get('hotel'):
+                                dinfo = dhs[0]['hotel'][0].get('hotelBasicInfo', {})
+                                hlat = dinfo.get('latitude') or hlat
+                                hlng = dinfo.get('longitude') or hlng
+                    if hlat is None or hlng is None or not has_geo:
+                        continue
+                    d = _haversine_m(float(spot['latitude']), float(spot['longitude']), float(hlat), float(hlng))
+                    if best_d is None or d < best_d:
+                        best_d = d
+                        best = basic
+                except Exception:
+                    continue
+            if best and best_d is not None and best_d <= 100 and best.get('hotelNo'):
+                provider_ids.append(('rakuten', str(best['hotelNo'])))
+    except Exception:
+        pass
+
+    return {'spot': spot, 'provider_ids': provider_ids, 'spot_data': spot_data}
+
+
+def _bulk_insert_spot_batch(user_id, resolved):
+    """補完済みの候補をまとめて INSERT する（spots / spot_provider_ids / social_posts / import_history 各1文）。
+
+    複数行 INSERT の RETURNING は行の順序が保証されないため、spots の id は先にシーケンスから
+    まとめて払い出し、子テーブルの行をその id で組み立てる。RETURNING は挿入件数の確認に使う。
+    コミットは呼び出し側。
+    """
+    if not resolved:
+        return []
+    now = datetime.utcnow()
+    spot_ids = [row[0] for row in db.session.execute(
+        text("SELECT nextval(pg_get_serial_sequence('spots', 'id')) FROM generate_series(1, :n)"),
+        {'n': len(resolved)},
+    ).fetchall()]
+
+    spot_rows, provider_rows, post_rows, history_rows = [], [], [], []
+    for spot_id, item in zip(spot_ids, resolved):
+        spot_data = item['spot_data']
+        spot_rows.append(dict(item['spot'], id=spot_id, user_id=user_id, is_active=False,  # 非公開状態で保存
+                              rating=0.0, review_count=0, created_at=now, updated_at=now))
+        for provider, external_id in item['provider_ids']:
+            provider_rows.append({'spot_id': spot_id, 'provider': provider, 'external_id': external_id,
+                                  'created_at': now, 'updated_at': now})
+        # Instagram投稿との紐付け
+        if spot_data.get('instagram_permalink'):
+            post_rows.append({'user_id': user_id, 'spot_id': spot_id, 'platform': 'instagram',
+                              'post_url': spot_data.get('instagram_permalink'), 'created_at': now})
+        # インポート履歴
+        if spot_data.get('instagram_post_id'):
+            history_rows.append({
+                'user_id': user_id,
+                'source': 'instagram',
+                'external_id': spot_data.get('instagram_post_id'),
+                'status': 'success',
+                'spot_id': spot_id,
+                'imported_at': now,
+                'raw_data': {
+                    'caption': spot_data.get('instagram_caption'),
+                    'timestamp': spot_data.get('timestamp'),
+                    'permalink': spot_data.get('instagram_permalink'),
+                    'post_id': spot_data.get('instagram_post_id')
+                },
+            })
+
+    spots_table = Spot.__table__
+    inserted_ids = db.session.execute(
+        spots_table.insert().values(spot_rows).returning(spots_table.c.id)
+    ).scalars().all()
+    if len(inserted_ids) != len(spot_rows):
+        raise RuntimeError(f"bulk insert returned {len(inserted_ids)} ids for {len(spot_rows)} spots")
+    if provider_rows:
+        db.session.execute(SpotProviderId.__table__.insert().values(provider_rows))
+        # Core の INSERT は ORM のイベントが出ないので、マッピングのキャッシュはコミット時に明示的に消す
+        provider_mappings.invalidate_on_commit(db.session(), {row['spot_id'] for row in provider_rows})
+    if post_rows:
+        db.session.execute(SocialPost.__table__.insert().values(post_rows))
+    if history_rows:
+        db.session.execute(ImportHistory.__table__.insert().values(history_rows))
+
+    saved = []
+    for spot_id, row, item in zip(spot_ids, spot_rows, resolved):
+        saved.append({
+            'spot_id': spot_id,
+            'name': row['name'],
+            'category': row['category'],
+            'formatted_address': row['formatted_address'],
+            'types': row['types'],
+            'summary_location': row['summary_location'],
+            'google_place_id': row['google_place_id'],
+            'instagram_post_id': item['spot_data'].get('instagram_post_id'),
+            'instagram_permalink': item['spot_data'].get('instagram_permalink')
+        })
+    return saved
+
+
+def _save_spot_batch(save_job_id, user_id, resolved, skipped):
+    """1バッチ分を INSERT してコミットする。一括 INSERT が失敗したら1件ずつ入れ直し、
+    それでも入らない候補は skipped に理由を付けて積む（1件の不正な候補でバッチ全体を落とさない）。
+    """
+    try:
+        saved = _bulk_insert_spot_batch(user_id, resolved)
+        db.session.commit()
+        return saved
+    except Exception as e:
+        db.session.rollback()
+        if len(resolved) == 1:
+            item = resolved[0]
+            logger.error(f"[SaveJob {save_job_id}] Spot insert failed: {item['spot'].get('name')}: {e}")
+            skipped.append({'name': item['spot'].get('name'), 'reason': str(e)})
+            return []
+        logger.warning(f"[SaveJob {save_job_id}] Batch insert failed, retrying one by one: {e}")
+    saved = []
+    for item in resolved:
+        saved.extend(_save_spot_batch(save_job_id, user_id, [item], skipped))
+    return saved
+
+
 def save_spots_async(save_job_id, user_id, spot_candidates):
     """
     選択されたスポット候補を非同期で保存する
+
+    1. 全候補の外部API補完をスレッドプールで並列に実行（IMPORT_SAVE_CONCURRENCY）
+    2. 候補順に IMPORT_SAVE_BATCH_SIZE 件ずつ、各テーブル1文の一括 INSERT → コミット
+    バッチごとにコミットするため、途中でキャンセル/失敗した場合もそれまでのバッチは保存される。
+    補完・INSERT に失敗した候補は飛ばして 'skipped' に記録する。途中で止まっても保存済みの
+    バッチがあれば completed（'partial': True）とし、保存できたスポットを返す。
+    スループット（spots/sec）と各段階の所要時間を save_result_data の 'stats' に記録する。
     """
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import current_app
+
     logger.info(f"[SaveJob {save_job_id}] Save processing started for user {user_id}.")
     
     def check_if_cancelled():
@@ -455,471 +1455,93 @@ def save_spots_async(save_job_id, user_id, spot_candidates):
     check_if_cancelled()
     
     _update_save_job_status(save_job_id, 'processing')
-    
+
+    pool = None
+    saved_spots = []
+    skipped = []
+    stats = {}
     try:
         # ユーザー情報を取得
         user = User.query.get(user_id)
         if not user:
             raise ValueError("User not found.")
-        
-        logger.info(f"[SaveJob {save_job_id}] Processing {len(spot_candidates)} spot candidates.")
-        
-        saved_spots = []
-        
-        # スポット候補の情報をログに出力
-        for i, spot_data in enumerate(spot_candidates):
-            # 定期的にキャンセル状態をチェック（5件ごと）
-            if i % 5 == 0:
-                check_if_cancelled()
-            
-            logger.info(f"[SaveJob {save_job_id}] Processing spot {i+1}/{len(spot_candidates)}: {spot_data.get('name', 'Unknown')}")
-            
-            # スポットの基本情報を設定
-            spot = Spot(
-                user_id=user.id,
-                name=spot_data.get('name'),
-                description='',  # デフォルトを空文字列に設定
-                location=spot_data.get('formatted_address', ''),
-                latitude=spot_data.get('latitude'),
-                longitude=spot_data.get('longitude'),
-                category=spot_data.get('types', [])[0] if spot_data.get('types') else None,
-                google_place_id=spot_data.get('place_id'),
-                formatted_address=spot_data.get('formatted_address', ''),
-                summary_location=spot_data.get('summary_location', ''),
-                thumbnail_url=spot_data.get('thumbnail_url', ''),
-                is_active=False  # 非公開状態で保存
-            )
-            
-            # Google Placesのtypesから日本語カテゴリを生成
-            if 'types' in spot_data and spot_data['types']:
-                try:
-                    spot.types = json.dumps(spot_data['types'])
-                    logger.info(f"[SaveJob {save_job_id}] Types設定: {spot.types}")
-                except Exception as e:
-                    logger.error(f"[SaveJob {save_job_id}] Types設定エラー: {str(e)}")
-                    spot.types = json.dumps([])
-                
-                # OpenAI APIを使用して日本語カテゴリを生成
-                if OPENAI_API_KEY:
-                    try:
-                        import openai
-                        from openai import OpenAI
-                        
-                        # OpenAIクライアントの初期化
-                        client = OpenAI(
-                            api_key=OPENAI_API_KEY,
-                            timeout=30.0
-                        )
-                        
-                        types_str = ", ".join(spot_data['types'])
-                        
-                        prompt = f"""
-                        以下のGoogle Places APIから返されたタイプ情報から、最も適切な日本語のカテゴリ名を1つだけ生成してください。
-                        
-                        タイプ情報: {types_str}
-                        
-                        以下のようなカテゴリを参考にしてください：
-                        - レストラン
-                        - カフェ
-                        - バー
-                        - ショッピング
-                        - 観光スポット
-                        - 公園
-                        - 美術館・博物館
-                        - ホテル
-                        - エンターテイメント
-                        - スポーツ施設
-                        - その他
-                        
-                        JSON形式で日本語カテゴリ名を返してください:
-                        """
-                        
-                        logger.info(f"[SaveJob {save_job_id}] OpenAI APIを呼び出してカテゴリを生成")
-                        response = client.chat.completions.create(
-                            model="gpt-4o",
-                            response_format={"type": "json_object"},
-                            messages=[
-                                {"role": "system", "content": "あなたはGoogle Placesのタイプ情報から適切な日本語カテゴリを生成する専門家です。"},
-                                {"role": "user", "content": prompt}
-                            ],
-                            max_tokens=50
-                        )
-                        
-                        category_result = json.loads(response.choices[0].message.content.strip())
-                        category = category_result.get('category', 'その他')
-                        spot.category = category
-                        logger.info(f"[SaveJob {save_job_id}] 生成されたカテゴリ: {category}")
-                    except Exception as e:
-                        logger.error(f"[SaveJob {save_job_id}] カテゴリ生成エラー: {str(e)}")
-                        spot.category = "その他"
-            
-            # 日本語のsummary_locationを取得
-            if spot_data.get('place_id') and (not spot.summary_location or spot.summary_location == ''):
-                try:
-                    logger.info(f"[SaveJob {save_job_id}] 日本語のsummary_locationを取得: place_id={spot_data.get('place_id')}")
-                    
-                    # Google Places APIの詳細エンドポイントを呼び出す
-                    details_url = f"https://places.googleapis.com/v1/places/{spot_data.get('place_id')}"
-                    details_headers = {
-                        'Content-Type': 'application/json',
-                        'X-Goog-Api-Key': GOOGLE_MAPS_API_KEY,
-                        'X-Goog-FieldMask': 'addressComponents',
-                        'X-Goog-LanguageCode': 'ja',
-                        'User-Agent': 'my-map.link App (https://my-map.link)'
-                    }
-                    
-                    details_response = requests.get(details_url, headers=details_headers)
-                    
-                    if details_response.status_code == 200:
-                        details_data = details_response.json()
-                        
-                        if 'addressComponents' in details_data:
-                            country = None
-                            prefecture = None
-                            locality = None
-                            
-                            for component in details_data['addressComponents']:
-                                types = component.get('types', [])
-                                if 'country' in types:
-                                    country = component.get('longText')
-                                elif 'administrative_area_level_1' in types:
-                                    prefecture = component.get('longText')
-                                elif 'locality' in types or 'sublocality_level_1' in types:
-                                    locality = component.get('longText')
-                            
-                            # サマリーロケーションを構築
-                            summary_parts = []
-                            if country and country != "日本":
-                                summary_parts.append(country)
-                            if prefecture:
-                                summary_parts.append(prefecture)
-                            if locality:
-                                summary_parts.append(locality)
-                            
-                            if summary_parts:
-                                spot.summary_location = '、'.join(summary_parts)
-                                logger.info(f"[SaveJob {save_job_id}] 日本語のsummary_locationを設定: {spot.summary_location}")
-                    else:
-                        logger.warning(f"[SaveJob {save_job_id}] Google Places API詳細取得エラー: ステータスコード {details_response.status_code}")
-                except Exception as e:
-                    logger.error(f"[SaveJob {save_job_id}] summary_location取得エラー: {str(e)}")
-            
-            # 日本語のsummary_locationが取得できなかった場合、searchTextエンドポイントを使用
-            if spot_data.get('place_id') and (not spot.summary_location or not _is_japanese(spot.summary_location)):
-                try:
-                    logger.info(f"[SaveJob {save_job_id}] searchTextエンドポイントを使用して日本語情報を取得: {spot.name}")
-                    
-                    search_url = "https://places.googleapis.com/v1/places:searchText"
-                    search_headers = {
-                        'Content-Type': 'application/json',
-                        'X-Goog-Api-Key': GOOGLE_MAPS_API_KEY,
-                        'X-Goog-FieldMask': 'places.displayName,places.formattedAddress,places.addressComponents'
-                    }
-                    search_data = {
-                        'textQuery': spot.name,
-                        'languageCode': 'ja',
-                        'regionCode': 'jp'
-                    }
-                    
-                    search_response = requests.post(search_url, headers=search_headers, json=search_data)
-                    
-                    if search_response.status_code == 200:
-                        search_data = search_response.json()
-                        
-                        if 'places' in search_data and len(search_data['places']) > 0:
-                            place = search_data['places'][0]
-                            
-                            # サマリーロケーションを生成
-                            if 'addressComponents' in place:
-                                country = None
-                                prefecture = None
-                                locality = None
-                                
-                                for component in place['addressComponents']:
-                                    types = component.get('types', [])
-                                    if 'country' in types:
-                                        country = component.get('longText')
-                                    elif 'administrative_area_level_1' in types:
-                                        prefecture = component.get('longText')
-                                    elif 'locality' in types or 'sublocality_level_1' in types:
-                                        locality = component.get('longText')
-                                
-                                # サマリーロケーションを構築
-                                summary_parts = []
-                                if country and country != "日本":
-                                    summary_parts.append(country)
-                                if prefecture:
-                                    summary_parts.append(prefecture)
-                                if locality:
-                                    summary_parts.append(locality)
-                                
-                                if summary_parts:
-                                    spot.summary_location = '、'.join(summary_parts)
-                                    logger.info(f"[SaveJob {save_job_id}] searchTextから日本語のsummary_locationを設定: {spot.summary_location}")
-                            
-                            # フォーマット済み住所が取得できたら更新
-                            if 'formattedAddress' in place and place['formattedAddress'] and not spot.formatted_address:
-                                spot.formatted_address = place['formattedAddress']
-                                logger.info(f"[SaveJob {save_job_id}] searchTextからformatted_addressを更新: {spot.formatted_address}")
-                except Exception as e:
-                    logger.error(f"[SaveJob {save_job_id}] searchText API呼び出しエラー: {str(e)}")
-            
-            # レビュー要約取得 & DataForSEO hotel_identifier（宿泊系 & 100m以内のみ）
-            try:
-                # 宿泊系判定
-                def is_lodging_category(cat: str) -> bool:
-                    if not cat:
-                        return False
-                    cat_l = cat.lower()
-                    return any(k in cat_l for k in ['hotel','hostel','inn','lodging']) or any(k in cat for k in ['旅館','ホテル'])
-
-                lodging_ok = False
-                if spot.category and is_lodging_category(spot.category):
-                    lodging_ok = True
-                else:
-                    tval = spot.types
-                    try:
-                        import json as _json
-                        types_list = _json.loads(tval) if tval else []
-                    except Exception:
-                        types_list = [s.strip() for s in tval.split(',')] if tval else []
-                    for t in types_list:
-                        if is_lodging_category(str(t)):
-                            lodging_ok = True
-                            break
-
-                if lodging_ok:
-                    keyword = spot.name
-                    location_name = os.environ.get('DATAFORSEO_DEFAULT_LOCATION', 'Japan')
-                    language_code = os.environ.get('DATAFORSEO_DEFAULT_LANGUAGE', 'ja')
-                    items = dfs_search_hotels(
-                        keyword=keyword,
-                        location_name=location_name,
-                        language_code=language_code,
-                        currency=os.environ.get('AGODA_CURRENCY', 'JPY'),
-                        adults=2,
-                    )
-                    chosen = None
-                    best_dist_m = None
-                    if items and spot.latitude and spot.longitude:
-                        import math
-                        def haversine_m(lat1, lon1, lat2, lon2):
-                            R = 6371000.0
-                            phi1 = math.radians(lat1)
-                            phi2 = math.radians(lat2)
-                            dphi = math.radians((lat2 - lat1))
-                            dlambda = math.radians((lon2 - lon1))
-                            a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-                            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-                            return R * c
-                        for it in items:
-                            loc = (it.get('location') or {})
-                            lat = loc.get('latitude')
-                            lng = loc.get('longitude')
-                            if lat is None or lng is None:
-                                continue
-                            d_m = haversine_m(spot.latitude, spot.longitude, float(lat), float(lng))
-                            if best_dist_m is None or d_m < best_dist_m:
-                                best_dist_m = d_m
-                                chosen = it
-                    if chosen and best_dist_m is not None and best_dist_m <= 100 and chosen.get('hotel_identifier'):
-                        if not getattr(spot, 'id', None):
-                            logger.warning(f"[SaveJob {save_job_id}] Skip DataForSEO mapping because spot.id is missing")
-                        else:
-                            exists = SpotProviderId.query.filter_by(spot_id=spot.id, provider='dataforseo').first()
-                            if not exists:
-                                db.session.add(SpotProviderId(
-                                    spot_id=spot.id,
-                                    provider='dataforseo',
-                                    external_id=chosen['hotel_identifier']
-                                ))
-
-                # review_summary のフォールバック取得
-                if spot.google_place_id and (not getattr(spot, 'review_summary', None) or not spot.review_summary):
-                    fetched_summary = get_place_review_summary(spot.google_place_id)
-                    if fetched_summary:
-                        spot.review_summary = fetched_summary
-                        logger.info(f"[SaveJob {save_job_id}] review_summary を設定しました（{len(fetched_summary)} 文字）")
-            except Exception as e:
-                logger.warning(f"[SaveJob {save_job_id}] mapping/summary step skipped: {e}")
-
-            logger.info(f"[SaveJob {save_job_id}] スポットをデータベースに追加")
-            spot_info = {
-                'name': spot.name,
-                'category': spot.category,
-                'formatted_address': spot.formatted_address,
-                'types': spot.types,
-                'summary_location': spot.summary_location,
-                'google_place_id': spot.google_place_id,
-                'instagram_post_id': spot_data.get('instagram_post_id'),
-                'instagram_permalink': spot_data.get('instagram_permalink')
-            }
-            saved_spots.append(spot_info)
-            db.session.add(spot)
-            # 先にSpotのIDを確定させる
-            try:
-                db.session.flush()
-            except Exception as e:
-                logger.error(f"[SaveJob {save_job_id}] Spot flush failed: {e}")
-                continue
-            if not getattr(spot, 'id', None):
-                logger.error(f"[SaveJob {save_job_id}] Spot ID not assigned after flush. Skipping candidate: {spot.name}")
-                continue
-            logger.info(f"[SaveJob {save_job_id}] スポットID: {spot.id}")
-            
-            # Instagram投稿との紐付けを追加
-            if spot_data.get('instagram_permalink'):
-                try:
-                    social_post = SocialPost(
-                        user_id=user.id,
-                        spot_id=spot.id,
-                        platform='instagram',
-                        post_url=spot_data.get('instagram_permalink')
-                    )
-                    db.session.add(social_post)
-                    logger.info(f"[SaveJob {save_job_id}] Instagram投稿を紐付け: {spot_data.get('instagram_permalink')}")
-                except Exception as e:
-                    logger.error(f"[SaveJob {save_job_id}] Instagram投稿紐付けエラー: {str(e)}")
-            
-            # インポート履歴の保存
-            if spot_data.get('instagram_post_id'):
+
+        candidates = list(spot_candidates or [])
+        logger.info(f"[SaveJob {save_job_id}] Processing {len(candidates)} spot candidates.")
+
+        app = current_app._get_current_object()
+        concurrency = max(1, int(app.config.get('IMPORT_SAVE_CONCURRENCY', 8)))
+        batch_size = max(1, int(app.config.get('IMPORT_SAVE_BATCH_SIZE', 50)))
+
+        openai_client = None
+        if OPENAI_API_KEY:
+            from openai import OpenAI
+            # クライアントはスレッド間で共有する（接続プールを使い回す）
+            openai_client = OpenAI(api_key=OPENAI_API_KEY, timeout=30.0)
+
+        def _resolve(spot_data):
+            started = time.monotonic()
+            with app.app_context():
                 try:
-                    import_history = ImportHistory(
-                        user_id=user.id,
-                        source='instagram',
-                        external_id=spot_data.get('instagram_post_id'),
-                        status='success',
-                        spot_id=spot.id,
-                        raw_data={
-                            'caption': spot_data.get('instagram_caption'),
-                            'timestamp': spot_data.get('timestamp'),
-                            'permalink': spot_data.get('instagram_permalink'),
-                            'post_id': spot_data.get('instagram_post_id')
-                        }
-                    )
-                    db.session.add(import_history)
-                    logger.info(f"[SaveJob {save_job_id}] インポート履歴を保存: Instagram投稿ID={spot_data.get('instagram_post_id')}")
+                    item = _resolve_spot_for_save(save_job_id, spot_data, openai_client)
                 except Exception as e:
-                    logger.error(f"[SaveJob {save_job_id}] インポート履歴保存エラー: {str(e)}")
-            
-            # 楽天トラベル: 宿泊系 & 100m以内のとき hotelNo を保存
-            try:
-                def is_lodging_category(cat: str) -> bool:
-                    if not cat:
-                        return False
-                    cat_l = cat.lower()
-                    return any(k in cat_l for k in ['hotel','hostel','inn','lodging']) or any(k in cat for k in ['旅館','ホテル'])
-
-                lodging_ok = False
-                if spot.category and is_lodging_category(spot.category):
-                    lodging_ok = True
+                    logger.error(f"[SaveJob {save_job_id}] Spot resolve failed: {spot_data.get('name')}: {e}")
+                    return {'error': str(e), 'spot_data': spot_data}
+            item['seconds'] = time.monotonic() - started
+            return item
+
+        started = time.monotonic()
+        stats = {'concurrency': concurrency, 'batch_size': batch_size, 'batches': 0,
+                 'enrich_seconds': 0.0, 'insert_seconds': 0.0}
+
+        # 全候補の補完を先に投入し、候補順にバッチ単位で結果を受け取って INSERT する
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        futures = [pool.submit(_resolve, spot_data) for spot_data in candidates]
+        for offset in range(0, len(futures), batch_size):
+            check_if_cancelled()
+            wait_started = time.monotonic()
+            resolved = []
+            for f in futures[offset:offset + batch_size]:
+                item = f.result()
+                if 'error' in item:
+                    skipped.append({'name': item['spot_data'].get('name'), 'reason': item['error']})
                 else:
-                    tval = spot.types
-                    try:
-                        import json as _json
-                        types_list = _json.loads(tval) if tval else []
-                    except Exception:
-                        types_list = [s.strip() for s in tval.split(',')] if tval else []
-                    for t in types_list:
-                        if is_lodging_category(str(t)):
-                            lodging_ok = True
-                            break
-
-                if lodging_ok:
-                    hotels = []
-                    if spot.latitude and spot.longitude:
-                        geo_res = rakuten_simple_geo(spot.name, float(spot.latitude), float(spot.longitude), hits=5)
-                        if geo_res and isinstance(geo_res, dict):
-                            hotels = geo_res.get('hotels') or []
-                            hotels = [ {'hotel':[h[0]]} for h in hotels if isinstance(h, list) and h ]
-                    if not hotels:
-                        res = rakuten_search(spot.name, affiliate_id=os.environ.get('RAKUTEN_AFFILIATE_ID'), hits=3)
-                        hotels = res.get('hotels') if isinstance(res, dict) else []
-                    import math
-                    def haversine_m(lat1, lon1, lat2, lon2):
-                        R = 6371000.0
-                        phi1 = math.radians(lat1)
-                        phi2 = math.radians(lat2)
-                        dphi = math.radians((lat2 - lat1))
-                        dlambda = math.radians((lon2 - lon1))
-                        a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-                        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-                        return R * c
-                    best = None
-                    best_d = None
-                    for h in hotels:
-                        try:
-                            basic = h['hotel'][0]['hotelBasicInfo'] if 'hotel' in h and h['hotel'] else {}
-                            hlat = basic.get('latitude')
-                            hlng = basic.get('longitude')
-                            if (hlat is None or hlng is None) and basic.get('hotelNo'):
-                                detail = rakuten_fetch_detail(str(basic.get('hotelNo')))
-                                if detail and isinstance(detail, dict):
-                                    dhs = detail.get('hotels') or []
-                                    if dhs and isinstance(dhs[0], dict) and dhs[0].get('hotel'):
-                                        dinfo = dhs[0]['hotel'][0].get('hotelBasicInfo', {})
-                                        hlat = dinfo.get('latitude') or hlat
-                                        hlng = dinfo.get('longitude') or hlng
-                            if hlat is None or hlng is None or not spot.latitude or not spot.longitude:
-                                continue
-                            d = haversine_m(float(spot.latitude), float(spot.longitude), float(hlat), float(hlng))
-                            if best_d is None or d < best_d:
-                                best_d = d
-                                best = basic
-                        except Exception:
-                            continue
-                    if best and best_d is not None and best_d <= 100 and best.get('hotelNo'):
-                        if not getattr(spot, 'id', None):
-                            logger.warning(f"[SaveJob {save_job_id}] Skip Rakuten mapping because spot.id is missing")
-                        else:
-                            exists = SpotProviderId.query.filter_by(spot_id=spot.id, provider='rakuten').first()
-                            if not exists:
-                                db.session.add(SpotProviderId(spot_id=spot.id, provider='rakuten', external_id=str(best['hotelNo'])))
-            except Exception:
-                pass
-            # if user.rakuten_affiliate_id and spot.name:
-            #     try:
-            #         logger.info(f"[SaveJob {save_job_id}] 楽天トラベルAPI検索: {spot.name}")
-            #         from app.utils.rakuten_api import search_hotel_with_fallback, select_best_hotel_with_evaluation, generate_rakuten_affiliate_url
-            #         hotel_results = search_hotel_with_fallback(spot.name, user.rakuten_affiliate_id)
-            #         if hotel_results.get('error') == 'no_hotels_found':
-            #             logger.info(f"[SaveJob {save_job_id}] 楽天トラベル: '{spot.name}'に該当するホテルが見つかりませんでした")
-            #         elif hotel_results.get('error'):
-            #             logger.warning(f"[SaveJob {save_job_id}] 楽天トラベルAPIエラー: {hotel_results.get('message', 'Unknown error')}")
-            #         elif 'hotels' in hotel_results and len(hotel_results['hotels']) > 0:
-            #             selected_hotel = select_best_hotel_with_evaluation(spot.name, hotel_results)
-            #             if selected_hotel:
-            #                 if 'hotel' in selected_hotel and len(selected_hotel['hotel']) > 0:
-            #                     hotel_info = selected_hotel['hotel'][0]
-            #                     if 'hotelBasicInfo' in hotel_info and hotel_info['hotelBasicInfo'].get('hotelInformationUrl'):
-            #                         hotel_url = hotel_info['hotelBasicInfo']['hotelInformationUrl']
-            #                         affiliate_url = generate_rakuten_affiliate_url(hotel_url, user.rakuten_affiliate_id)
-            #                         affiliate_link = AffiliateLink(
-            #                             spot_id=spot.id,
-            #                             platform='rakuten',
-            #                             url=affiliate_url,
-            #                             title='楽天トラベル',
-            #                             description='楽天トラベルで予約 (PRを含む)',
-            #                             icon_key='rakuten-travel',
-            #                             is_active=True
-            #                         )
-            #                         db.session.add(affiliate_link)
-            #     except Exception as e:
-            #         logger.error(f"[SaveJob {save_job_id}] 楽天トラベルアフィリエイトリンク生成エラー: {str(e)}")
-        
-        logger.info(f"[SaveJob {save_job_id}] データベースに変更をコミット")
-        db.session.commit()
-        
-        logger.info(f"[SaveJob {save_job_id}] コミット成功: {len(saved_spots)}件のスポットを保存")
+                    resolved.append(item)
+            stats['enrich_seconds'] += time.monotonic() - wait_started
+
+            insert_started = time.monotonic()
+            if resolved:
+                saved_spots.extend(_save_spot_batch(save_job_id, user.id, resolved, skipped))
+            stats['insert_seconds'] += time.monotonic() - insert_started
+            stats['batches'] += 1
+            logger.info(f"[SaveJob {save_job_id}] バッチ {stats['batches']} をコミット: 累計 {len(saved_spots)}/{len(candidates)} 件")
+        pool.shutdown(wait=True)
+        pool = None
+
+        total_seconds = time.monotonic() - started
+        stats.update({
+            'total_seconds': round(total_seconds, 3),
+            'enrich_seconds': round(stats['enrich_seconds'], 3),
+            'insert_seconds': round(stats['insert_seconds'], 3),
+            'spots_per_sec': round(len(saved_spots) / total_seconds, 2) if total_seconds > 0 else None,
+        })
+        logger.info(f"[SaveJob {save_job_id}] コミット成功: {len(saved_spots)}件のスポットを保存 "
+                    f"({stats['spots_per_sec']} spots/sec)")
         
         result = {
             'count': len(saved_spots),
-            'saved_spots': saved_spots
+            'saved_spots': saved_spots,
+            'skipped': skipped,
+            'stats': stats
         }
         _update_save_job_status(save_job_id, 'completed', result_data=result)
         logger.info(f"[SaveJob {save_job_id}] Save processing finished successfully.")
 
     except Exception as e:
+        if pool is not None:
+            # 未着手の補完は捨てる
+            pool.shutdown(wait=False, cancel_futures=True)
+
         # キャンセルされた場合は静かに終了
         if "CANCELLED_BY_USER" in str(e):
             logger.info(f"[SaveJob {save_job_id}] Save job was cancelled by user. Exiting gracefully.")
@@ -942,6 +1564,17 @@ def save_spots_async(save_job_id, user_id, spot_candidates):
             logger.error(f"[SaveJob {save_job_id}] Failed to send error to Sentry: {sentry_error}")
         
         db.session.rollback()
+        if saved_spots:
+            # コミット済みのバッチは残っているので、保存できた分を返す
+            result = {
+                'count': len(saved_spots),
+                'saved_spots': saved_spots,
+                'skipped': skipped,
+                'partial': True,
+                'stats': stats
+            }
+            _update_save_job_status(save_job_id, 'completed', error_info=str(e), result_data=result)
+            return
         _update_save_job_status(save_job_id, 'failed', error_info=str(e))
 
 def _is_japanese(text):
@@ -974,11 +1607,30 @@ def _next_month_start(d: date) -> date:
 
 def _month_end(d: date) -> date:
     return _next_month_start(d) - timedelta(days=1)
+
+
+def _day_bounds_utc(d: date, tz_name: str = 'Asia/Tokyo') -> tuple[datetime, datetime]:
+    """ローカル日 d を半開区間 [start, end) のUTC時刻に変換する。
+    created_at に関数を掛けずに比較できるため、インデックスとパーティションプルーニングが効く。
+    """
+    try:
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo(tz_name)
+    except Exception:
+        tz = JST
+    start = datetime(d.year, d.month, d.day, tzinfo=tz)
+    end_day = d + timedelta(days=1)
+    end = datetime(end_day.year, end_day.month, end_day.day, tzinfo=tz)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
 def run_withdrawal_cooldown_and_transfer(now_utc: datetime | None = None) -> None:
     """72時間経過したwithdrawalsを対象に、ガードを再評価しTransferを作成。
     - 大型出金(pending_review)は対象外（別途承認APIで実行）
     - Stripe自動出金を前提に、Payoutの明示作成は行わない（将来拡張）
     """
+    from app.services.wallet_balance import refresh_wallet_balance
+
     if now_utc is None:
         now_utc = datetime.utcnow()
 
@@ -1041,21 +1693,47 @@ def run_withdrawal_cooldown_and_transfer(now_utc: datetime | None = None) -> Non
                 ref_type='withdrawal',
                 ref_id=w.id
             ))
+            refresh_wallet_balance(w.user_id)
             db.session.commit()
 
 
 
-def run_daily_wallet_aggregation(target_day: date | None = None) -> None:
+DAILY_TARGET_TABLES = ('creator_daily', 'creator_daily_shadow')
+DAILY_COLUMNS = "day, user_id, pv, clicks, ctr, price_median, cpc_dynamic, ppv, ecmp, payout_day"
+DAILY_UPSERT_SET = """
+          SET pv=EXCLUDED.pv,
+              clicks=EXCLUDED.clicks,
+              ctr=EXCLUDED.ctr,
+              price_median=EXCLUDED.price_median,
+              cpc_dynamic=EXCLUDED.cpc_dynamic,
+              ppv=EXCLUDED.ppv,
+              ecmp=EXCLUDED.ecmp,
+              payout_day=EXCLUDED.payout_day,
+              created_at=NOW()"""
+
+
+def run_daily_wallet_aggregation(target_day: date | None = None, shards: int | None = None,
+                                 target_table: str = 'creator_daily', mode: str | None = None,
+                                 refresh_balances: bool = True, avg7_from_events: bool = False) -> dict:
     """前日分のイベントから creator_daily を集計してUPSERTする。
     - JSTでの1日区切り
     - PV: dwell_ms >= 3000, is_bot除外
-    - Click: DISTINCT ON (user_id, page_id, ota, session_or_client, JST日)
-    - m_price: price_median のビン
+    - Click: DISTINCT ON (user_id, page_id, ota, session_or_client)（対象は1日分のみ）
+    - m_price: price_median（価格ヒストグラムの中央値階級）のビン
     - cpc_dynamic: CPC_base * m_price * m_quality * m_trust を [CPC_MIN, CPC_MAX] でクリップ
     - ppv: min(PPV_floor + CTR*cpc_dynamic, PPV_cap) with バースト/新規制限
     - payout_day: pv * ppv
     - クリエイター日次上限 / グローバル日次上限の適用
+    - WALLET_AGGREGATION_MODE=incremental のときは event_log を読み直さず、速報カウンタ（creator_daily_live）から確定する
+    - shards > 1 のときは mod(user_id, shards) ごとに別コネクションで並列に集計して creator_daily_staging に書き、
+      target_table への移し替えと上限/予算の適用を最後の短いトランザクションで行う
+      （上限適用前の値が target_table や出金可能額に見えることはない）
+    - target_table='creator_daily_shadow' で検証用テーブルに書き込む（avg7 は常に creator_daily の PV を参照）
+    - avg7_from_events=True のときは avg7 を creator_daily ではなく前7日の event_log から数える
+      （前の日がまだ書き直されていない並列の再集計用）
+    - creator_daily への書き込み時は creator_balance（出金可能額のスナップショット）も同じトランザクションで更新する
     """
+    from concurrent.futures import ThreadPoolExecutor
     from flask import current_app
 
     cfg = current_app.config
@@ -1074,29 +1752,113 @@ def run_daily_wallet_aggregation(target_day: date | None = None) -> None:
     now_jst = datetime.now(JST)
     if target_day is None:
         target_day = (now_jst - timedelta(days=1)).date()
-
-    # SQL: 日次基礎集計（events）→ レート適用（rates）→ 係数とPPV計算（calc）
-    # 注意: session_idがNULLの場合はclient_keyで代用
-    sql = text(
-        """
-        WITH base AS (
+    shards = int(shards or cfg.get('WALLET_DAILY_SHARDS', 1) or 1)
+    if target_table not in DAILY_TARGET_TABLES:
+        raise ValueError(f"unsupported target table: {target_table}")
+    started = time.monotonic()
+
+    # シャード条件（'{col}' を user_id 列に置き換えて各 CTE に差し込む）
+    shard_predicate = " AND mod({col}, :shard_count) = :shard_index" if shards > 1 else ""
+
+    from app.services.wallet_rollup import PRICE_MEDIAN_CTE
+    from app.utils.price_sketch import PRICE_BUCKET_YEN
+    mode = mode or cfg.get('WALLET_AGGREGATION_MODE', 'full')
+    hll_clicks_json = None
+    # incremental: 速報カウンタ（creator_daily_live）を追い付かせてから、それを基礎値として確定する
+    if mode == 'incremental':
+        from app.services.wallet_rollup import run_wallet_rollup, live_base_cte
+        run_wallet_rollup()
+        base_cte = live_base_cte(shard_predicate)
+    else:
+        # WALLET_CLICK_COUNT_SOURCE=hll: ユニーククリックは取り込み時の HLL 推定値を使い、COUNT(DISTINCT) を省く
+        hll_clicks = None
+        if cfg.get('WALLET_CLICK_COUNT_SOURCE', 'sql') == 'hll':
+            from app.services.click_sketch import estimate_clicks_for_day
+            hll_clicks = estimate_clicks_for_day(target_day)
+            if hll_clicks is None:
+                logger.warning("click HLL unavailable; falling back to exact COUNT(DISTINCT)")
+
+        if hll_clicks is not None:
+            hll_clicks_json = json.dumps([{'user_id': k, 'clicks': v} for k, v in hll_clicks.items()])
+            clicks_select = ""
+            clicks_cte = """
+        hll AS (
+            SELECT h.user_id, h.clicks FROM jsonb_to_recordset(CAST(:hll_clicks AS jsonb)) AS h(user_id bigint, clicks bigint)
+        ),"""
+            clicks_join = "LEFT JOIN hll h ON h.user_id = b.user_id"
+            clicks_expr = "COALESCE(h.clicks, 0)"
+        else:
+            # 注意: session_idがNULLの場合はclient_keyで代用
+            clicks_select = """,
+                COUNT(DISTINCT CASE WHEN e.event_type='click' AND COALESCE(e.is_bot, false)=false THEN concat_ws('#', e.user_id::text, e.page_id::text, COALESCE(e.ota,''), COALESCE(NULLIF(e.session_id,''), COALESCE(NULLIF(e.client_key,''), 'anon'))) END) AS clicks"""
+            clicks_cte = ""
+            clicks_join = ""
+            clicks_expr = "b.clicks"
+
+        # 価格中央値は階級ごとの度数（ハッシュ集約）から求め、イベント全件のソートを避ける
+        base_cte = """
+        base_events AS (
             SELECT
                 e.user_id,
-                (e.created_at AT TIME ZONE :tz)::date AS day,
-                SUM(CASE WHEN e.event_type='view' AND COALESCE(e.is_bot, false)=false AND COALESCE(e.dwell_ms,0) >= 3000 THEN 1 ELSE 0 END) AS pv,
-                COUNT(DISTINCT CASE WHEN e.event_type='click' AND COALESCE(e.is_bot, false)=false THEN concat_ws('#', e.user_id::text, e.page_id::text, COALESCE(e.ota,''), COALESCE(NULLIF(e.session_id,''), COALESCE(NULLIF(e.client_key,''), 'anon')), ((e.created_at AT TIME ZONE :tz)::date)::text) END) AS clicks,
-                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY e.price_median) AS price_median
+                SUM(CASE WHEN e.event_type='view' AND COALESCE(e.is_bot, false)=false AND COALESCE(e.dwell_ms,0) >= 3000 THEN 1 ELSE 0 END) AS pv""" + clicks_select + """
             FROM event_log e
-            WHERE (e.created_at AT TIME ZONE :tz)::date = :target_day
-            GROUP BY 1,2
+            WHERE e.created_at >= :day_start_utc AND e.created_at < :day_end_utc""" + shard_predicate.format(col='e.user_id') + """
+            GROUP BY 1
         ),
+        price_hist AS (
+            SELECT e.user_id, FLOOR(e.price_median / :price_bucket_yen)::int AS bucket, COUNT(*) AS cnt
+            FROM event_log e
+            WHERE e.created_at >= :day_start_utc AND e.created_at < :day_end_utc AND e.price_median IS NOT NULL""" + shard_predicate.format(col='e.user_id') + """
+            GROUP BY 1, 2
+        ),
+        """ + PRICE_MEDIAN_CTE + """,""" + clicks_cte + """
+        base AS (
+            SELECT b.user_id, CAST(:target_day AS date) AS day, b.pv, """ + clicks_expr + """ AS clicks, pm.price_median
+            FROM base_events b
+            LEFT JOIN price_med pm ON pm.user_id = b.user_id
+            """ + clicks_join + """
+        )
+        """
+
+    if avg7_from_events:
+        # creator_daily と同じ PV の定義で、(user, JST日) ごとの PV を前7日の event_log から作る
+        avg7_cte = """
+        avg7 AS (
+            SELECT d.user_id, AVG(d.pv) AS pv_avg7
+            FROM (
+                SELECT e.user_id, (e.created_at AT TIME ZONE :tz)::date AS day,
+                       SUM(CASE WHEN e.event_type='view' AND COALESCE(e.is_bot, false)=false AND COALESCE(e.dwell_ms,0) >= 3000 THEN 1 ELSE 0 END) AS pv
+                FROM event_log e
+                WHERE e.created_at >= :d7_start_utc AND e.created_at < :day_start_utc""" + shard_predicate.format(col='e.user_id') + """
+                GROUP BY 1, 2
+            ) d
+            GROUP BY 1
+        )"""
+    else:
+        avg7_cte = """
         avg7 AS (
             SELECT user_id,
                    AVG(pv) AS pv_avg7
             FROM creator_daily
-            WHERE day >= :d7_start AND day <= :d7_end
+            WHERE day >= :d7_start AND day <= :d7_end""" + shard_predicate.format(col='user_id') + """
             GROUP BY 1
-        ),
+        )"""
+
+    if shards > 1:
+        # シャードは上限適用前の値をステージングに書く（target_table へは finalize で移す）
+        insert_into = "creator_daily_staging AS d (target, " + DAILY_COLUMNS + ")"
+        select_columns = "CAST(:target_table AS varchar), " + DAILY_COLUMNS
+        conflict_columns = "target, day, user_id"
+    else:
+        insert_into = target_table + " AS d (" + DAILY_COLUMNS + ")"
+        select_columns = DAILY_COLUMNS
+        conflict_columns = "day, user_id"
+
+    # SQL: 日次基礎集計（base）→ レート適用（rates）→ 係数とPPV計算（calc）
+    sql = text(
+        """
+        WITH """ + base_cte + """,
+        """ + avg7_cte + """,
         newbie AS (
             SELECT id AS user_id,
                    CASE WHEN (NOW() AT TIME ZONE 'UTC') < (created_at + interval '7 day') THEN TRUE ELSE FALSE END AS is_newbie
@@ -1141,47 +1903,82 @@ def run_daily_wallet_aggregation(target_day: date | None = None) -> None:
                    (c.pv::numeric) * LEAST(:ppv_floor + c.ctr * c.cpc_dynamic, CASE WHEN c.is_newbie THEN :ppv_cap_newbie ELSE c.ppv_cap_burst END) AS payout_day
             FROM calc c
         )
-        INSERT INTO creator_daily AS d (day, user_id, pv, clicks, ctr, price_median, cpc_dynamic, ppv, ecmp, payout_day)
-        SELECT day, user_id, pv, clicks, ctr, price_median, cpc_dynamic, ppv, ecmp, payout_day
+        INSERT INTO """ + insert_into + """
+        SELECT """ + select_columns + """
         FROM final
-        ON CONFLICT (day, user_id) DO UPDATE
-          SET pv=EXCLUDED.pv,
-              clicks=EXCLUDED.clicks,
-              ctr=EXCLUDED.ctr,
-              price_median=EXCLUDED.price_median,
-              cpc_dynamic=EXCLUDED.cpc_dynamic,
-              ppv=EXCLUDED.ppv,
-              ecmp=EXCLUDED.ecmp,
-              payout_day=EXCLUDED.payout_day,
-              created_at=NOW();
+        ON CONFLICT (""" + conflict_columns + """) DO UPDATE""" + DAILY_UPSERT_SET + """;
         """
     )
 
     d7_end = target_day - timedelta(days=1)
     d7_start = target_day - timedelta(days=7)
+    # JST日の範囲をUTCの半開区間で渡す（対象日の1パーティションだけが走査される）
+    day_start_utc, day_end_utc = _day_bounds_utc(target_day, tz_name)
 
-    db.session.execute(
-        sql,
-        {
-            'tz': tz_name,
-            'target_day': target_day,
-            'd7_start': d7_start,
-            'd7_end': d7_end,
-            'cpc_base': cpc_base,
-            'cpc_min': cpc_min,
-            'cpc_max': cpc_max,
-            'burst_factor': burst_factor,
-            'burst_cap_reduction': burst_cap_reduction,
-            'ppv_floor': ppv_floor,
-            'ppv_cap_default': ppv_cap_default,
-            'ppv_cap_newbie': ppv_cap_newbie,
-        },
-    )
+    params = {
+        'target_day': target_day,
+        'day_start_utc': day_start_utc,
+        'day_end_utc': day_end_utc,
+        'price_bucket_yen': PRICE_BUCKET_YEN,
+        'hll_clicks': hll_clicks_json,
+        'd7_start': d7_start,
+        'd7_end': d7_end,
+        'd7_start_utc': _day_bounds_utc(d7_start, tz_name)[0],
+        'tz': tz_name,
+        'target_table': target_table,
+        'cpc_base': cpc_base,
+        'cpc_min': cpc_min,
+        'cpc_max': cpc_max,
+        'burst_factor': burst_factor,
+        'burst_cap_reduction': burst_cap_reduction,
+        'ppv_floor': ppv_floor,
+        'ppv_cap_default': ppv_cap_default,
+        'ppv_cap_newbie': ppv_cap_newbie,
+    }
+
+    shard_stats = []
+    if shards > 1:
+        # 各シャードは独立したコネクション/トランザクションでステージングに UPSERT（user が重ならないので競合しない）。
+        # 前回の失敗した実行の残りは先に消す。target_table は finalize まで変わらないので、途中で失敗しても再実行すればよい
+        engine = db.engine
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM creator_daily_staging WHERE target = :target AND day = :day"),
+                         {'target': target_table, 'day': target_day})
+
+        def _run_shard(index: int) -> dict:
+            shard_started = time.monotonic()
+            with engine.begin() as conn:
+                rows = conn.execute(sql, dict(params, shard_count=shards, shard_index=index)).rowcount
+            return {'shard': index, 'rows': rows, 'seconds': round(time.monotonic() - shard_started, 3)}
+
+        with ThreadPoolExecutor(max_workers=shards) as pool:
+            shard_stats = list(pool.map(_run_shard, range(shards)))
+    else:
+        db.session.execute(sql, params)
+
+    finalize_started = time.monotonic()
+
+    if shards > 1:
+        # シャードの結果を target_table へ移す（以降の上限/予算の適用と同じトランザクション）
+        db.session.execute(
+            text("""
+                INSERT INTO """ + target_table + """ AS d (""" + DAILY_COLUMNS + """)
+                SELECT """ + DAILY_COLUMNS + """
+                FROM creator_daily_staging
+                WHERE target = :target AND day = :day
+                ON CONFLICT (day, user_id) DO UPDATE""" + DAILY_UPSERT_SET + """
+            """),
+            {'target': target_table, 'day': target_day},
+        )
+        db.session.execute(
+            text("DELETE FROM creator_daily_staging WHERE target = :target AND day = :day"),
+            {'target': target_table, 'day': target_day},
+        )
 
     # クリエイター日次上限の適用
     db.session.execute(
         text("""
-            UPDATE creator_daily
+            UPDATE """ + target_table + """
             SET payout_day = LEAST(payout_day, :creator_cap)
             WHERE day = :day
         """),
@@ -1190,7 +1987,7 @@ def run_daily_wallet_aggregation(target_day: date | None = None) -> None:
 
     # グローバル日次予算の適用（比例配分でスケール）
     total = db.session.execute(
-        text("SELECT COALESCE(SUM(payout_day), 0) FROM creator_daily WHERE day = :day"),
+        text(f"SELECT COALESCE(SUM(payout_day), 0) FROM {target_table} WHERE day = :day"),
         {'day': target_day},
     ).scalar() or 0
 
@@ -1198,7 +1995,7 @@ def run_daily_wallet_aggregation(target_day: date | None = None) -> None:
         ratio = float(global_daily_budget) / float(total)
         db.session.execute(
             text("""
-                UPDATE creator_daily
+                UPDATE """ + target_table + """
                 SET payout_day = ROUND(payout_day * :ratio, 2),
                     ecmp = ROUND(ppv * 1000, 2)
                 WHERE day = :day
@@ -1206,8 +2003,162 @@ def run_daily_wallet_aggregation(target_day: date | None = None) -> None:
             {'ratio': ratio, 'day': target_day},
         )
 
+    if target_table == 'creator_daily':
+        # /api/wallet/trends のキャッシュ（ETag）を無効化するウォーターマーク
+        from app.services.wallet_trends import touch_aggregation_watermark
+        touch_aggregation_watermark()
+
+    if refresh_balances and target_table == 'creator_daily':
+        # 出金可能額のスナップショットを確定値と同じトランザクションで更新
+        from app.services.wallet_balance import refresh_all_wallet_balances
+        refresh_all_wallet_balances()
+
     db.session.commit()
 
+    finalize_seconds = round(time.monotonic() - finalize_started, 3)
+
+    if mode == 'incremental':
+        from app.services.wallet_rollup import prune_rollup_detail
+        prune_rollup_detail()
+
+    return {
+        'day': target_day.isoformat(),
+        'mode': mode,
+        'shards': shard_stats,
+        'finalize_seconds': finalize_seconds,
+        'total_seconds': round(time.monotonic() - started, 3),
+    }
+
+
+def run_wallet_replay(from_day: date, to_day: date, concurrency: int = 4, dry_run: bool = False,
+                      run_id: str | None = None, restart: bool = False, mode: str = 'full',
+                      on_day=None) -> dict:
+    """[from_day, to_day] の日次集計を並列で再実行する（料率変更の反映・障害復旧用）。
+
+    - 対象日を concurrency 個の連続した区間に分け、各ワーカーは1つのアプリコンテキスト（同じセッション）で
+      自分の区間を日付順に処理する
+    - avg7（前7日の PV）は同じワーカーが書き直した creator_daily を読む。前7日に別ワーカーの担当日
+      （まだ書き直されていないかもしれない）を含む日だけ event_log から数える。dry_run は creator_daily を
+      変えないので常に creator_daily を読む
+    - 完了日は wallet_replay_days に記録し、同じ run_id で再実行すると未完了日から再開する。
+      失敗した日があれば各ワーカーはそこで止まる
+    - dry_run=True のときは creator_daily_shadow を空にしてから（再開時を除く）書き込み、creator_daily は変更しない
+    """
+    import queue
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from flask import current_app
+    from app.models import WalletReplayDay
+
+    target_table = 'creator_daily_shadow' if dry_run else 'creator_daily'
+    run_id = run_id or f"{target_table}:{from_day.isoformat()}:{to_day.isoformat()}"
+    app = current_app._get_current_object()
+
+    if restart:
+        WalletReplayDay.query.filter_by(run_id=run_id).delete()
+        db.session.commit()
+    done = {r.day for r in WalletReplayDay.query.filter_by(run_id=run_id, status='done').all()}
+    if dry_run and not done:
+        # 前回の dry-run の行が差分に混ざらないようにする
+        db.session.execute(text("TRUNCATE creator_daily_shadow"))
+        db.session.commit()
+    days = []
+    d = from_day
+    while d <= to_day:
+        if d not in done:
+            days.append(d)
+        d += timedelta(days=1)
+
+    chunk_size = -(-len(days) // max(1, concurrency)) if days else 1
+    chunks = [days[i:i + chunk_size] for i in range(0, len(days), chunk_size)]
+    owner = {day: k for k, chunk in enumerate(chunks) for day in chunk}
+
+    def _avg7_from_events(day: date) -> bool:
+        if dry_run:
+            return False
+        return any(owner.get(day - timedelta(days=n), owner[day]) != owner[day] for n in range(1, 8))
+
+    def _record(day: date, status: str, seconds: float, error: str | None = None) -> None:
+        db.session.execute(
+            text("""
+                INSERT INTO wallet_replay_days (run_id, day, status, seconds, error, finished_at)
+                VALUES (:run_id, :day, :status, :seconds, :error, NOW())
+                ON CONFLICT (run_id, day) DO UPDATE
+                  SET status = EXCLUDED.status, seconds = EXCLUDED.seconds,
+                      error = EXCLUDED.error, finished_at = NOW()
+            """),
+            {'run_id': run_id, 'day': day, 'status': status, 'seconds': round(seconds, 3), 'error': error},
+        )
+        db.session.commit()
+
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def _replay_chunk(chunk) -> None:
+        with app.app_context():
+            for day in chunk:
+                if stop.is_set():
+                    return
+                started = time.monotonic()
+                try:
+                    run_daily_wallet_aggregation(day, shards=1, target_table=target_table, mode=mode,
+                                                 refresh_balances=False, avg7_from_events=_avg7_from_events(day))
+                    _record(day, 'done', time.monotonic() - started)
+                    results.put({'day': day, 'ok': True, 'seconds': time.monotonic() - started})
+                except Exception as e:
+                    db.session.rollback()
+                    stop.set()
+                    _record(day, 'failed', time.monotonic() - started, str(e)[:2000])
+                    results.put({'day': day, 'ok': False, 'seconds': time.monotonic() - started, 'error': str(e)})
+                    return
+
+    stats = {'run_id': run_id, 'target_table': target_table, 'skipped': len(done), 'done': 0, 'failed': []}
+    with ThreadPoolExecutor(max_workers=max(1, len(chunks))) as pool:
+        futures = [pool.submit(_replay_chunk, chunk) for chunk in chunks]
+        # 進捗はメインスレッドで受け取る（on_day はワーカーから呼ばない）
+        while True:
+            try:
+                result = results.get(timeout=0.5)
+            except queue.Empty:
+                if all(f.done() for f in futures) and results.empty():
+                    break
+                continue
+            if on_day:
+                on_day(result)
+            if result['ok']:
+                stats['done'] += 1
+            else:
+                stats['failed'].append(result['day'].isoformat())
+        for f in futures:
+            f.result()
+    stats['remaining'] = len(days) - stats['done']
+
+    if not dry_run and stats['done']:
+        # 日ごとではなく最後に1回だけ残高スナップショットを更新する
+        from app.services.wallet_balance import refresh_all_wallet_balances
+        stats['balances_refreshed'] = refresh_all_wallet_balances()
+        db.session.commit()
+    return stats
+
+
+def diff_shadow_daily(from_day: date, to_day: date) -> dict:
+    """creator_daily_shadow と creator_daily を比較する（wallet-replay --dry-run の確認用）。"""
+    row = db.session.execute(
+        text("""
+            SELECT COUNT(*) AS rows,
+                   COUNT(*) FILTER (WHERE c.user_id IS NULL) AS only_shadow,
+                   COUNT(*) FILTER (WHERE c.user_id IS NOT NULL AND s.payout_day <> c.payout_day) AS changed,
+                   COALESCE(SUM(c.payout_day), 0) AS current_total,
+                   COALESCE(SUM(s.payout_day), 0) AS shadow_total,
+                   COALESCE(MAX(ABS(s.payout_day - COALESCE(c.payout_day, 0))), 0) AS max_abs_diff
+            FROM creator_daily_shadow s
+            LEFT JOIN creator_daily c ON c.day = s.day AND c.user_id = s.user_id
+            WHERE s.day >= :from_day AND s.day <= :to_day
+        """),
+        {'from_day': from_day, 'to_day': to_day},
+    ).mappings().first()
+    return {k: (float(v) if v is not None and not isinstance(v, int) else v) for k, v in dict(row).items()}
+
 
 def run_monthly_wallet_close(target_month_start: date | None = None) -> None:
     """前月の creator_daily を集計して creator_monthly / payout_ledger を更新する。"""
@@ -1260,6 +2211,11 @@ def run_monthly_wallet_close(target_month_start: date | None = None) -> None:
         """
     )
     db.session.execute(sql_ledger, {'m_start': target_month_start})
+
+    from app.services.wallet_balance import refresh_all_wallet_balances
+    from app.services.wallet_trends import touch_aggregation_watermark
+    refresh_all_wallet_balances()
+    touch_aggregation_watermark()
     db.session.commit()
 
 
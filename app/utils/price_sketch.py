@@ -0,0 +1,72 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+
+# 階級幅（円）。m_price のビン境界（8000/15000/25000）を割り切るため、中央値の階級が分かれば
+# ビン判定は正確値と一致する（件数が偶数で中央の2値が境界を跨ぐ場合を除く）。
+PRICE_BUCKET_YEN = 250
+
+
+class PriceSketch:
+    """price_median の固定幅ヒストグラム。加算・マージ可能な分位点スケッチとして使う。
+
+    DB 上は (day|month, user_id, bucket, cnt) の行で保持し、任意期間は cnt の合計でマージできる。
+    """
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None, bucket_yen: int = PRICE_BUCKET_YEN):
+        self.bucket_yen = bucket_yen
+        self.counts: Dict[int, int] = dict(counts or {})
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, int]], bucket_yen: int = PRICE_BUCKET_YEN) -> 'PriceSketch':
+        sketch = cls(bucket_yen=bucket_yen)
+        for bucket, cnt in rows:
+            sketch.counts[int(bucket)] = sketch.counts.get(int(bucket), 0) + int(cnt or 0)
+        return sketch
+
+    def bucket_of(self, price: float) -> int:
+        return int(float(price) // self.bucket_yen)
+
+    def add(self, price: Optional[float], count: int = 1) -> None:
+        if price is None:
+            return
+        b = self.bucket_of(price)
+        self.counts[b] = self.counts.get(b, 0) + count
+
+    def merge(self, other: 'PriceSketch') -> 'PriceSketch':
+        if other.bucket_yen != self.bucket_yen:
+            raise ValueError('bucket width mismatch')
+        for b, c in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + c
+        return self
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def quantile(self, q: float = 0.5) -> Optional[float]:
+        """累積度数が q を超える最初の階級の中央値（wallet_rollup の PRICE_MEDIAN_CTE / live_base_cte() と同じ定義）。"""
+        total = self.total
+        if total <= 0:
+            return None
+        cum = 0
+        for b in sorted(self.counts):
+            cum += self.counts[b]
+            if cum >= q * total:
+                return (b + 0.5) * self.bucket_yen
+        return (max(self.counts) + 0.5) * self.bucket_yen
+
+    def median(self) -> Optional[float]:
+        return self.quantile(0.5)
+
+
+def m_price_for(price_median: Optional[float]) -> float:
+    """rates CTE の m_price と同じビン。"""
+    if price_median is None:
+        return 1.0
+    if price_median < 8000:
+        return 0.8
+    if price_median < 15000:
+        return 1.0
+    if price_median < 25000:
+        return 1.3
+    return 1.6
@@ -217,6 +217,13 @@ def evaluate_hotel_candidates_with_llm(spot_name, hotel_candidates):
         if not candidates_text:
             logger.warning("評価可能なホテル候補がありません")
             return None
+
+        from app.services import llm_cache
+        cache_payload = {'spot_name': spot_name, 'candidates': candidates_text}
+        cached = llm_cache.get('hotel_match', 'gpt-4o', cache_payload)
+        if isinstance(cached, dict):
+            logger.info(f"LLM評価キャッシュヒット: {spot_name}")
+            return cached
         
         evaluation_prompt = f"""
         タスク: Instagram投稿で言及されたスポット名と楽天トラベル検索結果の適合性評価
@@ -260,6 +267,8 @@ def evaluate_hotel_candidates_with_llm(spot_name, hotel_candidates):
         
         content = response.choices[0].message.content
         evaluation_result = json.loads(content)
+        if isinstance(evaluation_result, dict):
+            llm_cache.put('hotel_match', 'gpt-4o', cache_payload, evaluation_result)
         
         logger.info(f"LLM評価完了: {evaluation_result}")
         return evaluation_result
@@ -0,0 +1,53 @@
+"""add creator_daily_staging for sharded daily aggregation (idempotent)
+
+Revision ID: a2e6c8f4d1b9
+Revises: d9a4b7c1e3f6
+Create Date: 2025-10-24 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2e6c8f4d1b9'
+down_revision = 'd9a4b7c1e3f6'
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(inspector, name: str) -> bool:
+    try:
+        return name in inspector.get_table_names()
+    except Exception:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _table_exists(inspector, 'creator_daily_staging'):
+        op.create_table(
+            'creator_daily_staging',
+            sa.Column('target', sa.String(length=32), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('user_id', sa.BigInteger(), nullable=False),
+            sa.Column('pv', sa.Integer(), nullable=False, server_default=sa.text('0')),
+            sa.Column('clicks', sa.Integer(), nullable=False, server_default=sa.text('0')),
+            sa.Column('ctr', sa.Numeric(8, 6), nullable=False, server_default=sa.text('0')),
+            sa.Column('price_median', sa.Numeric(10, 2), nullable=True),
+            sa.Column('cpc_dynamic', sa.Numeric(10, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('ppv', sa.Numeric(10, 4), nullable=False, server_default=sa.text('0')),
+            sa.Column('ecmp', sa.Numeric(10, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('payout_day', sa.Numeric(12, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=True, server_default=sa.text('NOW()')),
+            sa.PrimaryKeyConstraint('target', 'day', 'user_id')
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if _table_exists(inspector, 'creator_daily_staging'):
+        op.drop_table('creator_daily_staging')
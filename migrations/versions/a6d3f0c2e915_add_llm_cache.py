@@ -0,0 +1,54 @@
+"""add llm_cache table (idempotent)
+
+Revision ID: a6d3f0c2e915
+Revises: f4c2d8a1b736
+Create Date: 2025-10-14 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3f0c2e915'
+down_revision = 'f4c2d8a1b736'
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(inspector, name: str) -> bool:
+    try:
+        return name in inspector.get_table_names()
+    except Exception:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _table_exists(inspector, 'llm_cache'):
+        op.create_table(
+            'llm_cache',
+            sa.Column('key', sa.String(length=64), nullable=False),
+            sa.Column('namespace', sa.String(length=50), nullable=False),
+            sa.Column('model', sa.String(length=50), nullable=False),
+            sa.Column('prompt_version', sa.Integer(), nullable=False),
+            sa.Column('value', sa.JSON(), nullable=False),
+            sa.Column('hits', sa.Integer(), nullable=False, server_default=sa.text('0')),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('NOW()')),
+            sa.Column('last_hit_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+            sa.PrimaryKeyConstraint('key')
+        )
+        op.create_index('ix_llm_cache_expires_at', 'llm_cache', ['expires_at'])
+        op.create_index('ix_llm_cache_namespace_version', 'llm_cache', ['namespace', 'prompt_version'])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if _table_exists(inspector, 'llm_cache'):
+        op.drop_index('ix_llm_cache_namespace_version', table_name='llm_cache')
+        op.drop_index('ix_llm_cache_expires_at', table_name='llm_cache')
+        op.drop_table('llm_cache')
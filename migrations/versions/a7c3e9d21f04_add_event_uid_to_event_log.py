@@ -0,0 +1,40 @@
+"""add event_uid to event_log for buffered ingestion dedupe
+
+Revision ID: a7c3e9d21f04
+Revises: ef56_eventlog_ondelete_setnull
+Create Date: 2025-09-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9d21f04'
+down_revision = 'ef56_eventlog_ondelete_setnull'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    cols = [c['name'] for c in inspector.get_columns('event_log')]
+    if 'event_uid' not in cols:
+        op.add_column('event_log', sa.Column('event_uid', sa.String(length=64), nullable=True))
+
+    existing_indexes = [idx['name'] for idx in inspector.get_indexes('event_log')]
+    if 'ux_event_log_event_uid' not in existing_indexes:
+        # NULL は重複扱いされないため既存行はそのまま残せる
+        op.create_index('ux_event_log_event_uid', 'event_log', ['event_uid'], unique=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing_indexes = [idx['name'] for idx in inspector.get_indexes('event_log')]
+    if 'ux_event_log_event_uid' in existing_indexes:
+        op.drop_index('ux_event_log_event_uid', table_name='event_log')
+    cols = [c['name'] for c in inspector.get_columns('event_log')]
+    if 'event_uid' in cols:
+        op.drop_column('event_log', 'event_uid')
@@ -0,0 +1,190 @@
+"""partition event_log by month (RANGE on created_at)
+
+Revision ID: b4e8f2a6c913
+Revises: a7c3e9d21f04
+Create Date: 2025-09-27 10:00:00.000000
+
+"""
+import os
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8f2a6c913'
+down_revision = 'a7c3e9d21f04'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = ('id, event_uid, created_at, user_id, page_id, ota, event_type, client_key, session_id, '
+           'user_agent, ip, referrer, dwell_ms, price_median, is_bot, bot_reason')
+
+# 月初境界に使うタイムゾーン（アプリの WALLET_TZ と揃える）
+TZ_NAME = os.environ.get('WALLET_TZ', 'Asia/Tokyo')
+MONTHS_AHEAD = 3
+
+
+def _relkind(bind, name):
+    return bind.execute(sa.text(
+        "SELECT c.relkind FROM pg_class c WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {'name': name}).scalar()
+
+
+def _add_months(d, n):
+    idx = d.year * 12 + (d.month - 1) + n
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+def _month_start_local(ts):
+    from zoneinfo import ZoneInfo
+    local = ts.astimezone(ZoneInfo(TZ_NAME))
+    return date(local.year, local.month, 1)
+
+
+def _bound(d):
+    from zoneinfo import ZoneInfo
+    return datetime(d.year, d.month, 1, tzinfo=ZoneInfo(TZ_NAME)).isoformat()
+
+
+def _create_parent(bind, seq_name):
+    bind.execute(sa.text(f"""
+        CREATE TABLE event_log (
+            id BIGINT NOT NULL DEFAULT nextval('{seq_name}'),
+            event_uid VARCHAR(64),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            user_id BIGINT NOT NULL,
+            page_id BIGINT,
+            ota TEXT,
+            event_type VARCHAR(16) NOT NULL,
+            client_key TEXT,
+            session_id TEXT,
+            user_agent TEXT,
+            ip INET,
+            referrer TEXT,
+            dwell_ms INTEGER,
+            price_median NUMERIC(10, 2),
+            is_bot BOOLEAN NOT NULL DEFAULT false,
+            bot_reason TEXT,
+            CONSTRAINT event_log_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT ck_event_log_event_type CHECK (event_type in ('view','click')),
+            CONSTRAINT event_log_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id),
+            CONSTRAINT event_log_page_id_fkey FOREIGN KEY (page_id) REFERENCES spots (id) ON DELETE SET NULL
+        ) PARTITION BY RANGE (created_at)
+    """))
+    op.create_index('ix_event_log_user_id', 'event_log', ['user_id'])
+    op.create_index('ix_event_log_page_id', 'event_log', ['page_id'])
+    op.create_index('ix_event_log_user_created_at', 'event_log', ['user_id', 'created_at'])
+    op.create_index('ix_event_log_event_type_created_at', 'event_log', ['event_type', 'created_at'])
+    op.create_index('ix_event_log_user_page_event_created_at', 'event_log', ['user_id', 'page_id', 'event_type', 'created_at'])
+    # パーティション表の一意制約はパーティションキーを含める必要がある（バッファ再投入の重複排除用。
+    # 受信時刻に依存しないクライアント event_id の重複排除は d9a4b7c1e3f6 の event_log_uid）
+    op.create_index('ux_event_log_event_uid', 'event_log', ['event_uid', 'created_at'], unique=True)
+
+
+def _create_partitions(bind, first_month, last_month):
+    month = first_month
+    while month <= last_month:
+        nxt = _add_months(month, 1)
+        name = f"event_log_p{month.year:04d}_{month.month:02d}"
+        bind.execute(sa.text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF event_log "
+            f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(nxt)}')"
+        ))
+        month = nxt
+    # 先行作成が漏れた場合の受け皿（wallet-partitions が正規パーティションへ移送する）
+    bind.execute(sa.text("CREATE TABLE IF NOT EXISTS event_log_default PARTITION OF event_log DEFAULT"))
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    kind = _relkind(bind, 'event_log')
+    if kind == 'p':
+        return
+
+    now_month = _month_start_local(datetime.now(timezone.utc))
+    last_month = _add_months(now_month, MONTHS_AHEAD)
+
+    if kind is None:
+        bind.execute(sa.text("CREATE SEQUENCE IF NOT EXISTS event_log_id_seq"))
+        _create_parent(bind, 'event_log_id_seq')
+        bind.execute(sa.text("ALTER SEQUENCE event_log_id_seq OWNED BY event_log.id"))
+        _create_partitions(bind, now_month, last_month)
+        return
+
+    # 1) 既存テーブルを退避（インデックス名/PK名は新テーブルで使うため空ける）
+    op.rename_table('event_log', 'event_log_legacy')
+    pkey = bind.execute(sa.text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = 'event_log_legacy'::regclass AND contype = 'p'"
+    )).scalar()
+    if pkey:
+        bind.execute(sa.text(f'ALTER TABLE event_log_legacy RENAME CONSTRAINT "{pkey}" TO event_log_legacy_pkey'))
+    index_names = bind.execute(sa.text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'event_log_legacy' AND indexname <> 'event_log_legacy_pkey'"
+    )).fetchall()
+    for (name,) in index_names:
+        bind.execute(sa.text(f'DROP INDEX IF EXISTS "{name}"'))
+
+    seq_name = bind.execute(sa.text("SELECT pg_get_serial_sequence('event_log_legacy', 'id')")).scalar() or 'event_log_id_seq'
+    bind.execute(sa.text(f"ALTER SEQUENCE {seq_name} OWNED BY NONE"))
+
+    # 2) パーティション表と月次パーティションを作成
+    _create_parent(bind, seq_name)
+    min_created = bind.execute(sa.text("SELECT MIN(created_at) FROM event_log_legacy")).scalar()
+    first_month = _month_start_local(min_created) if min_created else now_month
+    _create_partitions(bind, min(first_month, now_month), last_month)
+
+    # 3) データ移送 → 旧テーブル削除
+    bind.execute(sa.text(f"INSERT INTO event_log ({COLUMNS}) SELECT {COLUMNS} FROM event_log_legacy"))
+    bind.execute(sa.text(f"ALTER SEQUENCE {seq_name} OWNED BY event_log.id"))
+    op.drop_table('event_log_legacy')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or _relkind(bind, 'event_log') != 'p':
+        return
+
+    seq_name = bind.execute(sa.text("SELECT pg_get_serial_sequence('event_log', 'id')")).scalar() or 'event_log_id_seq'
+    bind.execute(sa.text(f"ALTER SEQUENCE {seq_name} OWNED BY NONE"))
+    op.rename_table('event_log', 'event_log_partitioned')
+    bind.execute(sa.text("ALTER TABLE event_log_partitioned RENAME CONSTRAINT event_log_pkey TO event_log_partitioned_pkey"))
+    for name in ('ix_event_log_user_id', 'ix_event_log_page_id', 'ix_event_log_user_created_at',
+                 'ix_event_log_event_type_created_at', 'ix_event_log_user_page_event_created_at',
+                 'ux_event_log_event_uid'):
+        bind.execute(sa.text(f'DROP INDEX IF EXISTS "{name}"'))
+
+    bind.execute(sa.text(f"""
+        CREATE TABLE event_log (
+            id BIGINT NOT NULL DEFAULT nextval('{seq_name}') PRIMARY KEY,
+            event_uid VARCHAR(64),
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            user_id BIGINT NOT NULL REFERENCES users (id),
+            page_id BIGINT,
+            ota TEXT,
+            event_type VARCHAR(16) NOT NULL,
+            client_key TEXT,
+            session_id TEXT,
+            user_agent TEXT,
+            ip INET,
+            referrer TEXT,
+            dwell_ms INTEGER,
+            price_median NUMERIC(10, 2),
+            is_bot BOOLEAN NOT NULL DEFAULT false,
+            bot_reason TEXT,
+            CONSTRAINT ck_event_log_event_type CHECK (event_type in ('view','click')),
+            CONSTRAINT event_log_page_id_fkey FOREIGN KEY (page_id) REFERENCES spots (id) ON DELETE SET NULL
+        )
+    """))
+    bind.execute(sa.text(f"INSERT INTO event_log ({COLUMNS}) SELECT {COLUMNS} FROM event_log_partitioned"))
+    bind.execute(sa.text(f"ALTER SEQUENCE {seq_name} OWNED BY event_log.id"))
+    bind.execute(sa.text("DROP TABLE event_log_partitioned CASCADE"))
+
+    op.create_index('ix_event_log_user_created_at', 'event_log', ['user_id', 'created_at'])
+    op.create_index('ix_event_log_event_type_created_at', 'event_log', ['event_type', 'created_at'])
+    op.create_index('ix_event_log_user_page_event_created_at', 'event_log', ['user_id', 'page_id', 'event_type', 'created_at'])
+    op.create_index('ux_event_log_event_uid', 'event_log', ['event_uid'], unique=True)
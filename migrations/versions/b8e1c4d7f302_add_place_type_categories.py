@@ -0,0 +1,49 @@
+"""add place_type_categories mapping table (idempotent)
+
+Revision ID: b8e1c4d7f302
+Revises: a6d3f0c2e915
+Create Date: 2025-10-15 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e1c4d7f302'
+down_revision = 'a6d3f0c2e915'
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(inspector, name: str) -> bool:
+    try:
+        return name in inspector.get_table_names()
+    except Exception:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # 初期の対応表はコード側（place_categories.SEED_TYPE_CATEGORIES）にあり、`flask place-categories-sync` で書き込む
+    if not _table_exists(inspector, 'place_type_categories'):
+        op.create_table(
+            'place_type_categories',
+            sa.Column('types_key', sa.String(length=500), nullable=False),
+            sa.Column('category', sa.String(length=50), nullable=False),
+            sa.Column('priority', sa.Integer(), nullable=False, server_default=sa.text('50')),
+            sa.Column('source', sa.String(length=20), nullable=False, server_default='seed'),
+            sa.Column('version', sa.Integer(), nullable=False, server_default=sa.text('1')),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('NOW()')),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('NOW()')),
+            sa.PrimaryKeyConstraint('types_key')
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if _table_exists(inspector, 'place_type_categories'):
+        op.drop_table('place_type_categories')
@@ -0,0 +1,67 @@
+"""unique (spot_id, provider) on spot_provider_ids (idempotent)
+
+Revision ID: c3f7a9e2d514
+Revises: b8e1c4d7f302
+Create Date: 2025-10-20 10:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f7a9e2d514'
+down_revision = 'b8e1c4d7f302'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+INDEX_NAME = 'ux_spot_provider_ids_spot_provider'
+# 9c1a2f4b7cde で作られ ed7a33d3f885 で落とされた旧名（残っている環境では作り直さない）
+LEGACY_INDEX_NAME = 'ix_spot_provider_ids_spot_provider'
+
+
+def _index_names(inspector, table: str):
+    try:
+        return [ix['name'] for ix in inspector.get_indexes(table)]
+    except Exception:
+        return []
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'spot_provider_ids' not in inspector.get_table_names():
+        return
+    indexes = _index_names(inspector, 'spot_provider_ids')
+    if INDEX_NAME in indexes:
+        return
+    if LEGACY_INDEX_NAME in indexes:
+        op.drop_index(LEGACY_INDEX_NAME, table_name='spot_provider_ids')
+
+    # 重複は id の小さい方を残す。これまでの価格取得は ORDER BY なしの .first() で
+    # どの行が使われていたかは不定だったので、消す行は後から確認できるようログに残す
+    deleted = bind.execute(sa.text(
+        """
+        DELETE FROM spot_provider_ids a
+        USING spot_provider_ids b
+        WHERE a.spot_id = b.spot_id AND a.provider = b.provider AND a.id > b.id
+        RETURNING a.id, a.spot_id, a.provider, a.external_id
+        """
+    )).fetchall()
+    for row in deleted:
+        logger.warning(
+            f"spot_provider_ids: deleted duplicate id={row.id} spot_id={row.spot_id} "
+            f"provider={row.provider} external_id={row.external_id}"
+        )
+    op.create_index(INDEX_NAME, 'spot_provider_ids', ['spot_id', 'provider'], unique=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if INDEX_NAME in _index_names(inspector, 'spot_provider_ids'):
+        op.drop_index(INDEX_NAME, table_name='spot_provider_ids')
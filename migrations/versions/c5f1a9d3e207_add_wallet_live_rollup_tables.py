@@ -0,0 +1,80 @@
+"""add incremental wallet rollup tables (idempotent)
+
+Revision ID: c5f1a9d3e207
+Revises: b4e8f2a6c913
+Create Date: 2025-10-04 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f1a9d3e207'
+down_revision = 'b4e8f2a6c913'
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(inspector, name: str) -> bool:
+    try:
+        return name in inspector.get_table_names()
+    except Exception:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _table_exists(inspector, 'creator_daily_live'):
+        op.create_table(
+            'creator_daily_live',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('user_id', sa.BigInteger(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('pv', sa.BigInteger(), nullable=False, server_default=sa.text('0')),
+            sa.Column('clicks', sa.BigInteger(), nullable=False, server_default=sa.text('0')),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True, server_default=sa.text('NOW()')),
+            sa.PrimaryKeyConstraint('day', 'user_id')
+        )
+        op.create_index('ix_creator_daily_live_user_day', 'creator_daily_live', ['user_id', 'day'])
+
+    if not _table_exists(inspector, 'creator_daily_click_keys'):
+        op.create_table(
+            'creator_daily_click_keys',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('user_id', sa.BigInteger(), nullable=False),
+            sa.Column('click_key', postgresql.UUID(as_uuid=False), nullable=False),
+            sa.PrimaryKeyConstraint('day', 'user_id', 'click_key')
+        )
+
+    if not _table_exists(inspector, 'creator_daily_price_hist'):
+        op.create_table(
+            'creator_daily_price_hist',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('user_id', sa.BigInteger(), nullable=False),
+            sa.Column('bucket', sa.Integer(), nullable=False),
+            sa.Column('cnt', sa.BigInteger(), nullable=False, server_default=sa.text('0')),
+            sa.PrimaryKeyConstraint('day', 'user_id', 'bucket')
+        )
+
+    if not _table_exists(inspector, 'wallet_rollup_state'):
+        op.create_table(
+            'wallet_rollup_state',
+            sa.Column('name', sa.String(length=64), nullable=False),
+            sa.Column('last_event_id', sa.BigInteger(), nullable=False, server_default=sa.text('0')),
+            sa.Column('settled_event_id', sa.BigInteger(), nullable=False, server_default=sa.text('0')),
+            sa.Column('observed_max_id', sa.BigInteger(), nullable=False, server_default=sa.text('0')),
+            sa.Column('observed_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True, server_default=sa.text('NOW()')),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for name in ['wallet_rollup_state', 'creator_daily_price_hist', 'creator_daily_click_keys', 'creator_daily_live']:
+        if _table_exists(inspector, name):
+            op.drop_table(name)
@@ -0,0 +1,54 @@
+"""add creator_monthly_price_hist (idempotent)
+
+Revision ID: d2b7e4c8a915
+Revises: c5f1a9d3e207
+Create Date: 2025-10-08 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7e4c8a915'
+down_revision = 'c5f1a9d3e207'
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(inspector, name: str) -> bool:
+    try:
+        return name in inspector.get_table_names()
+    except Exception:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _table_exists(inspector, 'creator_monthly_price_hist'):
+        op.create_table(
+            'creator_monthly_price_hist',
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('user_id', sa.BigInteger(), nullable=False),
+            sa.Column('bucket', sa.Integer(), nullable=False),
+            sa.Column('cnt', sa.BigInteger(), nullable=False, server_default=sa.text('0')),
+            sa.PrimaryKeyConstraint('month', 'user_id', 'bucket')
+        )
+        # 既存の日次スケッチから月次分を作る
+        bind.execute(sa.text(
+            """
+            INSERT INTO creator_monthly_price_hist (month, user_id, bucket, cnt)
+            SELECT date_trunc('month', day)::date, user_id, bucket, SUM(cnt)
+            FROM creator_daily_price_hist
+            GROUP BY 1, 2, 3
+            """
+        ))
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if _table_exists(inspector, 'creator_monthly_price_hist'):
+        op.drop_table('creator_monthly_price_hist')
@@ -0,0 +1,68 @@
+"""add event_log_uid dedupe table for client event ids (idempotent)
+
+Revision ID: d9a4b7c1e3f6
+Revises: c3f7a9e2d514
+Create Date: 2025-10-21 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a4b7c1e3f6'
+down_revision = 'c3f7a9e2d514'
+branch_labels = None
+depends_on = None
+
+# 再送はこの日数より前のイベントには来ない想定（WALLET_INGEST_UID_RETAIN_DAYS の既定と揃える）
+BACKFILL_DAYS = 7
+
+
+def _table_exists(inspector, name: str) -> bool:
+    try:
+        return name in inspector.get_table_names()
+    except Exception:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _table_exists(inspector, 'event_log_uid'):
+        op.create_table(
+            'event_log_uid',
+            sa.Column('event_uid', sa.String(length=64), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('NOW()')),
+            sa.PrimaryKeyConstraint('event_uid')
+        )
+        op.create_index('ix_event_log_uid_created_at', 'event_log_uid', ['created_at'])
+
+    # 直近の event_uid を取り込んでおく（サーバー採番分も入るが、重複しないので害はない）
+    if bind.dialect.name == 'postgresql' and _table_exists(inspector, 'event_log'):
+        bind.execute(sa.text(
+            """
+            INSERT INTO event_log_uid (event_uid, created_at)
+            SELECT event_uid, MIN(created_at) FROM event_log
+            WHERE event_uid IS NOT NULL AND created_at >= NOW() - make_interval(days => :days)
+            GROUP BY event_uid
+            ON CONFLICT (event_uid) DO NOTHING
+            """
+        ), {'days': BACKFILL_DAYS})
+
+    # db.create_all() で作られたパーティション無しの event_log にも受け皿を付ける
+    if bind.dialect.name == 'postgresql':
+        kind = bind.execute(sa.text(
+            "SELECT c.relkind FROM pg_class c WHERE c.relname = 'event_log' AND pg_table_is_visible(c.oid)"
+        )).scalar()
+        if kind == 'p':
+            bind.execute(sa.text("CREATE TABLE IF NOT EXISTS event_log_default PARTITION OF event_log DEFAULT"))
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if _table_exists(inspector, 'event_log_uid'):
+        op.drop_index('ix_event_log_uid_created_at', table_name='event_log_uid')
+        op.drop_table('event_log_uid')
@@ -0,0 +1,65 @@
+"""add creator_daily_shadow and wallet_replay_days (idempotent)
+
+Revision ID: e3a9c6f1b428
+Revises: d2b7e4c8a915
+Create Date: 2025-10-11 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c6f1b428'
+down_revision = 'd2b7e4c8a915'
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(inspector, name: str) -> bool:
+    try:
+        return name in inspector.get_table_names()
+    except Exception:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _table_exists(inspector, 'creator_daily_shadow'):
+        op.create_table(
+            'creator_daily_shadow',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('user_id', sa.BigInteger(), nullable=False),
+            sa.Column('pv', sa.Integer(), nullable=False, server_default=sa.text('0')),
+            sa.Column('clicks', sa.Integer(), nullable=False, server_default=sa.text('0')),
+            sa.Column('ctr', sa.Numeric(8, 6), nullable=False, server_default=sa.text('0')),
+            sa.Column('price_median', sa.Numeric(10, 2), nullable=True),
+            sa.Column('cpc_dynamic', sa.Numeric(10, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('ppv', sa.Numeric(10, 4), nullable=False, server_default=sa.text('0')),
+            sa.Column('ecmp', sa.Numeric(10, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('payout_day', sa.Numeric(12, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('created_at', sa.DateTime(timezone=True), nullable=True, server_default=sa.text('NOW()')),
+            sa.PrimaryKeyConstraint('day', 'user_id')
+        )
+
+    if not _table_exists(inspector, 'wallet_replay_days'):
+        op.create_table(
+            'wallet_replay_days',
+            sa.Column('run_id', sa.String(length=128), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('status', sa.String(length=16), nullable=False, server_default='done'),
+            sa.Column('seconds', sa.Numeric(10, 3), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True, server_default=sa.text('NOW()')),
+            sa.PrimaryKeyConstraint('run_id', 'day')
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for name in ['wallet_replay_days', 'creator_daily_shadow']:
+        if _table_exists(inspector, name):
+            op.drop_table(name)
@@ -0,0 +1,54 @@
+"""add creator_balance snapshot table (idempotent)
+
+Revision ID: f4c2d8a1b736
+Revises: e3a9c6f1b428
+Create Date: 2025-10-12 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c2d8a1b736'
+down_revision = 'e3a9c6f1b428'
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(inspector, name: str) -> bool:
+    try:
+        return name in inspector.get_table_names()
+    except Exception:
+        return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _table_exists(inspector, 'creator_balance'):
+        op.create_table(
+            'creator_balance',
+            sa.Column('user_id', sa.BigInteger(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('as_of_date', sa.Date(), nullable=False),
+            sa.Column('unpaid_prev', sa.Numeric(12, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('current_month_ytd', sa.Numeric(12, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('month_estimated', sa.Numeric(12, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('on_hold', sa.Numeric(12, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('paid_this_month', sa.Numeric(12, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('withdrawable', sa.Numeric(12, 2), nullable=False, server_default=sa.text('0')),
+            sa.Column('has_stripe_account', sa.Boolean(), nullable=False, server_default=sa.text('false')),
+            sa.Column('payouts_enabled', sa.Boolean(), nullable=False, server_default=sa.text('false')),
+            sa.Column('payouts_ready', sa.Boolean(), nullable=False, server_default=sa.text('false')),
+            sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True, server_default=sa.text('NOW()')),
+            sa.PrimaryKeyConstraint('user_id')
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if _table_exists(inspector, 'creator_balance'):
+        op.drop_table('creator_balance')
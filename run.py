@@ -11,13 +11,17 @@ try:
     # CLI: wallet aggregations (Flask CLI登録はimport時に実行される必要がある)
     @click.command('wallet-daily')
     @click.option('--day', default=None, help='YYYY-MM-DD（省略時は前日）')
+    @click.option('--shards', default=None, type=click.IntRange(1, 16), help='user_id のハッシュで分割して並列集計するシャード数（省略時は WALLET_DAILY_SHARDS）')
     @with_appcontext
-    def wallet_daily(day):
+    def wallet_daily(day, shards):
         from app.tasks import run_daily_wallet_aggregation
         from datetime import datetime as _dt
         target = _dt.strptime(day, '%Y-%m-%d').date() if day else None
-        run_daily_wallet_aggregation(target)
-        click.echo('daily aggregation done')
+        stats = run_daily_wallet_aggregation(target, shards=shards)
+        for sh in stats['shards']:
+            click.echo(f"  shard {sh['shard']}: rows={sh['rows']} {sh['seconds']:.2f}s")
+        click.echo(f"daily aggregation done: day={stats['day']} mode={stats['mode']} "
+                   f"finalize={stats['finalize_seconds']:.2f}s total={stats['total_seconds']:.2f}s")
 
     @click.command('wallet-monthly')
     @click.option('--month', default=None, help='YYYY-MM-01（省略時は前月）')
@@ -32,6 +36,39 @@ try:
     app.cli.add_command(wallet_daily)
     app.cli.add_command(wallet_monthly)
 
+    # 期間指定の日次集計の再実行（料率変更の反映・障害復旧）。同じ引数で再実行すると未完了日から再開する
+    @click.command('wallet-replay')
+    @click.option('--from', 'from_day', required=True, help='YYYY-MM-DD（含む）')
+    @click.option('--to', 'to_day', required=True, help='YYYY-MM-DD（含む）')
+    @click.option('--concurrency', default=4, type=click.IntRange(1, 12), help='同時に処理する日数')
+    @click.option('--dry-run', is_flag=True, default=False, help='creator_daily_shadow に書き込み、現行値との差分を表示')
+    @click.option('--run-id', default=None, help='チェックポイントの識別子（省略時は期間と書き込み先から生成）')
+    @click.option('--restart', is_flag=True, default=False, help='チェックポイントを破棄して最初からやり直す')
+    @click.option('--mode', default='full', type=click.Choice(['full', 'incremental']), help='集計ソース（既定は event_log からの再計算）')
+    @with_appcontext
+    def wallet_replay(from_day, to_day, concurrency: int, dry_run: bool, run_id, restart: bool, mode: str):
+        from datetime import datetime as _dt
+        from app.tasks import run_wallet_replay, diff_shadow_daily
+        start = _dt.strptime(from_day, '%Y-%m-%d').date()
+        end = _dt.strptime(to_day, '%Y-%m-%d').date()
+
+        def _progress(result):
+            status = 'ok' if result['ok'] else f"FAILED: {result.get('error')}"
+            click.echo(f"  {result['day'].isoformat()} {result['seconds']:.2f}s {status}")
+
+        stats = run_wallet_replay(start, end, concurrency=concurrency, dry_run=dry_run, run_id=run_id,
+                                  restart=restart, mode=mode, on_day=_progress)
+        click.echo(f"replay {stats['run_id']}: done={stats['done']}, skipped={stats['skipped']}, "
+                   f"failed={stats['failed'] or '-'}, remaining={stats['remaining']}")
+        if dry_run:
+            diff = diff_shadow_daily(start, end)
+            click.echo(f"shadow diff: rows={diff['rows']}, changed={diff['changed']}, only_shadow={diff['only_shadow']}, "
+                       f"total {diff['current_total']:.0f} -> {diff['shadow_total']:.0f}, max_abs_diff={diff['max_abs_diff']:.2f}")
+        if stats['failed']:
+            raise SystemExit(1)
+
+    app.cli.add_command(wallet_replay)
+
     # Stripe Transfer バッチ（72時間クールダウン経過分の引き出しを処理）
     @click.command('wallet-transfers')
     @with_appcontext
@@ -42,6 +79,283 @@ try:
 
     app.cli.add_command(wallet_transfers)
 
+    # ビーコンバッファのドレイン（WALLET_INGEST_MODE=buffered 時に常駐させる）
+    @click.command('wallet-ingest-drain')
+    @click.option('--batch-size', default=None, type=int, help='1回のINSERT件数（省略時は WALLET_INGEST_BATCH_SIZE）')
+    @click.option('--loop', is_flag=True, default=False, help='空になっても終了せずにポーリングを続ける')
+    @click.option('--interval', default=1.0, help='--loop 時の空振り待機秒')
+    @click.option('--consumer', default='default', help='処理中リストの識別子（複数プロセス時は別名にする）')
+    @with_appcontext
+    def wallet_ingest_drain(batch_size, loop: bool, interval: float, consumer: str):
+        import time
+        from app.services.event_ingest import drain_event_buffer, buffer_length
+
+        size = batch_size or app.config.get('WALLET_INGEST_BATCH_SIZE', 500)
+        total = {'batches': 0, 'events': 0, 'inserted': 0}
+        while True:
+            stats = drain_event_buffer(batch_size=size, consumer=consumer)
+            for k in total:
+                total[k] += stats[k]
+            if stats['events']:
+                app.logger.info(f"[INGEST] drained events={stats['events']} inserted={stats['inserted']} batches={stats['batches']}")
+            if not loop:
+                break
+            if not stats['events']:
+                time.sleep(interval)
+
+        click.echo(f"ingest drain done: events={total['events']}, inserted={total['inserted']}, "
+                   f"batches={total['batches']}, remaining={buffer_length()}")
+
+    app.cli.add_command(wallet_ingest_drain)
+
+    # creator_daily_live の差分集計（数分おきの Scheduler、または --loop で常駐）
+    @click.command('wallet-rollup')
+    @click.option('--loop', is_flag=True, default=False, help='終了せずに interval 秒ごとに繰り返す')
+    @click.option('--interval', default=60.0, help='--loop 時の実行間隔（秒）')
+    @click.option('--rebuild-day', 'rebuild_days', multiple=True, help='YYYY-MM-DD の速報値を event_log から作り直す（複数可）')
+    @with_appcontext
+    def wallet_rollup(loop: bool, interval: float, rebuild_days):
+        import time
+        from datetime import datetime as _dt
+        from app.services.wallet_rollup import run_wallet_rollup, rebuild_live_day, initialize_watermark
+
+        if rebuild_days:
+            initialize_watermark()
+            for d in rebuild_days:
+                try:
+                    rebuild_live_day(_dt.strptime(d, '%Y-%m-%d').date())
+                except ValueError as e:
+                    raise click.ClickException(str(e))
+                click.echo(f'rebuilt live counters for {d}')
+
+        while True:
+            started = time.monotonic()
+            stats = run_wallet_rollup()
+            elapsed = time.monotonic() - started
+            app.logger.info(f"[ROLLUP] ids {stats['from_id']}..{stats['to_id']} batches={stats['batches']} ({elapsed:.2f}s)")
+            if not loop:
+                break
+            time.sleep(max(0.0, interval - elapsed))
+
+        click.echo(f"rollup done: last_event_id={stats['to_id']}, settled={stats['settled_id']}")
+
+    app.cli.add_command(wallet_rollup)
+
+    # ユニーククリックの HLL 推定値と SQL 正確値の照合
+    @click.command('wallet-clicks-reconcile')
+    @click.option('--day', default=None, help='YYYY-MM-DD（省略時は前日）')
+    @click.option('--top', default=10, help='誤差の大きい順に表示する user 数')
+    @with_appcontext
+    def wallet_clicks_reconcile(day, top: int):
+        from datetime import datetime as _dt, timedelta, timezone
+        from app.services.click_sketch import reconcile_day
+        if day:
+            target = _dt.strptime(day, '%Y-%m-%d').date()
+        else:
+            target = (_dt.now(timezone(timedelta(hours=9))) - timedelta(days=1)).date()
+
+        report = reconcile_day(target)
+        worst = sorted(report['rows'], key=lambda r: (r['rel_error'], r['exact']), reverse=True)[:top]
+        for r in worst:
+            click.echo(f"user={r['user_id']} exact={r['exact']} hll={r['hll']} err={r['rel_error'] * 100:.2f}%")
+        click.echo(f"reconcile {report['day']}: users={report['users']}, exact={report['total_exact']}, "
+                   f"hll={report['total_hll']}, total_err={report['total_rel_error'] * 100:.2f}%, "
+                   f"max_err={report['max_rel_error'] * 100:.2f}%, degraded={report['degraded']}")
+
+    app.cli.add_command(wallet_clicks_reconcile)
+
+    # 価格中央値スケッチの精度レポート（PERCENTILE_CONT との比較）
+    @click.command('wallet-price-sketch-report')
+    @click.option('--day', default=None, help='YYYY-MM-DD（省略時は前日）')
+    @click.option('--top', default=10, help='誤差の大きい順に表示する user 数')
+    @with_appcontext
+    def wallet_price_sketch_report(day, top: int):
+        from datetime import datetime as _dt, timedelta, timezone
+        from app.services.wallet_rollup import price_sketch_report
+        if day:
+            target = _dt.strptime(day, '%Y-%m-%d').date()
+        else:
+            target = (_dt.now(timezone(timedelta(hours=9))) - timedelta(days=1)).date()
+
+        report = price_sketch_report(target)
+        worst = sorted([r for r in report['rows'] if r['abs_error'] is not None],
+                       key=lambda r: r['abs_error'], reverse=True)[:top]
+        for r in worst:
+            click.echo(f"user={r['user_id']} exact={r['exact']:.0f} sketch={r['sketch']:.0f} "
+                       f"err={r['abs_error']:.0f} same_bin={r['same_bin']}")
+        click.echo(f"price sketch {report['day']} ({report['source']}): users={report['users']}, "
+                   f"mean_err={report['mean_abs_error']:.1f}, max_err={report['max_abs_error']:.1f}, "
+                   f"bin_agreement={report['bin_agreement'] * 100:.2f}%")
+
+    app.cli.add_command(wallet_price_sketch_report)
+
+    # 出金可能額スナップショット（creator_balance）と元テーブルの整合チェック
+    @click.command('wallet-balance-check')
+    @click.option('--fix', is_flag=True, help='全ユーザーのスナップショットを再計算して保存する')
+    @click.option('--tolerance', default=0.5, help='ドリフトとみなす差額（円）')
+    @click.option('--top', default=20, help='表示する user 数')
+    @with_appcontext
+    def wallet_balance_check(fix: bool, tolerance: float, top: int):
+        from app.services.wallet_balance import check_wallet_balances
+        report = check_wallet_balances(tolerance=tolerance, fix=fix, limit=top)
+        for d in report['drift']:
+            parts = [f"{c}: {v['snapshot']} -> {v['expected']}" for c, v in d['diffs'].items()]
+            click.echo(f"user={d['user_id']} " + ', '.join(parts))
+        click.echo(f"balance check {report['as_of_date']}: users={report['users']}, snapshots={report['snapshots']}, "
+                   f"missing={report['missing']}, stale={report['stale']}, drifted={report['drifted']}, "
+                   f"max_withdrawable_drift={report['max_withdrawable_drift']:.0f}"
+                   + (f", refreshed={report['refreshed']}" if fix else ''))
+        if report['drifted'] and not fix:
+            raise SystemExit(1)
+
+    app.cli.add_command(wallet_balance_check)
+
+    # LLM 応答キャッシュのヒット率
+    @click.command('llm-cache-stats')
+    @click.option('--reset', is_flag=True, help='表示後にカウンタをリセットする')
+    @with_appcontext
+    def llm_cache_stats(reset: bool):
+        from app.services.llm_cache import cache_stats
+        for namespace, row in cache_stats(reset=reset).items():
+            click.echo(f"{namespace} v{row['prompt_version']}: hit_rate={row['hit_rate'] * 100:.1f}% "
+                       f"redis_hit={row['redis_hit']} db_hit={row['db_hit']} miss={row['miss']} store={row['store']}")
+
+    app.cli.add_command(llm_cache_stats)
+
+    # 期限切れ・旧プロンプト版の llm_cache 行を削除（日次Scheduler想定）
+    @click.command('llm-cache-prune')
+    @click.option('--dry-run', is_flag=True, default=False, help='削除せず件数だけ表示')
+    @with_appcontext
+    def llm_cache_prune(dry_run: bool):
+        from app.services.llm_cache import prune
+        report = prune(dry_run=dry_run)
+        prefix = '[dry-run] ' if dry_run else ''
+        click.echo(f"{prefix}llm cache prune: expired={report['expired']}, "
+                   f"stale_version={report['stale_version']}, rows={report['remaining']}")
+
+    app.cli.add_command(llm_cache_prune)
+
+    # Google Places types → 日本語カテゴリ対応表の初期値の書き込み（MAPPING_VERSION を上げたらデプロイ後に実行）
+    @click.command('place-categories-sync')
+    @click.option('--dry-run', is_flag=True, default=False, help='変更せず件数だけ表示')
+    @click.option('--show-learned', default=0, help='LLM で決めた組み合わせを新しい順に表示する件数')
+    @with_appcontext
+    def place_categories_sync(dry_run: bool, show_learned: int):
+        from app.services.place_categories import MAPPING_VERSION, sync_seed, learned_combinations
+        report = sync_seed(dry_run=dry_run)
+        for key, category in learned_combinations(limit=show_learned) if show_learned else []:
+            click.echo(f"{key} -> {category}")
+        prefix = '[dry-run] ' if dry_run else ''
+        click.echo(f"{prefix}place categories v{MAPPING_VERSION}: seed={report['seed']}, "
+                   f"stale_removed={report['stale_removed']}, learned={report['learned']}")
+
+    app.cli.add_command(place_categories_sync)
+
+    # Places 共有キャッシュのヒット率（各プロセスのカウンタは30秒ごとに Redis へ集約）
+    @click.command('places-cache-stats')
+    @with_appcontext
+    def places_cache_stats():
+        from app.services.places_client import cache_stats
+        row = cache_stats()
+        click.echo(f"places cache: hit_rate={row['hit_rate'] * 100:.1f}% lru_hit={row['lru_hit']} "
+                   f"redis_hit={row['redis_hit']} negative_hit={row['negative_hit']} miss={row['miss']} "
+                   f"request={row['request']} error={row['error']} invalid={row['invalid']}")
+
+    app.cli.add_command(places_cache_stats)
+
+    # ホテル価格キャッシュのヒット状況と、プロバイダごとの呼び出し数・締切超過数・所要時間
+    @click.command('hotel-offers-stats')
+    @with_appcontext
+    def hotel_offers_stats():
+        from app.services.hotel_offers import cache_stats, provider_stats
+        row = cache_stats()
+        click.echo('cache: ' + ' '.join(f'{k}={v}' for k, v in row.items()))
+        for provider, row in provider_stats().items():
+            click.echo(f"{provider}: calls={row['calls']} ok={row['ok']} empty={row['empty']} errors={row['errors']} "
+                       f"timeouts={row['timeouts']} avg_ms={row['ms_avg']} max_ms={row['ms_max']}")
+
+    app.cli.add_command(hotel_offers_stats)
+
+    # よく見られている宿スポットの価格キャッシュを soft TTL 切れ前に温め直す（Scheduler で5分おき想定）
+    @click.command('offers-prewarm')
+    @click.option('--dry-run', is_flag=True, default=False, help='計算せず対象件数と予算の使い方だけ表示')
+    @click.option('--limit', default=None, type=int, help='対象スポット数（省略時は HOTEL_OFFERS_PREWARM_TOP_N）')
+    @click.option('--days', default=None, type=int, help='view 数を数える日数（省略時は HOTEL_OFFERS_PREWARM_DAYS）')
+    @click.option('--budget', default=None, type=int, help='プロバイダごとの呼び出し上限（省略時は HOTEL_OFFERS_PREWARM_BUDGET）')
+    @with_appcontext
+    def offers_prewarm(dry_run: bool, limit, days, budget):
+        from app.services.offers_prewarm import prewarm
+        summary = prewarm(limit=limit, days=days, budget=budget, dry_run=dry_run)
+        prefix = '[dry-run] ' if dry_run else ''
+        calls = ' '.join(f'{p}={n}' for p, n in summary['provider_calls'].items())
+        click.echo(f"{prefix}offers prewarm: spots={summary['spots']} windows={summary['windows']} "
+                   f"fresh={summary['fresh']} over_budget={summary['over_budget']} scheduled={summary['scheduled']} "
+                   f"warmed={summary['warmed']} partial={summary['partial']} locked={summary['locked']} "
+                   f"failed={summary['failed']} calls[{calls}]")
+
+    app.cli.add_command(offers_prewarm)
+
+    # event_log 月次パーティションの先行作成と古いパーティションの切り離し（日次Scheduler想定）
+    @click.command('wallet-partitions')
+    @click.option('--ahead', default=None, type=int, help='先行作成する月数（省略時は WALLET_EVENT_LOG_MONTHS_AHEAD）')
+    @click.option('--retain-months', default=None, type=int, help='保持する月数。超過分は DETACH（0 = 切り離さない）')
+    @click.option('--drop', is_flag=True, default=False, help='切り離したパーティションを削除する（アーカイブ済みの場合のみ）')
+    @click.option('--dry-run', is_flag=True, default=False, help='変更せず対象だけ表示')
+    @with_appcontext
+    def wallet_partitions(ahead, retain_months, drop: bool, dry_run: bool):
+        from app.services.event_partitions import (
+            is_partitioned, ensure_partitions, detach_old_partitions, default_partition_rows, prune_event_uids,
+        )
+        if not is_partitioned():
+            click.echo('event_log is not partitioned; run `flask db upgrade` first')
+            return
+
+        ahead = app.config.get('WALLET_EVENT_LOG_MONTHS_AHEAD', 3) if ahead is None else ahead
+        retain = app.config.get('WALLET_EVENT_LOG_RETAIN_MONTHS', 0) if retain_months is None else retain_months
+
+        created = ensure_partitions(months_ahead=ahead, dry_run=dry_run)
+        detached = detach_old_partitions(retain, drop=drop, dry_run=dry_run)
+        pruned = prune_event_uids(app.config.get('WALLET_INGEST_UID_RETAIN_DAYS', 7), dry_run=dry_run)
+        stray = default_partition_rows()
+        if stray:
+            app.logger.warning(f"[PARTITIONS] {stray} rows in event_log_default")
+
+        prefix = '[dry-run] ' if dry_run else ''
+        click.echo(f"{prefix}partitions done: created={created or '-'}, "
+                   f"{'dropped' if drop else 'detached'}={detached or '-'}, default_rows={stray}, "
+                   f"pruned_event_uids={pruned}")
+
+    app.cli.add_command(wallet_partitions)
+
+    # 連携済みクリエイター全員の差分インポートを RQ に積む（Scheduler想定。ワーカーは with_scheduler で起動）
+    @click.command('ig-auto-import')
+    @click.option('--dry-run', is_flag=True, default=False, help='積まずに対象件数だけ表示')
+    @click.option('--max-jitter', default=None, type=int, help='開始時刻をずらす最大秒数（省略時は IG_AUTO_IMPORT_JITTER）')
+    @click.option('--lookback-days', default=None, type=int, help='初回インポートの取得日数（省略時は IG_AUTO_IMPORT_LOOKBACK_DAYS）')
+    @click.option('--limit', default=None, type=int, help='対象ユーザー数の上限')
+    @click.option('--report', 'report_run', default=None, help='積まずに指定 run_id（"last" で直近）の集計を表示')
+    @with_appcontext
+    def ig_auto_import(dry_run: bool, max_jitter, lookback_days, limit, report_run):
+        from app.services.instagram_auto_import import run_report, schedule
+        if report_run:
+            report = run_report(None if report_run == 'last' else report_run)
+            if not report:
+                click.echo('no auto import run found')
+                return
+            click.echo(f"run {report['run_id']}: scheduled={report['scheduled']} done={report['users_done']} "
+                       f"failed={report['users_failed']} pending={report['pending']} "
+                       f"rate_limited={report['rate_limited']} reauth_required={report['reauth_required']} "
+                       f"deferred={report['deferred']} "
+                       f"posts={report['posts']} api_calls={report['api_calls']} candidates={report['candidates']}")
+            return
+        summary = schedule(dry_run=dry_run, max_jitter=max_jitter, lookback_days=lookback_days, limit=limit)
+        prefix = '[dry-run] ' if dry_run else ''
+        click.echo(f"{prefix}ig auto import {summary['run_id']}: eligible={summary['eligible']} "
+                   f"scheduled={summary['scheduled']} skipped_running={summary['skipped_running']} "
+                   f"skipped_unsaved={summary['skipped_unsaved']} skipped_cooldown={summary['skipped_cooldown']}")
+
+    app.cli.add_command(ig_auto_import)
+
     # Instagram 長期トークンの定期リフレッシュ（Scheduler想定）
     @click.command('ig-refresh')
     @click.option('--dry-run', is_flag=True, default=False, help='実更新せず対象とログだけ出す')
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import argparse
+import logging
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from app.services.openai_rate_limit import count_tokens
+from app.tasks import (
+    CAPTION_SYSTEM_PROMPT,
+    _analyze_posts_with_openai,
+    _batch_caption_prompt,
+    _caption_prompt,
+    _pack_caption_batches,
+)
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POSTS = os.path.join(PROJECT_ROOT, 'tests', 'mock_data', 'instagram_posts.json')
+MODES = ('per_post', 'batched')
+
+
+def configure_logging(verbose: bool = False) -> None:
+    level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(level=level, format='%(asctime)s [%(levelname)s] %(message)s')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark caption spot-name extraction: one request per post vs batched JSON requests",
+    )
+    parser.add_argument("--posts", default=DEFAULT_POSTS, help="Instagram Graph API style JSON ({'data': [...]})")
+    parser.add_argument("--repeat-posts", type=int, default=1, help="Replicate the post list N times (ids are suffixed)")
+    parser.add_argument("--batch-tokens", type=int, help="Override IMPORT_OPENAI_BATCH_TOKENS")
+    parser.add_argument("--batch-max-posts", type=int, help="Override IMPORT_OPENAI_BATCH_MAX_POSTS")
+    parser.add_argument("--input-price", type=float, default=2.50, help="USD per 1M input tokens (gpt-4o)")
+    parser.add_argument("--output-price", type=float, default=10.00, help="USD per 1M output tokens (gpt-4o)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count prompt tokens locally; no API calls")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    return parser.parse_args()
+
+
+def load_posts(path: str, repeat: int) -> list:
+    with open(path, encoding='utf-8') as f:
+        posts = json.load(f).get('data', [])
+    out = []
+    for r in range(max(1, repeat)):
+        for post in posts:
+            p = dict(post)
+            if r:
+                p['id'] = f"{post.get('id')}-{r}"
+            out.append(p)
+    return out
+
+
+def prompt_tokens(posts: list, budget: int, max_posts: int) -> dict:
+    """API を呼ばずに入力トークン数だけを見積もる。"""
+    targets = [(i, p, p['caption'][:1500]) for i, p in enumerate(posts) if p.get('caption')]
+    per_post = sum(count_tokens(CAPTION_SYSTEM_PROMPT + _caption_prompt(c)) for _, _, c in targets)
+    batches = _pack_caption_batches(targets, budget, max_posts)
+    batched = sum(
+        count_tokens(CAPTION_SYSTEM_PROMPT + _batch_caption_prompt([(str(p.get('id')), c) for _, p, c in b]))
+        for b in batches
+    )
+    return {
+        'per_post': {'requests': len(targets), 'prompt_tokens': per_post},
+        'batched': {'requests': len(batches), 'prompt_tokens': batched},
+    }
+
+
+def cost_usd(stats: dict, input_price: float, output_price: float) -> float:
+    return (stats.get('prompt_tokens', 0) * input_price + stats.get('completion_tokens', 0) * output_price) / 1_000_000
+
+
+def by_post(candidates: list) -> dict:
+    out = {}
+    for c in candidates:
+        out.setdefault(c['instagram_post_id'], set()).add(c['name'])
+    return out
+
+
+def main():
+    args = parse_args()
+    configure_logging(args.verbose)
+
+    app = create_app()
+    # 2回目の実行がキャッシュに当たらないように LLM キャッシュは切る
+    app.config['LLM_CACHE_ENABLED'] = 'false'
+    if args.batch_tokens:
+        app.config['IMPORT_OPENAI_BATCH_TOKENS'] = args.batch_tokens
+    if args.batch_max_posts:
+        app.config['IMPORT_OPENAI_BATCH_MAX_POSTS'] = args.batch_max_posts
+
+    with app.app_context():
+        posts = load_posts(args.posts, args.repeat_posts)
+        budget = int(app.config.get('IMPORT_OPENAI_BATCH_TOKENS', 6000))
+        max_posts = int(app.config.get('IMPORT_OPENAI_BATCH_MAX_POSTS', 25))
+        print(f"posts={len(posts)} batch_tokens={budget} batch_max_posts={max_posts}")
+
+        if args.dry_run:
+            est = prompt_tokens(posts, budget, max_posts)
+            print(f"{'mode':>9} {'requests':>9} {'prompt_tok':>11} {'input_usd':>10}")
+            for mode in MODES:
+                row = est[mode]
+                usd = row['prompt_tokens'] * args.input_price / 1_000_000
+                print(f"{mode:>9} {row['requests']:>9} {row['prompt_tokens']:>11} {usd:>10.5f}")
+            return
+
+        results = {}
+        print(f"{'mode':>9} {'requests':>9} {'splits':>7} {'errors':>7} {'prompt_tok':>11} "
+              f"{'output_tok':>11} {'usd':>9} {'wall_s':>8} {'candidates':>11}")
+        for mode in MODES:
+            stats = {}
+            candidates = _analyze_posts_with_openai('bench', posts, stats=stats, mode=mode)
+            results[mode] = by_post(candidates)
+            print(f"{mode:>9} {stats['requests']:>9} {stats['splits']:>7} {stats['errors']:>7} "
+                  f"{stats['prompt_tokens']:>11} {stats['completion_tokens']:>11} "
+                  f"{cost_usd(stats, args.input_price, args.output_price):>9.5f} "
+                  f"{stats['wall_seconds']:>8.2f} {len(candidates):>11}")
+
+        # 抽出結果の一致度（投稿ごとの施設名集合が完全一致した割合）
+        ids = set(results['per_post']) | set(results['batched'])
+        same = sum(1 for i in ids if results['per_post'].get(i) == results['batched'].get(i))
+        print(f"agreement: {same}/{len(ids)} posts with identical spot names")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from datetime import date, timedelta
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.tasks import _day_bounds_utc
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = 'bench_event_log'
+
+# 日次集計の base CTE と同じ形（フィルタ句だけ差し替える）
+BASE_QUERY = """
+SELECT e.user_id,
+       SUM(CASE WHEN e.event_type='view' AND COALESCE(e.is_bot,false)=false AND COALESCE(e.dwell_ms,0) >= 3000 THEN 1 ELSE 0 END) AS pv,
+       COUNT(DISTINCT CASE WHEN e.event_type='click' AND COALESCE(e.is_bot,false)=false
+             THEN concat_ws('#', e.user_id::text, e.page_id::text, COALESCE(e.ota,''), COALESCE(NULLIF(e.session_id,''), 'anon')) END) AS clicks
+FROM {table} e
+WHERE {predicate}
+GROUP BY 1
+"""
+OLD_PREDICATE = "(e.created_at AT TIME ZONE :tz)::date = :target_day"
+NEW_PREDICATE = "e.created_at >= :day_start_utc AND e.created_at < :day_end_utc"
+
+
+def configure_logging(verbose: bool = False) -> None:
+    level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(level=level, format='%(asctime)s [%(levelname)s] %(message)s')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the daily aggregation scan on flat vs month-partitioned event_log (synthetic data)",
+    )
+    parser.add_argument("--rows", type=int, default=50_000_000, help="Synthetic rows to generate")
+    parser.add_argument("--months", type=int, default=24, help="Months of history to spread rows over")
+    parser.add_argument("--users", type=int, default=5000, help="Distinct creators")
+    parser.add_argument("--target-day", default=None, help="YYYY-MM-DD to aggregate (default: 15th of the newest month)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant (best time is reported)")
+    parser.add_argument("--skip-load", action="store_true", help="Reuse previously generated tables")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {SCHEMA} schema afterwards")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    return parser.parse_args()
+
+
+def _add_months(d: date, n: int) -> date:
+    idx = d.year * 12 + (d.month - 1) + n
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+def load(first_month: date, months: int, rows: int, users: int, tz: str) -> None:
+    """flat（単一テーブル）と part（月次パーティション）に同一データを生成する。"""
+    columns = """
+        id BIGINT NOT NULL, event_uid VARCHAR(64), created_at TIMESTAMPTZ NOT NULL, user_id BIGINT NOT NULL,
+        page_id BIGINT, ota TEXT, event_type VARCHAR(16) NOT NULL, client_key TEXT, session_id TEXT,
+        dwell_ms INTEGER, price_median NUMERIC(10,2), is_bot BOOLEAN NOT NULL DEFAULT false
+    """
+    stmts = [
+        f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE",
+        f"CREATE SCHEMA {SCHEMA}",
+        f"CREATE TABLE {SCHEMA}.flat ({columns}, PRIMARY KEY (id))",
+        f"CREATE TABLE {SCHEMA}.part ({columns}, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)",
+    ]
+    for i in range(months):
+        m, n = _add_months(first_month, i), _add_months(first_month, i + 1)
+        stmts.append(
+            f"CREATE TABLE {SCHEMA}.part_p{m.year:04d}_{m.month:02d} PARTITION OF {SCHEMA}.part "
+            f"FOR VALUES FROM ('{m.isoformat()} 00:00:00 {tz}') TO ('{n.isoformat()} 00:00:00 {tz}')"
+        )
+    for st in stmts:
+        db.session.execute(text(st))
+    db.session.commit()
+
+    started = time.perf_counter()
+    db.session.execute(text(
+        f"""
+        INSERT INTO {SCHEMA}.flat (id, event_uid, created_at, user_id, page_id, ota, event_type, session_id, dwell_ms, price_median, is_bot)
+        SELECT g,
+               md5(g::text),
+               (:first_month)::timestamp AT TIME ZONE :tz + (random() * :span_s) * interval '1 second',
+               1 + (g % :users),
+               1 + (g % (:users * 20)),
+               CASE WHEN g % 10 = 0 THEN 'rakuten' END,
+               CASE WHEN g % 10 = 0 THEN 'click' ELSE 'view' END,
+               'sess-' || (g % 200000),
+               2000 + (g % 8000),
+               CASE WHEN g % 3 = 0 THEN 5000 + (g % 30000) END,
+               (g % 97 = 0)
+        FROM generate_series(1, :rows) AS g
+        """
+    ), {
+        'first_month': first_month.isoformat(),
+        'tz': tz,
+        'span_s': (_add_months(first_month, months) - first_month).days * 86400 - 1,
+        'users': users,
+        'rows': rows,
+    })
+    db.session.execute(text(f"INSERT INTO {SCHEMA}.part SELECT * FROM {SCHEMA}.flat"))
+    for table in ('flat', 'part'):
+        db.session.execute(text(f"CREATE INDEX ON {SCHEMA}.{table} (event_type, created_at)"))
+        db.session.execute(text(f"CREATE INDEX ON {SCHEMA}.{table} (user_id, created_at)"))
+    db.session.commit()
+    for table in ('flat', 'part'):
+        db.session.execute(text(f"ANALYZE {SCHEMA}.{table}"))
+    db.session.commit()
+    logger.info(f"generated {rows} rows in {time.perf_counter() - started:.1f}s")
+
+
+def explain(table: str, predicate: str, params: dict, repeat: int) -> dict:
+    sql = BASE_QUERY.format(table=f"{SCHEMA}.{table}", predicate=predicate)
+    best = None
+    plan = None
+    for _ in range(repeat):
+        row = db.session.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar()
+        plan = row[0] if isinstance(row, list) else json.loads(row)[0]
+        ms = plan['Execution Time']
+        best = ms if best is None else min(best, ms)
+    db.session.rollback()
+
+    def _scanned(node, acc):
+        if node.get('Relation Name'):
+            acc.add(node['Relation Name'])
+        for child in node.get('Plans', []) or []:
+            _scanned(child, acc)
+        return acc
+
+    rels = _scanned(plan['Plan'], set())
+    shared = plan['Plan'].get('Shared Hit Blocks', 0) + plan['Plan'].get('Shared Read Blocks', 0)
+    return {'ms': best, 'relations': len(rels), 'blocks': shared}
+
+
+def main():
+    args = parse_args()
+    configure_logging(args.verbose)
+
+    app = create_app()
+    with app.app_context():
+        tz = app.config.get('WALLET_TZ', 'Asia/Tokyo')
+        today = date.today()
+        first_month = _add_months(date(today.year, today.month, 1), -(args.months - 1))
+        if not args.skip_load:
+            load(first_month, args.months, args.rows, args.users, tz)
+
+        if args.target_day:
+            target_day = date.fromisoformat(args.target_day)
+        else:
+            newest = _add_months(first_month, args.months - 1)
+            target_day = newest + timedelta(days=14)
+        day_start_utc, day_end_utc = _day_bounds_utc(target_day, tz)
+        params = {'tz': tz, 'target_day': target_day, 'day_start_utc': day_start_utc, 'day_end_utc': day_end_utc}
+
+        variants = [
+            ('flat / AT TIME ZONE', 'flat', OLD_PREDICATE),
+            ('flat / UTC range', 'flat', NEW_PREDICATE),
+            ('partitioned / AT TIME ZONE', 'part', OLD_PREDICATE),
+            ('partitioned / UTC range', 'part', NEW_PREDICATE),
+        ]
+        print(f"target_day={target_day} rows={args.rows} months={args.months}")
+        print(f"{'variant':<28} {'best_ms':>10} {'relations':>10} {'blocks':>12}")
+        for label, table, predicate in variants:
+            r = explain(table, predicate, params, args.repeat)
+            print(f"{label:<28} {r['ms']:>10.1f} {r['relations']:>10} {r['blocks']:>12}")
+
+        if not args.keep:
+            db.session.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
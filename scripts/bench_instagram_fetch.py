@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import zlib
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+import app.tasks as tasks
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POSTS = os.path.join(PROJECT_ROOT, 'tests', 'mock_data', 'instagram_posts.json')
+LEGACY_FIELDS = "id,caption,media_type,media_url,permalink,timestamp,location"
+LEGACY_LIMIT = 50
+
+
+def configure_logging(verbose: bool = False) -> None:
+    level = logging.DEBUG if verbose else logging.WARNING
+    logging.basicConfig(level=level, format='%(asctime)s [%(levelname)s] %(message)s')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark Instagram media fetching: full-field client-side filtering vs "
+                    "since/until + minimal fields + hydration, against a simulated Graph API",
+    )
+    parser.add_argument("--posts", default=DEFAULT_POSTS, help="Instagram Graph API style JSON ({'data': [...]})")
+    parser.add_argument("--total-posts", type=int, default=500, help="Posts on the simulated account (mock data repeated)")
+    parser.add_argument("--hours-between", type=float, default=6.0, help="Hours between simulated posts")
+    parser.add_argument("--days", type=int, default=30, help="Import window (days back from now)")
+    parser.add_argument("--imported-ratio", type=float, default=0.0,
+                        help="Fraction of in-window posts that already have a SocialPost")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="Simulated latency per API call")
+    parser.add_argument("--fail-every", type=int, default=0,
+                        help="Return a transient 500 every N calls in the trimmed run (0 = never)")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    return parser.parse_args()
+
+
+def build_posts(path: str, total: int, hours_between: float) -> list:
+    """モックの投稿を total 件に増やし、現在から hours_between 時間おきの新しい順に並べる。"""
+    with open(path, encoding='utf-8') as f:
+        base = json.load(f).get('data', [])
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    posts = []
+    for i in range(total):
+        src = base[i % len(base)]
+        ts = now - timedelta(hours=hours_between * i)
+        posts.append(dict(src, id=f"{src.get('id')}{i:05d}",
+                          permalink=f"{src.get('permalink')}{i}",
+                          timestamp=ts.strftime('%Y-%m-%dT%H:%M:%S+0000')))
+    return posts
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+        self.content = text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class SimulatedGraphAPI:
+    """/me/media（since/until/limit/after/fields）と /{media-id}?fields= だけを返す Graph API の代わり。"""
+
+    def __init__(self, posts: list, latency: float, fail_every: int = 0):
+        self.posts = posts
+        self.by_id = {p['id']: p for p in posts}
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = 0
+        self.bytes = 0
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.bytes = 0
+
+    def get(self, url, params=None, timeout=None):
+        time.sleep(self.latency)
+        self.calls += 1
+        if self.fail_every and self.calls % self.fail_every == 0:
+            return FakeResponse(500, json.dumps({'error': {'message': 'transient', 'code': 2, 'is_transient': True}}))
+
+        parsed = urlparse(url)
+        query = dict(parse_qsl(parsed.query))
+        query.update({k: str(v) for k, v in (params or {}).items()})
+        fields = query.get('fields', 'id').split(',')
+
+        def pick(post):
+            return {f: post[f] for f in fields if f in post}
+
+        if parsed.path.endswith('/me/media'):
+            items = self.posts
+            since, until = query.get('since'), query.get('until')
+            if since or until:
+                items = [p for p in items if _in_range(p, since, until)]
+            offset = int(query.get('after') or 0)
+            limit = int(query.get('limit') or 25)
+            body = {'data': [pick(p) for p in items[offset:offset + limit]]}
+            if offset + limit < len(items):
+                next_query = dict(query, after=str(offset + limit))
+                body['paging'] = {'next': parsed._replace(query=urlencode(next_query)).geturl()}
+        else:
+            post = self.by_id.get(parsed.path.rsplit('/', 1)[-1])
+            if post is None:
+                return FakeResponse(400, json.dumps({'error': {'message': 'not found', 'code': 100}}))
+            body = pick(post)
+
+        text = json.dumps(body, ensure_ascii=False)
+        self.bytes += len(text.encode('utf-8'))
+        return FakeResponse(200, text)
+
+
+def _in_range(post: dict, since, until) -> bool:
+    ts = datetime.fromisoformat(post['timestamp'].replace('Z', '+00:00')).timestamp()
+    return (not since or ts >= int(since)) and (not until or ts <= int(until))
+
+
+def already_imported(ratio: float):
+    """permalink のハッシュで決まる割合の投稿を「取り込み済み」とみなす（実行間で同じ結果になる）。"""
+    def is_imported(post: dict) -> bool:
+        return (zlib.crc32(post.get('permalink', '').encode('utf-8')) % 1000) < ratio * 1000
+    return is_imported
+
+
+def legacy_fetch(api: SimulatedGraphAPI, start_date: str, end_date: str, is_imported) -> list:
+    """変更前の取得方法: 全フィールドを limit=50 で取り、期間と取り込み済みはダウンロード後に判定する。"""
+    start_dt = datetime.fromisoformat(f"{start_date}T00:00:00+00:00")
+    end_dt = datetime.fromisoformat(f"{end_date}T23:59:59+00:00")
+    url = f"https://graph.instagram.com/{tasks.INSTAGRAM_API_VERSION}/me/media"
+    params = {'fields': LEGACY_FIELDS, 'access_token': 'bench', 'limit': LEGACY_LIMIT}
+    posts = []
+    while url:
+        data = api.get(url, params=params).json()
+        url = data.get('paging', {}).get('next')
+        params = {}
+        page = data.get('data', [])
+        for post in page:
+            post_dt = datetime.fromisoformat(post['timestamp'].replace('Z', '+00:00'))
+            if start_dt <= post_dt <= end_dt and not is_imported(post):
+                posts.append(post)
+        if page and datetime.fromisoformat(page[-1]['timestamp'].replace('Z', '+00:00')) < start_dt:
+            break
+    return posts
+
+
+def trimmed_fetch(start_date: str, end_date: str, is_imported) -> tuple:
+    stats = {}
+    posts = []
+    pages = tasks._iter_instagram_post_pages(
+        'bench', 'bench', start_date, end_date, stats=stats,
+        exclude=lambda page: [p for p in page if not is_imported(p)],
+    )
+    for page, _ in pages:
+        posts.extend(page)
+    return posts, stats
+
+
+def main():
+    args = parse_args()
+    configure_logging(args.verbose)
+
+    app = create_app()
+    # 開発モードのモック読み込みではなくシミュレーションを叩かせる
+    os.environ.pop('FLASK_ENV', None)
+    app.config['IG_FETCH_BACKOFF'] = 0.05
+
+    posts = build_posts(args.posts, args.total_posts, args.hours_between)
+    api = SimulatedGraphAPI(posts, args.latency_ms / 1000.0)
+    tasks.requests.get = api.get
+
+    end = datetime.now(timezone.utc).date()
+    start = end - timedelta(days=args.days)
+    is_imported = already_imported(args.imported_ratio)
+
+    with app.app_context():
+        print(f"account_posts={len(posts)} window={start}..{end} imported_ratio={args.imported_ratio} "
+              f"latency_ms={args.latency_ms} fail_every={args.fail_every}")
+        print(f"{'mode':>8} {'api_calls':>10} {'kb':>9} {'wall_s':>8} {'posts':>7}")
+
+        api.reset()
+        started = time.monotonic()
+        legacy_posts = legacy_fetch(api, start.isoformat(), end.isoformat(), is_imported)
+        print(f"{'legacy':>8} {api.calls:>10} {api.bytes / 1024:>9.1f} {time.monotonic() - started:>8.2f} "
+              f"{len(legacy_posts):>7}")
+
+        # 変更前は再試行しないので、一時的な 500 は新しい取得方法の側だけに入れる
+        api.reset()
+        api.fail_every = args.fail_every
+        started = time.monotonic()
+        trimmed_posts, _ = trimmed_fetch(start.isoformat(), end.isoformat(), is_imported)
+        print(f"{'trimmed':>8} {api.calls:>10} {api.bytes / 1024:>9.1f} {time.monotonic() - started:>8.2f} "
+              f"{len(trimmed_posts):>7}")
+
+        same = [p['id'] for p in legacy_posts] == [p['id'] for p in trimmed_posts]
+        captions = all(p.get('caption') for p in trimmed_posts)
+        print(f"same posts: {same}, captions hydrated: {captions}")
+
+
+if __name__ == '__main__':
+    main()
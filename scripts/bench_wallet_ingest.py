@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app, db
+from app.services.event_ingest import drain_event_buffer, buffer_length
+
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(verbose: bool = False) -> None:
+    level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(level=level, format='%(asctime)s [%(levelname)s] %(message)s')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark wallet beacon ingestion (direct INSERT vs Redis-buffered batch INSERT)",
+    )
+    parser.add_argument("--events", type=int, default=5000, help="Beacons to send per mode")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent senders")
+    parser.add_argument("--user-id", type=int, required=True, help="Existing creator user_id to attribute events to")
+    parser.add_argument("--page-id", type=int, required=True, help="Existing spot id to attribute events to")
+    parser.add_argument("--batch-size", type=int, default=500, help="Drain batch size for buffered mode")
+    parser.add_argument("--modes", default="direct,buffered", help="Comma-separated modes to run")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    return parser.parse_args()
+
+
+def send_beacons(app, n: int, concurrency: int, user_id: int, page_id: int) -> float:
+    """test_client で view ビーコンを n 件送って経過秒を返す（HTTP層のオーバーヘッドを含む）。"""
+    def _one(_i: int) -> int:
+        client = app.test_client()
+        resp = client.post('/api/wallet/ingest/view', json={
+            'event_id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'page_id': page_id,
+            'client_id': f"bench-{_i % 997}",
+            'session_id': f"bench-s-{_i % 97}",
+            'dwell_ms': 5000,
+        }, headers={'User-Agent': 'Mozilla/5.0 (bench)'})
+        return resp.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        codes = list(pool.map(_one, range(n)))
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for c in codes if c != 200)
+    if failed:
+        logger.warning(f"{failed} beacons failed")
+    return elapsed
+
+
+def main():
+    args = parse_args()
+    configure_logging(args.verbose)
+
+    modes = [m.strip() for m in args.modes.split(',') if m.strip() in ('direct', 'buffered')]
+    app = create_app()
+    results = []
+    for mode in modes:
+        app.config['WALLET_INGEST_MODE'] = mode
+        elapsed = send_beacons(app, args.events, args.concurrency, args.user_id, args.page_id)
+        drain_s = 0.0
+        if mode == 'buffered':
+            with app.app_context():
+                started = time.perf_counter()
+                stats = drain_event_buffer(batch_size=args.batch_size, consumer='bench')
+                drain_s = time.perf_counter() - started
+                logger.info(f"drained {stats['events']} events in {stats['batches']} batches "
+                            f"({drain_s:.2f}s), remaining={buffer_length()}")
+        results.append((mode, elapsed, drain_s))
+
+    print(f"{'mode':<10} {'events':>8} {'accept_s':>9} {'beacons/s':>10} {'drain_s':>8} {'rows/s':>10}")
+    for mode, elapsed, drain_s in results:
+        rate = args.events / elapsed if elapsed else 0.0
+        rows = (args.events / drain_s) if drain_s else rate
+        print(f"{mode:<10} {args.events:>8} {elapsed:>9.2f} {rate:>10.1f} {drain_s:>8.2f} {rows:>10.1f}")
+
+    with app.app_context():
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
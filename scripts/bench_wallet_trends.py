@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import argparse
+import logging
+from datetime import date, timedelta
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.services.wallet_trends import _add_months, trend_series
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = 'bench_wallet_trends'
+
+
+def configure_logging(verbose: bool = False) -> None:
+    level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(level=level, format='%(asctime)s [%(levelname)s] %(message)s')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark /api/wallet/trends: per-month queries vs single window-function query (synthetic data)",
+    )
+    parser.add_argument("--users", type=int, default=2000, help="Distinct creators")
+    parser.add_argument("--history-months", type=int, default=60, help="Months of creator_monthly/creator_daily history")
+    parser.add_argument("--months", default="3,6,12,24,48", help="Comma-separated ?months= values to measure")
+    parser.add_argument("--repeat", type=int, default=20, help="Requests per variant (median is reported)")
+    parser.add_argument("--skip-load", action="store_true", help="Reuse previously generated tables")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {SCHEMA} schema afterwards")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    return parser.parse_args()
+
+
+def load(first_month: date, this_month: date, users: int) -> None:
+    """creator_monthly（締め済み月）と creator_daily（全期間）の同名テーブルを別スキーマに生成する。"""
+    stmts = [
+        f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE",
+        f"CREATE SCHEMA {SCHEMA}",
+        f"""CREATE TABLE {SCHEMA}.creator_daily (
+              day DATE NOT NULL, user_id BIGINT NOT NULL, pv INTEGER NOT NULL DEFAULT 0,
+              clicks INTEGER NOT NULL DEFAULT 0, payout_day NUMERIC(12,2) NOT NULL DEFAULT 0,
+              PRIMARY KEY (day, user_id))""",
+        f"""CREATE TABLE {SCHEMA}.creator_monthly (
+              month DATE NOT NULL, user_id BIGINT NOT NULL, pv INTEGER NOT NULL DEFAULT 0,
+              clicks INTEGER NOT NULL DEFAULT 0, payout_month NUMERIC(12,2) NOT NULL DEFAULT 0,
+              PRIMARY KEY (month, user_id))""",
+    ]
+    for st in stmts:
+        db.session.execute(text(st))
+    db.session.commit()
+
+    started = time.perf_counter()
+    db.session.execute(text(
+        f"""
+        INSERT INTO {SCHEMA}.creator_daily (day, user_id, pv, clicks, payout_day)
+        SELECT d::date, u, (random() * 500)::int, (random() * 30)::int, round((random() * 40)::numeric, 2)
+        FROM generate_series(CAST(:first AS date), CAST(:yesterday AS date), interval '1 day') AS d,
+             generate_series(1, :users) AS u
+        """
+    ), {'first': first_month, 'yesterday': date.today() - timedelta(days=1), 'users': users})
+    db.session.execute(text(
+        f"""
+        INSERT INTO {SCHEMA}.creator_monthly (month, user_id, pv, clicks, payout_month)
+        SELECT date_trunc('month', day)::date, user_id, SUM(pv), SUM(clicks), SUM(payout_day)
+        FROM {SCHEMA}.creator_daily WHERE day < :this_month GROUP BY 1, 2
+        """
+    ), {'this_month': this_month})
+    db.session.commit()
+    # 本番と同じく (user_id, day) で引けるようにする（PK は (day, user_id)）
+    db.session.execute(text(f"CREATE INDEX ON {SCHEMA}.creator_daily (user_id, day)"))
+    db.session.execute(text(f"CREATE INDEX ON {SCHEMA}.creator_monthly (user_id, month)"))
+    db.session.execute(text(f"ANALYZE {SCHEMA}.creator_daily"))
+    db.session.execute(text(f"ANALYZE {SCHEMA}.creator_monthly"))
+    db.session.commit()
+    logger.info(f"generated {users} users x {first_month}..{this_month} in {time.perf_counter() - started:.1f}s")
+
+
+def legacy_trends(user_id: int, months: int, this_month: date) -> list:
+    """旧実装: 締め済み月ごとに creator_monthly を1回、当月に creator_daily を1回引く。"""
+    out = []
+    for i in range(months - 1, -1, -1):
+        m = _add_months(this_month, -i)
+        if m == this_month:
+            row = db.session.execute(text(
+                "SELECT COALESCE(SUM(pv),0), COALESCE(SUM(clicks),0), COALESCE(SUM(payout_day),0) "
+                "FROM creator_daily WHERE user_id = :u AND day >= :m AND day < :n"
+            ), {'u': user_id, 'm': m, 'n': _add_months(m, 1)}).first()
+        else:
+            row = db.session.execute(text(
+                "SELECT pv, clicks, payout_month FROM creator_monthly WHERE user_id = :u AND month = :m"
+            ), {'u': user_id, 'm': m}).first()
+        out.append(tuple(row) if row else (0, 0, 0))
+    return out
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    args = parse_args()
+    configure_logging(args.verbose)
+
+    app = create_app()
+    with app.app_context():
+        today = date.today()
+        this_month = date(today.year, today.month, 1)
+        first_month = _add_months(this_month, -(args.history_months - 1))
+        if not args.skip_load:
+            load(first_month, this_month, args.users)
+
+        months_list = [int(m) for m in args.months.split(',') if m.strip()]
+        # 同名テーブルをスキーマで差し替える（SET LOCAL なのでロールバックで元に戻る）
+        db.session.execute(text(f"SET LOCAL search_path TO {SCHEMA}, public"))
+        print(f"users={args.users} history_months={args.history_months} repeat={args.repeat}")
+        print(f"{'months':>7} {'legacy_ms':>10} {'trips':>6} {'single_ms':>10} {'weekly_ms':>10} {'daily_ms':>10}")
+        for n in months_list:
+            uid = 1 + (n * 7919) % args.users
+            legacy_ms = _median_ms(lambda: legacy_trends(uid, n, this_month), args.repeat)
+            single_ms = _median_ms(lambda: trend_series(uid, n, 'month', today), args.repeat)
+            weekly_ms = _median_ms(lambda: trend_series(uid, n, 'week', today), args.repeat)
+            daily_ms = _median_ms(lambda: trend_series(uid, n, 'day', today), args.repeat)
+            # 結果が旧実装と一致することも確認する
+            legacy = legacy_trends(uid, n, this_month)
+            single = trend_series(uid, n, 'month', today)
+            if [round(float(r[2]), 0) for r in legacy] != single['revenue']:
+                logger.warning(f"months={n}: revenue mismatch between legacy and single-query results")
+            print(f"{n:>7} {legacy_ms:>10.2f} {n:>6} {single_ms:>10.2f} {weekly_ms:>10.2f} {daily_ms:>10.2f}")
+        db.session.rollback()
+
+        if not args.keep:
+            db.session.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import create_app
+from app.models import Spot
+from app.services.google_photos import get_redis_client
+import app.services.hotel_offers as hotel_offers
+
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(verbose: bool = False) -> None:
+    level = logging.DEBUG if verbose else logging.WARNING
+    logging.basicConfig(level=level, format='%(asctime)s [%(levelname)s] %(message)s')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Load-test /public/api/spots/<id>/hotel_offers with simulated providers: "
+                    "concurrent misses without coalescing vs the stale-while-revalidate cache",
+    )
+    parser.add_argument("--spot-id", type=int, help="Active spot to request (default: first active spot)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Simultaneous requests per phase")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Simulated latency per provider call")
+    parser.add_argument("--days-ahead", type=int, default=120,
+                        help="Check-in this many days ahead (a window real traffic is unlikely to have cached)")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logging")
+    return parser.parse_args()
+
+
+class SimulatedProviders:
+    """DataForSEO / 楽天 / Agoda の代わり。呼び出し回数だけ数える。"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def fetcher(self, provider: str, price: int):
+        def fetch(external_id, check_in, check_out, adults, children, spot_id):
+            with self._lock:
+                self.calls[provider] += 1
+            time.sleep(self.latency)
+            if provider == 'agoda':
+                return [{'price': price, 'currency': 'JPY'}]
+            return [{'provider': provider.title(), 'price': price, 'currency': 'JPY',
+                     'deeplink': f'https://example.com/{provider}/{external_id}'}]
+        return fetch
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)] if ordered else 0.0
+
+
+def run_phase(name: str, concurrency: int, call, providers: SimulatedProviders) -> None:
+    providers.reset()
+    barrier = threading.Barrier(concurrency)
+
+    def one(_):
+        barrier.wait()
+        started = time.monotonic()
+        state = call()
+        return time.monotonic() - started, state
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(concurrency)))
+    wall = time.monotonic() - started
+    latencies = [r[0] for r in results]
+    states = Counter(r[1] for r in results)
+    print(f"{name:>10} {sum(providers.calls.values()):>14} {percentile(latencies, 0.5) * 1000:>8.0f} "
+          f"{percentile(latencies, 0.95) * 1000:>8.0f} {wall:>7.2f}  "
+          + ' '.join(f'{k}={v}' for k, v in sorted(states.items())))
+
+
+def main():
+    args = parse_args()
+    configure_logging(args.verbose)
+
+    app = create_app()
+    providers = SimulatedProviders(args.latency_ms / 1000.0)
+    hotel_offers._FETCHERS.update(
+        dataforseo=providers.fetcher('dataforseo', 12000),
+        rakuten=providers.fetcher('rakuten', 11500),
+        agoda=providers.fetcher('agoda', 11800),
+    )
+    hotel_offers.provider_mappings = lambda spot_id: {'dataforseo': 'bench', 'rakuten': 'bench', 'agoda': 'bench'}
+
+    with app.app_context():
+        client = get_redis_client()
+        if client is None:
+            print("REDIS_URL is required")
+            return
+        spot = Spot.query.get(args.spot_id) if args.spot_id else Spot.query.filter_by(is_active=True).first()
+        if spot is None or not spot.is_active:
+            print("No active spot found")
+            return
+        spot_id = spot.id
+
+    check_in = date.today() + timedelta(days=args.days_ahead)
+    query = {'checkIn': check_in.isoformat(), 'checkOut': (check_in + timedelta(days=1)).isoformat(),
+             'adults': 2, 'children': 0}
+    key = hotel_offers.cache_key(spot_id, query['checkIn'], query['checkOut'], 2, 0)
+    url = f"/public/api/spots/{spot_id}/hotel_offers"
+
+    def request_offers():
+        resp = app.test_client().get(url, query_string=query)
+        return resp.headers.get('X-Offers-Cache', str(resp.status_code))
+
+    def compute_directly():
+        # 変更前の経路: ミスしたリクエストがそれぞれプロバイダを叩く
+        with app.app_context():
+            s = Spot.query.get(spot_id)
+            hotel_offers.compute_offers(s, query['checkIn'], query['checkOut'], 2, 0)
+        return 'miss'
+
+    print(f"spot={spot_id} concurrency={args.concurrency} provider_latency_ms={args.latency_ms}")
+    print(f"{'phase':>10} {'provider_calls':>14} {'p50_ms':>8} {'p95_ms':>8} {'wall_s':>7}  cache")
+
+    client.delete(key, hotel_offers.LOCK_KEY_PREFIX + key)
+    run_phase('no-cache', args.concurrency, compute_directly, providers)
+
+    client.delete(key, hotel_offers.LOCK_KEY_PREFIX + key)
+    run_phase('cold', args.concurrency, request_offers, providers)
+    run_phase('warm', args.concurrency, request_offers, providers)
+
+    # soft TTL 切れを再現: 値はそのままで fresh_until だけ過去にする
+    entry = json.loads(client.get(key))
+    entry['fresh_until'] = 0
+    client.set(key, json.dumps(entry), ex=client.ttl(key))
+    run_phase('stale', args.concurrency, request_offers, providers)
+    # 裏の再計算が終わるのを待ってから数える
+    deadline = time.monotonic() + args.latency_ms / 1000.0 + 10
+    while time.monotonic() < deadline:
+        if client.get(hotel_offers.LOCK_KEY_PREFIX + key) is None:
+            break
+        time.sleep(0.05)
+    print(f"background refresh provider calls after stale phase: {sum(providers.calls.values())}")
+
+    with app.app_context():
+        print("cache stats:", hotel_offers.cache_stats())
+    client.delete(key)
+
+
+if __name__ == '__main__':
+    main()
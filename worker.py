@@ -47,5 +47,5 @@ if __name__ == '__main__':
         queues = [Queue(name, connection=conn) for name in listen]
         # ワーカーを生成し、指定されたキューを監視させる
         worker = Worker(queues, connection=conn)
-        # ワーカーの処理を開始
-        worker.work() 
\ No newline at end of file
+        # ワーカーの処理を開始（enqueue_in で遅延投入したジョブ（自動インポート）も実行する）
+        worker.work(with_scheduler=True) 
\ No newline at end of file